@@ -35,9 +35,16 @@ class BenchmarkResults:
     template, properties are computed on demand and only once.
     """
 
-    def __init__(self, benchmark_name, experiment_df, coverage_dict,
-                 output_directory, plotter):
+    def __init__(self,
+                 benchmark_name,
+                 experiment_df,
+                 coverage_dict,
+                 output_directory,
+                 plotter,
+                 snapshot_time=None):
         self.name = benchmark_name
+        # Computed from the benchmark's data if not given.
+        self._snapshot_time = snapshot_time
 
         self._experiment_df = experiment_df
         self._coverage_dict = coverage_dict
@@ -87,13 +94,14 @@ class BenchmarkResults:
     @property
     @functools.lru_cache()
     def _benchmark_snapshot_df(self):
-        return data_utils.get_benchmark_snapshot(self._benchmark_df)
+        return data_utils.get_benchmark_snapshot(
+            self._benchmark_df, snapshot_time=self._snapshot_time)
 
     @property
     @functools.lru_cache()
-    def _benchmark_coverage_dict(self):
+    def _benchmark_coverage(self):
         """Covered branches of each fuzzer on this benchmark."""
-        return coverage_data_utils.get_benchmark_cov_dict(
+        return coverage_data_utils.get_benchmark_coverage(
             self._coverage_dict, self.name)
 
     @property
@@ -101,21 +109,14 @@ class BenchmarkResults:
     def _benchmark_aggregated_coverage_df(self):
         """Aggregated covered branches of each fuzzer on this benchmark."""
         return coverage_data_utils.get_benchmark_aggregated_cov_df(
-            self._coverage_dict, self.name)
-
-    @property
-    @functools.lru_cache()
-    def _unique_branch_dict(self):
-        """Unique branches with the fuzzers that cover it."""
-        return coverage_data_utils.get_unique_branch_dict(
-            self._benchmark_coverage_dict)
+            self._benchmark_coverage)
 
     @property
     @functools.lru_cache()
     def unique_branch_cov_df(self):
         """Fuzzers with the number of covered unique branches."""
         return coverage_data_utils.get_unique_branch_cov_df(
-            self._unique_branch_dict, self.fuzzer_names)
+            self._benchmark_coverage, self.fuzzer_names)
 
     @property
     def fuzzers_with_not_enough_samples(self):
@@ -317,7 +318,8 @@ class BenchmarkResults:
             self._get_full_path(plot_filename),
             wide=True,
             logscale=logscale,
-            bugs=bugs)
+            bugs=bugs,
+            snapshot_time=self._snapshot_time)
         return plot_filename
 
     @property
@@ -410,7 +412,7 @@ class BenchmarkResults:
         fuzzers = self.unique_branch_cov_df.sort_values(
             by='unique_branches_covered', ascending=False).fuzzer
         return coverage_data_utils.get_pairwise_unique_coverage_table(
-            self._benchmark_coverage_dict, fuzzers)
+            self._benchmark_coverage, fuzzers)
 
     @property
     def pairwise_unique_coverage_plot(self):
@@ -14,20 +14,35 @@
 """Utility functions for coverage data calculation."""
 
 import collections
+import hashlib
 import itertools
 import json
+import os
 import posixpath
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import tempfile
 
+import numpy as np
 import pandas as pd
 
 from analysis import data_utils
+from common import coverage_format
+from common import environment
+from common import filestore_cache
 from common import filestore_utils
+from common import filesystem
 from common import logs
 
 logger = logs.Logger()
 
+# Default directory for caching coverage data downloaded from filestores.
+COVERAGE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'fuzzbench', 'coverage')
+
+# Default size in bytes of the coverage cache. Set COVERAGE_CACHE_SIZE to
+# change it.
+DEFAULT_COVERAGE_CACHE_SIZE = 5 * 2**30
+
 
 def fuzzer_and_benchmark_to_key(fuzzer: str, benchmark: str) -> str:
     """Returns the key representing |fuzzer| and |benchmark|."""
@@ -74,113 +89,342 @@ def get_coverage_report_filestore_path(fuzzer: str, benchmark: str,
                           fuzzer, 'index.html')
 
 
-def get_covered_branches_dict(experiment_df: pd.DataFrame) -> Dict:
-    """Combines json files for different fuzzer-benchmark pair in
-    |experiment_df| and returns a dictionary of the covered branches."""
+def _get_benchmark_fuzzers(experiment_df: pd.DataFrame) -> Dict:
+    """Returns a dictionary mapping each benchmark and experiment filestore in
+    |experiment_df| to the fuzzers whose coverage data is there."""
     fuzzers_and_benchmarks = set(
         zip(experiment_df.fuzzer, experiment_df.benchmark))
-    arguments = [(fuzzer, benchmark,
-                  get_experiment_filestore_path_for_fuzzer_benchmark(
-                      fuzzer, benchmark, experiment_df))
-                 for fuzzer, benchmark in fuzzers_and_benchmarks]
-    result = itertools.starmap(get_fuzzer_benchmark_covered_branches_and_key,
-                               arguments)
-    return dict(result)
+    benchmark_fuzzers = collections.defaultdict(list)
+    for fuzzer, benchmark in fuzzers_and_benchmarks:
+        filestore = get_experiment_filestore_path_for_fuzzer_benchmark(
+            fuzzer, benchmark, experiment_df)
+        benchmark_fuzzers[(benchmark, filestore)].append(fuzzer)
+    return benchmark_fuzzers
+
+
+# pylint: disable=too-many-locals
+def get_covered_branches_dict(experiment_df: pd.DataFrame,
+                              cache_dir: Optional[str] = None) -> Dict:
+    """Combines the covered branches of different fuzzer-benchmark pairs in
+    |experiment_df| and returns a dictionary of the covered branches. Files are
+    downloaded in bulk and cached in |cache_dir| (COVERAGE_CACHE_DIR by
+    default) until they change in the filestore."""
+    cache_dir = cache_dir or COVERAGE_CACHE_DIR
+    benchmark_fuzzers = _get_benchmark_fuzzers(experiment_df)
+
+    # List each experiment's coverage data once instead of checking every file
+    # for changes.
+    versions = {}
+    for filestore in {filestore for _, filestore in benchmark_fuzzers}:
+        versions.update(
+            filestore_utils.list_versions(
+                posixpath.join(filestore, 'coverage', 'data')) or {})
+
+    src_dirs = {
+        benchmark_and_filestore:
+        get_benchmark_covered_branches_filestore_dir(*benchmark_and_filestore)
+        for benchmark_and_filestore in benchmark_fuzzers
+    }
+    local_paths = fetch_files([
+        posixpath.join(src_dir, filename)
+        for src_dir in src_dirs.values()
+        for filename in (coverage_format.INDEX_FILENAME,
+                         coverage_format.BINARY_FILENAME)
+    ], versions, cache_dir)
+
+    covered_branches_dict = {}
+    json_paths = {}
+    for benchmark_and_filestore, src_dir in src_dirs.items():
+        benchmark, filestore = benchmark_and_filestore
+        covered_branches = _load_benchmark_covered_branches(
+            src_dir, local_paths)
+        for fuzzer in benchmark_fuzzers[benchmark_and_filestore]:
+            key = fuzzer_and_benchmark_to_key(fuzzer, benchmark)
+            if (covered_branches is not None and
+                    fuzzer in covered_branches.fuzzers):
+                covered_branches_dict[key] = (
+                    coverage_format.get_fuzzer_branches(covered_branches,
+                                                        fuzzer))
+            else:
+                # Experiments from before the binary format only have json
+                # files.
+                json_paths[key] = (
+                    get_fuzzer_benchmark_covered_branches_filestore_path(
+                        fuzzer, benchmark, filestore))
+
+    local_paths = fetch_files(list(json_paths.values()), versions, cache_dir)
+    for key, json_path in json_paths.items():
+        covered_branches_dict[key] = _load_fuzzer_covered_branches(
+            json_path, local_paths[json_path])
+    return covered_branches_dict
+
+
+def _get_cache_path(filestore_path: str, version: Optional[str],
+                    cache_dir: str) -> str:
+    """Returns the path of the copy of |version| of |filestore_path| in
+    |cache_dir|."""
+    key = hashlib.sha256(f'{filestore_path}#{version}'.encode()).hexdigest()
+    return os.path.join(cache_dir, key[:2],
+                        key + '-' + posixpath.basename(filestore_path))
+
+
+def fetch_files(filestore_paths: List[str], versions: Optional[Dict[str, str]],
+                cache_dir: str) -> Dict[str, Optional[str]]:
+    """Returns a dictionary mapping each of |filestore_paths| to the path of a
+    copy of it in |cache_dir|, or to None if it can't be downloaded. Files are
+    only downloaded if there is no copy of their current version, as given by
+    |versions| (see filestore_utils.list_versions), and all of them are
+    downloaded at once. Files without a known version are always downloaded.
+    The least recently used files are then removed from |cache_dir| if it
+    holds more than COVERAGE_CACHE_SIZE bytes, except for the returned
+    ones."""
+    versions = versions or {}
+    cache_paths = {}
+    temp_paths = {}
+    for filestore_path in filestore_paths:
+        version = versions.get(filestore_path)
+        cache_path = _get_cache_path(filestore_path, version, cache_dir)
+        cache_paths[filestore_path] = cache_path
+        if version is not None and os.path.exists(cache_path):
+            # Mark the copy as recently used.
+            os.utime(cache_path)
+            continue
+        # Download to a temporary file first so that other reports never read
+        # a partial file.
+        filesystem.create_directory(os.path.dirname(cache_path))
+        temp_fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(cache_path), prefix=filestore_cache.TEMP_PREFIX)
+        os.close(temp_fd)
+        temp_paths[filestore_path] = temp_path
+
+    downloaded = filestore_utils.get_many(temp_paths) if temp_paths else {}
+    for filestore_path, temp_path in temp_paths.items():
+        if downloaded[filestore_path]:
+            os.replace(temp_path, cache_paths[filestore_path])
+        else:
+            os.remove(temp_path)
+            cache_paths[filestore_path] = None
+
+    filestore_cache.remove_least_recently_used(cache_dir,
+                                               environment.get(
+                                                   'COVERAGE_CACHE_SIZE',
+                                                   DEFAULT_COVERAGE_CACHE_SIZE),
+                                               keep=cache_paths.values())
+    return cache_paths
+
+
+def fetch_file(filestore_path: str, versions: Optional[Dict[str, str]],
+               cache_dir: str) -> Optional[str]:
+    """Returns the path to a copy of |filestore_path| in |cache_dir|, or None
+    if it can't be downloaded. See fetch_files."""
+    return fetch_files([filestore_path], versions, cache_dir)[filestore_path]
+
+
+def get_benchmark_covered_branches_filestore_dir(
+        benchmark: str, exp_filestore_path: str) -> str:
+    """Returns the directory in the filestore containing the covered branches
+    of every fuzzer on |benchmark|."""
+    return posixpath.join(exp_filestore_path, 'coverage', 'data', benchmark)
+
+
+def _load_benchmark_covered_branches(
+    src_dir: str, local_paths: Dict[str, Optional[str]]
+) -> Optional[coverage_format.CoveredBranches]:
+    """Returns the CoveredBranches from the binary file in |src_dir| or None
+    if there isn't one. |local_paths| maps filestore paths to the paths of
+    their copies, as returned by fetch_files."""
+    # The index is uploaded after the binary file, so only use the binary file
+    # if the index exists.
+    index_path = local_paths[posixpath.join(src_dir,
+                                            coverage_format.INDEX_FILENAME)]
+    binary_path = local_paths[posixpath.join(src_dir,
+                                             coverage_format.BINARY_FILENAME)]
+    if index_path is None or binary_path is None:
+        return None
+
+    try:
+        index = coverage_format.read_index(index_path)
+        return coverage_format.load(binary_path, index)
+    except (coverage_format.CoverageFormatError, KeyError, ValueError) as error:
+        logger.warning('Could not read covered branches in %s: %s.', src_dir,
+                       error)
+        return None
+
+
+def get_benchmark_covered_branches(
+    benchmark: str,
+    filestore: str,
+    versions: Optional[Dict[str, str]] = None,
+    cache_dir: Optional[str] = None
+) -> Optional[coverage_format.CoveredBranches]:
+    """Returns the CoveredBranches of |benchmark| from the binary file in the
+    filestore or None if there isn't one. See fetch_files for |versions| and
+    |cache_dir|."""
+    src_dir = get_benchmark_covered_branches_filestore_dir(benchmark, filestore)
+    local_paths = fetch_files([
+        posixpath.join(src_dir, coverage_format.INDEX_FILENAME),
+        posixpath.join(src_dir, coverage_format.BINARY_FILENAME)
+    ], versions, cache_dir or COVERAGE_CACHE_DIR)
+    return _load_benchmark_covered_branches(src_dir, local_paths)
 
 
 def get_fuzzer_benchmark_covered_branches_filestore_path(
         fuzzer: str, benchmark: str, exp_filestore_path: str) -> str:
     """Returns the path to the covered branches json file in the |filestore| for
     |fuzzer| and |benchmark|."""
-    return posixpath.join(exp_filestore_path, 'coverage', 'data', benchmark,
-                          fuzzer, 'covered_branches.json')
-
-
-def get_fuzzer_covered_branches(fuzzer: str, benchmark: str, filestore: str):
+    return posixpath.join(
+        get_benchmark_covered_branches_filestore_dir(benchmark,
+                                                     exp_filestore_path),
+        fuzzer, 'covered_branches.json')
+
+
+def _load_fuzzer_covered_branches(src_file: str, dst_file: Optional[str]):
+    """Returns the covered branches in |dst_file|, the copy of the json file
+    |src_file|."""
+    if dst_file is None:
+        logger.warning('covered_branches.json file: %s could not be copied.',
+                       src_file)
+        return {}
+    with open(dst_file, encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+
+def get_fuzzer_covered_branches(fuzzer: str,
+                                benchmark: str,
+                                filestore: str,
+                                versions: Optional[Dict[str, str]] = None,
+                                cache_dir: Optional[str] = None):
     """Returns the covered branches dict for |fuzzer| from the json file in the
-    filestore."""
+    filestore. See fetch_files for |versions| and |cache_dir|."""
     src_file = get_fuzzer_benchmark_covered_branches_filestore_path(
         fuzzer, benchmark, filestore)
-    with tempfile.NamedTemporaryFile() as dst_file:
-        if filestore_utils.cp(src_file, dst_file.name,
-                              expect_zero=False).retcode:
-            logger.warning(
-                'covered_branches.json file: %s could not be copied.', src_file)
-            return {}
-        with open(dst_file.name, encoding='utf-8') as json_file:
-            return json.load(json_file)
-
-
-def get_fuzzer_benchmark_covered_branches_and_key(
-        fuzzer: str, benchmark: str, filestore: str) -> Tuple[str, Dict]:
-    """Accepts |fuzzer|, |benchmark|, |filestore|.
-    Returns a tuple containing the fuzzer benchmark key and the branches covered
-    by the fuzzer on the benchmark."""
-    fuzzer_benchmark_covered_branches = get_fuzzer_covered_branches(
-        fuzzer, benchmark, filestore)
-    key = fuzzer_and_benchmark_to_key(fuzzer, benchmark)
-    return key, fuzzer_benchmark_covered_branches
+    dst_file = fetch_file(src_file, versions, cache_dir or COVERAGE_CACHE_DIR)
+    return _load_fuzzer_covered_branches(src_file, dst_file)
+
+
+# The branches covered by each fuzzer on a benchmark. Every branch covered by
+# any fuzzer is interned into a dense index: |branches| holds one branch per
+# row. |covered| is a boolean matrix with a row for each of |fuzzers| and a
+# column for each branch, so that set operations on coverage are vectorized.
+BenchmarkCoverage = collections.namedtuple('BenchmarkCoverage',
+                                           ['fuzzers', 'branches', 'covered'])
+
+
+def _get_fuzzer_indexes(benchmark_coverage: BenchmarkCoverage,
+                        fuzzers) -> List[int]:
+    """Returns the row of each of |fuzzers| in |benchmark_coverage|."""
+    fuzzer_indexes = {
+        fuzzer: index for index, fuzzer in enumerate(benchmark_coverage.fuzzers)
+    }
+    return [fuzzer_indexes[fuzzer] for fuzzer in fuzzers]
 
 
-def get_unique_branch_dict(benchmark_coverage_dict: Dict) -> Dict:
+def get_unique_branch_dict(benchmark_coverage: BenchmarkCoverage) -> Dict:
     """Returns a dictionary containing the covering fuzzers for each unique
     branch, where the |threshold| defines which branches are unique."""
-    branch_dict = collections.defaultdict(list)
-    unique_branch_dict = {}
     threshold_count = 1
-    for fuzzer in benchmark_coverage_dict:
-        for branch in benchmark_coverage_dict[fuzzer]:
-            branch_dict[branch].append(fuzzer)
-    for branch, fuzzers in branch_dict.items():
-        if len(fuzzers) <= threshold_count:
-            unique_branch_dict[branch] = fuzzers
+    covering_fuzzers_counts = benchmark_coverage.covered.sum(axis=0)
+    unique_branch_dict = {}
+    for branch_index in np.flatnonzero(
+            covering_fuzzers_counts <= threshold_count):
+        fuzzer_indexes = np.flatnonzero(
+            benchmark_coverage.covered[:, branch_index])
+        branch = tuple(benchmark_coverage.branches[branch_index].tolist())
+        unique_branch_dict[branch] = [
+            benchmark_coverage.fuzzers[index] for index in fuzzer_indexes
+        ]
     return unique_branch_dict
 
 
-def get_unique_branch_cov_df(unique_branch_dict: Dict,
+def get_unique_branch_cov_df(benchmark_coverage: BenchmarkCoverage,
                              fuzzer_names: List[str]) -> pd.DataFrame:
     """Returns a DataFrame where the two columns are fuzzers and the number of
     unique branches covered."""
-    fuzzers = collections.defaultdict(int)
-    for branch in unique_branch_dict:
-        for fuzzer in unique_branch_dict[branch]:
-            fuzzers[fuzzer] += 1
-    dict_to_transform = {'fuzzer': [], 'unique_branches_covered': []}
-    for fuzzer in fuzzer_names:
-        covered_num = fuzzers[fuzzer]
-        dict_to_transform['fuzzer'].append(fuzzer)
-        dict_to_transform['unique_branches_covered'].append(covered_num)
-    return pd.DataFrame(dict_to_transform)
-
-
-def get_benchmark_cov_dict(coverage_dict, benchmark):
-    """Returns a dictionary to store the covered branches of each fuzzer. Uses a
-    set of tuples to store the covered branches."""
-    benchmark_cov_dict = {}
-    for key, covered_braches in coverage_dict.items():
+    covered = benchmark_coverage.covered
+    unique_branches = covered.sum(axis=0) == 1
+    unique_counts = np.count_nonzero(covered & unique_branches, axis=1)
+    fuzzer_unique_counts = dict(zip(benchmark_coverage.fuzzers, unique_counts))
+    return pd.DataFrame({
+        'fuzzer':
+            list(fuzzer_names),
+        'unique_branches_covered': [
+            int(fuzzer_unique_counts.get(fuzzer, 0)) for fuzzer in fuzzer_names
+        ],
+    })
+
+
+def _get_branches_array(covered_branches) -> np.ndarray:
+    """Returns |covered_branches|, a list of branches (lists of integers) or
+    an array read from the binary format, as a 2D array with a row for each
+    branch."""
+    if isinstance(covered_branches, np.ndarray):
+        return covered_branches.astype(np.int64, copy=False)
+    if not covered_branches:
+        return np.empty((0, 0), dtype=np.int64)
+    # Much faster than np.array() on a list of lists.
+    values = np.fromiter(itertools.chain.from_iterable(covered_branches),
+                         dtype=np.int64)
+    return values.reshape(len(covered_branches), -1)
+
+
+def _intern_branches(branches: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the distinct rows of |branches| and the index of each row of
+    |branches| in them. Faster than np.unique(axis=0), which sorts rows."""
+    # Combine the columns into a single key one at a time, factorizing after
+    # each step so that the key stays small enough not to overflow.
+    keys = np.zeros(len(branches), dtype=np.int64)
+    for column in branches.T:
+        column_codes, column_values = pd.factorize(column)
+        keys, _ = pd.factorize(keys * len(column_values) + column_codes)
+    _, first_indexes = np.unique(keys, return_index=True)
+    return branches[first_indexes], keys
+
+
+def get_benchmark_coverage(coverage_dict, benchmark) -> BenchmarkCoverage:
+    """Returns the BenchmarkCoverage of each fuzzer on |benchmark| in
+    |coverage_dict|."""
+    fuzzers = []
+    fuzzer_branches = []
+    for key, covered_branches in coverage_dict.items():
         current_fuzzer, current_benchmark = key_to_fuzzer_and_benchmark(key)
         if current_benchmark == benchmark:
-            covered_braches_in_set = set()
-            for branch in covered_braches:
-                covered_braches_in_set.add(tuple(branch))
-            benchmark_cov_dict[current_fuzzer] = covered_braches_in_set
-    return benchmark_cov_dict
-
-
-def get_benchmark_aggregated_cov_df(coverage_dict, benchmark):
+            fuzzers.append(current_fuzzer)
+            fuzzer_branches.append(_get_branches_array(covered_branches))
+
+    branch_width = max((branches.shape[1] for branches in fuzzer_branches),
+                       default=0)
+    fuzzer_branches = [
+        branches if len(branches) else np.empty(
+            (0, branch_width), dtype=np.int64) for branches in fuzzer_branches
+    ]
+    if not any(len(branches) for branches in fuzzer_branches):
+        return BenchmarkCoverage(fuzzers,
+                                 np.empty((0, branch_width), dtype=np.int64),
+                                 np.zeros((len(fuzzers), 0), dtype=bool))
+
+    # Intern the branches of all fuzzers into a single index.
+    branches, branch_indexes = _intern_branches(np.concatenate(fuzzer_branches))
+    branch_counts = [len(fuzzer_array) for fuzzer_array in fuzzer_branches]
+    fuzzer_indexes = np.repeat(np.arange(len(fuzzers)), branch_counts)
+    covered = np.zeros((len(fuzzers), len(branches)), dtype=bool)
+    covered[fuzzer_indexes, branch_indexes] = True
+    return BenchmarkCoverage(fuzzers, branches, covered)
+
+
+def get_benchmark_aggregated_cov_df(
+        benchmark_coverage: BenchmarkCoverage) -> pd.DataFrame:
     """Returns a dataframe where each row represents a fuzzer and its aggregated
     coverage number."""
-    dict_to_transform = {'fuzzer': [], 'aggregated_edges_covered': []}
-    for key, covered_branches in coverage_dict.items():
-        current_fuzzer, current_benchmark = key_to_fuzzer_and_benchmark(key)
-        if current_benchmark == benchmark:
-            dict_to_transform['fuzzer'].append(current_fuzzer)
-            dict_to_transform['aggregated_edges_covered'].append(
-                len(covered_branches))
-    return pd.DataFrame(dict_to_transform)
+    return pd.DataFrame({
+        'fuzzer':
+            benchmark_coverage.fuzzers,
+        'aggregated_edges_covered':
+            np.count_nonzero(benchmark_coverage.covered, axis=1),
+    })
 
 
-def get_pairwise_unique_coverage_table(benchmark_coverage_dict, fuzzers):
+def get_pairwise_unique_coverage_table(benchmark_coverage: BenchmarkCoverage,
+                                       fuzzers):
     """Returns a table that shows the unique coverage between each pair of
     fuzzers.
 
@@ -188,18 +432,15 @@ def get_pairwise_unique_coverage_table(benchmark_coverage_dict, fuzzers):
     row and column represents a fuzzer, and each cell contains a number
     showing the branches covered by the fuzzer of the column but not by
     the fuzzer of the row."""
-
-    pairwise_unique_coverage_values = []
-    for fuzzer_in_row in fuzzers:
-        row = []
-        for fuzzer_in_col in fuzzers:
-            pairwise_unique_coverage_value = get_unique_covered_percentage(
-                benchmark_coverage_dict[fuzzer_in_row],
-                benchmark_coverage_dict[fuzzer_in_col])
-            row.append(pairwise_unique_coverage_value)
-        pairwise_unique_coverage_values.append(row)
-
-    return pd.DataFrame(pairwise_unique_coverage_values,
+    fuzzers = list(fuzzers)
+    covered = benchmark_coverage.covered[_get_fuzzer_indexes(
+        benchmark_coverage, fuzzers)]
+    # Cell (row, col) counts branches where ~covered[row] & covered[col], which
+    # is the dot product of the two rows. Floats are exact for these counts and
+    # use BLAS.
+    not_covered = (~covered).astype(np.float64)
+    pairwise_unique_coverage_values = not_covered @ covered.astype(np.float64).T
+    return pd.DataFrame(pairwise_unique_coverage_values.astype(np.int64),
                         index=fuzzers,
                         columns=fuzzers)
 
@@ -207,13 +448,11 @@ def get_pairwise_unique_coverage_table(benchmark_coverage_dict, fuzzers):
 def get_unique_covered_percentage(fuzzer_row_covered_branches,
                                   fuzzer_col_covered_branches):
     """Returns the number of branches covered by the fuzzer of the
-    column but not by the fuzzer of the row."""
-
-    unique_branch_count = 0
-    for branch in fuzzer_col_covered_branches:
-        if branch not in fuzzer_row_covered_branches:
-            unique_branch_count += 1
-    return unique_branch_count
+    column but not by the fuzzer of the row. Both arguments are rows of
+    BenchmarkCoverage.covered."""
+    return int(
+        np.count_nonzero(fuzzer_col_covered_branches &
+                         ~fuzzer_row_covered_branches))
 
 
 def rank_by_average_normalized_score(benchmarks_unique_coverage_list):
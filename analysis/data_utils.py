@@ -12,13 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Utility functions for data (frame) transformations."""
+import ast
+import collections
+import json
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
+from scipy import stats
 from clusterfuzz.stacktraces.crash_comparer import CrashComparer
 
 from analysis import stat_tests
 from common import benchmark_utils
 from common import environment
+from common import filesystem
 from common import logs
+from common import resource_usage
 
 logger = logs.Logger()
 
@@ -129,25 +139,151 @@ def filter_max_time(experiment_df, max_time):
     return experiment_df[experiment_df['time'] <= max_time]
 
 
-def is_unique_crash(crash_group):
-    """Check if each crash in |crash_group| is unique with CF's crash comparer.
-    Return the |crash_group| with an extra columns representing if that crash
-    is the first occurrence."""
-    unique_crashes = set()
-    is_firsts = []
-    for crash in crash_group.crash_key:
-        # crash_key is an concatenation of crash type and crash state:
-        # '{crash_type}:{crash_state}'
-        crash_state = ':'.join(str(crash).split(':')[1:])
-        is_unique = True
-        for unique_crash in unique_crashes:
-            if CrashComparer(crash_state, unique_crash).is_similar():
-                is_unique = False
-                break
-        unique_crashes.add(crash_state)
-        is_firsts.append(is_unique)
-    crash_group['firsts'] = is_firsts
-    return crash_group.firsts
+# Number of pairs of crash states whose similarity is remembered. The cache is
+# shared by every report generated by the process, so crashes that were
+# compared for a previous report aren't compared again. It can also be stored
+# for the next reports (see save_crash_similarity_cache).
+CRASH_SIMILARITY_CACHE_SIZE = 1 << 20
+
+CRASH_SIMILARITY_CACHE_FILENAME = 'crash_similarity_cache.json'
+
+# Maximum size in bytes of a stored crash similarity cache. The least recently
+# used similarities are left out of it.
+CRASH_SIMILARITY_CACHE_MAX_BYTES = 64 * 2**20
+
+# Maps pairs of crash states to whether CF's crash comparer finds them similar,
+# from the least to the most recently used.
+_crash_similarities = {}
+
+
+def _get_crash_state(crash_key):
+    """Returns the crash state in |crash_key|."""
+    # crash_key is an concatenation of crash type and crash state:
+    # '{crash_type}:{crash_state}'
+    return ':'.join(str(crash_key).split(':')[1:])
+
+
+def _is_similar_crash(crash_state, seen_crash_state):
+    """Returns True if CF's crash comparer finds |crash_state| similar to
+    |seen_crash_state|."""
+    key = (crash_state, seen_crash_state)
+    is_similar = _crash_similarities.pop(key, None)
+    if is_similar is None:
+        is_similar = CrashComparer(crash_state, seen_crash_state).is_similar()
+        if len(_crash_similarities) >= CRASH_SIMILARITY_CACHE_SIZE:
+            return is_similar
+    # Keep the cache ordered from the least to the most recently used.
+    _crash_similarities[key] = is_similar
+    return is_similar
+
+
+def load_crash_similarity_cache(cache_path):
+    """Adds the similarities of crash states stored in |cache_path| by
+    save_crash_similarity_cache to the cache, if there are any."""
+    try:
+        with open(cache_path, encoding='utf-8') as file_handle:
+            similarities = json.load(file_handle)
+    except (OSError, ValueError):
+        return
+    for crash_state, seen_crash_state, is_similar in similarities:
+        if len(_crash_similarities) >= CRASH_SIMILARITY_CACHE_SIZE:
+            break
+        _crash_similarities[(crash_state, seen_crash_state)] = is_similar
+
+
+def save_crash_similarity_cache(cache_path,
+                                max_bytes=CRASH_SIMILARITY_CACHE_MAX_BYTES):
+    """Stores the most recently used similarities of crash states in the cache
+    to |cache_path|, up to |max_bytes| of them."""
+    similarities = []
+    size = 2
+    for (crash_state,
+         seen_crash_state), is_similar in reversed(_crash_similarities.items()):
+        similarity = json.dumps([crash_state, seen_crash_state, is_similar])
+        size += len(similarity.encode('utf-8')) + 1
+        if size > max_bytes:
+            break
+        similarities.append(similarity)
+    # Written to a temporary file first so that reports generated at the same
+    # time never read a partial file.
+    filesystem.create_directory(os.path.dirname(cache_path))
+    temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+    with os.fdopen(temp_fd, 'w', encoding='utf-8') as file_handle:
+        file_handle.write('[' + ','.join(reversed(similarities)) + ']')
+    os.replace(temp_path, cache_path)
+
+
+def _may_have_similar_lines(lines, seen_lines):
+    """Returns False if |lines| and |seen_lines| can't be similar enough line
+    by line for CF's crash comparer, without comparing their characters. The
+    Levenshtein distance of two lines is at least the difference of their
+    lengths, which bounds their similarity ratio."""
+    num_lines = min(len(lines), len(seen_lines))
+    max_ratio_sum = 0.0
+    for line, seen_line in zip(lines, seen_lines):
+        length_sum = len(line) + len(seen_line)
+        if not length_sum:
+            max_ratio_sum += 1.0
+            continue
+        # Computed like CF's similarity ratio so that the bound is exact.
+        max_ratio_sum += (length_sum -
+                          abs(len(line) - len(seen_line))) / (1.0 * length_sum)
+    return max_ratio_sum / num_lines > CrashComparer.COMPARE_THRESHOLD
+
+
+class CrashDeduplicator:
+    """Finds crashes that aren't similar, according to CF's crash comparer, to
+    any crash seen before. Identical crash states are found with a hash lookup,
+    crash states sharing frames with an index of the frames and the others are
+    only compared if their frames' lengths allow them to be similar."""
+
+    def __init__(self):
+        self._seen = set()
+        # The lines of each crash state in |self._seen|.
+        self._seen_lines = {}
+        # Maps each frame to the crash states in |self._seen| containing it.
+        self._frames = collections.defaultdict(set)
+
+    def _is_similar_to_seen(self, crash_state, lines):
+        """Returns True if |crash_state| is similar to a crash seen before."""
+        if crash_state in self._seen:
+            return True
+        # CF only compares crash states with fuzzer hashes exactly.
+        if 'FuzzerHash=' in crash_state:
+            return False
+
+        # States sharing two frames are similar (if in the same order), so
+        # check those first.
+        candidates = set()
+        for line in lines:
+            candidates.update(self._frames.get(line, ()))
+        for seen_crash_state in candidates:
+            if _is_similar_crash(crash_state, seen_crash_state):
+                return True
+
+        for seen_crash_state, seen_lines in self._seen_lines.items():
+            if seen_crash_state in candidates:
+                continue
+            if not _may_have_similar_lines(lines, seen_lines):
+                continue
+            if _is_similar_crash(crash_state, seen_crash_state):
+                return True
+        return False
+
+    def add(self, crash_state):
+        """Adds |crash_state| to the crashes seen. Returns True if it isn't
+        similar to any crash seen before."""
+        # Empty crash states can't match anything.
+        if not crash_state:
+            return True
+        lines = crash_state.splitlines()
+        is_unique = not self._is_similar_to_seen(crash_state, lines)
+        if crash_state not in self._seen:
+            self._seen.add(crash_state)
+            self._seen_lines[crash_state] = lines
+            for line in lines:
+                self._frames[line].add(crash_state)
+        return is_unique
 
 
 def add_bugs_covered_column(experiment_df):
@@ -159,9 +295,15 @@ def add_bugs_covered_column(experiment_df):
     grouping2 = ['fuzzer', 'benchmark', 'trial_id']
     grouping3 = ['fuzzer', 'benchmark', 'trial_id', 'time']
     df = experiment_df.sort_values(grouping3)
-    df['firsts'] = (
-        df.groupby(grouping2, group_keys=False).apply(is_unique_crash) &
-        ~df.crash_key.isna())
+    crash_keys = df.crash_key.to_numpy()
+    firsts = np.zeros(len(df), dtype=bool)
+    for indices in df.groupby(grouping2, sort=False).indices.values():
+        deduplicator = CrashDeduplicator()
+        firsts[indices] = [
+            deduplicator.add(_get_crash_state(crash_keys[index]))
+            for index in indices
+        ]
+    df['firsts'] = firsts & ~df.crash_key.isna()
     df['bugs_cumsum'] = df.groupby(grouping2)['firsts'].transform('cumsum')
     df['bugs_covered'] = (
         df.groupby(grouping3)['bugs_cumsum'].transform('max').astype(int))
@@ -169,30 +311,71 @@ def add_bugs_covered_column(experiment_df):
     return new_df
 
 
+def _parse_fuzzer_stats(fuzzer_stats):
+    """Returns |fuzzer_stats| as a dictionary. They are dictionaries when read
+    from the database and strings when read from CSV files."""
+    if isinstance(fuzzer_stats, str):
+        try:
+            fuzzer_stats = ast.literal_eval(fuzzer_stats)
+        except (ValueError, SyntaxError):
+            return None
+    return fuzzer_stats if isinstance(fuzzer_stats, dict) else None
+
+
+def add_cpu_utilization_column(experiment_df):
+    """Returns a modified experiment df with a |cpu_utilization| column, the
+    effective CPU utilization of the fuzzer up to each snapshot (see
+    resource_usage.get_cpu_utilization). It is NaN if the fuzzer stats don't
+    have resource usage."""
+    if 'fuzzer_stats' not in experiment_df:
+        return experiment_df.assign(cpu_utilization=np.nan)
+    cpu_utilization = experiment_df.fuzzer_stats.map(
+        lambda fuzzer_stats: resource_usage.get_cpu_utilization(
+            _parse_fuzzer_stats(fuzzer_stats)))
+    return experiment_df.assign(
+        cpu_utilization=pd.to_numeric(cpu_utilization, errors='coerce'))
+
+
 # Creating "snapshots" (see README.md for definition).
 
 _MIN_FRACTION_OF_ALIVE_TRIALS_AT_SNAPSHOT = 0.5
 
 
-def get_benchmark_snapshot(benchmark_df,
-                           threshold=_MIN_FRACTION_OF_ALIVE_TRIALS_AT_SNAPSHOT):
+def get_snapshot_times(experiment_df,
+                       threshold=_MIN_FRACTION_OF_ALIVE_TRIALS_AT_SNAPSHOT):
     """Finds the latest time where |threshold| fraction of the trials were still
-    running. In most cases, this is the end of the experiment. However, if less
-    than |threshold| fraction of the trials reached the end of the experiment,
-    then we will use an earlier "snapshot" time for comparing results.
+    running, for every benchmark in |experiment_df| at once. In most cases, this
+    is the end of the experiment. However, if less than |threshold| fraction of
+    the trials reached the end of the experiment, then we will use an earlier
+    "snapshot" time for comparing results.
 
-    Returns a data frame that only contains the measurements of the picked
-    snapshot time.
+    Returns a series mapping each benchmark to its snapshot time.
     """
     # Allow overriding threshold with environment variable as well.
     threshold = environment.get('BENCHMARK_SAMPLE_NUM_THRESHOLD', threshold)
 
-    num_trials = benchmark_df.trial_id.nunique()
-    trials_running_at_time = benchmark_df.time.value_counts()
-    criteria = trials_running_at_time >= threshold * num_trials
-    ok_times = trials_running_at_time[criteria]
-    latest_ok_time = ok_times.index.max()
-    benchmark_snapshot_df = benchmark_df[benchmark_df.time == latest_ok_time]
+    num_trials = experiment_df.groupby('benchmark').trial_id.nunique()
+    trials_running_at_time = experiment_df.groupby(['benchmark', 'time']).size()
+    benchmarks = trials_running_at_time.index.get_level_values('benchmark')
+    criteria = (trials_running_at_time.to_numpy() >=
+                threshold * num_trials.reindex(benchmarks).to_numpy())
+    ok_times = trials_running_at_time[criteria].index.to_frame(index=False)
+    return ok_times.groupby('benchmark').time.max()
+
+
+def get_benchmark_snapshot(benchmark_df,
+                           threshold=_MIN_FRACTION_OF_ALIVE_TRIALS_AT_SNAPSHOT,
+                           snapshot_time=None):
+    """Returns a data frame that only contains the measurements of
+    |benchmark_df| made at the snapshot time of the benchmark (see
+    get_snapshot_times). |snapshot_time| can be passed if it is already
+    known."""
+    if snapshot_time is None:
+        snapshot_times = get_snapshot_times(benchmark_df, threshold)
+        if snapshot_times.empty:
+            return benchmark_df.iloc[0:0]
+        snapshot_time = snapshot_times.iloc[0]
+    benchmark_snapshot_df = benchmark_df[benchmark_df.time == snapshot_time]
     return benchmark_snapshot_df
 
 
@@ -216,17 +399,80 @@ def get_fuzzers_with_not_enough_samples(
     return few_sample_fuzzers.tolist()
 
 
-def get_experiment_snapshots(experiment_df):
+def get_experiment_snapshots(experiment_df, snapshot_times=None):
     """Finds a good snapshot time for each benchmark in the experiment data.
+    |snapshot_times| can be passed if they are already known (see
+    get_snapshot_times).
 
     Returns the data frame that only contains the measurements made at these
     snapshot times.
     """
-    benchmark_groups = experiment_df.groupby('benchmark')
-    experiment_snapshots = benchmark_groups.apply(get_benchmark_snapshot)
-    # We don't need the extra index added by the groupby('benchmark').
-    experiment_snapshots.reset_index(drop=True, inplace=True)
-    return experiment_snapshots
+    if snapshot_times is None:
+        snapshot_times = get_snapshot_times(experiment_df)
+    is_snapshot = (experiment_df.time.to_numpy() == experiment_df.benchmark.map(
+        snapshot_times).to_numpy())
+    experiment_snapshots = experiment_df[is_snapshot]
+    # Keep the benchmarks grouped, like they used to be.
+    experiment_snapshots = experiment_snapshots.sort_values('benchmark',
+                                                            kind='stable')
+    return experiment_snapshots.reset_index(drop=True)
+
+
+# Coverage growth over time.
+
+# Growth series of a benchmark with more measurement times than this are
+# downsampled to about this many times.
+_MAX_GROWTH_TIMES = 200
+
+_GROWTH_CONFIDENCE_LEVEL = 0.95
+
+
+def _is_growth_time(experiment_df, max_times):
+    """Returns a bool array that is True for the rows of |experiment_df|
+    measured at one of the times kept when downsampling each benchmark to
+    about |max_times| times. The first and the last times are always kept."""
+    times = experiment_df[['benchmark', 'time']].drop_duplicates()
+    times = times.sort_values(['benchmark', 'time'])
+    benchmark_groups = times.groupby('benchmark')
+    ranks = benchmark_groups.cumcount().to_numpy()
+    num_times = benchmark_groups.time.transform('size').to_numpy()
+    steps = np.ceil(num_times / max_times)
+    kept_times = times[(ranks % steps == 0) | (ranks == num_times - 1)]
+    return pd.MultiIndex.from_frame(experiment_df[['benchmark', 'time']]).isin(
+        pd.MultiIndex.from_frame(kept_times))
+
+
+def get_coverage_growth_bands(experiment_df,
+                              key='edges_covered',
+                              confidence_level=_GROWTH_CONFIDENCE_LEVEL,
+                              max_times=_MAX_GROWTH_TIMES):
+    """Returns the median of |key| over the trials of each fuzzer on each
+    benchmark at each time, with columns:
+    |benchmark|fuzzer|time|median|lower|upper|
+    |lower| and |upper| bound the distribution-free confidence interval of the
+    median at |confidence_level|, they are the order statistics whose ranks
+    come from the binomial distribution. They are left out if
+    |confidence_level| is None. Benchmarks measured at more than |max_times|
+    times are downsampled.
+    """
+    df = experiment_df[['benchmark', 'fuzzer', 'time', key]].dropna()
+    df = df[_is_growth_time(df, max_times)]
+    grouping = ['benchmark', 'fuzzer', 'time']
+    df = df.sort_values(grouping + [key])
+    # Groups are in the order of |df| so that the order statistics can be
+    # picked by position.
+    groups = df.groupby(grouping, sort=False)[key]
+    bands = groups.median().rename('median').to_frame()
+    if confidence_level is not None:
+        sizes = groups.size().to_numpy()
+        starts = np.cumsum(sizes) - sizes
+        lower_ranks = np.maximum(
+            stats.binom.ppf(
+                (1 - confidence_level) / 2, sizes, 0.5).astype(int) - 1, 0)
+        values = df[key].to_numpy()
+        bands['lower'] = values[starts + lower_ranks]
+        bands['upper'] = values[starts + sizes - 1 - lower_ranks]
+    return bands.reset_index()
 
 
 # Summary tables containing statistics on the samples.
@@ -311,9 +557,7 @@ def benchmark_rank_by_stat_test_wins(benchmark_snapshot_df,
     p_values = stat_tests.one_sided_u_test(benchmark_snapshot_df, key=key)
 
     # Turn "significant" p-values into 1-s.
-    better_than = p_values.applymap(
-        lambda p: p < stat_tests.SIGNIFICANCE_THRESHOLD)
-    better_than = better_than.applymap(int)
+    better_than = (p_values < stat_tests.SIGNIFICANCE_THRESHOLD).astype(int)
 
     score = better_than.sum(axis=1).sort_values(ascending=False)
     score.rename('stat wins', inplace=True)
@@ -327,9 +571,7 @@ def create_better_than_table(benchmark_snapshot_df, key='edges_covered'):
     p_values = stat_tests.one_sided_u_test(benchmark_snapshot_df, key=key)
 
     # Turn "significant" p-values into 1-s.
-    better_than = p_values.applymap(
-        lambda p: p < stat_tests.SIGNIFICANCE_THRESHOLD)
-    better_than = better_than.applymap(int)
+    better_than = (p_values < stat_tests.SIGNIFICANCE_THRESHOLD).astype(int)
 
     # Order rows and columns of matrix according to score ranking.
     score = better_than.sum(axis=1).sort_values(ascending=False)
@@ -114,12 +114,19 @@ class ExperimentResults:  # pylint: disable=too-many-instance-attributes
         df.index = df.index.map(lambda fuzzer: description_link(commit, fuzzer))
         return df
 
+    @functools.cached_property
+    def _snapshot_times(self):
+        """Snapshot time of each benchmark, shared by every benchmark and
+        plot."""
+        return data_utils.get_snapshot_times(self._experiment_df)
+
     @functools.cached_property
     def _experiment_snapshots_df(self):
         """Data frame containing only the time snapshots, for each benchmark,
         based on which we do further analysis, i.e., statistical tests and
         ranking."""
-        return data_utils.get_experiment_snapshots(self._experiment_df)
+        return data_utils.get_experiment_snapshots(self._experiment_df,
+                                                   self._snapshot_times)
 
     @property
     @functools.lru_cache()
@@ -135,7 +142,8 @@ class ExperimentResults:  # pylint: disable=too-many-instance-attributes
             benchmark_results.BenchmarkResults(name, self._experiment_df,
                                                self._coverage_dict,
                                                self._output_directory,
-                                               self._plotter)
+                                               self._plotter,
+                                               self._snapshot_times.get(name))
             for name in sorted(benchmark_names)
         ]
 
@@ -211,6 +219,37 @@ class ExperimentResults:  # pylint: disable=too-many-instance-attributes
         """Summary table of median relative bug coverage."""
         return self._relative_summary_table(key_column='bugs_covered')
 
+    @property
+    @functools.lru_cache()
+    def cpu_utilization_summary_table(self):
+        """A pivot table of the mean effective CPU utilization of each fuzzer
+        on each benchmark, at the end of each trial. None if the fuzzers'
+        resource usage wasn't recorded."""
+        if ('cpu_utilization' not in self._full_experiment_df or
+                self._full_experiment_df.cpu_utilization.isna().all()):
+            return None
+        trials_df = self._full_experiment_df.dropna(subset=['cpu_utilization'])
+        trials_df = trials_df.sort_values('time').groupby(
+            ['experiment', 'trial_id']).tail(1)
+        pivot = trials_df.pivot_table(index='benchmark',
+                                      columns='fuzzer',
+                                      values='cpu_utilization',
+                                      aggfunc='mean')
+        pivot = pivot.rename_axis(index=None, columns=None)
+
+        # Add row for the mean utilization, at the top.
+        nrows, _ = pivot.shape
+        pivot.loc['FuzzerMean'] = pivot.iloc[0:nrows].mean()
+        row_index = pivot.index.to_list()
+        pivot = pivot.reindex(row_index[-1:] + row_index[:-1])
+        idx = pd.IndexSlice['FuzzerMean', :]
+
+        pivot = pivot.style\
+                .format('{:.0%}', na_rep='-')\
+                .apply(data_utils.underline_row, axis=1, subset=idx)\
+                .set_table_styles(self._SUMMARY_TABLE_STYLE)
+        return pivot
+
     @property
     def found_bugs_summary_table(self):
         """A pivot table of total found bugs by each fuzzer on each
@@ -14,6 +14,7 @@
 """Report generator tool."""
 
 import argparse
+import concurrent.futures
 import os
 import sys
 
@@ -25,12 +26,19 @@ from analysis import experiment_results
 from analysis import plotting
 from analysis import queries
 from analysis import rendering
+from analysis import results_store
 from common import filesystem
 from common import logs
 
 logger = logs.Logger()
 
+# Directory for caches kept between reports. They aren't written to the report
+# directory so that they aren't published with the report.
+REPORT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'fuzzbench',
+                                'report')
+
 DATA_FILENAME = 'data.csv.gz'
+COVERAGE_GROWTH_FILENAME = 'coverage_growth.csv.gz'
 
 
 def get_arg_parser():
@@ -85,6 +93,24 @@ def get_arg_parser():
         action='store_true',
         default=False,
         help='If set, clang coverage reports and differential plots are shown.')
+    parser.add_argument(
+        '--coverage-cache-dir',
+        default=None,
+        help=('Directory for caching coverage data downloaded for the '
+              'coverage report. Default: '
+              f'{coverage_data_utils.COVERAGE_CACHE_DIR}'))
+    parser.add_argument(
+        '--plot-cache',
+        action='store_true',
+        default=False,
+        help=('If set, plots whose data did not change since the last report '
+              'written to the same directory are not rendered again, and '
+              'crashes compared for it are not compared again.'))
+    parser.add_argument(
+        '--cache-dir',
+        default=None,
+        help=('Directory for the caches used by --plot-cache, kept outside of '
+              f'the report. Default: {REPORT_CACHE_DIR}'))
 
     # It doesn't make sense to clobber and label by experiment, since nothing
     # can get clobbered like this.
@@ -124,14 +150,67 @@ def get_arg_parser():
         help=('If set, and the experiment data is already cached, '
               'don\'t query the database again to get the data.'))
 
+    parser.add_argument(
+        '--use-results-store',
+        action='store_true',
+        default=False,
+        help=('If set, the data of finished experiments is read from (and '
+              'stored in) their filestore instead of the database.'))
+
     return parser
 
 
-def get_experiment_data(experiment_names,
-                        main_experiment_name,
-                        from_cached_data,
-                        data_path,
-                        main_experiment_benchmarks=None):
+def _get_finished_experiment_data(experiment_name, experiment_filestore):
+    """Returns the data of |experiment_name|, which ended, from the results
+    store. It is read from the database and stored first if needed."""
+    experiment_df = results_store.load(experiment_name, experiment_filestore)
+    if experiment_df is not None:
+        return experiment_df
+    logger.info('Storing the data of %s.', experiment_name)
+    experiment_df = data_utils.add_bugs_covered_column(
+        queries.get_experiment_data([experiment_name]))
+    experiment_df = data_utils.add_cpu_utilization_column(experiment_df)
+    results_store.store(experiment_name, experiment_filestore, experiment_df)
+    return experiment_df
+
+
+def get_experiment_data_from_results_store(experiment_names,
+                                           main_experiment_benchmarks=None):
+    """Returns the data of |experiment_names| with bugs covered counted. The
+    data of experiments that ended comes from the results store, only the
+    experiments still running are queried from the database."""
+    finished_experiments = queries.get_finished_experiment_filestores(
+        experiment_names)
+    with concurrent.futures.ThreadPoolExecutor(
+            results_store.LOAD_WORKERS) as executor:
+        finished_dfs = executor.map(_get_finished_experiment_data,
+                                    finished_experiments.keys(),
+                                    finished_experiments.values())
+        experiment_dfs = dict(zip(finished_experiments, finished_dfs))
+
+    live_experiments = [
+        name for name in experiment_names if name not in finished_experiments
+    ]
+    if live_experiments:
+        experiment_dfs[None] = data_utils.add_cpu_utilization_column(
+            data_utils.add_bugs_covered_column(
+                queries.get_experiment_data(live_experiments,
+                                            main_experiment_benchmarks)))
+
+    experiment_df = pd.concat(experiment_dfs.values(), ignore_index=True)
+    if main_experiment_benchmarks:
+        experiment_df = experiment_df[experiment_df.benchmark.isin(
+            main_experiment_benchmarks)]
+    return experiment_df
+
+
+def get_experiment_data(  # pylint: disable=too-many-arguments
+        experiment_names,
+        main_experiment_name,
+        from_cached_data,
+        data_path,
+        main_experiment_benchmarks=None,
+        use_results_store=False):
     """Helper function that reads data from disk or from the database. Returns a
     dataframe and the experiment description."""
     if from_cached_data and os.path.exists(data_path):
@@ -140,8 +219,12 @@ def get_experiment_data(experiment_names,
         logger.info('Done reading data from %s.', data_path)
         return experiment_df, 'from cached data'
     logger.info('Reading experiment data from db.')
-    experiment_df = queries.get_experiment_data(experiment_names,
-                                                main_experiment_benchmarks)
+    if use_results_store:
+        experiment_df = get_experiment_data_from_results_store(
+            experiment_names, main_experiment_benchmarks)
+    else:
+        experiment_df = queries.get_experiment_data(experiment_names,
+                                                    main_experiment_benchmarks)
     logger.info('Done reading experiment data from db.')
     description = queries.get_experiment_description(main_experiment_name)
     return experiment_df, description
@@ -187,6 +270,19 @@ def modify_experiment_data_if_requested(  # pylint: disable=too-many-arguments
 
 
 # pylint: disable=too-many-arguments,too-many-locals
+def write_coverage_growth_data(experiment_df, path):
+    """Writes the median coverage (and bug coverage) of each fuzzer on each
+    benchmark over time, with its confidence interval, to |path|."""
+    growth_dfs = []
+    for key in ['edges_covered', 'bugs_covered']:
+        if key not in experiment_df.columns:
+            continue
+        growth_df = data_utils.get_coverage_growth_bands(experiment_df, key)
+        growth_df.insert(0, 'key', key)
+        growth_dfs.append(growth_df)
+    pd.concat(growth_dfs).to_csv(path, index=False)
+
+
 def generate_report(experiment_names,
                     report_directory,
                     report_name=None,
@@ -202,8 +298,14 @@ def generate_report(experiment_names,
                     merge_with_clobber=False,
                     merge_with_clobber_nonprivate=False,
                     coverage_report=False,
-                    experiment_benchmarks=None):
-    """Generate report helper."""
+                    experiment_benchmarks=None,
+                    coverage_cache_dir=None,
+                    plot_cache=False,
+                    use_results_store=False,
+                    cache_dir=None):
+    """Generate report helper. Returns the paths, relative to
+    |report_directory|, of the plots of the previous report that were removed
+    because this one doesn't have them."""
     if merge_with_clobber_nonprivate:
         experiment_names = (
             queries.add_nonprivate_experiments_for_merge_with_clobber(
@@ -215,13 +317,21 @@ def generate_report(experiment_names,
 
     filesystem.create_directory(report_directory)
 
+    cache_dir = cache_dir or REPORT_CACHE_DIR
+    crash_similarity_cache_path = None
+    if plot_cache:
+        crash_similarity_cache_path = os.path.join(
+            cache_dir, data_utils.CRASH_SIMILARITY_CACHE_FILENAME)
+        data_utils.load_crash_similarity_cache(crash_similarity_cache_path)
+
     data_path = os.path.join(report_directory, DATA_FILENAME)
     experiment_df, experiment_description = get_experiment_data(
         experiment_names,
         main_experiment_name,
         from_cached_data,
         data_path,
-        main_experiment_benchmarks=experiment_benchmarks)
+        main_experiment_benchmarks=experiment_benchmarks,
+        use_results_store=use_results_store)
 
     # TODO(metzman): Ensure that each experiment is in the df. Otherwise there
     # is a good chance user misspelled something.
@@ -231,24 +341,36 @@ def generate_report(experiment_names,
         experiment_df, experiment_names, benchmarks, fuzzers,
         label_by_experiment, end_time, merge_with_clobber)
 
-    # Add |bugs_covered| column prior to export.
-    experiment_df = data_utils.add_bugs_covered_column(experiment_df)
+    # Add |bugs_covered| column prior to export. Data from the results store
+    # already has it, and |cpu_utilization|.
+    if 'bugs_covered' not in experiment_df.columns:
+        experiment_df = data_utils.add_bugs_covered_column(experiment_df)
+    if 'cpu_utilization' not in experiment_df.columns:
+        experiment_df = data_utils.add_cpu_utilization_column(experiment_df)
+    if crash_similarity_cache_path:
+        data_utils.save_crash_similarity_cache(crash_similarity_cache_path)
 
     # Save the filtered raw data along with the report if not using cached data
     # or if the data does not exist.
     if not from_cached_data or not os.path.exists(data_path):
         experiment_df.to_csv(data_path)
 
+    # Save the coverage growth medians, e.g. for interactive plots.
+    write_coverage_growth_data(
+        experiment_df, os.path.join(report_directory, COVERAGE_GROWTH_FILENAME))
+
     # Load the coverage json summary file.
     coverage_dict = {}
     if coverage_report:
         logger.info('Generating coverage report info.')
         coverage_dict = coverage_data_utils.get_covered_branches_dict(
-            experiment_df)
+            experiment_df, coverage_cache_dir)
         logger.info('Finished generating coverage report info.')
 
     fuzzer_names = experiment_df.fuzzer.unique()
-    plotter = plotting.Plotter(fuzzer_names, quick, log_scale)
+    # Plots are only recorded while rendering the template and written in
+    # parallel afterwards.
+    plotter = plotting.Plotter(fuzzer_names, quick, log_scale, deferred=True)
     experiment_ctx = experiment_results.ExperimentResults(
         experiment_df,
         coverage_dict,
@@ -263,8 +385,19 @@ def generate_report(experiment_names,
                                               experiment_description)
     logger.info('Done rendering HTML report.')
 
+    logger.info('Rendering plots.')
+    plot_cache_path = None
+    if plot_cache:
+        plot_cache_path = plotting.get_plot_cache_path(cache_dir,
+                                                       report_directory)
+    removed_images = plotter.render_deferred_plots(cache_path=plot_cache_path)
+    logger.info('Done rendering plots.')
+
     filesystem.write(os.path.join(report_directory, 'index.html'),
                      detailed_report)
+    return [
+        os.path.relpath(image, report_directory) for image in removed_images
+    ]
 
 
 def main():
@@ -274,20 +407,25 @@ def main():
     parser = get_arg_parser()
     args = parser.parse_args()
 
-    generate_report(experiment_names=args.experiments,
-                    report_directory=args.report_dir,
-                    report_name=args.report_name,
-                    label_by_experiment=args.label_by_experiment,
-                    benchmarks=args.benchmarks,
-                    fuzzers=args.fuzzers,
-                    report_type=args.report_type,
-                    quick=args.quick,
-                    log_scale=args.log_scale,
-                    from_cached_data=args.from_cached_data,
-                    end_time=args.end_time,
-                    merge_with_clobber=args.merge_with_clobber,
-                    merge_with_clobber_nonprivate=args.merge_with_clobber_nonprivate,
-                    coverage_report=args.coverage_report)
+    generate_report(
+        experiment_names=args.experiments,
+        report_directory=args.report_dir,
+        report_name=args.report_name,
+        label_by_experiment=args.label_by_experiment,
+        benchmarks=args.benchmarks,
+        fuzzers=args.fuzzers,
+        report_type=args.report_type,
+        quick=args.quick,
+        log_scale=args.log_scale,
+        from_cached_data=args.from_cached_data,
+        end_time=args.end_time,
+        merge_with_clobber=args.merge_with_clobber,
+        merge_with_clobber_nonprivate=args.merge_with_clobber_nonprivate,
+        coverage_report=args.coverage_report,
+        coverage_cache_dir=args.coverage_cache_dir,
+        plot_cache=args.plot_cache,
+        use_results_store=args.use_results_store,
+        cache_dir=args.cache_dir)
 
 
 if __name__ == '__main__':
@@ -13,17 +13,108 @@
 # limitations under the License.
 """Plotting functions."""
 
+import collections
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+
 import numpy as np
 import Orange
+import pandas as pd
 import seaborn as sns
 
 from matplotlib import colors
 from matplotlib import pyplot as plt
 from analysis import data_utils
+from common import filesystem
 
 _DEFAULT_TICKS_COUNT = 12
 _DEFAULT_LABEL_ROTATION = 30
 
+# Prefix of the files mapping the images of a report to the keys of their
+# plots. They are kept outside of the report directory (see
+# get_plot_cache_path) so that they aren't published with the report.
+PLOT_CACHE_PREFIX = 'plot_cache-'
+
+# Change this to render every cached plot again, e.g. after changing how plots
+# look.
+PLOT_CACHE_VERSION = 1
+
+# A plot written by a deferred Plotter. |method| is the name of the "write_"
+# method of the Plotter that writes it.
+DeferredPlot = collections.namedtuple('DeferredPlot',
+                                      ['method', 'args', 'kwargs'])
+
+
+def _deferrable(write_method):
+    """Decorator for the "write_" methods of Plotter. If the plotter is
+    deferred, the plot is recorded instead of written, so that all plots can
+    be written in parallel by render_deferred_plots."""
+    signature = inspect.signature(write_method)
+
+    @functools.wraps(write_method)
+    def wrapper(self, *args, **kwargs):
+        if not self._deferred:  # pylint: disable=protected-access
+            return write_method(self, *args, **kwargs)
+        image_path = signature.bind(self, *args,
+                                    **kwargs).arguments['image_path']
+        # Only the last plot written to an image matters.
+        self._deferred_plots[str(image_path)] = DeferredPlot(  # pylint: disable=protected-access
+            write_method.__name__, args, kwargs)
+        return None
+
+    return wrapper
+
+
+def _hash_plot_input(hasher, value):
+    """Updates |hasher| with the contents of |value|, an argument of a plot."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        hasher.update(type(value).__name__.encode())
+        hasher.update(
+            repr(value.dtypes.to_dict() if isinstance(value, pd.DataFrame) else
+                 (value.name, value.dtype)).encode())
+        hasher.update(
+            pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, (list, tuple)):
+        hasher.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _hash_plot_input(hasher, item)
+    elif isinstance(value, dict):
+        hasher.update(f'dict{len(value)}'.encode())
+        for key in sorted(value):
+            _hash_plot_input(hasher, key)
+            _hash_plot_input(hasher, value[key])
+    else:
+        hasher.update(repr(value).encode())
+
+
+def get_plot_cache_path(cache_dir, report_directory):
+    """Returns the path in |cache_dir| of the plot cache of the report written
+    to |report_directory|."""
+    digest = hashlib.sha256(
+        os.path.abspath(report_directory).encode()).hexdigest()
+    return os.path.join(cache_dir, f'{PLOT_CACHE_PREFIX}{digest[:16]}.json')
+
+
+def _read_plot_cache(cache_path):
+    """Returns the dictionary mapping images to the keys of the plots in
+    them stored in |cache_path|."""
+    try:
+        with open(cache_path, encoding='utf-8') as file_handle:
+            return json.load(file_handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _render_deferred_plot(plotter, deferred_plot):
+    """Writes |deferred_plot| using |plotter|."""
+    getattr(plotter, deferred_plot.method)(*deferred_plot.args,
+                                           **deferred_plot.kwargs)
+
 
 def _formatted_hour_min(seconds):
     """Turns |seconds| seconds into %H:%m format.
@@ -94,9 +185,10 @@ class Plotter:
         'X', ',', '.'
     ]
 
-    def __init__(self, fuzzers, quick=False, logscale=False):
+    def __init__(self, fuzzers, quick=False, logscale=False, deferred=False):
         """Instantiates plotter with list of |fuzzers|. If |quick| is True,
-        creates plots faster but, with less detail.
+        creates plots faster but, with less detail. If |deferred| is True,
+        plots are only written when render_deferred_plots is called.
         """
         self._fuzzer_colors = {
             fuzzer: self._COLOR_PALETTE[idx % len(self._COLOR_PALETTE)]
@@ -109,6 +201,76 @@ class Plotter:
 
         self._quick = quick
         self._logscale = logscale
+        self._deferred = deferred
+        self._deferred_plots = {}
+
+    def _get_plot_key(self, deferred_plot):
+        """Returns a key identifying the image written for |deferred_plot|.
+        It depends on the type of plot, its inputs and the plotter's
+        options."""
+        hasher = hashlib.sha256()
+        _hash_plot_input(hasher, [
+            PLOT_CACHE_VERSION, deferred_plot.method, self._fuzzer_colors,
+            self._fuzzer_markers, self._quick, self._logscale,
+            deferred_plot.args, deferred_plot.kwargs
+        ])
+        return hasher.hexdigest()
+
+    def render_deferred_plots(self, processes=None, cache_path=None):
+        """Writes the plots recorded by a deferred plotter using a pool of
+        |processes| (the number of CPUs by default). If |cache_path| is given,
+        it stores the key of each image, and images whose plot has the same key
+        as last time are left as they are. Images written last time that
+        aren't plotted anymore are removed and returned."""
+        deferred_plots = self._deferred_plots
+        self._deferred_plots = {}
+        if cache_path is None:
+            self._render_plots(list(deferred_plots.values()), processes)
+            return []
+
+        cache = _read_plot_cache(cache_path)
+        keys = {}
+        stale_plots = []
+        for image_path, deferred_plot in deferred_plots.items():
+            image = os.path.abspath(image_path)
+            keys[image] = self._get_plot_key(deferred_plot)
+            if cache.get(image) != keys[image] or not os.path.exists(image):
+                stale_plots.append(deferred_plot)
+        self._render_plots(stale_plots, processes)
+
+        removed_images = sorted(set(cache) - set(keys))
+        for image in removed_images:
+            try:
+                os.remove(image)
+            except FileNotFoundError:
+                pass
+
+        # Only written once every image is, so that an interrupted render
+        # can't leave an outdated image behind a new key.
+        filesystem.create_directory(os.path.dirname(cache_path))
+        with open(cache_path, 'w', encoding='utf-8') as file_handle:
+            json.dump(keys, file_handle, indent=2, sort_keys=True)
+        return removed_images
+
+    def _render_plots(self, deferred_plots, processes):
+        """Writes |deferred_plots| using a pool of |processes|."""
+        if not deferred_plots:
+            return
+        plotter = copy.copy(self)
+        plotter._deferred = False  # pylint: disable=protected-access
+        plotter._deferred_plots = {}  # pylint: disable=protected-access
+
+        processes = min(processes or multiprocessing.cpu_count(),
+                        len(deferred_plots))
+        if processes == 1:
+            for deferred_plot in deferred_plots:
+                _render_deferred_plot(plotter, deferred_plot)
+            return
+        with multiprocessing.Pool(processes) as pool:
+            pool.starmap(
+                _render_deferred_plot,
+                [(plotter, deferred_plot) for deferred_plot in deferred_plots],
+                chunksize=1)
 
     def _write_plot_to_image(self,
                              plot_function,
@@ -137,38 +299,54 @@ class Plotter:
         if snapshot:
             assert benchmark_df.time.nunique() == 1, 'Not a snapshot!'
 
-    def coverage_growth_plot(self,
-                             benchmark_df,
-                             axes=None,
-                             logscale=False,
-                             bugs=False):
+    def coverage_growth_plot(  # pylint: disable=too-many-arguments
+            self,
+            benchmark_df,
+            axes=None,
+            logscale=False,
+            bugs=False,
+            snapshot_time=None):
         """Draws edge (or bug) coverage growth plot on given |axes|.
 
         The fuzzer labels will be in the order of their mean coverage at the
-        snapshot time (typically, the end of experiment).
+        snapshot time (typically, the end of experiment). The |snapshot_time|
+        is computed from |benchmark_df| if not given.
         """
         self._common_datafame_checks(benchmark_df)
 
         column_of_interest = 'bugs_covered' if bugs else 'edges_covered'
 
-        benchmark_snapshot_df = data_utils.get_benchmark_snapshot(benchmark_df)
+        benchmark_snapshot_df = data_utils.get_benchmark_snapshot(
+            benchmark_df, snapshot_time=snapshot_time)
         snapshot_time = benchmark_snapshot_df.time.unique()[0]
         fuzzer_order = data_utils.benchmark_rank_by_mean(
             benchmark_snapshot_df, key=column_of_interest).index
 
-        axes = sns.lineplot(
-            y=column_of_interest,
-            x='time',
-            hue='fuzzer',
-            hue_order=fuzzer_order,
-            data=benchmark_df[benchmark_df.time <= snapshot_time],
-            ci=None if bugs or self._quick else 95,
-            estimator=np.median,
-            palette=self._fuzzer_colors,
-            style='fuzzer',
-            dashes=False,
-            markers=self._fuzzer_markers,
-            ax=axes)
+        # Medians and their confidence intervals are computed up front, which
+        # is much faster than letting seaborn bootstrap them.
+        bands = data_utils.get_coverage_growth_bands(
+            benchmark_df[benchmark_df.time <= snapshot_time],
+            key=column_of_interest,
+            confidence_level=None if bugs or self._quick else 0.95)
+        axes = sns.lineplot(y='median',
+                            x='time',
+                            hue='fuzzer',
+                            hue_order=fuzzer_order,
+                            data=bands,
+                            estimator=None,
+                            palette=self._fuzzer_colors,
+                            style='fuzzer',
+                            dashes=False,
+                            markers=self._fuzzer_markers,
+                            ax=axes)
+        if 'lower' in bands:
+            for fuzzer, fuzzer_bands in bands.groupby('fuzzer'):
+                axes.fill_between(fuzzer_bands.time,
+                                  fuzzer_bands.lower,
+                                  fuzzer_bands.upper,
+                                  color=self._fuzzer_colors[fuzzer],
+                                  alpha=0.2,
+                                  linewidth=0)
 
         axes.set_title(_formatted_title(benchmark_snapshot_df))
 
@@ -205,20 +383,23 @@ class Plotter:
         plt.xlim(0)
         sns.despine(ax=axes, trim=True)
 
+    @_deferrable
     def write_coverage_growth_plot(  # pylint: disable=too-many-arguments
             self,
             benchmark_df,
             image_path,
             wide=False,
             logscale=False,
-            bugs=False):
+            bugs=False,
+            snapshot_time=None):
         """Writes coverage growth plot."""
         self._write_plot_to_image(self.coverage_growth_plot,
                                   benchmark_df,
                                   image_path,
                                   wide=wide,
                                   logscale=logscale,
-                                  bugs=bugs)
+                                  bugs=bugs,
+                                  snapshot_time=snapshot_time)
 
     def box_or_violin_plot(self,
                            benchmark_snapshot_df,
@@ -272,6 +453,7 @@ class Plotter:
 
         sns.despine(ax=axes, trim=True)
 
+    @_deferrable
     def write_violin_plot(self, benchmark_snapshot_df, image_path, bugs=False):
         """Writes violin plot."""
         self._write_plot_to_image(self.box_or_violin_plot,
@@ -280,6 +462,7 @@ class Plotter:
                                   bugs=bugs,
                                   violin=True)
 
+    @_deferrable
     def write_box_plot(self, benchmark_snapshot_df, image_path, bugs=False):
         """Writes box plot."""
         self._write_plot_to_image(self.box_or_violin_plot,
@@ -316,6 +499,7 @@ class Plotter:
                              rotation=_DEFAULT_LABEL_ROTATION,
                              horizontalalignment='right')
 
+    @_deferrable
     def write_distribution_plot(self, benchmark_snapshot_df, image_path):
         """Writes distribution plot."""
         self._write_plot_to_image(self.distribution_plot, benchmark_snapshot_df,
@@ -351,6 +535,7 @@ class Plotter:
 
         sns.despine(ax=axes, trim=True)
 
+    @_deferrable
     def write_ranking_plot(self, benchmark_snapshot_df, image_path):
         """Writes ranking plot."""
         self._write_plot_to_image(self.ranking_plot, benchmark_snapshot_df,
@@ -376,6 +561,7 @@ class Plotter:
                              rotation=_DEFAULT_LABEL_ROTATION,
                              horizontalalignment='right')
 
+    @_deferrable
     def write_better_than_plot(self, better_than_table, image_path):
         """Writes better than plot."""
         self._write_plot_to_image(self.better_than_plot, better_than_table,
@@ -439,6 +625,7 @@ class Plotter:
         cbar_ax.ax.tick_params(size=0)
         return axis
 
+    @_deferrable
     def write_heatmap_plot(self, p_values, image_path, symmetric=False):
         """Writes heatmap plot."""
         self._write_plot_to_image(self._pvalue_heatmap_plot,
@@ -474,11 +661,13 @@ class Plotter:
                                           heatmap_args,
                                           shrink_cbar=0.1)
 
+    @_deferrable
     def write_a12_heatmap_plot(self, a12_values, image_path):
         """Writes A12 heatmap plot."""
         self._write_plot_to_image(self._a12_heatmap_plot, a12_values,
                                   image_path)
 
+    @_deferrable
     def write_critical_difference_plot(self, average_ranks, num_of_benchmarks,
                                        image_path):
         """Writes critical difference diagram."""
@@ -534,6 +723,7 @@ class Plotter:
 
         sns.despine(ax=axes, trim=True)
 
+    @_deferrable
     def write_unique_coverage_ranking_plot(self, unique_branch_cov_df_combined,
                                            image_path):
         """Writes ranking plot for unique coverage."""
@@ -559,6 +749,7 @@ class Plotter:
         axes.set(ylabel='Not covered by')
         axes.set(xlabel='Covered by')
 
+    @_deferrable
     def write_pairwise_unique_coverage_heatmap_plot(
             self, pairwise_unique_coverage_table, image_path):
         """Writes pairwise unique coverage heatmap plot."""
@@ -55,6 +55,17 @@ def get_experiment_description(experiment_name):
                 .filter(Experiment.name == experiment_name).one()
 
 
+def get_finished_experiment_filestores(experiment_names):
+    """Returns a dictionary mapping each of |experiment_names| that ended to
+    its experiment filestore."""
+    with db_utils.session_scope() as session:
+        finished_experiments = session.query(
+            Experiment.name, Experiment.experiment_filestore).filter(
+                Experiment.name.in_(experiment_names),
+                ~Experiment.time_ended.is_(None))
+        return dict(finished_experiments.all())
+
+
 def add_nonprivate_experiments_for_merge_with_clobber(experiment_names):
     """Returns a new list containing experiment names preeceeded by a list of
     nonprivate experiments in the order in which they were run, such that
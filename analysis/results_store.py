@@ -0,0 +1,77 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Store of the data of finished experiments. Finished experiments never
+change, so their data only needs to be read from the database and processed
+(e.g. counting the bugs covered) once. It is then stored in the experiment's
+filestore, where reports merging many experiments read it from.
+
+The data is stored as JSON with a table schema, so that it is loaded as it
+was stored, e.g. the dictionaries in fuzzer_stats, the dtypes of the columns
+and missing values, regardless of the versions of python and pandas used.
+Loading it doesn't run any code from the filestore. Only the rows of an
+experiment, with the columns derived from them alone, are stored. Tables
+derived for reports (snapshots, summaries, unique coverage) are not, since they
+depend on the other experiments, benchmarks and fuzzers in the report and on
+its options."""
+
+import os
+import posixpath
+import tempfile
+from typing import Optional
+
+import pandas as pd
+
+from common import filestore_utils
+from common import logs
+
+# Change this whenever the data stored changes, e.g. when adding columns.
+VERSION = 3
+FILENAME = f'experiment_data-v{VERSION}.json.gz'
+
+# Maximum number of experiments whose data is loaded concurrently.
+LOAD_WORKERS = 16
+
+logger = logs.Logger()  # pylint: disable=invalid-name
+
+
+def get_filestore_path(experiment: str, experiment_filestore: str) -> str:
+    """Returns the path of the stored data of |experiment| in
+    |experiment_filestore|."""
+    return posixpath.join(experiment_filestore, experiment, 'results', FILENAME)
+
+
+def load(experiment: str, experiment_filestore: str) -> Optional[pd.DataFrame]:
+    """Returns the stored data of |experiment| or None if it wasn't stored."""
+    filestore_path = get_filestore_path(experiment, experiment_filestore)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        local_path = os.path.join(temp_dir, FILENAME)
+        if filestore_utils.cp(filestore_path, local_path,
+                              expect_zero=False).retcode:
+            return None
+        return pd.read_json(local_path, orient='table')
+
+
+def store(experiment: str, experiment_filestore: str,
+          experiment_df: pd.DataFrame) -> bool:
+    """Stores |experiment_df|, the data of |experiment|. Returns True on
+    success."""
+    filestore_path = get_filestore_path(experiment, experiment_filestore)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        local_path = os.path.join(temp_dir, FILENAME)
+        experiment_df.to_json(local_path, orient='table', index=False)
+        if filestore_utils.cp(local_path, filestore_path,
+                              expect_zero=False).retcode:
+            logger.error('Failed to store the data of %s.', experiment)
+            return False
+    return True
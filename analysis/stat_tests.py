@@ -13,6 +13,10 @@
 # limitations under the License.
 """Statistical tests."""
 
+import collections
+import hashlib
+import threading
+
 import numpy as np
 import pandas as pd
 import scikit_posthocs as sp
@@ -20,6 +24,26 @@ import scipy.stats as ss
 
 SIGNIFICANCE_THRESHOLD = 0.05
 
+# ss.mannwhitneyu uses the exact distribution of U if either sample is at most
+# this large and there are no ties, otherwise the normal approximation.
+MAX_EXACT_MANN_WHITNEY_SIZE = 8
+
+# Number of benchmark snapshots and keys whose pairwise statistics are kept.
+PAIRWISE_STATISTICS_CACHE_SIZE = 256
+
+# The Mann-Whitney U statistics of every pair of fuzzers on a benchmark. Each
+# matrix has a row and a column for each of |fuzzers|. |u_statistics| is the U
+# statistic of the samples of the row's fuzzer against the column's fuzzer's.
+# |tie_terms| is the sum of t^3 - t over the groups of t tied values in the
+# samples of both fuzzers. |same_values| is True if both fuzzers have the same
+# set of values, the tables have no result for those pairs.
+PairwiseStatistics = collections.namedtuple(
+    'PairwiseStatistics',
+    ['fuzzers', 'samples', 'sizes', 'u_statistics', 'tie_terms', 'same_values'])
+
+_pairwise_statistics_cache = collections.OrderedDict()
+_pairwise_statistics_lock = threading.Lock()
+
 
 def _create_pairwise_table(benchmark_snapshot_df, key, statistical_test):
     """Given a benchmark snapshot data frame and a statistical test function,
@@ -49,18 +73,167 @@ def _create_pairwise_table(benchmark_snapshot_df, key, statistical_test):
     return pd.DataFrame(data, index=fuzzers, columns=fuzzers)
 
 
+def _count_smaller_samples(values, fuzzer_codes, num_fuzzers):
+    """Returns two matrices with a row for each distinct value in |values| and
+    a column for each fuzzer. The first counts the samples of the fuzzer
+    smaller than the value, the second the samples smaller or equal to it.
+    |fuzzer_codes| is the fuzzer of each of |values|."""
+    order = np.argsort(values, kind='stable')
+    # |counts_before[k, f]| is the number of samples of fuzzer f in the first k
+    # sorted samples.
+    one_hot = np.zeros((len(values), num_fuzzers))
+    one_hot[np.arange(len(values)), fuzzer_codes[order]] = 1
+    counts_before = np.zeros((len(values) + 1, num_fuzzers))
+    np.cumsum(one_hot, axis=0, out=counts_before[1:])
+
+    _, starts, tie_sizes = np.unique(values[order],
+                                     return_index=True,
+                                     return_counts=True)
+    return counts_before[starts], counts_before[starts + tie_sizes]
+
+
+def _get_tie_terms(value_counts):
+    """Returns the sum of t^3 - t over the groups of t tied values in the
+    samples of each pair of fuzzers. |value_counts| has the number of samples
+    of each fuzzer (column) equal to each distinct value (row)."""
+    # Expands sum((a + b)^3 - (a + b)) over the distinct values, where a and b
+    # are the counts of the value for each fuzzer.
+    sizes = value_counts.sum(axis=0)
+    cubes = (value_counts**3).sum(axis=0)
+    cross_terms = 3 * (value_counts**2).T @ value_counts
+    return (cubes[:, None] + cubes[None, :] + cross_terms + cross_terms.T -
+            sizes[:, None] - sizes[None, :])
+
+
+def _get_same_values(value_counts):
+    """Returns a matrix that is True for each pair of fuzzers with the same set
+    of values in |value_counts| (see _get_tie_terms)."""
+    present = (value_counts > 0).astype(np.float64)
+    common_values = present.T @ present
+    distinct_values = present.sum(axis=0)
+    same_values = ((common_values == distinct_values[:, None]) &
+                   (common_values == distinct_values[None, :]))
+    np.fill_diagonal(same_values, True)
+    return same_values
+
+
+def _compute_pairwise_statistics(benchmark_snapshot_df, key):
+    """Returns the PairwiseStatistics of |key| for every pair of fuzzers in
+    |benchmark_snapshot_df|. The samples of all fuzzers are sorted once and the
+    statistics of all pairs are computed from the number of samples of each
+    fuzzer that are smaller than each distinct value."""
+    groups = benchmark_snapshot_df.groupby('fuzzer')
+    samples = groups[key].apply(np.asarray)
+    fuzzer_codes = np.repeat(np.arange(len(samples)),
+                             [len(sample) for sample in samples])
+    values = np.concatenate(samples.values).astype(np.float64)
+    smaller_counts, smaller_or_equal_counts = _count_smaller_samples(
+        values, fuzzer_codes, len(samples))
+    value_counts = smaller_or_equal_counts - smaller_counts
+
+    # Every sample counts 1 for each smaller sample of the other fuzzer and 0.5
+    # for each equal one. This is U = R - n * (n + 1) / 2.
+    u_statistics = value_counts.T @ (
+        (smaller_counts + smaller_or_equal_counts) / 2)
+    return PairwiseStatistics(samples.index, list(samples.values),
+                              value_counts.sum(axis=0), u_statistics,
+                              _get_tie_terms(value_counts),
+                              _get_same_values(value_counts))
+
+
+def _get_cache_key(benchmark_snapshot_df, key):
+    """Returns a key identifying the contents of |benchmark_snapshot_df| that
+    are relevant for the pairwise statistics of |key|."""
+    hashes = pd.util.hash_pandas_object(benchmark_snapshot_df[['fuzzer', key]],
+                                        index=False)
+    return hashlib.sha256(hashes.values.tobytes()).hexdigest(), key
+
+
+def get_pairwise_statistics(benchmark_snapshot_df, key):
+    """Returns the PairwiseStatistics of |key| for every pair of fuzzers in
+    |benchmark_snapshot_df| or None if some samples are missing (NaN). Results
+    are memoized, so the tables of all tests on the same snapshot and key are
+    computed from a single computation."""
+    if benchmark_snapshot_df[key].isna().any():
+        return None
+    cache_key = _get_cache_key(benchmark_snapshot_df, key)
+    with _pairwise_statistics_lock:
+        if cache_key in _pairwise_statistics_cache:
+            _pairwise_statistics_cache.move_to_end(cache_key)
+            return _pairwise_statistics_cache[cache_key]
+
+    pairwise_statistics = _compute_pairwise_statistics(benchmark_snapshot_df,
+                                                       key)
+    with _pairwise_statistics_lock:
+        _pairwise_statistics_cache[cache_key] = pairwise_statistics
+        if len(_pairwise_statistics_cache) > PAIRWISE_STATISTICS_CACHE_SIZE:
+            _pairwise_statistics_cache.popitem(last=False)
+    return pairwise_statistics
+
+
+def _u_test_p_values(pairwise_statistics, alternative):
+    """Returns the p-values of the Mann-Whitney U test with |alternative| for
+    every pair in |pairwise_statistics|. Gives the same results as
+    ss.mannwhitneyu, which is used for small samples without ties."""
+    sizes_x = pairwise_statistics.sizes[:, None]
+    sizes_y = pairwise_statistics.sizes[None, :]
+    u_statistics = pairwise_statistics.u_statistics
+    tie_terms = pairwise_statistics.tie_terms
+    factor = 1
+    if alternative == 'less':
+        u_statistics = sizes_x * sizes_y - u_statistics
+    elif alternative == 'two-sided':
+        u_statistics = np.maximum(u_statistics,
+                                  sizes_x * sizes_y - u_statistics)
+        factor = 2
+
+    # Normal approximation with tie and continuity correction.
+    total_sizes = sizes_x + sizes_y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(sizes_x * sizes_y / 12 * ((total_sizes + 1) - tie_terms /
+                                                (total_sizes *
+                                                 (total_sizes - 1))))
+        z_values = (u_statistics - sizes_x * sizes_y / 2 - 0.5) / std
+    p_values = np.clip(ss.norm.sf(z_values) * factor, 0, 1)
+
+    exact = ((sizes_x <= MAX_EXACT_MANN_WHITNEY_SIZE) |
+             (sizes_y <= MAX_EXACT_MANN_WHITNEY_SIZE)) & (tie_terms == 0)
+    samples = pairwise_statistics.samples
+    for idx_x, idx_y in zip(*np.nonzero(exact)):
+        p_values[idx_x, idx_y] = ss.mannwhitneyu(samples[idx_x],
+                                                 samples[idx_y],
+                                                 alternative=alternative).pvalue
+    return p_values
+
+
+def _create_pairwise_statistics_table(pairwise_statistics, values):
+    """Returns a table of |values| computed for every pair of fuzzers in
+    |pairwise_statistics|, without values for pairs of fuzzers with the same
+    samples."""
+    values = np.where(pairwise_statistics.same_values, np.nan, values)
+    fuzzers = pairwise_statistics.fuzzers
+    return pd.DataFrame(values, index=fuzzers, columns=fuzzers)
+
+
+def _u_test(benchmark_snapshot_df, key, alternative):
+    """Returns p-value table for Mann-Whitney U test with |alternative|."""
+    pairwise_statistics = get_pairwise_statistics(benchmark_snapshot_df, key)
+    if pairwise_statistics is None:
+        return _create_pairwise_table(
+            benchmark_snapshot_df, key, lambda xs, ys: ss.mannwhitneyu(
+                xs, ys, alternative=alternative).pvalue)
+    return _create_pairwise_statistics_table(
+        pairwise_statistics, _u_test_p_values(pairwise_statistics, alternative))
+
+
 def one_sided_u_test(benchmark_snapshot_df, key):
     """Returns p-value table for one-tailed Mann-Whitney U test."""
-    return _create_pairwise_table(
-        benchmark_snapshot_df, key,
-        lambda xs, ys: ss.mannwhitneyu(xs, ys, alternative='greater').pvalue)
+    return _u_test(benchmark_snapshot_df, key, 'greater')
 
 
 def two_sided_u_test(benchmark_snapshot_df, key):
     """Returns p-value table for two-tailed Mann-Whitney U test."""
-    return _create_pairwise_table(
-        benchmark_snapshot_df, key,
-        lambda xs, ys: ss.mannwhitneyu(xs, ys, alternative='two-sided').pvalue)
+    return _u_test(benchmark_snapshot_df, key, 'two-sided')
 
 
 def one_sided_wilcoxon_test(benchmark_snapshot_df, key):
@@ -79,7 +252,14 @@ def two_sided_wilcoxon_test(benchmark_snapshot_df, key):
 
 def a12_measure_test(benchmark_snapshot_df, key='edges_covered'):
     """Returns a Vargha-Delaney A12 measure table."""
-    return _create_pairwise_table(benchmark_snapshot_df, key, a12)
+    pairwise_statistics = get_pairwise_statistics(benchmark_snapshot_df, key)
+    if pairwise_statistics is None:
+        return _create_pairwise_table(benchmark_snapshot_df, key, a12)
+    # A12 is the U statistic normalized by the number of pairs of samples.
+    sizes = pairwise_statistics.sizes
+    return _create_pairwise_statistics_table(
+        pairwise_statistics,
+        pairwise_statistics.u_statistics / np.outer(sizes, sizes))
 
 
 def anova_test(benchmark_snapshot_df, key):
@@ -12,12 +12,17 @@
 # See the License for the specific language governing permissions andsss
 # limitations under the License.
 """Tests for coverage_data_utils.py"""
+import json
+import os
 from unittest import mock
 
 import pandas as pd
 import pandas.testing as pd_test
+import pytest
 
 from analysis import coverage_data_utils
+from common import coverage_format
+from common import filestore_utils
 
 FUZZER = 'afl'
 BENCHMARK = 'libpng-1.6.38'
@@ -47,10 +52,10 @@ def create_coverage_data():
 def test_get_unique_branch_dict():
     """Tests get_unique_branch_dict() function."""
     coverage_dict = create_coverage_data()
-    benchmark_coverage_dict = coverage_data_utils.get_benchmark_cov_dict(
+    benchmark_coverage = coverage_data_utils.get_benchmark_coverage(
         coverage_dict, 'libpng-1.6.38')
     unique_branch_dict = coverage_data_utils.get_unique_branch_dict(
-        benchmark_coverage_dict)
+        benchmark_coverage)
     expected_dict = {
         (0, 0, 2, 2): ['afl'],
         (0, 0, 2, 3): ['libfuzzer'],
@@ -62,13 +67,11 @@ def test_get_unique_branch_dict():
 def test_get_unique_branch_cov_df():
     """Tests get_unique_branch_cov_df() function."""
     coverage_dict = create_coverage_data()
-    benchmark_coverage_dict = coverage_data_utils.get_benchmark_cov_dict(
+    benchmark_coverage = coverage_data_utils.get_benchmark_coverage(
         coverage_dict, 'libpng-1.6.38')
-    unique_branch_dict = coverage_data_utils.get_unique_branch_dict(
-        benchmark_coverage_dict)
     fuzzer_names = ['afl', 'libfuzzer']
     unique_branch_df = coverage_data_utils.get_unique_branch_cov_df(
-        unique_branch_dict, fuzzer_names)
+        benchmark_coverage, fuzzer_names)
     unique_branch_df = unique_branch_df.sort_values(by=['fuzzer']).reset_index(
         drop=True)
     expected_df = pd.DataFrame([{
@@ -81,28 +84,63 @@ def test_get_unique_branch_cov_df():
     assert unique_branch_df.equals(expected_df)
 
 
-def test_get_benchmark_cov_dict():
-    """Tests that get_benchmark_cov_dict() returns correct dictionary."""
+def test_get_benchmark_coverage():
+    """Tests that get_benchmark_coverage() returns the covered branches of each
+    fuzzer."""
     coverage_dict = create_coverage_data()
     benchmark = 'libpng-1.6.38'
-    benchmark_cov_dict = coverage_data_utils.get_benchmark_cov_dict(
+    benchmark_coverage = coverage_data_utils.get_benchmark_coverage(
         coverage_dict, benchmark)
+    benchmark_cov_dict = {
+        fuzzer: {
+            tuple(branch) for branch in benchmark_coverage.branches[
+                benchmark_coverage.covered[index]].tolist()
+        } for index, fuzzer in enumerate(benchmark_coverage.fuzzers)
+    }
     expected_cov_dict = {
         'afl': {(0, 0, 3, 3), (0, 0, 2, 2), (0, 0, 1, 1)},
         'libfuzzer': {(0, 0, 4, 4), (0, 0, 3, 3), (0, 0, 2, 3), (0, 0, 1, 1)}
     }
     assert expected_cov_dict == benchmark_cov_dict
+    # Each branch is interned once.
+    assert len(benchmark_coverage.branches) == 5
+
+
+def test_get_benchmark_coverage_no_coverage():
+    """Tests that get_benchmark_coverage() handles fuzzers without coverage
+    data."""
+    coverage_dict = {'afl libpng-1.6.38': {}, 'libfuzzer libpng-1.6.38': []}
+    benchmark_coverage = coverage_data_utils.get_benchmark_coverage(
+        coverage_dict, 'libpng-1.6.38')
+    assert benchmark_coverage.covered.shape == (2, 0)
+    aggregated_df = coverage_data_utils.get_benchmark_aggregated_cov_df(
+        benchmark_coverage)
+    assert list(aggregated_df['aggregated_edges_covered']) == [0, 0]
+
+
+def test_get_benchmark_aggregated_cov_df():
+    """Tests that get_benchmark_aggregated_cov_df() counts the branches
+    covered by each fuzzer."""
+    benchmark_coverage = coverage_data_utils.get_benchmark_coverage(
+        create_coverage_data(), 'libpng-1.6.38')
+    aggregated_df = coverage_data_utils.get_benchmark_aggregated_cov_df(
+        benchmark_coverage)
+    expected_df = pd.DataFrame({
+        'fuzzer': ['afl', 'libfuzzer'],
+        'aggregated_edges_covered': [3, 4]
+    })
+    pd_test.assert_frame_equal(aggregated_df, expected_df)
 
 
 def test_get_pairwise_unique_coverage_table():
     """Tests that get_pairwise_unique_coverage_table() gives the
     correct dataframe."""
     coverage_dict = create_coverage_data()
-    benchmark_coverage_dict = coverage_data_utils.get_benchmark_cov_dict(
+    benchmark_coverage = coverage_data_utils.get_benchmark_coverage(
         coverage_dict, 'libpng-1.6.38')
     fuzzers = ['libfuzzer', 'afl']
     table = coverage_data_utils.get_pairwise_unique_coverage_table(
-        benchmark_coverage_dict, fuzzers)
+        benchmark_coverage, fuzzers)
     expected_table = pd.DataFrame([[0, 1], [2, 0]],
                                   index=fuzzers,
                                   columns=fuzzers)
@@ -120,6 +158,117 @@ def test_get_fuzzer_benchmark_covered_branches_filestore_path():
                     'covered_branches.json'))
 
 
+def _write_covered_branches(exp_filestore_path):
+    """Writes the binary file with the covered branches of afl and a json file
+    with the covered branches of honggfuzz to |exp_filestore_path|."""
+    data_dir = coverage_data_utils.get_benchmark_covered_branches_filestore_dir(
+        BENCHMARK, exp_filestore_path)
+    os.makedirs(os.path.join(data_dir, 'honggfuzz'))
+    coverage_format.write(data_dir, {
+        'afl': create_coverage_data()['afl libpng-1.6.38'],
+    })
+    json_path = (coverage_data_utils.
+                 get_fuzzer_benchmark_covered_branches_filestore_path(
+                     'honggfuzz', BENCHMARK, exp_filestore_path))
+    with open(json_path, 'w', encoding='utf-8') as file_handle:
+        json.dump([[0, 0, 5, 5]], file_handle)
+    return json_path
+
+
+@pytest.mark.usefixtures('use_local_filestore')
+def test_get_covered_branches_dict(tmp_path):
+    """Tests that get_covered_branches_dict reads the binary file and falls
+    back to json files for fuzzers that aren't in it."""
+    os.environ['EXPERIMENT_FILESTORE'] = str(tmp_path)
+    _write_covered_branches(str(tmp_path / 'exp'))
+    experiment_df = pd.DataFrame({
+        'experiment_filestore': str(tmp_path),
+        'experiment': 'exp',
+        'fuzzer': ['afl', 'honggfuzz', 'libfuzzer'],
+        'benchmark': BENCHMARK,
+    })
+
+    covered_branches_dict = coverage_data_utils.get_covered_branches_dict(
+        experiment_df, str(tmp_path / 'cache'))
+    assert (covered_branches_dict['afl libpng-1.6.38'].tolist() ==
+            create_coverage_data()['afl libpng-1.6.38'])
+    assert covered_branches_dict['honggfuzz libpng-1.6.38'] == [[0, 0, 5, 5]]
+    assert covered_branches_dict['libfuzzer libpng-1.6.38'] == {}
+    benchmark_coverage = coverage_data_utils.get_benchmark_coverage(
+        covered_branches_dict, BENCHMARK)
+    assert sorted(benchmark_coverage.covered.sum(axis=1).tolist()) == [0, 1, 3]
+
+
+@pytest.mark.usefixtures('use_local_filestore')
+def test_get_covered_branches_dict_cached(tmp_path):
+    """Tests that get_covered_branches_dict only downloads files again after
+    they changed."""
+    os.environ['EXPERIMENT_FILESTORE'] = str(tmp_path)
+    json_path = _write_covered_branches(str(tmp_path / 'exp'))
+    experiment_df = pd.DataFrame({
+        'experiment_filestore': str(tmp_path),
+        'experiment': 'exp',
+        'fuzzer': ['afl', 'honggfuzz'],
+        'benchmark': BENCHMARK,
+    })
+    cache_dir = str(tmp_path / 'cache')
+    coverage_data_utils.get_covered_branches_dict(experiment_df, cache_dir)
+
+    with mock.patch('common.filestore_utils.get_many') as mocked_get_many:
+        coverage_data_utils.get_covered_branches_dict(experiment_df, cache_dir)
+    assert not mocked_get_many.call_count
+
+    # Only the changed files are downloaded, in a single bulk operation.
+    with open(json_path, 'w', encoding='utf-8') as file_handle:
+        json.dump([[0, 0, 6, 6]], file_handle)
+    with mock.patch('common.filestore_utils.get_many',
+                    wraps=filestore_utils.get_many) as mocked_get_many:
+        coverage_data_utils.get_covered_branches_dict(experiment_df, cache_dir)
+    mocked_get_many.assert_called_once()
+    assert list(mocked_get_many.call_args[0][0]) == [json_path]
+
+    with open(json_path, 'w', encoding='utf-8') as file_handle:
+        json.dump([[0, 0, 6, 6], [0, 0, 7, 7]], file_handle)
+    covered_branches_dict = coverage_data_utils.get_covered_branches_dict(
+        experiment_df, cache_dir)
+    assert covered_branches_dict['honggfuzz libpng-1.6.38'] == [[0, 0, 6, 6],
+                                                                [0, 0, 7, 7]]
+
+
+@pytest.mark.usefixtures('use_local_filestore')
+def test_fetch_files_evicts_least_recently_used(tmp_path, environ):  # pylint: disable=unused-argument
+    """Tests that fetch_files keeps the cache within COVERAGE_CACHE_SIZE and
+    never removes the files it returns."""
+    os.environ['COVERAGE_CACHE_SIZE'] = '8'
+    paths = []
+    for name in ['a', 'b', 'c']:
+        path = str(tmp_path / name)
+        with open(path, 'w', encoding='utf-8') as file_handle:
+            file_handle.write(name * 4)
+        paths.append(path)
+    versions = {path: '1' for path in paths}
+    cache_dir = str(tmp_path / 'cache')
+
+    a_path = coverage_data_utils.fetch_files(paths[:1], versions,
+                                             cache_dir)[paths[0]]
+    os.utime(a_path, (0, 0))
+    b_path = coverage_data_utils.fetch_files(paths[1:2], versions,
+                                             cache_dir)[paths[1]]
+    os.utime(b_path, (1, 1))
+    # Using "a" again makes "b" the least recently used.
+    assert coverage_data_utils.fetch_files(paths[:1], versions,
+                                           cache_dir)[paths[0]] == a_path
+    c_path = coverage_data_utils.fetch_files(paths[2:], versions,
+                                             cache_dir)[paths[2]]
+    assert os.path.exists(a_path)
+    assert not os.path.exists(b_path)
+    assert os.path.exists(c_path)
+
+    # Files being returned are kept even if they don't fit.
+    cache_paths = coverage_data_utils.fetch_files(paths, versions, cache_dir)
+    assert all(os.path.exists(path) for path in cache_paths.values())
+
+
 def test_fuzzer_and_benchmark_to_key():
     """Tests that fuzzer_and_benchmark_to_key returns the correct result."""
     assert (coverage_data_utils.fuzzer_and_benchmark_to_key(
@@ -14,10 +14,14 @@
 
 # pylint: disable=missing-function-docstring
 """Tests for data_utils.py"""
+import os
+import random
+from unittest import mock
 
 import pandas as pd
 import pandas.testing as pd_test
 import pytest
+from clusterfuzz.stacktraces.crash_comparer import CrashComparer
 
 from analysis import data_utils
 
@@ -85,6 +89,26 @@ def test_drop_uniteresting_columns():
     assert 'time_started' not in cleaned_df.columns
 
 
+def test_add_cpu_utilization_column():
+    experiment_df = pd.DataFrame({
+        'fuzzer_stats': [
+            {
+                'cpu_time': 50.0,
+                'wall_time': 100.0
+            },
+            # Fuzzer stats are strings when read from CSV files.
+            "{'cpu_time': 100.0, 'wall_time': 100.0}",
+            {
+                'execs_per_sec': 10.0
+            },
+            None,
+        ]
+    })
+    experiment_df = data_utils.add_cpu_utilization_column(experiment_df)
+    assert experiment_df.cpu_utilization.to_list()[:2] == [.5, 1.]
+    assert experiment_df.cpu_utilization.iloc[2:].isna().all()
+
+
 def test_clobber_experiments_data():
     """Tests that clobber experiments data clobbers stale snapshots from earlier
     experiments."""
@@ -218,6 +242,19 @@ def test_benchmark_snapshot_incomplete(threshold, expected_snapshot_time,
     assert (timestamps_per_trial['time'] == expected_snapshot_time).all()
 
 
+@pytest.mark.parametrize('threshold, expected_libxml_time', [(1.0, 5),
+                                                             (0.5, 9)])
+def test_get_snapshot_times(threshold, expected_libxml_time):
+    """Tests that get_snapshot_times finds the snapshot time of every
+    benchmark at once."""
+    experiment_df = create_experiment_data(incomplete=True)
+    snapshot_times = data_utils.get_snapshot_times(experiment_df, threshold)
+    assert snapshot_times.to_dict() == {
+        'libpng_libpng_read_fuzzer': 9,
+        'libxml': expected_libxml_time
+    }
+
+
 def test_fuzzers_with_not_enough_samples():
     experiment_df = create_experiment_data()
     # Drop one of the afl/libxml trials (trial id 5).
@@ -395,3 +432,113 @@ def test_experiment_rank_by_average_normalized_score():
                                 expected_ranking,
                                 check_names=False,
                                 rtol=10**-3)
+
+
+def _naive_unique_crashes(crash_states):
+    """Returns whether each of |crash_states| is unique by comparing it to
+    every crash state before it."""
+    seen = []
+    is_uniques = []
+    for crash_state in crash_states:
+        is_uniques.append(not any(
+            CrashComparer(crash_state, seen_crash_state).is_similar()
+            for seen_crash_state in seen))
+        seen.append(crash_state)
+    return is_uniques
+
+
+def test_crash_deduplicator():
+    """Tests that CrashDeduplicator finds the same unique crashes as comparing
+    each crash to every crash before it."""
+    rand = random.Random(0)
+    frames = ['foo', 'foo2', 'bar', 'baz', 'LLVMFuzzerTestOneInput', 'f', '']
+    crash_states = ['', 'FuzzerHash=abc', 'FuzzerHash=abc', 'FuzzerHash=abd']
+    for _ in range(300):
+        crash_states.append('\n'.join(
+            rand.choice(frames) for _ in range(rand.randint(1, 3))))
+    rand.shuffle(crash_states)
+
+    deduplicator = data_utils.CrashDeduplicator()
+    actual = [deduplicator.add(crash_state) for crash_state in crash_states]
+    assert actual == _naive_unique_crashes(crash_states)
+
+
+def test_get_coverage_growth_bands():
+    """Tests that get_coverage_growth_bands computes the median of each fuzzer
+    at each time and the order statistics bounding its confidence interval."""
+    experiment_df = pd.concat([
+        create_trial_data(trial_id, 'libxml', 'afl', 3, coverage,
+                          'test_experiment', 'gs://fuzzbench-data')
+        for trial_id, coverage in enumerate(range(100, 300, 10))
+    ] + [
+        create_trial_data(20, 'libxml', 'libfuzzer', 3, 500, 'test_experiment',
+                          'gs://fuzzbench-data')
+    ])
+    bands = data_utils.get_coverage_growth_bands(experiment_df)
+
+    assert bands.columns.tolist() == [
+        'benchmark', 'fuzzer', 'time', 'median', 'lower', 'upper'
+    ]
+    afl_bands = bands[bands.fuzzer == 'afl']
+    assert afl_bands.time.tolist() == [0, 1, 2]
+    assert (afl_bands['median'] == 195).all()
+    # For 20 samples, the 95% confidence interval of the median is between the
+    # 6th and the 15th smallest samples.
+    assert (afl_bands.lower == 150).all()
+    assert (afl_bands.upper == 240).all()
+    libfuzzer_bands = bands[bands.fuzzer == 'libfuzzer']
+    assert (libfuzzer_bands[['median', 'lower', 'upper']] == 500).all().all()
+
+    bands = data_utils.get_coverage_growth_bands(experiment_df,
+                                                 confidence_level=None)
+    assert 'lower' not in bands.columns
+
+
+def test_get_coverage_growth_bands_downsampled():
+    """Tests that long growth series are downsampled, keeping the first and
+    last times."""
+    experiment_df = create_trial_data(0, 'libxml', 'afl', 10, 100,
+                                      'test_experiment', 'gs://fuzzbench-data')
+    bands = data_utils.get_coverage_growth_bands(experiment_df, max_times=4)
+    assert bands.time.tolist() == [0, 3, 6, 9]
+    bands = data_utils.get_coverage_growth_bands(experiment_df, max_times=3)
+    assert bands.time.tolist() == [0, 4, 8, 9]
+
+
+def test_crash_similarity_cache(tmp_path):
+    """Tests that crash similarities saved to a file are used instead of
+    comparing the crashes again."""
+    cache_path = str(tmp_path / data_utils.CRASH_SIMILARITY_CACHE_FILENAME)
+    with mock.patch.dict(data_utils._crash_similarities, clear=True):  # pylint: disable=protected-access
+        data_utils.CrashDeduplicator().add('foo\nbar')
+        deduplicator = data_utils.CrashDeduplicator()
+        deduplicator.add('foo\nbar')
+        assert not deduplicator.add('foo\nbar2')
+        data_utils.save_crash_similarity_cache(cache_path)
+
+    with mock.patch.dict(data_utils._crash_similarities, clear=True):  # pylint: disable=protected-access
+        data_utils.load_crash_similarity_cache(cache_path)
+        with mock.patch('analysis.data_utils.CrashComparer') as mocked_comparer:
+            deduplicator = data_utils.CrashDeduplicator()
+            deduplicator.add('foo\nbar')
+            assert not deduplicator.add('foo\nbar2')
+        assert not mocked_comparer.call_count
+
+
+def test_save_crash_similarity_cache_max_bytes(tmp_path):
+    """Tests that only the most recently used crash similarities that fit in
+    the size limit are saved."""
+    cache_path = str(tmp_path / 'cache' /
+                     data_utils.CRASH_SIMILARITY_CACHE_FILENAME)
+    with mock.patch.dict(data_utils._crash_similarities, clear=True):  # pylint: disable=protected-access
+        for crash_state in ['a', 'b', 'c']:
+            data_utils._is_similar_crash(crash_state, 'x')  # pylint: disable=protected-access
+        # Using "a" again makes "b" the least recently used.
+        data_utils._is_similar_crash('a', 'x')  # pylint: disable=protected-access
+        data_utils.save_crash_similarity_cache(cache_path, max_bytes=40)
+        assert os.path.getsize(cache_path) <= 40
+
+    with mock.patch.dict(data_utils._crash_similarities, clear=True):  # pylint: disable=protected-access
+        data_utils.load_crash_similarity_cache(cache_path)
+        similarities = data_utils._crash_similarities  # pylint: disable=protected-access
+        assert list(similarities) == [('c', 'x'), ('a', 'x')]
@@ -33,3 +33,25 @@ def test_linkify_fuzzer_names_in_ranking(_):
     assert ranking.index[0] == (
         '<a href="https://github.com/google/fuzzbench/blob/'
         'master/fuzzers/afl">afl</a>')
+
+
+@mock.patch('common.benchmark_config.get_config', return_value={})
+def test_cpu_utilization_summary_table(_):
+    """Tests that the CPU utilization table averages the utilization at the
+    end of each trial."""
+    experiment_df = test_data_utils.create_experiment_data()
+    results = experiment_results.ExperimentResults(experiment_df,
+                                                   coverage_dict=None,
+                                                   output_directory=None,
+                                                   plotter=None)
+    assert results.cpu_utilization_summary_table is None
+
+    experiment_df['cpu_utilization'] = (experiment_df.trial_id % 2 +
+                                        experiment_df.time / 10)
+    results = experiment_results.ExperimentResults(experiment_df,
+                                                   coverage_dict=None,
+                                                   output_directory=None,
+                                                   plotter=None)
+    table = results.cpu_utilization_summary_table.data
+    assert table.loc['libxml', 'afl'] == 1.4
+    assert table.loc['FuzzerMean', 'libfuzzer'] == 1.4
@@ -13,6 +13,8 @@
 # limitations under the License.
 """Plotting tests."""
 
+from unittest import mock
+
 import matplotlib.testing.compare as plt_cmp
 import pandas as pd
 
@@ -57,3 +59,75 @@ def test_unique_coverage_ranking_plot(tmp_path):
 
     golden_path = 'analysis/test_data/unique_coverage_ranking.png'
     plt_cmp.compare_images(image_path, golden_path, tol=0.01)
+
+
+def test_deferred_plots(tmp_path):
+    """Tests that a deferred plotter only writes plots when they are rendered
+    and that they are the same as plots written right away."""
+    fuzzer_num = 22
+    fuzzers = [f'fuzzer-{i}' for i in range(fuzzer_num)]
+    table_df = pd.DataFrame([range(1000, 1000 + fuzzer_num)] * fuzzer_num,
+                            index=fuzzers,
+                            columns=fuzzers)
+    unique_df = pd.DataFrame({
+        'fuzzer': fuzzers,
+        'unique_branches_covered': [10 * i for i in range(fuzzer_num)],
+        'aggregated_edges_covered': [1000] * fuzzer_num
+    })
+
+    def write_plots(plotter, prefix):
+        plotter.write_pairwise_unique_coverage_heatmap_plot(
+            table_df, tmp_path / f'{prefix}-heatmap.png')
+        plotter.write_unique_coverage_ranking_plot(unique_df,
+                                                   image_path=tmp_path /
+                                                   f'{prefix}-ranking.png')
+
+    write_plots(plotting.Plotter(fuzzers), 'expected')
+    plotter = plotting.Plotter(fuzzers, deferred=True)
+    write_plots(plotter, 'deferred')
+    assert not list(tmp_path.glob('deferred-*'))
+
+    plotter.render_deferred_plots(processes=2)
+    for plot in ['heatmap', 'ranking']:
+        assert plt_cmp.compare_images(tmp_path / f'expected-{plot}.png',
+                                      tmp_path / f'deferred-{plot}.png',
+                                      tol=0) is None
+
+
+def test_render_deferred_plots_cache(tmp_path):
+    """Tests that plots whose inputs didn't change since they were last
+    rendered aren't rendered again."""
+    fuzzers = ['afl', 'libfuzzer']
+    unique_df = pd.DataFrame({
+        'fuzzer': fuzzers,
+        'unique_branches_covered': [10, 20],
+        'aggregated_edges_covered': [1000, 1000]
+    })
+    cache_path = plotting.get_plot_cache_path(str(tmp_path / 'cache'),
+                                              str(tmp_path))
+
+    def render(df, image_name='ranking.svg'):
+        plotter = plotting.Plotter(fuzzers, deferred=True)
+        plotter.write_unique_coverage_ranking_plot(df,
+                                                   image_path=str(tmp_path /
+                                                                  image_name))
+        with mock.patch('analysis.plotting._render_deferred_plot',
+                        wraps=plotting._render_deferred_plot) as mocked_render:  # pylint: disable=protected-access
+            plotter.render_deferred_plots(processes=1, cache_path=cache_path)
+        return mocked_render.call_count
+
+    assert render(unique_df) == 1
+    image_contents = (tmp_path / 'ranking.svg').read_bytes()
+    assert render(unique_df.copy()) == 0
+    assert (tmp_path / 'ranking.svg').read_bytes() == image_contents
+
+    # Changing the data, or losing the image, renders it again.
+    changed_df = unique_df.copy()
+    changed_df.loc[0, 'unique_branches_covered'] = 11
+    assert render(changed_df) == 1
+    (tmp_path / 'ranking.svg').unlink()
+    assert render(changed_df) == 1
+    assert render(changed_df, 'other.svg') == 1
+    # Images that aren't plotted anymore are removed.
+    assert not (tmp_path / 'ranking.svg').exists()
+    assert (tmp_path / 'other.svg').exists()
@@ -83,3 +83,28 @@ def test_get_experiment_data_fuzzer_stats(db):
     db_utils.add_all([snapshot])
     experiment_df = queries.get_experiment_data([experiment_name])  # pylint: disable=unused-variable
     # TODO(metzman): Finish this test.
+
+
+def test_get_finished_experiment_filestores(db):
+    """Tests that get_finished_experiment_filestores only returns the
+    experiments that ended."""
+    db_utils.add_all([
+        models.Experiment(name='ended',
+                          time_created=ARBITRARY_DATETIME,
+                          time_ended=ARBITRARY_DATETIME,
+                          experiment_filestore='gs://fuzzbench-data',
+                          private=False),
+        models.Experiment(name='in-progress',
+                          time_created=ARBITRARY_DATETIME,
+                          experiment_filestore='gs://fuzzbench-data',
+                          private=False),
+        models.Experiment(name='other-ended',
+                          time_created=ARBITRARY_DATETIME,
+                          time_ended=ARBITRARY_DATETIME,
+                          experiment_filestore='gs://other-data',
+                          private=False),
+    ])
+    assert queries.get_finished_experiment_filestores(
+        ['ended', 'in-progress']) == {
+            'ended': 'gs://fuzzbench-data'
+        }
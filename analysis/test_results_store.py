@@ -0,0 +1,79 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for results_store.py."""
+import datetime
+from unittest import mock
+
+import pandas as pd
+import pandas.testing as pd_test
+
+from analysis import generate_report
+from analysis import results_store
+
+# pylint: disable=unused-argument
+
+EXPERIMENT_DF = pd.DataFrame({
+    'experiment': ['experiment-1'] * 2,
+    'benchmark': ['libpng', 'libxml'],
+    'fuzzer': ['afl', 'afl'],
+    'trial_id': [1, 2],
+    'time_started': [datetime.datetime(2020, 1, 1)] * 2,
+    'time_ended': [pd.NaT, datetime.datetime(2020, 1, 2)],
+    'time': [900, 900],
+    'edges_covered': [100, 200],
+    'crash_key': [None, 'type:state'],
+    'fuzzer_stats': [None, {
+        'execs_per_sec': 10.5
+    }],
+})
+
+
+def test_store_and_load(tmp_path, use_local_filestore):
+    """Tests that stored data is loaded as it was, with the same dtypes and
+    fuzzer stats."""
+    experiment_filestore = str(tmp_path)
+    assert results_store.load('experiment-1', experiment_filestore) is None
+    assert results_store.store('experiment-1', experiment_filestore,
+                               EXPERIMENT_DF)
+    pd_test.assert_frame_equal(
+        results_store.load('experiment-1', experiment_filestore), EXPERIMENT_DF)
+
+
+def test_get_experiment_data_from_results_store(tmp_path, use_local_filestore):
+    """Tests that the data of finished experiments is only queried from the
+    database once and that running experiments are always queried."""
+    live_df = EXPERIMENT_DF.assign(experiment='experiment-2')
+
+    def get_experiment_data(experiment_names, main_experiment_benchmarks=None):
+        if experiment_names == ['experiment-1']:
+            return EXPERIMENT_DF.copy()
+        assert experiment_names == ['experiment-2']
+        return live_df.copy()
+
+    with mock.patch('analysis.queries.get_finished_experiment_filestores',
+                    return_value={'experiment-1': str(tmp_path)}), \
+            mock.patch('analysis.queries.get_experiment_data',
+                       side_effect=get_experiment_data) as mocked_query:
+        for _ in range(2):
+            experiment_df = (
+                generate_report.get_experiment_data_from_results_store(
+                    ['experiment-1', 'experiment-2'], ['libxml']))
+            assert experiment_df.experiment.tolist() == [
+                'experiment-1', 'experiment-2'
+            ]
+            assert experiment_df.bugs_covered.tolist() == [1, 1]
+            assert 'cpu_utilization' in experiment_df.columns
+
+    assert [call.args[0] for call in mocked_query.call_args_list
+           ] == [['experiment-1'], ['experiment-2'], ['experiment-2']]
@@ -15,7 +15,11 @@
 # pylint: disable=missing-function-docstring
 """Tests for stat_tests.py"""
 
+import numpy as np
+import pandas as pd
+import pandas.testing as pd_test
 import pytest
+import scipy.stats as ss
 
 from analysis import stat_tests
 
@@ -40,3 +44,69 @@ def test_a12_equal():
 
     result = stat_tests.a12(x_values, y_values)
     assert result == pytest.approx(0.5, 0.0001)
+
+
+def _create_benchmark_snapshot_df():
+    samples = {
+        # Small samples without ties use the exact distribution.
+        'afl': [10, 12, 15, 17, 20],
+        'honggfuzz': [11, 13, 14, 16, 18, 19, 21, 22, 23, 24],
+        # Samples with ties use the normal approximation.
+        'libfuzzer': [10, 10, 12, 12, 14, 30, 30, 31, 32, 33],
+        # Same values as afl, so there are no results for this pair.
+        'mopt': [20, 17, 15, 12, 10],
+    }
+    return pd.DataFrame([{
+        'fuzzer': fuzzer,
+        'edges_covered': value
+    } for fuzzer, values in samples.items() for value in values])
+
+
+@pytest.mark.parametrize(('test_function', 'alternative'),
+                         [(stat_tests.one_sided_u_test, 'greater'),
+                          (stat_tests.two_sided_u_test, 'two-sided')])
+def test_u_test_same_as_scipy(test_function, alternative):
+    """Tests that the tables computed for all pairs at once are the same as
+    testing each pair with scipy."""
+    snapshot_df = _create_benchmark_snapshot_df()
+    expected_table = stat_tests._create_pairwise_table(  # pylint: disable=protected-access
+        snapshot_df, 'edges_covered',
+        lambda xs, ys: ss.mannwhitneyu(xs, ys, alternative=alternative).pvalue)
+    table = test_function(snapshot_df, 'edges_covered')
+    pd_test.assert_frame_equal(table, expected_table, rtol=1e-12)
+    assert np.isnan(table.loc['afl', 'mopt'])
+
+
+def test_a12_measure_test_same_as_a12():
+    """Tests that the A12 table computed for all pairs at once is the same as
+    computing a12 for each pair."""
+    snapshot_df = _create_benchmark_snapshot_df()
+    expected_table = stat_tests._create_pairwise_table(  # pylint: disable=protected-access
+        snapshot_df, 'edges_covered', stat_tests.a12)
+    pd_test.assert_frame_equal(stat_tests.a12_measure_test(snapshot_df),
+                               expected_table)
+
+
+def test_get_pairwise_statistics_memoized():
+    """Tests that pairwise statistics are computed once for snapshots with the
+    same samples."""
+    snapshot_df = _create_benchmark_snapshot_df()
+    pairwise_statistics = stat_tests.get_pairwise_statistics(
+        snapshot_df, 'edges_covered')
+    assert stat_tests.get_pairwise_statistics(
+        snapshot_df.copy(), 'edges_covered') is pairwise_statistics
+
+    snapshot_df.loc[0, 'edges_covered'] = 100
+    assert stat_tests.get_pairwise_statistics(
+        snapshot_df, 'edges_covered') is not pairwise_statistics
+
+
+def test_u_test_missing_values():
+    """Tests that samples with missing values are tested like scipy does."""
+    snapshot_df = _create_benchmark_snapshot_df()
+    snapshot_df.loc[0, 'edges_covered'] = np.nan
+    assert stat_tests.get_pairwise_statistics(snapshot_df,
+                                              'edges_covered') is None
+    table = stat_tests.two_sided_u_test(snapshot_df, 'edges_covered')
+    assert np.isnan(table.loc['afl', 'honggfuzz'])
+    assert not np.isnan(table.loc['honggfuzz', 'libfuzzer'])
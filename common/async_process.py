@@ -0,0 +1,238 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Asyncio based executor for running many processes concurrently. Unlike
+new_process.execute, it doesn't use a thread per process: output is read and
+processes are reaped from the event loop. The number of processes running at
+once is limited by a semaphore shared by all the callers of an executor, and
+the resources used by each process are returned with its result."""
+
+import asyncio
+import collections
+import os
+import signal
+import subprocess
+import time
+import weakref
+from typing import Callable, List, Optional
+
+from common import environment
+from common import logs
+from common import new_process
+from common import resource_usage
+
+# Like new_process.ProcessResult, with the resource_usage.ResourceUsage of the
+# process (and of the children it waited for).
+AsyncProcessResult = collections.namedtuple(
+    'AsyncProcessResult', new_process.ProcessResult._fields + ('usage',))
+
+
+def _kill(process: subprocess.Popen, kill_children: bool):
+    """Sends SIGKILL to |process| and its process group if
+    |kill_children|."""
+    try:
+        if kill_children:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            os.kill(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _read_output(process: subprocess.Popen,
+                       capture: new_process.OutputCapture):
+    """Reads the output of |process| into |capture| until it is closed."""
+    loop = asyncio.get_running_loop()
+    file_descriptor = process.stdout.fileno()
+    os.set_blocking(file_descriptor, False)
+    closed = loop.create_future()
+
+    def read():
+        try:
+            data = os.read(file_descriptor, new_process.READ_SIZE)
+        except BlockingIOError:
+            return
+        if data:
+            capture.write(data)
+            return
+        loop.remove_reader(file_descriptor)
+        closed.set_result(None)
+
+    loop.add_reader(file_descriptor, read)
+    try:
+        await closed
+    finally:
+        loop.remove_reader(file_descriptor)
+        capture.close()
+        process.stdout.close()
+
+
+async def _wait(process: subprocess.Popen):
+    """Waits for |process| to exit and reaps it. Returns the status and the
+    rusage returned by os.wait4."""
+    if not hasattr(os, 'pidfd_open'):
+        # Not Linux, wait from a thread instead.
+        loop = asyncio.get_running_loop()
+        _, status, rusage = await loop.run_in_executor(None, os.wait4,
+                                                       process.pid, 0)
+        return status, rusage
+
+    loop = asyncio.get_running_loop()
+    pidfd = os.pidfd_open(process.pid)
+    exited = loop.create_future()
+
+    def on_exit():
+        if not exited.done():
+            exited.set_result(None)
+
+    loop.add_reader(pidfd, on_exit)
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    _, status, rusage = os.wait4(process.pid, 0)
+    return status, rusage
+
+
+def _get_num_cpus() -> int:
+    """Returns the number of CPUs this process can run on, e.g. the CPUs a
+    measurer is pinned to."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+class AsyncExecutor:
+    """Runs processes from asyncio event loops, at most |max_processes| at
+    once."""
+
+    def __init__(self, max_processes: Optional[int] = None):
+        self.max_processes = max_processes or _get_num_cpus()
+        # asyncio.Semaphore can only be used from one event loop.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_processes)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def execute(  # pylint: disable=too-many-arguments,too-many-locals
+            self,
+            command: List[str],
+            *args,
+            expect_zero: bool = True,
+            timeout: Optional[float] = None,
+            output_file=None,
+            kill_children: bool = False,
+            output_limit: Optional[int] = None,
+            head_limit: int = 0,
+            line_callback: Optional[Callable[[str], None]] = None,
+            **kwargs) -> AsyncProcessResult:
+        """Executes |command| and returns its AsyncProcessResult. The
+        arguments are the same as new_process.execute's, except that output
+        can't be written to stdout. Waits until fewer than |max_processes|
+        processes are running before starting it."""
+        async with self._get_semaphore():
+            start_time = time.time()
+            # pylint: disable=consider-using-with
+            process = subprocess.Popen(command,
+                                       *args,
+                                       stdout=output_file or subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       start_new_session=kill_children,
+                                       **kwargs)
+            reader = None
+            capture = None
+            if output_file is None:
+                capture = new_process.OutputCapture(output_limit, head_limit,
+                                                    line_callback)
+                reader = asyncio.ensure_future(_read_output(process, capture))
+
+            waiter = asyncio.ensure_future(_wait(process))
+            timed_out = False
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                _kill(process, kill_children)
+            except asyncio.CancelledError:
+                _kill(process, kill_children)
+                raise
+            finally:
+                status, rusage = await waiter
+                # Let Popen know that the process was reaped.
+                process.returncode = os.waitstatus_to_exitcode(status)
+                if kill_children:
+                    _kill(process, kill_children)
+                if reader is not None:
+                    await reader
+            usage = resource_usage.from_rusage(rusage, time.time() - start_time)
+
+        output = capture.getvalue() if capture is not None else None
+        retcode = process.returncode
+        command_log_str = ' '.join(command)[:new_process.LOG_LIMIT_FIELD]
+        log_message = 'Executed command: "%s" returned: %d.'
+        log_extras = None
+        if output is not None:
+            log_extras = {'output': output[-new_process.LOG_LIMIT_FIELD:]}
+
+        if expect_zero and retcode != 0 and not timed_out:
+            logs.error(log_message, command_log_str, retcode, extras=log_extras)
+            raise subprocess.CalledProcessError(retcode, command)
+
+        logs.debug(log_message, command_log_str, retcode, extras=log_extras)
+        return AsyncProcessResult(retcode, output, timed_out, usage)
+
+    def execute_many(self, commands: List[List[str]],
+                     **kwargs) -> List[AsyncProcessResult]:
+        """Executes |commands| concurrently from a new event loop and returns
+        their results in the same order. |kwargs| are passed to execute.
+        Errors are returned instead of being raised."""
+
+        async def execute_all():
+            return await asyncio.gather(
+                *[self.execute(command, **kwargs) for command in commands],
+                return_exceptions=True)
+
+        return asyncio.run(execute_all())
+
+
+# pylint: disable=invalid-name
+_executor = None
+
+
+def get_executor() -> AsyncExecutor:
+    """Returns the executor shared by the process. MAX_CONCURRENT_PROCESSES
+    limits the number of processes it runs at once, it defaults to the number
+    of CPUs the process can run on."""
+    global _executor
+    if _executor is None:
+        _executor = AsyncExecutor(environment.get('MAX_CONCURRENT_PROCESSES'))
+    return _executor
+
+
+async def execute(command: List[str], *args, **kwargs) -> AsyncProcessResult:
+    """Executes |command| with the shared executor. See
+    AsyncExecutor.execute."""
+    return await get_executor().execute(command, *args, **kwargs)
+
+
+def execute_many(commands: List[List[str]],
+                 **kwargs) -> List[AsyncProcessResult]:
+    """Executes |commands| concurrently with the shared executor. See
+    AsyncExecutor.execute_many."""
+    return get_executor().execute_many(commands, **kwargs)
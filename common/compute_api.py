@@ -0,0 +1,318 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Native client for the Compute Engine REST API. Unlike the gcloud CLI this
+reuses HTTP connections, batches instance inserts and deletes into a single
+HTTP request and polls the resulting operations in batches as well."""
+
+import collections
+import email.parser
+import email.policy
+import json
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+import google.auth
+import google.auth.exceptions
+from google.auth.transport import requests as google_requests
+import requests
+
+from common import logs
+
+COMPUTE_ENDPOINT = 'https://compute.googleapis.com'
+API_PATH = '/compute/v1'
+BATCH_PATH = '/batch/compute/v1'
+CLOUD_PLATFORM_SCOPE = 'https://www.googleapis.com/auth/cloud-platform'
+
+# Number of calls to put in one batch request. The API accepts up to 1000, but
+# bigger batches run into rate limit errors.
+BATCH_SIZE = 100
+
+OPERATION_POLL_SECONDS = 2
+OPERATION_TIMEOUT_SECONDS = 10 * 60
+
+# Don't let a hanging connection block the scheduler forever.
+REQUEST_TIMEOUT_SECONDS = 60
+
+# pylint: disable=invalid-name
+_client = None
+
+# A single call in a batch request: the HTTP method, the path relative to the
+# endpoint and the JSON body (or None).
+Call = collections.namedtuple('Call', ['method', 'path', 'body'])
+
+# The result of a single call in a batch request. |body| is the decoded JSON
+# response.
+CallResult = collections.namedtuple('CallResult', ['status', 'body'])
+
+
+class ComputeApiError(Exception):
+    """Error returned by the Compute Engine API."""
+
+
+# Errors that calls to the API can raise: errors returned by the API, HTTP
+# errors such as timeouts and errors refreshing the credentials.
+ERRORS = (ComputeApiError, requests.exceptions.RequestException,
+          google.auth.exceptions.GoogleAuthError)
+
+
+def _is_success(status: int) -> bool:
+    """Returns True if |status| is a successful HTTP status code."""
+    return 200 <= status < 300
+
+
+def _encode_batch(calls: List[Call], boundary: str) -> bytes:
+    """Returns the multipart/mixed body of a batch request for |calls|."""
+    lines = []
+    for index, call in enumerate(calls):
+        lines.extend([
+            f'--{boundary}',
+            'Content-Type: application/http',
+            f'Content-ID: <{index}>',
+            '',
+            f'{call.method} {call.path} HTTP/1.1',
+        ])
+        if call.body is not None:
+            lines.extend([
+                'Content-Type: application/json',
+                '',
+                json.dumps(call.body),
+            ])
+        else:
+            lines.append('')
+    lines.append(f'--{boundary}--')
+    lines.append('')
+    return '\r\n'.join(lines).encode('utf-8')
+
+
+def _decode_http_response(payload: str) -> CallResult:
+    """Decodes |payload|, an HTTP response embedded in a batch response."""
+    head, _, body = payload.replace('\r\n', '\n').partition('\n\n')
+    status_line = head.split('\n', 1)[0]
+    status = int(status_line.split()[1])
+    body = body.strip()
+    return CallResult(status, json.loads(body) if body else {})
+
+
+def _decode_batch(content_type: str, content: bytes,
+                  num_calls: int) -> List[CallResult]:
+    """Decodes the multipart/mixed batch response |content| and returns the
+    results ordered like the calls in the request."""
+    message = email.parser.BytesParser(
+        policy=email.policy.HTTP).parsebytes(b'Content-Type: ' +
+                                             content_type.encode('utf-8') +
+                                             b'\r\n\r\n' + content)
+    results = [None] * num_calls
+    for part in message.iter_parts():
+        # Content-IDs in responses look like "<response-INDEX>".
+        content_id = part['Content-ID'].strip('<>')
+        index = int(content_id.rsplit('-', 1)[-1])
+        results[index] = _decode_http_response(part.get_payload())
+
+    missing = [index for index, result in enumerate(results) if result is None]
+    for index in missing:
+        results[index] = CallResult(500, {'error': 'Missing from response.'})
+    return results
+
+
+class ComputeClient:
+    """Client for the Compute Engine API of |project|. A client keeps a pool of
+    HTTP connections open, so create one per process and reuse it."""
+
+    def __init__(self, project: str, endpoint=COMPUTE_ENDPOINT, session=None):
+        self.project = project
+        self.endpoint = endpoint.rstrip('/')
+        if session is None:
+            credentials, _ = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+            session = google_requests.AuthorizedSession(credentials)
+        self.session = session
+
+    def _zone_path(self, zone: str, *parts) -> str:
+        """Returns the API path of the zonal resource specified by |parts|."""
+        return '/'.join((API_PATH, 'projects', self.project, 'zones', zone) +
+                        parts)
+
+    def request(self, method: str, path: str, body=None, params=None) -> dict:
+        """Executes a single call and returns the decoded response. Raises
+        ComputeApiError if the call fails."""
+        response = self.session.request(method,
+                                        self.endpoint + path,
+                                        json=body,
+                                        params=params,
+                                        timeout=REQUEST_TIMEOUT_SECONDS)
+        if not _is_success(response.status_code):
+            raise ComputeApiError(
+                f'{method} {path} returned {response.status_code}: '
+                f'{response.text}')
+        return response.json() if response.content else {}
+
+    def batch(self, calls: List[Call]) -> List[CallResult]:
+        """Executes |calls| using as few HTTP requests as possible and returns
+        their results in the same order. Calls failing individually are
+        reported in their result, only failures of entire batches raise
+        ComputeApiError."""
+        results = []
+        for idx in range(0, len(calls), BATCH_SIZE):
+            calls_batch = calls[idx:idx + BATCH_SIZE]
+            boundary = f'batch_{uuid.uuid4().hex}'
+            response = self.session.post(
+                self.endpoint + BATCH_PATH,
+                data=_encode_batch(calls_batch, boundary),
+                headers={
+                    'Content-Type': f'multipart/mixed; boundary={boundary}'
+                },
+                timeout=REQUEST_TIMEOUT_SECONDS)
+            if not _is_success(response.status_code):
+                raise ComputeApiError(
+                    f'Batch request returned {response.status_code}: '
+                    f'{response.text}')
+            results.extend(
+                _decode_batch(response.headers['Content-Type'],
+                              response.content, len(calls_batch)))
+        return results
+
+    def insert_instances(self, zone: str,
+                         instance_bodies: List[dict]) -> List[CallResult]:
+        """Starts creating the instances described by |instance_bodies| in
+        |zone|. Returns the result of each insert, successful ones contain the
+        operation to wait on."""
+        path = self._zone_path(zone, 'instances')
+        return self.batch(
+            [Call('POST', path, body) for body in instance_bodies])
+
+    def delete_instances(self, zone: str,
+                         instance_names: List[str]) -> List[CallResult]:
+        """Starts deleting |instance_names| in |zone|. Returns the result of
+        each delete, successful ones contain the operation to wait on."""
+        return self.batch([
+            Call('DELETE', self._zone_path(zone, 'instances', name), None)
+            for name in instance_names
+        ])
+
+    def wait_for_operations(
+            self,
+            zone: str,
+            operations: List[dict],
+            timeout: int = OPERATION_TIMEOUT_SECONDS) -> Dict[str, bool]:
+        """Polls |operations| in |zone| until they are done or |timeout|
+        seconds have passed. Returns a dictionary mapping each operation's
+        target (e.g. the instance URL) to whether it succeeded. Operations that
+        didn't finish in time are considered failed."""
+        pending = {
+            operation['name']: operation
+            for operation in operations
+            if operation.get('status') != 'DONE'
+        }
+        finished = [
+            operation for operation in operations
+            if operation.get('status') == 'DONE'
+        ]
+        deadline = time.time() + timeout
+        while pending and time.time() < deadline:
+            time.sleep(OPERATION_POLL_SECONDS)
+            names = list(pending)
+            results = self.batch([
+                Call('GET', self._zone_path(zone, 'operations', name), None)
+                for name in names
+            ])
+            for name, result in zip(names, results):
+                if not _is_success(result.status):
+                    logs.warning('Failed to poll operation %s: %s.', name,
+                                 result.body)
+                    continue
+                if result.body.get('status') == 'DONE':
+                    finished.append(result.body)
+                    del pending[name]
+
+        operation_results = {}
+        for operation in finished:
+            succeeded = not operation.get('error')
+            if not succeeded:
+                logs.error('Operation %s failed: %s.', operation['name'],
+                           operation['error'])
+            operation_results[operation['targetLink']] = succeeded
+        for operation in pending.values():
+            logs.error('Operation %s timed out.', operation['name'])
+            operation_results[operation['targetLink']] = False
+        return operation_results
+
+    def list_instances(
+            self,
+            zone: str,
+            filter_expression: Optional[str] = None) -> Iterator[dict]:
+        """Returns an iterator of the instances in |zone| matching
+        |filter_expression|."""
+        params = {}
+        if filter_expression:
+            params['filter'] = filter_expression
+        path = self._zone_path(zone, 'instances')
+        while True:
+            response = self.request('GET', path, params=params)
+            yield from response.get('items', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+            params['pageToken'] = page_token
+
+
+def wait_for_results(client: ComputeClient, zone: str,
+                     results: List[CallResult]) -> List[bool]:
+    """Waits for the operations started by |results| (from a call to
+    insert_instances or delete_instances) in |zone| and returns whether each
+    of them succeeded."""
+    operations = []
+    for result in results:
+        if _is_success(result.status):
+            operations.append(result.body)
+        else:
+            logs.error('Compute API call failed: %s.', result.body)
+    operation_results = client.wait_for_operations(zone, operations)
+    succeeded = []
+    for result in results:
+        if not _is_success(result.status):
+            succeeded.append(False)
+            continue
+        succeeded.append(operation_results.get(result.body['targetLink'],
+                                               False))
+    return succeeded
+
+
+def parse_memory_mb(memory: str) -> int:
+    """Returns the size in MB of |memory|, a string such as "12GB"."""
+    units = {'MB': 1, 'GB': 1024}
+    for suffix, multiplier in units.items():
+        if memory.upper().endswith(suffix):
+            return int(float(memory[:-len(suffix)]) * multiplier)
+    return int(memory)
+
+
+def initialize(project: str, **kwargs) -> ComputeClient:
+    """Initializes the client used by this process for |project|."""
+    global _client
+    _client = ComputeClient(project, **kwargs)
+    return _client
+
+
+def get_client(project: Optional[str] = None) -> Optional[ComputeClient]:
+    """Returns the client used by this process. If no client was initialized
+    yet and |project| is provided, initializes one for |project|."""
+    if _client is None and project is not None:
+        return initialize(project)
+    return _client
+
+
+def reset():
+    """Drops the client used by this process. Useful for testing."""
+    global _client
+    _client = None
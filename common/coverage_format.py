@@ -0,0 +1,209 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Binary format for the branches (or regions) covered by each fuzzer on a
+benchmark.
+
+Every branch covered by any fuzzer on the benchmark is stored once in a table
+of integers and the branches covered by each fuzzer are a bitmap over the rows
+of that table. The binary file contains:
+    MAGIC | table (rows x columns, little-endian, row-major) | padding |
+    one bitmap per fuzzer (np.packbits of a bool per row).
+The JSON index stored next to it describes the layout (format version, dtype,
+offsets and the fuzzer of each bitmap), so that the binary file can be
+memory-mapped without being parsed."""
+
+import collections
+import itertools
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+VERSION = 1
+MAGIC = b'FBCOV\x00\x00\x01'
+BINARY_FILENAME = 'covered_branches.bin'
+INDEX_FILENAME = 'covered_branches.index.json'
+
+# Sections of the binary file start at a multiple of this.
+ALIGNMENT = 8
+
+# The branches covered by |fuzzers|. |branches| has one branch per row,
+# |bitmaps| has the packed bitmap of each of |fuzzers| per row.
+CoveredBranches = collections.namedtuple('CoveredBranches',
+                                         ['fuzzers', 'branches', 'bitmaps'])
+
+
+class CoverageFormatError(Exception):
+    """Error raised when a covered branches file can't be read."""
+
+
+def _align(offset: int) -> int:
+    """Returns |offset| rounded up to ALIGNMENT."""
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _get_table_dtype(branches: np.ndarray) -> np.dtype:
+    """Returns the smallest little-endian integer dtype that can hold every
+    value in |branches|."""
+    if not branches.size:
+        return np.dtype('<i4')
+    low, high = int(branches.min()), int(branches.max())
+    for dtype in ('<i2', '<i4'):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype('<i8')
+
+
+def _to_array(covered_branches) -> np.ndarray:
+    """Returns |covered_branches|, a list of branches (lists of integers), as
+    a 2D array with a row for each branch."""
+    if len(covered_branches) == 0:
+        return np.empty((0, 0), dtype=np.int64)
+    # Much faster than np.asarray() on a list of lists.
+    values = np.fromiter(itertools.chain.from_iterable(covered_branches),
+                         dtype=np.int64)
+    return values.reshape(len(covered_branches), -1)
+
+
+def _get_table_and_bitmaps(fuzzer_arrays: List[np.ndarray], num_columns: int):
+    """Returns the table of every branch in |fuzzer_arrays| and the packed
+    bitmap of the branches in each of them."""
+    if not fuzzer_arrays:
+        return np.empty((0, num_columns), dtype=np.int64), np.empty(
+            (0, 0), dtype=np.uint8)
+    # Sorting makes the table deterministic.
+    branches, inverse = np.unique(np.concatenate(fuzzer_arrays),
+                                  axis=0,
+                                  return_inverse=True)
+    covered = np.zeros((len(fuzzer_arrays), len(branches)), dtype=bool)
+    fuzzer_indexes = np.repeat(np.arange(len(fuzzer_arrays)),
+                               [len(array) for array in fuzzer_arrays])
+    covered[fuzzer_indexes, inverse.reshape(-1)] = True
+    return branches, np.packbits(covered, axis=1, bitorder='little')
+
+
+def encode(fuzzers_covered_branches: Dict[str, List[List[int]]]):
+    """Returns the contents of the binary file and of the index for
+    |fuzzers_covered_branches|, a dictionary mapping each fuzzer to the
+    branches it covered."""
+    fuzzers = sorted(fuzzers_covered_branches)
+    arrays = [_to_array(fuzzers_covered_branches[fuzzer]) for fuzzer in fuzzers]
+    num_columns = max((array.shape[1] for array in arrays), default=0)
+    arrays = [
+        array if len(array) else np.empty((0, num_columns), dtype=np.int64)
+        for array in arrays
+    ]
+    branches, bitmaps = _get_table_and_bitmaps(arrays, num_columns)
+
+    dtype = _get_table_dtype(branches)
+    table = branches.astype(dtype).tobytes()
+    table_offset = len(MAGIC)
+    bitmaps_offset = _align(table_offset + len(table))
+    contents = b''.join([
+        MAGIC, table, b'\x00' * (bitmaps_offset - table_offset - len(table)),
+        bitmaps.tobytes()
+    ])
+    index = {
+        'version': VERSION,
+        'dtype': dtype.str,
+        'num_branches': len(branches),
+        'num_columns': num_columns,
+        'table_offset': table_offset,
+        'bitmaps_offset': bitmaps_offset,
+        'bitmap_size': bitmaps.shape[1],
+        'fuzzers': fuzzers,
+    }
+    return contents, index
+
+
+def write(directory: str, fuzzers_covered_branches: Dict[str, List[List[int]]]):
+    """Writes the binary file and the index for |fuzzers_covered_branches| to
+    |directory|. Returns their paths."""
+    contents, index = encode(fuzzers_covered_branches)
+    binary_path = os.path.join(directory, BINARY_FILENAME)
+    index_path = os.path.join(directory, INDEX_FILENAME)
+    with open(binary_path, 'wb') as file_handle:
+        file_handle.write(contents)
+    with open(index_path, 'w', encoding='utf-8') as file_handle:
+        json.dump(index, file_handle)
+    return binary_path, index_path
+
+
+def read_index(index_path: str) -> dict:
+    """Returns the index stored in |index_path|. Raises CoverageFormatError if
+    it is for an unsupported version of the format."""
+    with open(index_path, encoding='utf-8') as file_handle:
+        index = json.load(file_handle)
+    if index.get('version') != VERSION:
+        raise CoverageFormatError(
+            f'Unsupported covered branches version: {index.get("version")}.')
+    return index
+
+
+def load(binary_path: str,
+         index: dict,
+         mmap_mode: Optional[str] = 'r') -> CoveredBranches:
+    """Returns the CoveredBranches stored in |binary_path| described by
+    |index|. Like np.load, the file is memory-mapped unless |mmap_mode| is
+    None, in which case it is read into memory."""
+    with open(binary_path, 'rb') as file_handle:
+        if file_handle.read(len(MAGIC)) != MAGIC:
+            raise CoverageFormatError(
+                f'{binary_path} is not a covered branches file.')
+
+    branches = _load_array(binary_path, index['table_offset'],
+                           np.dtype(index['dtype']),
+                           (index['num_branches'], index['num_columns']),
+                           mmap_mode)
+    bitmaps = _load_array(binary_path, index['bitmaps_offset'], np.uint8,
+                          (len(index['fuzzers']), index['bitmap_size']),
+                          mmap_mode)
+    return CoveredBranches(index['fuzzers'], branches, bitmaps)
+
+
+def _load_array(binary_path: str, offset: int, dtype, shape,
+                mmap_mode: Optional[str]) -> np.ndarray:
+    """Returns the array of |shape| and |dtype| at |offset| in
+    |binary_path|."""
+    size = int(np.prod(shape))
+    if not size:
+        # Numpy can't map empty arrays.
+        return np.empty(shape, dtype=dtype)
+    if mmap_mode is None:
+        return np.fromfile(binary_path, dtype=dtype, count=size,
+                           offset=offset).reshape(shape)
+    return np.memmap(binary_path,
+                     dtype=dtype,
+                     mode=mmap_mode,
+                     offset=offset,
+                     shape=shape)
+
+
+def get_covered(covered_branches: CoveredBranches, fuzzer: str) -> np.ndarray:
+    """Returns a bool array with an element for each branch in
+    |covered_branches| that is True if |fuzzer| covered it."""
+    fuzzer_index = covered_branches.fuzzers.index(fuzzer)
+    return np.unpackbits(covered_branches.bitmaps[fuzzer_index],
+                         count=len(covered_branches.branches),
+                         bitorder='little').astype(bool)
+
+
+def get_fuzzer_branches(covered_branches: CoveredBranches,
+                        fuzzer: str) -> np.ndarray:
+    """Returns the branches covered by |fuzzer| as an array with a row for
+    each branch."""
+    branches = covered_branches.branches[get_covered(covered_branches, fuzzer)]
+    return np.asarray(branches, dtype=np.int64)
@@ -0,0 +1,223 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Topology-aware allocation of CPUs to runners and measurers. Runners get
+whole physical cores (every SMT sibling) on a single NUMA node so that trials
+don't interfere with each other and measurers are kept off the cores used by
+runners."""
+
+import collections
+import glob
+import multiprocessing
+import os
+import sys
+from typing import Dict, List, Optional
+
+from common import logs
+
+SYSFS_CPU_DIR = '/sys/devices/system/cpu'
+
+# A logical CPU and where it sits in the topology of the machine. |core| is a
+# machine-wide identifier of the physical core, SMT siblings share it.
+Cpu = collections.namedtuple('Cpu', ['cpu', 'core', 'node', 'l3'])
+
+
+def parse_cpu_list(cpu_list: str) -> List[int]:
+    """Returns the CPUs in |cpu_list|, a string in the kernel's cpulist format
+    (e.g. "0-3,8")."""
+    cpus = []
+    for cpu_range in cpu_list.strip().split(','):
+        if not cpu_range:
+            continue
+        start, _, end = cpu_range.partition('-')
+        cpus.extend(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def format_cpu_list(cpus: List[int]) -> str:
+    """Returns |cpus| in the cpulist format used by the kernel and by docker's
+    --cpuset-cpus. Single CPUs are written as ranges (e.g. "5-5") like the
+    cpusets the scheduler used before it was topology-aware."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{start}-{end}' for start, end in ranges)
+
+
+def _read(path: str) -> Optional[str]:
+    """Returns the contents of |path| or None if it can't be read."""
+    try:
+        with open(path, encoding='utf-8') as file_handle:
+            return file_handle.read().strip()
+    except OSError:
+        return None
+
+
+def _get_node(cpu_dir: str) -> int:
+    """Returns the NUMA node of the CPU described in |cpu_dir|."""
+    node_dirs = glob.glob(os.path.join(cpu_dir, 'node[0-9]*'))
+    if not node_dirs:
+        return 0
+    return int(os.path.basename(node_dirs[0])[len('node'):])
+
+
+def _get_l3(cpu_dir: str) -> int:
+    """Returns an identifier (the lowest CPU sharing it) for the L3 cache of
+    the CPU described in |cpu_dir|."""
+    for cache_dir in glob.glob(os.path.join(cpu_dir, 'cache', 'index[0-9]*')):
+        if _read(os.path.join(cache_dir, 'level')) != '3':
+            continue
+        shared_cpu_list = _read(os.path.join(cache_dir, 'shared_cpu_list'))
+        if shared_cpu_list:
+            return min(parse_cpu_list(shared_cpu_list))
+    return 0
+
+
+def get_flat_topology(num_cpus: int) -> List[Cpu]:
+    """Returns the topology of a machine with |num_cpus| CPUs that are each
+    their own physical core on node 0. Used when the real topology isn't known,
+    e.g. for instances that haven't been created yet."""
+    return [Cpu(cpu, cpu, 0, 0) for cpu in range(num_cpus)]
+
+
+def read_topology(sysfs_cpu_dir: str = SYSFS_CPU_DIR) -> List[Cpu]:
+    """Returns the online CPUs of this machine as described by
+    |sysfs_cpu_dir|. If the topology can't be read, every CPU is treated as
+    its own physical core on node 0."""
+    online = _read(os.path.join(sysfs_cpu_dir, 'online'))
+    if online is None:
+        logs.warning('Could not read CPU topology, ignoring it.')
+        return get_flat_topology(multiprocessing.cpu_count())
+
+    topology = []
+    for cpu in parse_cpu_list(online):
+        cpu_dir = os.path.join(sysfs_cpu_dir, f'cpu{cpu}')
+        siblings = _read(
+            os.path.join(cpu_dir, 'topology', 'thread_siblings_list'))
+        # Identify each physical core by its lowest numbered SMT sibling.
+        core = min(parse_cpu_list(siblings)) if siblings else cpu
+        topology.append(Cpu(cpu, core, _get_node(cpu_dir), _get_l3(cpu_dir)))
+    return topology
+
+
+def _get_cores(topology: List[Cpu]) -> Dict[int, List[Cpu]]:
+    """Returns a dictionary mapping each physical core in |topology| to its
+    logical CPUs. Cores are ordered by NUMA node and L3 cache so that
+    neighbouring cores share as much as possible."""
+    cores = collections.defaultdict(list)
+    for cpu in topology:
+        cores[cpu.core].append(cpu)
+    return dict(
+        sorted(cores.items(),
+               key=lambda item: (item[1][0].node, item[1][0].l3, item[0])))
+
+
+def allocate_runner_cpusets(topology: List[Cpu], runners_cpus: int,
+                            cores_per_trial: int) -> List[str]:
+    """Returns the cpusets for the trials that can run on |runners_cpus|
+    physical cores of |topology|. Each cpuset contains every SMT sibling of
+    |cores_per_trial| physical cores on a single NUMA node. The siblings don't
+    count against |runners_cpus|, they are only reserved so that nothing else
+    runs on the same cores as trials."""
+    cores_by_node = collections.defaultdict(list)
+    for core_cpus in _get_cores(topology).values():
+        cores_by_node[core_cpus[0].node].append(core_cpus)
+
+    num_trials = runners_cpus // cores_per_trial
+    cpusets = []
+    for node_cores in cores_by_node.values():
+        for idx in range(0,
+                         len(node_cores) - cores_per_trial + 1,
+                         cores_per_trial):
+            if len(cpusets) == num_trials:
+                return cpusets
+            trial_cpus = [
+                cpu.cpu
+                for core_cpus in node_cores[idx:idx + cores_per_trial]
+                for cpu in core_cpus
+            ]
+            cpusets.append(format_cpu_list(trial_cpus))
+
+    if len(cpusets) < num_trials:
+        logs.warning('Only %d of %d runners fit on the cores of this machine.',
+                     len(cpusets), num_trials)
+    return cpusets
+
+
+def get_runner_cpusets(topology: List[Cpu], runners_cpus: int,
+                       cores_per_trial: int) -> List[str]:
+    """Returns the cpusets to run trials on, given |runners_cpus| physical
+    cores of |topology| and |cores_per_trial| of them per trial. If no trial
+    fits on the cores of a single NUMA node, CPUs are handed out in order
+    instead. Both the scheduler and the measurer use this so that measurers
+    are kept off the CPUs runners actually use. Raises ValueError if
+    |runners_cpus| is too small for a single trial."""
+    num_trials = runners_cpus // cores_per_trial
+    if not num_trials:
+        raise ValueError(f'runners_cpus ({runners_cpus}) is less than '
+                         f'runner_num_cpu_cores ({cores_per_trial}).')
+    cpusets = allocate_runner_cpusets(topology, runners_cpus, cores_per_trial)
+    if not cpusets:
+        logs.error(
+            'No runner with %d cores fits on a NUMA node of this machine. '
+            'Scheduling runners without following the topology.',
+            cores_per_trial)
+        cpusets = allocate_runner_cpusets(get_flat_topology(runners_cpus),
+                                          runners_cpus, cores_per_trial)
+    return cpusets
+
+
+def allocate_measurer_cpus(topology: List[Cpu], runner_cpusets: List[str],
+                           measurers_cpus: int) -> List[int]:
+    """Returns the logical CPUs of |topology| to pin |measurers_cpus|
+    measurers to. CPUs on physical cores used by runners in |runner_cpusets|
+    are avoided. If there aren't enough free CPUs, measurers share them."""
+    runner_cpus = set()
+    for cpuset in runner_cpusets:
+        runner_cpus.update(parse_cpu_list(cpuset))
+
+    runner_cores = {cpu.core for cpu in topology if cpu.cpu in runner_cpus}
+    free_cpus = [
+        cpu.cpu
+        for core_cpus in _get_cores(topology).values()
+        for cpu in core_cpus
+        if cpu.core not in runner_cores
+    ]
+    if len(free_cpus) < measurers_cpus:
+        logs.warning('Only %d CPUs are free for %d measurers.', len(free_cpus),
+                     measurers_cpus)
+        if not free_cpus:
+            free_cpus = [cpu.cpu for cpu in topology]
+    return [free_cpus[idx % len(free_cpus)] for idx in range(measurers_cpus)]
+
+
+def main():
+    """Prints the cpusets of the trials that can run on this machine, one per
+    line. Used by packed runner instances, whose topology isn't known until
+    they are running."""
+    if len(sys.argv) != 3:
+        print(f'Usage: {sys.argv[0]} RUNNERS_CPUS CORES_PER_TRIAL',
+              file=sys.stderr)
+        return 1
+    runners_cpus, cores_per_trial = (int(arg) for arg in sys.argv[1:])
+    for cpuset in get_runner_cpusets(read_topology(), runners_cpus,
+                                     cores_per_trial):
+        print(cpuset)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
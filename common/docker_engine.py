@@ -0,0 +1,294 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Client for the Docker Engine API on the local docker socket. Used to run
+containers for local experiments without spawning a "docker" process per
+container. Connections are pooled and calls for many containers are made
+concurrently."""
+
+import collections
+import concurrent.futures
+import http.client
+import json
+import queue
+import socket
+import sys
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+from common import logs
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+API_VERSION = 'v1.41'
+
+# Maximum number of connections to the socket and of concurrent calls.
+POOL_SIZE = 16
+
+# Seconds to wait for a container to exit after SIGTERM before killing it.
+STOP_TIMEOUT_SECONDS = 10
+
+# Generous so that pulling and creating many containers at once doesn't time
+# out, following logs or waiting for a container uses no timeout.
+REQUEST_TIMEOUT_SECONDS = 5 * 60
+
+# pylint: disable=invalid-name
+_client = None
+
+# The state of a container. |status| is docker's status (e.g. "running" or
+# "exited"). |exit_code| is only meaningful once the container exited.
+ContainerState = collections.namedtuple('ContainerState',
+                                        ['name', 'status', 'exit_code'])
+
+
+class DockerEngineError(Exception):
+    """Error returned by the Docker Engine API."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection to a unix domain socket."""
+
+    def __init__(self, socket_path: str, timeout=REQUEST_TIMEOUT_SECONDS):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def use_docker_engine(config: dict) -> bool:
+    """Returns True if local containers described by |config| should be
+    managed using the Docker Engine API rather than the docker CLI."""
+    return bool(config.get('use_docker_engine'))
+
+
+class DockerClient:
+    """Client for the Docker Engine listening on |socket_path|. A client keeps
+    a pool of connections open, so create one per process and reuse it."""
+
+    def __init__(self, socket_path: str = DOCKER_SOCKET, pool_size=POOL_SIZE):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._connections = queue.LifoQueue()
+
+    def _get_connection(self) -> UnixHTTPConnection:
+        """Returns an idle connection from the pool or a new one."""
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path)
+
+    def _release_connection(self, connection: UnixHTTPConnection):
+        """Returns |connection| to the pool, unless the pool is full."""
+        if self._connections.qsize() < self.pool_size:
+            self._connections.put(connection)
+        else:
+            connection.close()
+
+    def request(self, method: str, path: str, body=None, params=None):
+        """Executes a call and returns the decoded JSON response (or None if
+        the response is empty). Raises DockerEngineError if the call fails."""
+        url = f'/{API_VERSION}{path}'
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        headers = {}
+        content = None
+        if body is not None:
+            content = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+
+        connection = self._get_connection()
+        try:
+            connection.request(method, url, body=content, headers=headers)
+            response = connection.getresponse()
+            response_content = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            connection.close()
+            raise DockerEngineError(
+                f'{method} {path} failed: {error}.') from error
+        self._release_connection(connection)
+
+        if response.status >= 300:
+            raise DockerEngineError(
+                f'{method} {path} returned {response.status}: '
+                f'{response_content.decode("utf-8", errors="replace")}',
+                response.status)
+        if not response_content:
+            return None
+        return json.loads(response_content)
+
+    def map(self, function, args_list: List[tuple]) -> list:
+        """Returns the results of calling |function| with each of the
+        |args_list| concurrently."""
+        if not args_list:
+            return []
+        max_workers = min(self.pool_size, len(args_list))
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(lambda args: function(*args), args_list))
+
+    def run_container(self, name: str, config: dict) -> bool:
+        """Creates and starts a container named |name| as specified by
+        |config| (the body of a container create call). Returns True on
+        success. A container that can't be started is removed, so that the
+        name can be used again."""
+        try:
+            self.request('POST',
+                         '/containers/create',
+                         body=config,
+                         params={'name': name})
+        except DockerEngineError as error:
+            logs.error('Failed to create container %s: %s', name, error)
+            return False
+        try:
+            self.request('POST', f'/containers/{name}/start')
+        except DockerEngineError as error:
+            logs.error('Failed to start container %s: %s', name, error)
+            self.stop_container(name)
+            return False
+        return True
+
+    def run_containers(self, containers: List[Tuple[str, dict]]) -> List[bool]:
+        """Runs |containers|, a list of (name, config) tuples, concurrently.
+        Returns whether each container was started."""
+        return self.map(self.run_container, containers)
+
+    def stop_container(self,
+                       name: str,
+                       timeout: int = STOP_TIMEOUT_SECONDS) -> bool:
+        """Stops and removes container |name|. Returns True if it is gone,
+        including if it didn't exist in the first place."""
+        try:
+            # Stop first so that the container gets a chance to exit cleanly.
+            self.request('POST',
+                         f'/containers/{name}/stop',
+                         params={'t': timeout})
+        except DockerEngineError as error:
+            # 304 means it already stopped.
+            if error.status not in (304, 404):
+                logs.error('Failed to stop container %s: %s', name, error)
+                return False
+        try:
+            self.request('DELETE',
+                         f'/containers/{name}',
+                         params={'force': 'true'})
+        except DockerEngineError as error:
+            if error.status != 404:
+                logs.error('Failed to remove container %s: %s', name, error)
+                return False
+        return True
+
+    def stop_containers(self,
+                        names: List[str],
+                        timeout: int = STOP_TIMEOUT_SECONDS) -> bool:
+        """Stops and removes |names| concurrently. Returns True if all of them
+        are gone."""
+        return all(
+            self.map(self.stop_container, [(name, timeout) for name in names]))
+
+    def get_container_state(self, name: str) -> Optional[ContainerState]:
+        """Returns the state of container |name| or None if it doesn't
+        exist."""
+        try:
+            container = self.request('GET', f'/containers/{name}/json')
+        except DockerEngineError as error:
+            if error.status != 404:
+                logs.error('Failed to inspect container %s: %s', name, error)
+            return None
+        state = container['State']
+        return ContainerState(name, state['Status'], state['ExitCode'])
+
+    def get_container_states(
+            self, names: List[str]) -> Dict[str, Optional[ContainerState]]:
+        """Returns a dictionary mapping each of |names| to its state (or None
+        if it doesn't exist). Containers are inspected concurrently."""
+        states = self.map(self.get_container_state, [(name,) for name in names])
+        return dict(zip(names, states))
+
+    def list_containers(self, name_prefix: str = '') -> List[str]:
+        """Returns the names of all containers, including stopped ones, whose
+        name starts with |name_prefix|."""
+        params = {'all': 'true'}
+        if name_prefix:
+            # This filter matches anywhere in the name, so filter again below.
+            params['filters'] = json.dumps({'name': [name_prefix]})
+        containers = self.request('GET', '/containers/json', params=params)
+        names = []
+        for container in containers:
+            for name in container['Names']:
+                name = name.lstrip('/')
+                if name.startswith(name_prefix):
+                    names.append(name)
+        return names
+
+    def stream_logs(self, name: str, output=None):
+        """Writes the output of container |name| to |output| (stdout by
+        default) until the container exits. The container must have been
+        created with "Tty" so that its output is not multiplexed."""
+        output = output or sys.stdout.buffer
+        connection = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            connection.request(
+                'GET', f'/{API_VERSION}/containers/{name}/logs?' +
+                urllib.parse.urlencode({
+                    'follow': 'true',
+                    'stdout': 'true',
+                    'stderr': 'true'
+                }))
+            response = connection.getresponse()
+            while True:
+                chunk = response.read1(64 * 1024)
+                if not chunk:
+                    break
+                output.write(chunk)
+                output.flush()
+        finally:
+            connection.close()
+
+    def wait_container(self, name: str) -> int:
+        """Waits for container |name| to exit and returns its exit code."""
+        connection = UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            connection.request('POST', f'/{API_VERSION}/containers/{name}/wait')
+            response = connection.getresponse()
+            result = json.loads(response.read())
+        finally:
+            connection.close()
+        if response.status >= 300:
+            raise DockerEngineError(f'Waiting for {name} failed: {result}',
+                                    response.status)
+        return result['StatusCode']
+
+
+def initialize(**kwargs) -> DockerClient:
+    """Initializes the client used by this process."""
+    global _client
+    _client = DockerClient(**kwargs)
+    return _client
+
+
+def get_client() -> DockerClient:
+    """Returns the client used by this process, initializing it if needed."""
+    if _client is None:
+        return initialize()
+    return _client
+
+
+def reset():
+    """Drops the client used by this process. Useful for testing."""
+    global _client
+    _client = None
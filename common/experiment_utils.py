@@ -15,6 +15,7 @@
 
 import os
 import posixpath
+from typing import Optional
 
 from common import benchmark_utils
 from common import environment
@@ -115,7 +116,33 @@ def get_dispatcher_instance_name(experiment: str) -> str:
 
 def get_trial_instance_name(experiment: str, trial_id: int) -> str:
     """Returns a unique instance name for each trial of an experiment."""
-    return f'r-{experiment}-{trial_id}'
+    return f'{get_trial_instance_name_prefix(experiment)}{trial_id}'
+
+
+def get_trial_instance_name_prefix(experiment: str) -> str:
+    """Returns the prefix shared by the instance names of every trial of
+    |experiment|."""
+    return f'r-{experiment}-'
+
+
+def get_packed_instance_name(experiment: str, trial_id: int) -> str:
+    """Returns the name of the instance running multiple trials of |experiment|
+    starting with trial |trial_id|."""
+    return f'{get_trial_instance_name_prefix(experiment)}h{trial_id}'
+
+
+def get_trial_id_from_instance_name(experiment: str,
+                                    instance_name: str) -> Optional[int]:
+    """Returns the id of the trial that |instance_name| was created for or None
+    if |instance_name| isn't a trial instance of |experiment| (or is a packed
+    instance running multiple trials)."""
+    prefix = get_trial_instance_name_prefix(experiment)
+    if not instance_name.startswith(prefix):
+        return None
+    trial_id = instance_name[len(prefix):]
+    if not trial_id.isdigit():
+        return None
+    return int(trial_id)
 
 
 def get_cycle_filename(basename: str, cycle: int) -> str:
@@ -0,0 +1,936 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-process clients for the filestore: the local filesystem for local
+experiments, or Google Cloud Storage through its JSON API. Unlike running "cp"
+or "gsutil", operations don't fork a process. Clients are thread-safe, use
+get_local_filestore() and get_gcs_filestore() to share them within a
+process."""
+
+import base64
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import http.client
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import queue
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from typing import Dict, List, Optional
+
+import google.auth
+import google.auth.exceptions
+from google.auth.transport import requests as google_auth_requests
+
+from common import environment
+from common import filesystem
+from common import new_process
+from common import utils
+
+GCS_PREFIX = 'gs://'
+GCS_ENDPOINT = 'https://storage.googleapis.com'
+GCS_SCOPES = ['https://www.googleapis.com/auth/devstorage.read_write']
+
+# Maximum number of connections to GCS and of concurrent transfers.
+POOL_SIZE = 16
+
+REQUEST_TIMEOUT_SECONDS = 5 * 60
+NUM_RETRIES = 3
+RETRY_DELAY = 1
+
+# Fields of the objects returned by the JSON API.
+OBJECT_FIELDS = 'name,size,generation,md5Hash'
+
+# gsutil's "-h" headers that can be set as metadata of uploaded objects.
+HEADER_METADATA = {
+    'cache-control': 'cacheControl',
+    'content-disposition': 'contentDisposition',
+    'content-encoding': 'contentEncoding',
+    'content-language': 'contentLanguage',
+    'content-type': 'contentType',
+}
+
+# A file (or GCS object). |version| changes whenever it is modified. |md5| is
+# the base64 encoded MD5 digest of its contents when it is known without
+# reading them.
+ObjectInfo = collections.namedtuple('ObjectInfo',
+                                    ['path', 'size', 'version', 'md5'])
+
+# pylint: disable=invalid-name
+_local_filestore = None
+_gcs_filestore = None
+_clients_lock = threading.Lock()
+
+
+class FilestoreError(Exception):
+    """Error raised when a filestore operation fails."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class FilestoreNotFoundError(FilestoreError):
+    """Error raised when a file doesn't exist."""
+
+
+class TransientFilestoreError(FilestoreError):
+    """Error raised when an operation failed but may succeed if retried."""
+
+
+def is_gcs_path(path: str) -> bool:
+    """Returns True if |path| is a gs:// URL."""
+    return path.startswith(GCS_PREFIX)
+
+
+def parse_gcs_path(path: str):
+    """Returns the bucket and the object name (or prefix) of the gs:// URL
+    |path|."""
+    bucket, _, name = path[len(GCS_PREFIX):].partition('/')
+    return bucket, name
+
+
+def get_md5(local_path: str) -> str:
+    """Returns the base64 encoded MD5 digest of |local_path|, like GCS."""
+    md5 = hashlib.md5()
+    with open(local_path, 'rb') as file_handle:
+        for chunk in iter(lambda: file_handle.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+
+def _walk(directory: str, recursive: bool = True) -> Dict[str, ObjectInfo]:
+    """Returns a dictionary mapping the path relative to |directory| of each
+    file in it (and its subdirectories if |recursive|) to its ObjectInfo."""
+    files = {}
+    for root, dirs, filenames in os.walk(directory):
+        if not recursive:
+            dirs.clear()
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            files[os.path.relpath(path, directory)] = ObjectInfo(
+                path, file_stat.st_size,
+                f'{file_stat.st_mtime_ns}-{file_stat.st_size}', None)
+    return files
+
+
+def _remove_extra_directories(source: str, destination: str):
+    """Removes the directories in |destination| that aren't in |source|."""
+    for root, dirs, _ in os.walk(destination, topdown=False):
+        for directory in dirs:
+            path = os.path.join(root, directory)
+            if not os.path.isdir(
+                    os.path.join(source, os.path.relpath(path, destination))):
+                shutil.rmtree(path)
+
+
+def run(function, *args, expect_zero=True, **kwargs):
+    """Returns the result of calling |function| as a
+    new_process.ProcessResult, like the commands the filestore used to run.
+    |function| returns the output, if any. Raises
+    subprocess.CalledProcessError if |function| fails and |expect_zero|."""
+    try:
+        output = function(*args, **kwargs)
+    except FilestoreError as error:
+        if expect_zero:
+            raise subprocess.CalledProcessError(1, [function.__name__] +
+                                                list(args),
+                                                output=str(error)) from error
+        return new_process.ProcessResult(1, str(error), False)
+    return new_process.ProcessResult(0, output or '', False)
+
+
+def run_many(function, arguments: Dict, max_workers: int = POOL_SIZE) -> Dict:
+    """Calls |function| with each tuple of arguments in the values of
+    |arguments| using up to |max_workers| threads. Returns a dictionary mapping
+    each key of |arguments| to the value returned by |function|."""
+    if len(arguments) <= 1 or max_workers <= 1:
+        return {key: function(*args) for key, args in arguments.items()}
+    max_workers = min(max_workers, len(arguments))
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        return dict(
+            zip(arguments,
+                executor.map(lambda args: function(*args), arguments.values())))
+
+
+def succeeded(errors: Dict) -> Dict:
+    """Returns a dictionary mapping each key of |errors|, as returned by bulk
+    operations, to True if the operation succeeded."""
+    return {key: error is None for key, error in errors.items()}
+
+
+def _get_error(function, *args) -> Optional[FilestoreError]:
+    """Calls |function| with |args|. Returns the FilestoreError it raised or
+    None if it succeeded."""
+    try:
+        function(*args)
+    except FilestoreError as error:
+        return error
+    return None
+
+
+class Filestore:
+    """Interface of the filestore clients. Paths are local paths or gs:// URLs
+    depending on the implementation. Directories are just prefixes of object
+    names in GCS, so they don't need to be created."""
+
+    def stat(self, path: str) -> Optional[ObjectInfo]:
+        """Returns the ObjectInfo of file |path|, or None if there is no such
+        file."""
+        raise NotImplementedError
+
+    def exists(self, path: str) -> bool:
+        """Returns True if |path| is a file or a non-empty directory."""
+        raise NotImplementedError
+
+    def list_objects(self, path: str) -> List[ObjectInfo]:
+        """Returns the ObjectInfo of every file under directory |path|."""
+        raise NotImplementedError
+
+    def list_versions(self, path: str) -> Dict[str, str]:
+        """Returns a dictionary mapping every file under |path| to its
+        version."""
+        return {info.path: info.version for info in self.list_objects(path)}
+
+    def read(self, path: str) -> bytes:
+        """Returns the contents of file |path|."""
+        raise NotImplementedError
+
+    def write(self, path: str, data: bytes, metadata=None):
+        """Writes |data| to file |path|."""
+        raise NotImplementedError
+
+    def download(self, path: str, local_path: str):
+        """Copies file |path| to |local_path|."""
+        raise NotImplementedError
+
+    def upload(self, local_path: str, path: str, metadata=None):
+        """Copies |local_path| to file |path|. |metadata| (object metadata
+        such as "cacheControl") is only used by GCS."""
+        raise NotImplementedError
+
+    def delete(self, path: str):
+        """Deletes file |path|."""
+        raise NotImplementedError
+
+    # Maximum number of files transferred concurrently by bulk operations.
+    max_workers = POOL_SIZE
+
+    def get_many(
+            self, downloads: Dict[str,
+                                  str]) -> Dict[str, Optional[FilestoreError]]:
+        """Downloads files concurrently. |downloads| maps the path of each file
+        to the local path to copy it to. Returns a dictionary mapping each path
+        to None if it was downloaded or to the FilestoreError if it
+        wasn't."""
+        return run_many(functools.partial(_get_error, self.download), {
+            path: (path, local_path) for path, local_path in downloads.items()
+        }, self.max_workers)
+
+    def put_many(self,
+                 uploads: Dict[str, str],
+                 metadata=None) -> Dict[str, Optional[FilestoreError]]:
+        """Uploads files concurrently. |uploads| maps each local path to the
+        path to copy it to. Returns a dictionary mapping each local path to
+        None if it was uploaded or to the FilestoreError if it wasn't."""
+        return run_many(
+            functools.partial(_get_error, self.upload), {
+                local_path: (local_path, path, metadata)
+                for local_path, path in uploads.items()
+            }, self.max_workers)
+
+    def exists_many(self, paths: List[str]) -> Dict[str, bool]:
+        """Returns a dictionary mapping each of |paths| to True if it exists
+        (see exists)."""
+        return run_many(self.exists, {path: (path,) for path in paths},
+                        self.max_workers)
+
+    def cp(self, source: str, destination: str, recursive: bool = False):  # pylint: disable=invalid-name
+        """Copies |source| to |destination| like "cp" and "gsutil cp". If
+        |destination| is a directory, |source| is copied into it."""
+        raise NotImplementedError
+
+    def ls(self, path: str) -> List[str]:  # pylint: disable=invalid-name
+        """Returns the files and directories in |path|, or |path| if it is a
+        file, like "ls" and "gsutil ls"."""
+        raise NotImplementedError
+
+    def rm(self, path: str, recursive: bool = True, force: bool = False):  # pylint: disable=invalid-name
+        """Removes |path| (and what it contains if |recursive|). Doesn't fail
+        if it doesn't exist and |force|."""
+        raise NotImplementedError
+
+    def rsync(  # pylint: disable=too-many-arguments
+            self,
+            source: str,
+            destination: str,
+            delete: bool = True,
+            recursive: bool = True,
+            metadata=None):
+        """Makes directory |destination| contain the same files as directory
+        |source|, only copying the files that differ. Files that aren't in
+        |source| are removed if |delete|."""
+        raise NotImplementedError
+
+
+class LocalFilestore(Filestore):
+    """Filestore on the local filesystem, used by local experiments."""
+
+    def stat(self, path):
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        return ObjectInfo(path, file_stat.st_size,
+                          f'{file_stat.st_mtime_ns}-{file_stat.st_size}', None)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def list_objects(self, path):
+        files = _walk(path)
+        return [files[relpath] for relpath in sorted(files)]
+
+    def read(self, path):
+        try:
+            with open(path, 'rb') as file_handle:
+                return file_handle.read()
+        except FileNotFoundError as error:
+            raise FilestoreNotFoundError(f'{path} does not exist.') from error
+        except OSError as error:
+            raise FilestoreError(f'Failed to read {path}: {error}.') from error
+
+    def write(self, path, data, metadata=None):
+        try:
+            filesystem.create_directory(os.path.dirname(path))
+            with open(path, 'wb') as file_handle:
+                file_handle.write(data)
+        except OSError as error:
+            raise FilestoreError(f'Failed to write {path}: {error}.') from error
+
+    def _copy_file(self, source, destination):
+        """Copies file |source| to |destination|, creating its directory."""
+        try:
+            filesystem.create_directory(os.path.dirname(destination))
+            shutil.copyfile(source, destination)
+        except FileNotFoundError as error:
+            raise FilestoreNotFoundError(f'{source} does not exist.') from error
+        except OSError as error:
+            raise FilestoreError(
+                f'Failed to copy {source} to {destination}: {error}.'
+            ) from error
+
+    def download(self, path, local_path):
+        self._copy_file(path, local_path)
+
+    def upload(self, local_path, path, metadata=None):
+        self._copy_file(local_path, path)
+
+    def delete(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError as error:
+            raise FilestoreNotFoundError(f'{path} does not exist.') from error
+        except OSError as error:
+            raise FilestoreError(
+                f'Failed to delete {path}: {error}.') from error
+
+    def cp(self, source, destination, recursive=False):
+        # Create intermediate folders to behave like `gsutil cp`.
+        filesystem.create_directory(os.path.dirname(destination))
+        if os.path.isdir(destination):
+            destination = os.path.join(destination,
+                                       os.path.basename(source.rstrip('/')))
+        if not os.path.isdir(source):
+            self._copy_file(source, destination)
+            return
+        if not recursive:
+            raise FilestoreError(f'{source} is a directory.')
+        try:
+            shutil.copytree(source, destination, dirs_exist_ok=True)
+        except (OSError, shutil.Error) as error:
+            raise FilestoreError(
+                f'Failed to copy {source} to {destination}: {error}.'
+            ) from error
+
+    def ls(self, path):
+        if os.path.isdir(path):
+            return sorted(os.listdir(path))
+        if os.path.lexists(path):
+            return [path]
+        raise FilestoreNotFoundError(f'{path} does not exist.')
+
+    def rm(self, path, recursive=True, force=False):
+        if not os.path.lexists(path):
+            if force:
+                return
+            raise FilestoreNotFoundError(f'{path} does not exist.')
+        if os.path.isdir(path) and not os.path.islink(path):
+            if not recursive:
+                raise FilestoreError(f'{path} is a directory.')
+            try:
+                shutil.rmtree(path)
+            except OSError as error:
+                raise FilestoreError(
+                    f'Failed to remove {path}: {error}.') from error
+            return
+        self.delete(path)
+
+    def rsync(  # pylint: disable=too-many-arguments
+            self,
+            source,
+            destination,
+            delete=True,
+            recursive=True,
+            metadata=None):
+        source_files = _walk(source, recursive)
+        destination_files = _walk(destination, recursive)
+        try:
+            for relpath, info in source_files.items():
+                destination_info = destination_files.get(relpath)
+                # The same quick check as rsync, copy2() keeps the mtime.
+                if (destination_info and
+                        destination_info.version == info.version):
+                    continue
+                destination_path = os.path.join(destination, relpath)
+                filesystem.create_directory(os.path.dirname(destination_path))
+                shutil.copy2(info.path, destination_path)
+            if not delete:
+                return
+            for relpath, info in destination_files.items():
+                if relpath not in source_files:
+                    os.remove(info.path)
+            if recursive:
+                _remove_extra_directories(source, destination)
+        except OSError as error:
+            raise FilestoreError(
+                f'Failed to rsync {source} to {destination}: {error}.'
+            ) from error
+
+
+class GcsFilestore(Filestore):  # pylint: disable=too-many-public-methods
+    """Client for the Google Cloud Storage JSON API at |endpoint|. It keeps a
+    pool of connections open. Paths are gs:// URLs, except for the local side
+    of transfers. Requests are made with the access tokens of |credentials|,
+    or anonymously if they are None (e.g. for emulators)."""
+
+    def __init__(self,
+                 endpoint: str = GCS_ENDPOINT,
+                 credentials=None,
+                 pool_size: int = POOL_SIZE):
+        parsed_endpoint = urllib.parse.urlsplit(endpoint)
+        self._connection_class = (http.client.HTTPSConnection
+                                  if parsed_endpoint.scheme == 'https' else
+                                  http.client.HTTPConnection)
+        self._host = parsed_endpoint.netloc
+        self._credentials = credentials
+        self._credentials_lock = threading.Lock()
+        self.pool_size = pool_size
+        self.max_workers = pool_size
+        self._connections = queue.LifoQueue()
+
+    def _get_connection(self):
+        """Returns an idle connection from the pool or a new one."""
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            return self._connection_class(self._host,
+                                          timeout=REQUEST_TIMEOUT_SECONDS)
+
+    def _release_connection(self, connection):
+        """Returns |connection| to the pool, unless the pool is full."""
+        if self._connections.qsize() < self.pool_size:
+            self._connections.put(connection)
+        else:
+            connection.close()
+
+    def _get_auth_headers(self) -> Dict[str, str]:
+        """Returns the headers authorizing a request."""
+        if self._credentials is None:
+            return {}
+        with self._credentials_lock:
+            if not self._credentials.valid:
+                try:
+                    self._credentials.refresh(google_auth_requests.Request())
+                except google.auth.exceptions.GoogleAuthError as error:
+                    message = f'Failed to refresh credentials: {error}.'
+                    if (isinstance(error, google.auth.exceptions.TransportError)
+                            or getattr(error, 'retryable', False)):
+                        raise TransientFilestoreError(message) from error
+                    raise FilestoreError(message) from error
+            return {'Authorization': f'Bearer {self._credentials.token}'}
+
+    def _request_once(  # pylint: disable=too-many-arguments
+            self,
+            method,
+            url,
+            body=None,
+            headers=None,
+            output=None):
+        """Makes a request and returns the decoded JSON response (or None if
+        it is empty). If |output| is given, the content of a successful
+        response is written to it instead."""
+        headers = dict(headers or {})
+        headers.update(self._get_auth_headers())
+        if hasattr(body, 'seek'):
+            body.seek(0)
+        if output is not None:
+            output.seek(0)
+            output.truncate()
+
+        connection = self._get_connection()
+        try:
+            connection.request(method, url, body=body, headers=headers)
+            response = connection.getresponse()
+            if response.status < 300 and output is not None:
+                shutil.copyfileobj(response, output)
+                content = b''
+            else:
+                content = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            connection.close()
+            raise TransientFilestoreError(
+                f'{method} {url} failed: {error}.') from error
+        self._release_connection(connection)
+
+        if response.status < 300:
+            return json.loads(content) if content else None
+        message = (f'{method} {url} returned {response.status}: '
+                   f'{content.decode("utf-8", errors="replace")}')
+        if response.status == 404:
+            raise FilestoreNotFoundError(message, response.status)
+        if response.status == 429 or response.status >= 500:
+            raise TransientFilestoreError(message, response.status)
+        raise FilestoreError(message, response.status)
+
+    def _request(  # pylint: disable=too-many-arguments
+            self,
+            method,
+            path,
+            params=None,
+            body=None,
+            headers=None,
+            output=None):
+        """Makes a request to |path| of the API with query |params|, retrying
+        transient errors. See _request_once."""
+        url = path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        for num_try in range(1, NUM_RETRIES + 2):
+            try:
+                return self._request_once(method, url, body, headers, output)
+            except TransientFilestoreError:
+                if num_try > NUM_RETRIES:
+                    raise
+                time.sleep(utils.get_retry_delay(num_try, RETRY_DELAY, 2))
+        return None
+
+    def _list(self, bucket, prefix, delimiter=None):
+        """Returns the objects with names starting with |prefix| in |bucket|
+        and, if |delimiter| is given, the prefixes of the "subdirectories"."""
+        params = {
+            'prefix': prefix,
+            'fields': f'items({OBJECT_FIELDS}),'
+                      'prefixes,nextPageToken'
+        }
+        if delimiter:
+            params['delimiter'] = delimiter
+        items = []
+        prefixes = []
+        while True:
+            response = self._request('GET', f'/storage/v1/b/{bucket}/o',
+                                     params) or {}
+            items.extend(response.get('items', []))
+            prefixes.extend(response.get('prefixes', []))
+            if 'nextPageToken' not in response:
+                return items, prefixes
+            params['pageToken'] = response['nextPageToken']
+
+    def _list_tree(self, path, recursive=True) -> Dict[str, ObjectInfo]:
+        """Returns a dictionary mapping the path relative to directory |path|
+        (a gs:// URL or a local path) of the files in it to their ObjectInfo.
+        """
+        if not is_gcs_path(path):
+            return _walk(path, recursive)
+        bucket, name = parse_gcs_path(path)
+        prefix = name.rstrip('/') + '/' if name.rstrip('/') else ''
+        items, _ = self._list(bucket, prefix, None if recursive else '/')
+        return {
+            item['name'][len(prefix):]: _get_object_info(bucket, item)
+            for item in items
+        }
+
+    def stat(self, path):
+        bucket, name = parse_gcs_path(path)
+        if not name or name.endswith('/'):
+            return None
+        try:
+            item = self._request('GET',
+                                 _get_object_path(bucket, name),
+                                 params={'fields': OBJECT_FIELDS})
+        except FilestoreNotFoundError:
+            return None
+        return _get_object_info(bucket, item)
+
+    def _is_dir(self, path):
+        """Returns True if |path| is a local directory or a prefix of objects
+        in GCS."""
+        if not is_gcs_path(path):
+            return os.path.isdir(path)
+        bucket, name = parse_gcs_path(path)
+        if not name.rstrip('/'):
+            return True
+        params = {
+            'prefix': name.rstrip('/') + '/',
+            'maxResults': 1,
+            'fields': 'items(name)'
+        }
+        response = self._request('GET', f'/storage/v1/b/{bucket}/o', params)
+        return bool((response or {}).get('items'))
+
+    def _is_file(self, path):
+        """Returns True if |path| is a local file or an object in GCS."""
+        if not is_gcs_path(path):
+            return os.path.isfile(path)
+        return self.stat(path) is not None
+
+    def exists(self, path):
+        return self._is_file(path) or self._is_dir(path)
+
+    def _list_children(self, directory):
+        """Returns the names of the objects and of the "subdirectories" (with
+        a trailing "/") directly in |directory|, a gs:// URL."""
+        bucket, name = parse_gcs_path(directory)
+        prefix = name.rstrip('/') + '/' if name.rstrip('/') else ''
+        items, prefixes = self._list(bucket, prefix, '/')
+        return {item['name'] for item in items}.union(prefixes)
+
+    def exists_many(self, paths):
+        # Paths that share a directory are checked by listing the directory
+        # once rather than with a request (or two) per path.
+        directories = collections.defaultdict(list)
+        for path in paths:
+            directories[posixpath.dirname(path.rstrip('/'))].append(path)
+        listed_directories = [
+            directory for directory, directory_paths in directories.items()
+            if len(directory_paths) > 1 and is_gcs_path(directory)
+        ]
+        children = run_many(
+            self._list_children,
+            {directory: (directory,) for directory in listed_directories},
+            self.max_workers)
+        results = {}
+        for directory in listed_directories:
+            for path in directories.pop(directory):
+                name = parse_gcs_path(path)[1].rstrip('/')
+                results[path] = bool({name, name + '/'} & children[directory])
+        unlisted_paths = [
+            path for directory_paths in directories.values()
+            for path in directory_paths
+        ]
+        results.update(super().exists_many(unlisted_paths))
+        return {path: results[path] for path in paths}
+
+    def list_objects(self, path):
+        files = self._list_tree(path)
+        return [files[relpath] for relpath in sorted(files)]
+
+    def read(self, path):
+        output = io.BytesIO()
+        bucket, name = parse_gcs_path(path)
+        self._request('GET',
+                      _get_object_path(bucket, name),
+                      params={'alt': 'media'},
+                      output=output)
+        return output.getvalue()
+
+    def download(self, path, local_path):
+        bucket, name = parse_gcs_path(path)
+        directory = os.path.dirname(os.path.abspath(local_path))
+        filesystem.create_directory(directory)
+        # Download to a temporary file so that |local_path| is never partial.
+        temp_fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(temp_fd, 'wb') as file_handle:
+                self._request('GET',
+                              _get_object_path(bucket, name),
+                              params={'alt': 'media'},
+                              output=file_handle)
+            os.replace(temp_path, local_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _upload(self, path, body, size, metadata=None):
+        """Uploads |size| bytes of |body| (bytes or a file) to |path|."""
+        bucket, name = parse_gcs_path(path)
+        metadata = dict(metadata or {})
+        metadata.setdefault(
+            'contentType',
+            mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        if set(metadata) == {'contentType'}:
+            self._request('POST',
+                          f'/upload/storage/v1/b/{bucket}/o',
+                          params={
+                              'uploadType': 'media',
+                              'name': name
+                          },
+                          body=body,
+                          headers={
+                              'Content-Type': metadata['contentType'],
+                              'Content-Length': str(size)
+                          })
+            return
+
+        # Other metadata needs a multipart upload, only used for small files
+        # such as reports.
+        data = body if isinstance(body, bytes) else body.read()
+        boundary = uuid.uuid4().hex
+        metadata['name'] = name
+        multipart_body = b''.join([
+            f'--{boundary}\r\nContent-Type: application/json; '
+            'charset=UTF-8\r\n\r\n'.encode(),
+            json.dumps(metadata).encode(),
+            f'\r\n--{boundary}\r\nContent-Type: {metadata["contentType"]}'
+            '\r\n\r\n'.encode(), data, f'\r\n--{boundary}--\r\n'.encode()
+        ])
+        self._request(
+            'POST',
+            f'/upload/storage/v1/b/{bucket}/o',
+            params={'uploadType': 'multipart'},
+            body=multipart_body,
+            headers={'Content-Type': f'multipart/related; boundary={boundary}'})
+
+    def write(self, path, data, metadata=None):
+        self._upload(path, data, len(data), metadata)
+
+    def upload(self, local_path, path, metadata=None):
+        try:
+            with open(local_path, 'rb') as file_handle:
+                self._upload(path, file_handle,
+                             os.fstat(file_handle.fileno()).st_size, metadata)
+        except FileNotFoundError as error:
+            raise FilestoreNotFoundError(
+                f'{local_path} does not exist.') from error
+
+    def copy(self, source, destination, metadata=None):
+        """Copies object |source| to |destination| within GCS."""
+        source_bucket, source_name = parse_gcs_path(source)
+        destination_bucket, destination_name = parse_gcs_path(destination)
+        path = (_get_object_path(source_bucket, source_name) + '/rewriteTo' +
+                _get_object_path(destination_bucket,
+                                 destination_name)[len('/storage/v1'):])
+        params = {}
+        body = json.dumps(metadata).encode() if metadata else None
+        headers = {'Content-Type': 'application/json'} if metadata else None
+        while True:
+            response = self._request(
+                'POST', path, params=params, body=body, headers=headers) or {}
+            if response.get('done', True):
+                return
+            params['rewriteToken'] = response['rewriteToken']
+
+    def delete(self, path):
+        bucket, name = parse_gcs_path(path)
+        self._request('DELETE', _get_object_path(bucket, name))
+
+    def _transfer(self, source, destination, metadata=None):
+        """Copies file |source| to |destination|, either of which can be
+        local or in GCS."""
+        if is_gcs_path(source) and is_gcs_path(destination):
+            self.copy(source, destination, metadata)
+        elif is_gcs_path(source):
+            self.download(source, destination)
+        elif is_gcs_path(destination):
+            self.upload(source, destination, metadata)
+        else:
+            LocalFilestore().cp(source, destination)
+
+    def _map(self, function, args_list):
+        """Calls |function| with each of |args_list| concurrently."""
+        if len(args_list) <= 1:
+            for args in args_list:
+                function(*args)
+            return
+        max_workers = min(self.pool_size, len(args_list))
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            # list() raises the first exception.
+            list(executor.map(lambda args: function(*args), args_list))
+
+    def cp(self, source, destination, recursive=False):
+        if destination.endswith('/') or self._is_dir(destination):
+            destination = posixpath.join(destination,
+                                         posixpath.basename(source.rstrip('/')))
+        if self._is_file(source):
+            self._transfer(source, destination)
+            return
+        if not recursive:
+            raise FilestoreNotFoundError(f'No file matched {source}.')
+        files = self._list_tree(source)
+        if not files:
+            raise FilestoreNotFoundError(f'No file matched {source}.')
+        self._map(self._transfer,
+                  [(info.path, posixpath.join(destination, relpath))
+                   for relpath, info in files.items()])
+
+    def ls(self, path):
+        bucket, name = parse_gcs_path(path)
+        if self.stat(path):
+            return [path]
+        prefix = name.rstrip('/') + '/' if name.rstrip('/') else ''
+        items, prefixes = self._list(bucket, prefix, '/')
+        children = [f'{GCS_PREFIX}{bucket}/{item["name"]}' for item in items]
+        children.extend(f'{GCS_PREFIX}{bucket}/{prefix}' for prefix in prefixes)
+        if not children:
+            raise FilestoreNotFoundError('One or more URLs matched no objects.')
+        return sorted(children)
+
+    def rm(self, path, recursive=True, force=False):
+        paths = [path] if self.stat(path) else []
+        if recursive:
+            paths.extend(info.path for info in self.list_objects(path))
+        if not paths:
+            if force:
+                return
+            raise FilestoreNotFoundError('One or more URLs matched no objects.')
+        self._map(self.delete, [(path,) for path in paths])
+
+    def _is_same_file(self, info, other_info):
+        """Returns True if the files described by |info| and |other_info|
+        have the same contents, according to their sizes and MD5s."""
+        if other_info is None or info.size != other_info.size:
+            return False
+        md5 = info.md5 or get_md5(info.path)
+        other_md5 = other_info.md5 or get_md5(other_info.path)
+        return md5 == other_md5
+
+    def rsync(  # pylint: disable=too-many-arguments
+            self,
+            source,
+            destination,
+            delete=True,
+            recursive=True,
+            metadata=None):
+        source_files = self._list_tree(source, recursive)
+        destination_files = self._list_tree(destination, recursive)
+        self._map(
+            self._transfer,
+            [(info.path, posixpath.join(destination, relpath), metadata)
+             for relpath, info in source_files.items()
+             if not self._is_same_file(info, destination_files.get(relpath))])
+        if not delete:
+            return
+        deleted_paths = [
+            info.path
+            for relpath, info in destination_files.items()
+            if relpath not in source_files
+        ]
+        if is_gcs_path(destination):
+            self._map(self.delete, [(path,) for path in deleted_paths])
+        else:
+            for path in deleted_paths:
+                try:
+                    os.remove(path)
+                except OSError as error:
+                    raise FilestoreError(
+                        f'Failed to delete {path}: {error}.') from error
+
+
+def _get_object_path(bucket: str, name: str) -> str:
+    """Returns the path of object |name| in |bucket| in the JSON API."""
+    return f'/storage/v1/b/{bucket}/o/{urllib.parse.quote(name, safe="")}'
+
+
+def _get_object_info(bucket: str, item: dict) -> ObjectInfo:
+    """Returns the ObjectInfo of |item|, an object resource of |bucket|."""
+    return ObjectInfo(f'{GCS_PREFIX}{bucket}/{item["name"]}', int(item['size']),
+                      str(item['generation']), item.get('md5Hash'))
+
+
+def get_metadata_from_gsutil_options(gsutil_options) -> Optional[dict]:
+    """Returns the object metadata set by the "-h" headers in
+    |gsutil_options|, or None if there are other options that the GCS client
+    doesn't support."""
+    metadata = {}
+    gsutil_options = list(gsutil_options or [])
+    while gsutil_options:
+        if len(gsutil_options) < 2 or gsutil_options[0] != '-h':
+            return None
+        header, _, value = gsutil_options[1].partition(':')
+        field = HEADER_METADATA.get(header.strip().lower())
+        if field is None:
+            return None
+        metadata[field] = value.strip()
+        gsutil_options = gsutil_options[2:]
+    return metadata
+
+
+def use_gcs_client() -> bool:
+    """Returns True if GCS should be accessed with the in-process client rather
+    than gsutil. Set USE_GCS_CLIENT to enable it. STORAGE_EMULATOR_HOST points
+    it at an emulator instead of GCS."""
+    return bool(environment.get('USE_GCS_CLIENT', False))
+
+
+def get_local_filestore() -> LocalFilestore:
+    """Returns the LocalFilestore shared by this process."""
+    global _local_filestore
+    with _clients_lock:
+        if _local_filestore is None:
+            _local_filestore = LocalFilestore()
+        return _local_filestore
+
+
+def get_gcs_filestore() -> GcsFilestore:
+    """Returns the GcsFilestore shared by this process."""
+    global _gcs_filestore
+    with _clients_lock:
+        if _gcs_filestore is None:
+            emulator_host = os.getenv('STORAGE_EMULATOR_HOST')
+            if emulator_host:
+                if '://' not in emulator_host:
+                    emulator_host = 'http://' + emulator_host
+                _gcs_filestore = GcsFilestore(emulator_host)
+            else:
+                try:
+                    credentials, _ = google.auth.default(scopes=GCS_SCOPES)
+                except google.auth.exceptions.GoogleAuthError as error:
+                    raise FilestoreError(
+                        f'Failed to get credentials: {error}.') from error
+                _gcs_filestore = GcsFilestore(credentials=credentials)
+        return _gcs_filestore
+
+
+def reset():
+    """Drops the clients shared by this process. Useful for testing."""
+    global _local_filestore, _gcs_filestore
+    with _clients_lock:
+        _local_filestore = None
+        _gcs_filestore = None
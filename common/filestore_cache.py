@@ -0,0 +1,254 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local read-through cache for filestore objects that are never modified
+once written and are read more than once, such as coverage builds. Set
+FILESTORE_CACHE_DIR to enable it for every process on the host, and
+FILESTORE_CACHE_SIZE to change its size in bytes.
+
+Corpus archives are only cached if FILESTORE_CACHE_OPTIONAL (a comma separated
+list of the names in OPTIONAL_PATTERNS) contains "corpus-archives": the
+measurer reads each of them once, but reproducing or re-measuring an
+experiment on the same host reads them again. covered_branches.json files are
+rewritten whenever a benchmark is measured again, so they are only cached by
+path if "covered-branches" is set. Reports cache them anyway, keyed by
+generation, in analysis.coverage_data_utils.fetch_files.
+
+The contents of objects are stored once in "blobs/", named by their SHA-256
+digest. Files in "refs/", named by the digest of the filestore path, contain
+the digest of the object's contents. Both are written to a temporary file
+first and then renamed, so that concurrent readers never see partial files.
+The least recently used blobs are removed when the cache grows larger than its
+size. Each process estimates the size of the cache from its last scan and the
+blobs it added since, and only scans the cache again when the estimate is over
+the size or the scan is older than SCAN_INTERVAL. Blobs added by other
+processes can make the cache larger than its size until then."""
+
+import fnmatch
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from common import environment
+from common import filesystem
+from common import logs
+
+logger = logs.Logger()
+
+DEFAULT_SIZE = 10 * 2**30
+
+# Filestore paths of objects that are never modified after being written.
+IMMUTABLE_PATTERNS = [
+    '*/coverage-binaries/coverage-build-*.tar.gz',
+    '*/results/experiment_data-v*.json.gz',
+]
+
+# Filestore paths of objects that are only cached if FILESTORE_CACHE_OPTIONAL
+# contains their name (see the module docstring).
+OPTIONAL_PATTERNS = {
+    'corpus-archives': '*/corpus/corpus-archive-*.tar.gz',
+    'covered-branches': '*/coverage/data/*/covered_branches.json',
+}
+
+# Seconds after which the size of the cache is checked again, even if this
+# process didn't fill it.
+SCAN_INTERVAL = 10 * 60
+
+CHUNK_SIZE = 1024 * 1024
+
+# Prefix of the files being written to the cache.
+TEMP_PREFIX = '.tmp-'
+
+# pylint: disable=invalid-name
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_digest(path: str) -> str:
+    """Returns the SHA-256 digest of the contents of |path|."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file_handle:
+        for chunk in iter(lambda: file_handle.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _write_atomically(path: str, data: bytes):
+    """Writes |data| to |path| through a temporary file."""
+    directory = os.path.dirname(path)
+    filesystem.create_directory(directory)
+    temp_fd, temp_path = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+    with os.fdopen(temp_fd, 'wb') as file_handle:
+        file_handle.write(data)
+    os.replace(temp_path, path)
+
+
+class FilestoreCache:
+    """Cache of filestore objects in |directory| holding up to |size| bytes.
+    Only objects whose paths match one of |patterns| are cached."""
+
+    def __init__(self,
+                 directory: str,
+                 size: int = DEFAULT_SIZE,
+                 patterns: Optional[List[str]] = None):
+        self.directory = directory
+        self.size = size
+        self.patterns = IMMUTABLE_PATTERNS if patterns is None else patterns
+        # Estimated size of the blobs, None until the cache is first scanned.
+        self._estimated_size = None
+        self._next_scan = 0
+        self._size_lock = threading.Lock()
+
+    def is_cacheable(self, filestore_path: str) -> bool:
+        """Returns True if |filestore_path| is never modified once written."""
+        return any(
+            fnmatch.fnmatchcase(filestore_path, pattern)
+            for pattern in self.patterns)
+
+    def _get_ref_path(self, filestore_path: str) -> str:
+        key = hashlib.sha256(filestore_path.encode()).hexdigest()
+        return os.path.join(self.directory, 'refs', key[:2], key)
+
+    def _get_blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'blobs', digest[:2], digest)
+
+    def get(self, filestore_path: str, local_path: str) -> bool:
+        """Copies the cached |filestore_path| to |local_path|. Returns False if
+        it isn't cached."""
+        try:
+            with open(self._get_ref_path(filestore_path),
+                      encoding='utf-8') as file_handle:
+                blob_path = self._get_blob_path(file_handle.read().strip())
+            filesystem.create_directory(os.path.dirname(local_path))
+            shutil.copyfile(blob_path, local_path)
+            # Mark the blob as recently used.
+            os.utime(blob_path)
+        except FileNotFoundError:
+            # Not cached or evicted by another process.
+            return False
+        except OSError as error:
+            logger.warning('Could not read %s from the cache: %s.',
+                           filestore_path, error)
+            return False
+        return True
+
+    def add(self, filestore_path: str, local_path: str):
+        """Adds |local_path|, a copy of |filestore_path|, to the cache. Errors
+        are only logged, the cache is best effort."""
+        try:
+            self._add(filestore_path, local_path)
+        except OSError as error:
+            logger.warning('Could not add %s to the cache: %s.', filestore_path,
+                           error)
+
+    def _add(self, filestore_path: str, local_path: str):
+        digest = _get_digest(local_path)
+        blob_path = self._get_blob_path(digest)
+        added_size = 0
+        if os.path.exists(blob_path):
+            # Another object has the same contents.
+            os.utime(blob_path)
+        else:
+            blob_dir = os.path.dirname(blob_path)
+            filesystem.create_directory(blob_dir)
+            temp_fd, temp_path = tempfile.mkstemp(dir=blob_dir,
+                                                  prefix=TEMP_PREFIX)
+            os.close(temp_fd)
+            shutil.copyfile(local_path, temp_path)
+            os.replace(temp_path, blob_path)
+            added_size = os.path.getsize(blob_path)
+        _write_atomically(self._get_ref_path(filestore_path), digest.encode())
+        with self._size_lock:
+            if self._estimated_size is not None:
+                self._estimated_size += added_size
+                if (self._estimated_size <= self.size and
+                        time.monotonic() < self._next_scan):
+                    return
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used blobs until the cache is no larger
+        than its size. Refs to removed blobs are treated as misses."""
+        size = remove_least_recently_used(os.path.join(self.directory, 'blobs'),
+                                          self.size)
+        with self._size_lock:
+            self._estimated_size = size
+            self._next_scan = time.monotonic() + SCAN_INTERVAL
+
+
+def remove_least_recently_used(directory: str,
+                               size: int,
+                               keep: Iterable[str] = ()) -> int:
+    """Removes the least recently modified files in |directory| until the
+    files in it take no more than |size| bytes and returns the number of bytes
+    they take. Files being written (named with TEMP_PREFIX) and the paths in
+    |keep| are never removed."""
+    keep = set(keep)
+    files = []
+    total_size = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.startswith(TEMP_PREFIX):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                file_stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((file_stat.st_mtime, file_stat.st_size, path))
+            total_size += file_stat.st_size
+    for _, file_size, path in sorted(files):
+        if total_size <= size:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= file_size
+    return total_size
+
+
+def get_patterns() -> List[str]:
+    """Returns the patterns of the filestore paths to cache: IMMUTABLE_PATTERNS
+    and the OPTIONAL_PATTERNS named in FILESTORE_CACHE_OPTIONAL."""
+    patterns = list(IMMUTABLE_PATTERNS)
+    for name in os.getenv('FILESTORE_CACHE_OPTIONAL', '').split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in OPTIONAL_PATTERNS:
+            logger.warning('Unknown FILESTORE_CACHE_OPTIONAL entry: %s.', name)
+            continue
+        patterns.append(OPTIONAL_PATTERNS[name])
+    return patterns
+
+
+def get_cache() -> Optional[FilestoreCache]:
+    """Returns the FilestoreCache configured by the environment, or None if
+    the cache is disabled."""
+    global _cache
+    directory = os.getenv('FILESTORE_CACHE_DIR')
+    if not directory:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.directory != directory:
+            _cache = FilestoreCache(
+                directory, environment.get('FILESTORE_CACHE_SIZE',
+                                           DEFAULT_SIZE), get_patterns())
+        return _cache
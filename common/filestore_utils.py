@@ -13,9 +13,15 @@
 # limitations under the License.
 """Helper functions for interacting with the file storage."""
 
+import os
+import posixpath
+
 from common import experiment_utils
+from common import filestore
+from common import filestore_cache
 from common import gsutil
 from common import local_filestore
+from common import new_process
 
 GCS_GSUTIL_PREFIX = 'gs://'
 GCS_HTTP_PREFIX = 'https://storage.googleapis.com/'
@@ -48,6 +54,13 @@ def get_user_facing_path(filestore_path):
     return filestore_path.replace(GCS_GSUTIL_PREFIX, GCS_HTTP_PREFIX)
 
 
+def uses_gsutil_processes():
+    """Returns True if filestore operations run gsutil processes rather than
+    using an in-process client. Copying directories recursively is then
+    cheaper than copying their files with put_many or get_many."""
+    return _using_gsutil() and not filestore.use_gcs_client()
+
+
 def get_impl():
     """Returns the implementation for filestore_utils."""
     if _using_gsutil():
@@ -56,15 +69,46 @@ def get_impl():
     return local_filestore
 
 
+def get_filestore() -> filestore.Filestore:
+    """Returns the in-process client (see filestore.py) for the filestore,
+    for callers that want to use it directly rather than the functions
+    below."""
+    if _using_gsutil():
+        return filestore.get_gcs_filestore()
+    return filestore.get_local_filestore()
+
+
+def _get_cache(source, destination):
+    """Returns the FilestoreCache to read |source| through when it is copied
+    to |destination|, or None if it shouldn't be cached."""
+    cache = filestore_cache.get_cache()
+    if (cache is None or not is_gcs_filestore_path(source) or
+            is_gcs_filestore_path(destination) or
+            not cache.is_cacheable(source)):
+        return None
+    return cache
+
+
 def cp(source, destination, recursive=False, expect_zero=True, parallel=False):  # pylint: disable=invalid-name
     """Copies |source| to |destination|. If |expect_zero| is True then it can
     raise subprocess.CalledProcessError. |parallel| is only used by the gsutil
-    implementation."""
-    return get_impl().cp(source,
-                         destination,
-                         recursive=recursive,
-                         expect_zero=expect_zero,
-                         parallel=parallel)
+    implementation. Immutable files are read through the local cache if it is
+    enabled (see filestore_cache.py)."""
+    cache = None if recursive else _get_cache(source, destination)
+    if cache is not None:
+        if destination.endswith('/') or os.path.isdir(destination):
+            destination = os.path.join(destination, posixpath.basename(source))
+        if cache.get(source, destination):
+            return new_process.ProcessResult(0, '', False)
+
+    result = get_impl().cp(source,
+                           destination,
+                           recursive=recursive,
+                           expect_zero=expect_zero,
+                           parallel=parallel)
+    if cache is not None and not result.retcode:
+        cache.add(source, destination)
+    return result
 
 
 def ls(path, must_exist=True):  # pylint: disable=invalid-name
@@ -73,6 +117,53 @@ def ls(path, must_exist=True):  # pylint: disable=invalid-name
     return get_impl().ls(path, must_exist=must_exist)
 
 
+def get_many(downloads):
+    """Downloads files concurrently. |downloads| maps the filestore path of
+    each file to the local path to copy it to. Returns a dictionary mapping
+    each filestore path to True if it was downloaded. Immutable files are read
+    through the local cache if it is enabled (see filestore_cache.py)."""
+    caches = {
+        path: _get_cache(path, local_path)
+        for path, local_path in downloads.items()
+    }
+    results = {
+        path: True
+        for path, local_path in downloads.items()
+        if caches[path] is not None and caches[path].get(path, local_path)
+    }
+    remaining_downloads = {
+        path: local_path
+        for path, local_path in downloads.items()
+        if path not in results
+    }
+    if remaining_downloads:
+        results.update(get_impl().get_many(remaining_downloads))
+    for path, local_path in remaining_downloads.items():
+        if caches[path] is not None and results[path]:
+            caches[path].add(path, local_path)
+    return {path: results[path] for path in downloads}
+
+
+def put_many(uploads):
+    """Uploads files concurrently. |uploads| maps each local path to the
+    filestore path to copy it to. Returns a dictionary mapping each local path
+    to True if it was uploaded."""
+    return get_impl().put_many(uploads)
+
+
+def exists_many(paths):
+    """Returns a dictionary mapping each of the filestore |paths| to True if
+    it exists."""
+    return get_impl().exists_many(paths)
+
+
+def list_versions(path):
+    """Returns a dictionary mapping every file under |path| to a version (the
+    generation on GCS) that changes whenever the file is modified. Returns None
+    if the files can't be listed."""
+    return get_impl().list_versions(path)
+
+
 def rm(path, recursive=True, force=False, parallel=False):  # pylint: disable=invalid-name
     """Removes |path|."""
     return get_impl().rm(path,
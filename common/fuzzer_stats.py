@@ -15,7 +15,15 @@
 
 import json
 
-SCHEMA = {'execs_per_sec': float}
+SCHEMA = {
+    'execs_per_sec': float,
+    # Resources used by the fuzzer process, see resource_usage.to_stats.
+    'cpu_time': float,
+    'wall_time': float,
+    'max_rss_mb': float,
+    'read_bytes': int,
+    'write_bytes': int,
+}
 
 
 def validate_fuzzer_stats(stats_json_str):
@@ -30,13 +30,24 @@ def initialize():
                                            credentials=credentials)
 
 
-def _get_instance_items(project, zone):
-    """Return an iterator of all instance response items for a project."""
+# Server-side filter matching preempted instances. Using it means listing
+# preempted instances only costs as much as the number of preempted instances
+# that haven't been deleted yet instead of the number of instances in the zone.
+PREEMPTED_FILTER = '(scheduling.preemptible = true) (status = TERMINATED)'
+
+
+def _get_instance_items(project, zone, filter_expression=None):
+    """Return an iterator of all instance response items for a project. If
+    |filter_expression| is provided, only instances matching it are
+    returned."""
     instances = thread_local.service.instances()
-    request = instances.list(project=project, zone=zone)
+    kwargs = {}
+    if filter_expression is not None:
+        kwargs['filter'] = filter_expression
+    request = instances.list(project=project, zone=zone, **kwargs)
     while request is not None:
         response = request.execute(num_retries=NUM_RETRIES)
-        for instance in response['items']:
+        for instance in response.get('items', []):
             yield instance
         request = instances.list_next(previous_request=request,
                                       previous_response=response)
@@ -48,9 +59,15 @@ def get_instances(project, zone):
         yield instance['name']
 
 
-def get_preempted_instances(project, zone):
-    """Return a list of preempted instance names in |project| and |zone|."""
-    for instance in _get_instance_items(project, zone):
+def get_preempted_instances(project, zone, name_prefix=None):
+    """Return a list of preempted instance names in |project| and |zone|. If
+    |name_prefix| is provided, only instances whose names start with it are
+    returned."""
+    for instance in _get_instance_items(project, zone, PREEMPTED_FILTER):
+        if name_prefix is not None and not instance['name'].startswith(
+                name_prefix):
+            continue
+        # Check the status again in case the filter wasn't applied.
         if (instance['scheduling']['preemptible'] and
                 instance['status'] == 'TERMINATED'):
             yield instance['name']
@@ -14,10 +14,13 @@
 """Google cloud related code."""
 
 import enum
+import math
 import posixpath
+import re
 import subprocess
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+from common import compute_api
 from common import experiment_utils
 from common import logs
 from common import new_process
@@ -37,6 +40,25 @@ MEASURER_WORKER_BOOT_DISK_SIZE = '50GB'
 # Number of instances to process at once.
 INSTANCE_BATCH_SIZE = 100
 
+COS_IMAGE = 'projects/cos-cloud/global/images/family/cos-stable'
+
+# Memory in MB per vCPU of the predefined N1 machine types.
+N1_MEMORY_MB_PER_CPU = {
+    'standard': 3840,
+    'highmem': 6656,
+    'highcpu': 921.6,
+}
+
+# Limits of N1 custom machine types. They have 1 or an even number of vCPUs
+# and their memory is a multiple of 256MB.
+N1_CUSTOM_MAX_CPUS = 96
+N1_CUSTOM_MIN_MEMORY_MB_PER_CPU = 921.6
+N1_CUSTOM_MAX_MEMORY_MB_PER_CPU = 6656
+N1_CUSTOM_MEMORY_MB_MULTIPLE = 256
+
+# Number of vCPUs (hyperthreads) of each physical core of N1 machine types.
+N1_VCPUS_PER_CORE = 2
+
 
 class InstanceType(enum.Enum):
     """Types of instances we need for the experiment."""
@@ -56,6 +78,10 @@ def create_instance(instance_name: str,
     if experiment_utils.is_local_experiment():
         return run_local_instance(startup_script)
 
+    if use_compute_api(config):
+        return create_instances([instance_name], instance_type, config,
+                                [startup_script], [preemptible])[0]
+
     command = [
         'gcloud',
         'compute',
@@ -79,7 +105,7 @@ def create_instance(instance_name: str,
             command.append(f'--machine-type={machine_type}')
         else:
             # Do this to support KLEE experiments.
-            command.append([
+            command.extend([
                 f'--custom-memory={config["runner_memory"]}',
                 f'--custom-cpu={config["runner_num_cpu_cores"]}',
             ])
@@ -107,6 +133,16 @@ def create_instance(instance_name: str,
 def delete_instances(instance_names: List[str], zone: str, **kwargs) -> bool:
     """Delete gcloud instance |instance_names|. Returns true if the operation
     succeeded or false otherwise."""
+    client = compute_api.get_client()
+    if client is not None:
+        try:
+            results = client.delete_instances(zone, instance_names)
+            return all(compute_api.wait_for_results(client, zone, results))
+        except compute_api.ERRORS as error:
+            logs.error('Failed to delete instances: %s. Error: %s.',
+                       instance_names, error)
+            return False
+
     error_occurred = False
     # Delete instances in batches, otherwise we run into rate limit errors.
     for idx in range(0, len(instance_names), INSTANCE_BATCH_SIZE):
@@ -120,6 +156,145 @@ def delete_instances(instance_names: List[str], zone: str, **kwargs) -> bool:
     return not error_occurred
 
 
+def use_compute_api(config: dict) -> bool:
+    """Returns True if instances should be managed using the Compute Engine
+    API directly instead of the gcloud CLI."""
+    return bool(config.get('use_compute_api'))
+
+
+def _get_disk_size_gb(disk_size: str) -> int:
+    """Returns |disk_size|, a gcloud disk size such as "30GB", in GB."""
+    if disk_size.endswith('TB'):
+        return int(disk_size[:-2]) * 1024
+    return int(disk_size[:-2])
+
+
+def _get_instance_body(instance_name: str, instance_type: InstanceType,
+                       config: dict, startup_script: Optional[str],
+                       preemptible: bool) -> dict:
+    """Returns the Compute Engine API representation of the instance that
+    create_instance would create using the gcloud CLI."""
+    zone = config['cloud_compute_zone']
+    boot_disk_params = {'sourceImage': COS_IMAGE}
+    network_interface = {'network': 'global/networks/default'}
+    if instance_type == InstanceType.DISPATCHER:
+        machine_type = DISPATCHER_MACHINE_TYPE
+        boot_disk_params['diskSizeGb'] = _get_disk_size_gb(
+            DISPATCHER_BOOT_DISK_SIZE)
+        boot_disk_params['diskType'] = (
+            f'zones/{zone}/diskTypes/{DISPATCHER_BOOT_DISK_TYPE}')
+        network_interface['accessConfigs'] = [{'type': 'ONE_TO_ONE_NAT'}]
+    else:
+        machine_type = config['runner_machine_type']
+        if machine_type is None:
+            # Do this to support KLEE experiments.
+            memory_mb = compute_api.parse_memory_mb(config['runner_memory'])
+            machine_type = (
+                f'custom-{config["runner_num_cpu_cores"]}-{memory_mb}')
+        boot_disk_params['diskSizeGb'] = _get_disk_size_gb(
+            RUNNER_BOOT_DISK_SIZE)
+
+    body = {
+        'name': instance_name,
+        'machineType': f'zones/{zone}/machineTypes/{machine_type}',
+        'disks': [{
+            'boot': True,
+            'autoDelete': True,
+            'initializeParams': boot_disk_params,
+        }],
+        'networkInterfaces': [network_interface],
+        'serviceAccounts': [{
+            'email': 'default',
+            'scopes': [compute_api.CLOUD_PLATFORM_SCOPE],
+        }],
+        'scheduling': {
+            'preemptible': preemptible,
+        },
+    }
+    if startup_script:
+        with open(startup_script, encoding='utf-8') as file_handle:
+            body['metadata'] = {
+                'items': [{
+                    'key': 'startup-script',
+                    'value': file_handle.read(),
+                }]
+            }
+    return body
+
+
+def create_instances(instance_names: List[str], instance_type: InstanceType,
+                     config: dict, startup_scripts: List[Optional[str]],
+                     preemptibles: List[bool]) -> List[bool]:
+    """Creates GCE instances named |instance_names| of type |instance_type|
+    using the Compute Engine API. The instances are created using batched API
+    requests. Each instance gets the startup script and preemptibility at the
+    same index of |startup_scripts| and |preemptibles|. Returns a list
+    indicating whether each instance was created."""
+    zone = config['cloud_compute_zone']
+    client = compute_api.get_client(config['cloud_project'])
+    bodies = [
+        _get_instance_body(instance_name, instance_type, config, startup_script,
+                           preemptible)
+        for instance_name, startup_script, preemptible in zip(
+            instance_names, startup_scripts, preemptibles)
+    ]
+    try:
+        results = client.insert_instances(zone, bodies)
+        return compute_api.wait_for_results(client, zone, results)
+    except compute_api.ERRORS as error:
+        logs.error('Failed to create instances: %s. Error: %s.', instance_names,
+                   error)
+        return [False] * len(instance_names)
+
+
+def get_machine_type_resources(machine_type: str) -> Tuple[int, float]:
+    """Returns the number of vCPUs and the memory in MB of |machine_type|, a
+    predefined or custom N1 machine type. Raises ValueError for other machine
+    types."""
+    match = re.fullmatch(r'n1-(standard|highmem|highcpu)-(\d+)', machine_type)
+    if match:
+        num_cpus = int(match.group(2))
+        return num_cpus, N1_MEMORY_MB_PER_CPU[match.group(1)] * num_cpus
+    match = re.fullmatch(r'(?:n1-)?custom-(\d+)-(\d+)(?:-ext)?', machine_type)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    raise ValueError(f'Unsupported machine type: {machine_type}.')
+
+
+def get_custom_machine_resources(num_cpus: int,
+                                 memory_mb: float) -> Tuple[int, int]:
+    """Returns the number of vCPUs and the memory in MB of the smallest N1
+    custom machine type with at least |num_cpus| vCPUs and |memory_mb| MB of
+    memory. Raises ValueError if there is none."""
+    # Add vCPUs if there is more memory per vCPU than allowed.
+    num_cpus = max(num_cpus,
+                   math.ceil(memory_mb / N1_CUSTOM_MAX_MEMORY_MB_PER_CPU))
+    if num_cpus > 1 and num_cpus % 2:
+        num_cpus += 1
+    if num_cpus > N1_CUSTOM_MAX_CPUS:
+        raise ValueError(f'No N1 custom machine type has {num_cpus} vCPUs.')
+    memory_mb = max(memory_mb, num_cpus * N1_CUSTOM_MIN_MEMORY_MB_PER_CPU)
+    memory_mb = N1_CUSTOM_MEMORY_MB_MULTIPLE * math.ceil(
+        memory_mb / N1_CUSTOM_MEMORY_MB_MULTIPLE)
+    return num_cpus, memory_mb
+
+
+def get_packed_runner_resources(config: dict,
+                                num_trials: int) -> Tuple[int, int]:
+    """Returns the number of vCPUs and the memory in MB of the N1 custom
+    machine type that runs |num_trials| trials. Each trial gets
+    runner_num_cpu_cores whole physical cores, so that trials don't share
+    hyperthreads, and the memory of runner_machine_type, or runner_memory if
+    it is None. Raises ValueError if there is no such machine type."""
+    machine_type = config['runner_machine_type']
+    if machine_type is None:
+        memory_mb = compute_api.parse_memory_mb(config['runner_memory'])
+    else:
+        _, memory_mb = get_machine_type_resources(machine_type)
+    num_cpus = N1_VCPUS_PER_CORE * config['runner_num_cpu_cores'] * num_trials
+    return get_custom_machine_resources(num_cpus, memory_mb * num_trials)
+
+
 def set_default_project(cloud_project: str):
     """Set default project for future gcloud and gsutil commands."""
     return new_process.execute(
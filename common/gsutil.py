@@ -13,8 +13,25 @@
 # limitations under the License.
 """Helper functions for using the gsutil tool."""
 
+import collections
+import posixpath
+
+from common import filestore
+from common import filesystem
 from common import new_process
 
+# Characters of gsutil wildcards, which the GCS client doesn't support.
+WILDCARD_CHARACTERS = '*?['
+
+
+def _use_gcs_client(*paths):
+    """Returns True if the in-process GCS client should be used for an
+    operation on |paths| instead of gsutil."""
+    return filestore.use_gcs_client() and not any(
+        character in path
+        for path in paths
+        for character in WILDCARD_CHARACTERS)
+
 
 def gsutil_command(arguments, expect_zero=True, parallel=False):
     """Executes a gsutil command with |arguments| and returns the result. If
@@ -32,6 +49,13 @@ def cp(source, destination, recursive=False, expect_zero=True, parallel=False):
     """Executes gsutil's "cp" command to copy |source| to |destination|. Uses -r
     if |recursive|. If |expect_zero| is True and the command fails then this
     function will raise a subprocess.CalledError."""
+    if _use_gcs_client(source, destination):
+        return filestore.run(filestore.get_gcs_filestore().cp,
+                             source,
+                             destination,
+                             recursive=recursive,
+                             expect_zero=expect_zero)
+
     command = ['cp']
     if recursive:
         command.append('-r')
@@ -43,15 +67,144 @@ def cp(source, destination, recursive=False, expect_zero=True, parallel=False):
 def ls(path, must_exist=True):  # pylint: disable=invalid-name
     """Executes gsutil's "ls" command on |path|. If |must_exist| is True and the
     command fails then this function will raise a subprocess.CalledError."""
+    if _use_gcs_client(path):
+
+        def _ls(path):
+            return ''.join(
+                line + '\n' for line in filestore.get_gcs_filestore().ls(path))
+
+        return filestore.run(_ls, path, expect_zero=must_exist)
+
     command = ['ls', path]
     process_result = gsutil_command(command, expect_zero=must_exist)
     return process_result
 
 
+def list_versions(path):
+    """Returns a dictionary mapping the URL of every object under |path| to its
+    generation, or None if the objects can't be listed."""
+    if _use_gcs_client(path):
+        try:
+            return filestore.get_gcs_filestore().list_versions(path)
+        except filestore.FilestoreError:
+            return None
+
+    command = ['ls', '-a', posixpath.join(path, '**')]
+    result = gsutil_command(command, expect_zero=False)
+    if result.retcode:
+        if 'matched no objects' in result.output:
+            return {}
+        return None
+    versions = {}
+    for line in result.output.splitlines():
+        url, separator, generation = line.strip().rpartition('#')
+        if separator:
+            versions[url] = generation
+    return versions
+
+
+# Maximum number of files copied by a single "gsutil cp" command of a bulk
+# operation.
+MAX_FILES_PER_COMMAND = 100
+
+
+def _cp_succeeded(source, destination):
+    """Returns True if "gsutil cp" copied |source| to |destination|."""
+    return not cp(source, destination, expect_zero=False).retcode
+
+
+def _exists(url):
+    """Returns True if "gsutil ls" found |url|."""
+    return not ls(url, must_exist=False).retcode
+
+
+def _cp_group(sources, destination):
+    """Copies |sources| with a single "gsutil cp" command. |destination| is the
+    destination file if there is only one source, otherwise it is the
+    directory to copy every source into. Returns a dictionary mapping each
+    source to True if it was copied."""
+    if len(sources) == 1:
+        return {sources[0]: _cp_succeeded(sources[0], destination)}
+    if not filestore.is_gcs_path(destination):
+        filesystem.create_directory(destination)
+    result = gsutil_command(['cp'] + sources + [destination + '/'],
+                            expect_zero=False,
+                            parallel=True)
+    if not result.retcode:
+        return {source: True for source in sources}
+    # Copy each file separately to find out which ones failed.
+    return {
+        source:
+        _cp_succeeded(source,
+                      posixpath.join(destination, posixpath.basename(source)))
+        for source in sources
+    }
+
+
+def _cp_many(transfers):
+    """Copies files with as few "gsutil cp" commands as possible. |transfers|
+    maps each source to its destination. Files that keep their name and are
+    copied to the same directory are copied by the same command. Returns a
+    dictionary mapping each source to True if it was copied."""
+    directories = collections.defaultdict(list)
+    groups = []
+    for source, destination in transfers.items():
+        if posixpath.basename(source) == posixpath.basename(destination):
+            directories[posixpath.dirname(destination)].append(source)
+        else:
+            groups.append(([source], destination))
+    for directory, sources in directories.items():
+        if len(sources) == 1:
+            groups.append((sources, transfers[sources[0]]))
+            continue
+        for idx in range(0, len(sources), MAX_FILES_PER_COMMAND):
+            groups.append((sources[idx:idx + MAX_FILES_PER_COMMAND], directory))
+
+    results = {}
+    for group_results in filestore.run_many(_cp_group,
+                                            dict(enumerate(groups))).values():
+        results.update(group_results)
+    return results
+
+
+def get_many(downloads):
+    """Downloads files concurrently. |downloads| maps the URL of each file to
+    the local path to copy it to. Returns a dictionary mapping each URL to
+    True if it was downloaded."""
+    if _use_gcs_client(*downloads):
+        return filestore.succeeded(
+            filestore.get_gcs_filestore().get_many(downloads))
+    return _cp_many(downloads)
+
+
+def put_many(uploads):
+    """Uploads files concurrently. |uploads| maps each local path to the URL
+    to copy it to. Returns a dictionary mapping each local path to True if it
+    was uploaded."""
+    if _use_gcs_client(*uploads.values()):
+        return filestore.succeeded(
+            filestore.get_gcs_filestore().put_many(uploads))
+    return _cp_many(uploads)
+
+
+def exists_many(urls):
+    """Returns a dictionary mapping each of |urls| to True if it exists."""
+    if _use_gcs_client(*urls):
+        return filestore.get_gcs_filestore().exists_many(urls)
+    return filestore.run_many(_exists, {url: (url,) for url in urls})
+
+
 def rm(path, recursive=True, force=False, parallel=False):  # pylint: disable=invalid-name
     """Executes gsutil's rm command on |path| and returns the result.
     Uses -r if |recursive|. If |force|, then uses -f and will not except if
     return code is nonzero."""
+    if _use_gcs_client(path):
+        return filestore.run(filestore.get_gcs_filestore().rm,
+                             path,
+                             recursive=recursive,
+                             force=force,
+                             expect_zero=not force)
+
     command = ['rm', path]
     if recursive:
         command.insert(1, '-r')
@@ -73,7 +226,18 @@ def rsync(  # pylint: disable=too-many-arguments
         parallel=False):
     """Does gsutil rsync from |source| to |destination| using useful defaults
     that can be overriden. Prepends any |gsutil_options| before the rsync
-    subcommand if provided."""
+    subcommand if provided. The GCS client is used unless there are |options|
+    or |gsutil_options| other than headers setting metadata."""
+    metadata = filestore.get_metadata_from_gsutil_options(gsutil_options)
+    if (_use_gcs_client(source, destination) and options is None and
+            metadata is not None):
+        return filestore.run(filestore.get_gcs_filestore().rsync,
+                             source,
+                             destination,
+                             delete=delete,
+                             recursive=recursive,
+                             metadata=metadata)
+
     command = [] if gsutil_options is None else gsutil_options
     command.append('rsync')
     if delete:
@@ -88,6 +252,14 @@ def rsync(  # pylint: disable=too-many-arguments
 
 def cat(file_path, expect_zero=True):
     """Does gsutil cat on |file_path| and returns the result."""
+    if _use_gcs_client(file_path):
+
+        def _cat(file_path):
+            return filestore.get_gcs_filestore().read(file_path).decode(
+                'utf-8', errors='replace')
+
+        return filestore.run(_cat, file_path, expect_zero=expect_zero)
+
     command = ['cat', file_path]
     # TODO(metzman): Consider replacing this technique with cp to temp file
     # and a local `cat`. The problem with this technique is stderr output
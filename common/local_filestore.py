@@ -15,8 +15,9 @@
 
 import os
 
-from common import new_process
+from common import filestore
 from common import filesystem
+from common import new_process
 
 
 def cp(  # pylint: disable=invalid-name
@@ -25,25 +26,51 @@ def cp(  # pylint: disable=invalid-name
         recursive=False,
         expect_zero=True,
         parallel=False):  # pylint: disable=unused-argument
-    """Executes "cp" command from |source| to |destination|."""
-    # Create intermediate folders for `cp` command to behave like `gsutil.cp`.
-    filesystem.create_directory(os.path.dirname(destination))
-
-    command = ['cp']
-    if recursive:
-        command.append('-r')
-    command.extend([source, destination])
-    return new_process.execute(command, expect_zero=expect_zero)
+    """Copies |source| to |destination| like "cp", creating intermediate
+    folders to behave like `gsutil.cp`."""
+    return filestore.run(filestore.get_local_filestore().cp,
+                         source,
+                         destination,
+                         recursive=recursive,
+                         expect_zero=expect_zero)
 
 
 def ls(path, must_exist=True):  # pylint: disable=invalid-name
-    """Executes "ls" command for |path|. If |must_exist| is True then it can
-    raise subprocess.CalledProcessError."""
-    # Add '-1' (i.e., number one) to behave like `gsutil.ls` (i.e., one filename
-    # per line).
-    command = ['ls', '-1', path]
-    process_result = new_process.execute(command, expect_zero=must_exist)
-    return process_result
+    """Lists |path| with one filename per line to behave like `gsutil.ls`. If
+    |must_exist| is True then it can raise subprocess.CalledProcessError."""
+
+    def _ls(path):
+        return ''.join(
+            line + '\n' for line in filestore.get_local_filestore().ls(path))
+
+    return filestore.run(_ls, path, expect_zero=must_exist)
+
+
+def list_versions(path):
+    """Returns a dictionary mapping every file under |path| to a version that
+    changes whenever the file is modified."""
+    return filestore.get_local_filestore().list_versions(path)
+
+
+def get_many(downloads):
+    """Copies files concurrently. |downloads| maps the path of each file to
+    the local path to copy it to. Returns a dictionary mapping each path to
+    True if it was copied."""
+    return filestore.succeeded(
+        filestore.get_local_filestore().get_many(downloads))
+
+
+def put_many(uploads):
+    """Copies files concurrently. |uploads| maps each local path to the path
+    to copy it to. Returns a dictionary mapping each local path to True if it
+    was copied."""
+    return filestore.succeeded(
+        filestore.get_local_filestore().put_many(uploads))
+
+
+def exists_many(paths):
+    """Returns a dictionary mapping each of |paths| to True if it exists."""
+    return filestore.get_local_filestore().exists_many(paths)
 
 
 def rm(  # pylint: disable=invalid-name
@@ -51,15 +78,12 @@ def rm(  # pylint: disable=invalid-name
         recursive=True,
         force=False,
         parallel=False):  # pylint: disable=unused-argument
-    """Executes "rm" command for |path| and returns the result. Uses -r
-    if |recursive|. If |force|, then uses -f and will not except if return code
-    is nonzero."""
-    command = ['rm', path]
-    if recursive:
-        command.insert(1, '-r')
-    if force:
-        command.insert(1, '-f')
-    return new_process.execute(command, expect_zero=True)
+    """Removes |path| and returns the result. Removes directories if
+    |recursive|. If |force|, it is not an error if |path| doesn't exist."""
+    return filestore.run(filestore.get_local_filestore().rm,
+                         path,
+                         recursive=recursive,
+                         force=force)
 
 
 def rsync(  # pylint: disable=too-many-arguments
@@ -71,7 +95,8 @@ def rsync(  # pylint: disable=too-many-arguments
         options=None,
         parallel=False):  # pylint: disable=unused-argument
     """Does local_filestore rsync from |source| to |destination| using useful
-    defaults that can be overriden."""
+    defaults that can be overriden. The "rsync" command is only used if
+    |options| are given."""
     # Add check to behave like `gsutil.rsync`.
     assert os.path.isdir(source), 'filestore_utils.rsync: source should be dir.'
 
@@ -79,13 +104,19 @@ def rsync(  # pylint: disable=too-many-arguments
     # `gsutil.rsync`.
     filesystem.create_directory(destination)
 
+    if options is None:
+        return filestore.run(filestore.get_local_filestore().rsync,
+                             source,
+                             destination,
+                             delete=delete,
+                             recursive=recursive)
+
     command = ['rsync']
     if delete:
         command.append('--delete')
     if recursive:
         command.append('-r')
-    if options is not None:
-        command.extend(options)
+    command.extend(options)
     # Add '/' at the end of `source` to behave like `gsutil.rsync`.
     if source[-1] != '/':
         source = source + '/'
@@ -94,6 +125,10 @@ def rsync(  # pylint: disable=too-many-arguments
 
 
 def cat(file_path, expect_zero=True):
-    """Does cat on |file_path| and returns the result."""
-    command = ['cat', file_path]
-    return new_process.execute(command, expect_zero=expect_zero)
+    """Reads |file_path| and returns the result."""
+
+    def _cat(file_path):
+        return filestore.get_local_filestore().read(file_path).decode(
+            'utf-8', errors='replace')
+
+    return filestore.run(_cat, file_path, expect_zero=expect_zero)
@@ -11,12 +11,19 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""Set up for logging."""
+"""Set up for logging. On Google Cloud, and locally if JSON_LOG_FILE is set,
+log entries are shipped in batches by a background thread so that logging
+never blocks the caller."""
 from enum import Enum
 
+import collections
+import json
 import logging
+import multiprocessing.util
 import os
+import queue
 import sys
+import threading
 import time
 import traceback
 
@@ -40,6 +47,23 @@ NUM_ATTEMPTS = 4
 RETRY_DELAY = 1
 BACKOFF = 2
 
+# Maximum number of entries waiting to be shipped. Entries logged when the
+# queue is full are dropped.
+QUEUE_SIZE = 10000
+# Maximum number of entries shipped at once.
+BATCH_SIZE = 100
+# Maximum number of seconds an entry waits for its batch to fill up.
+BATCH_INTERVAL = 1
+# Maximum number of seconds to wait for pending entries to be shipped.
+FLUSH_TIMEOUT = 30
+
+# An entry for the log shipper. |target| is where it is shipped: a Cloud
+# Logging logger, the path of a JSON lines file or None for error reporting.
+LogEntry = collections.namedtuple('LogEntry', ['target', 'struct', 'severity'])
+
+_shipper = None
+_shipper_lock = threading.Lock()
+
 
 def _initialize_cloud_clients():
     """Initialize clients for Google Cloud Logging and Error reporting."""
@@ -155,71 +179,231 @@ class LogSeverity(Enum):
     DEBUG = logging.DEBUG
 
 
+def _ship_entries(target, entries):
+    """Ships |entries| to |target| (see LogEntry)."""
+    if target is None:
+        for entry in entries:
+            _error_reporting_client.report(entry.struct['message'])
+    elif isinstance(target, str):
+        with open(target, 'a', encoding='utf-8') as file_handle:
+            file_handle.writelines(
+                json.dumps(dict(entry.struct, severity=entry.severity)) + '\n'
+                for entry in entries)
+    else:
+        batch = target.batch()
+        for entry in entries:
+            batch.log_struct(entry.struct, severity=entry.severity)
+        batch.commit()
+
+
+class LogShipper:
+    """Ships LogEntries from a background thread, in batches of up to
+    |batch_size| entries or every |batch_interval| seconds. Logging only adds
+    entries to a queue of |queue_size| entries. Entries are dropped, and
+    counted, when it is full."""
+
+    def __init__(self,
+                 ship_function=_ship_entries,
+                 queue_size=QUEUE_SIZE,
+                 batch_size=BATCH_SIZE,
+                 batch_interval=BATCH_INTERVAL):
+        self._ship_function = ship_function
+        self._queue = queue.Queue(queue_size)
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._dropped_lock = threading.Lock()
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run,
+                                        name='log-shipper',
+                                        daemon=True)
+        self._thread.start()
+
+    def put(self, entry: LogEntry) -> bool:
+        """Queues |entry| to be shipped. Returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return False
+
+    def flush(self, timeout=FLUSH_TIMEOUT) -> bool:
+        """Waits up to |timeout| seconds for the entries queued so far to be
+        shipped. Returns False if they weren't."""
+        flushed = threading.Event()
+        try:
+            self._queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return False
+        return flushed.wait(timeout)
+
+    def _get_batch(self):
+        """Returns the next entries to ship and the flush events among
+        them."""
+        batch = []
+        flush_events = []
+        deadline = None
+        while len(batch) < self._batch_size:
+            timeout = None if deadline is None else max(deadline -
+                                                        time.time(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                flush_events.append(item)
+                break
+            batch.append(item)
+            if deadline is None:
+                deadline = time.time() + self._batch_interval
+        return batch, flush_events
+
+    def _run(self):
+        """Ships entries forever."""
+        while True:
+            batch, flush_events = self._get_batch()
+            if batch:
+                with self._dropped_lock:
+                    dropped, self.dropped = self.dropped, 0
+                if dropped:
+                    self._add_dropped_entry(batch, dropped)
+            self._ship(batch)
+            for flush_event in flush_events:
+                flush_event.set()
+
+    @staticmethod
+    def _add_dropped_entry(batch, dropped):
+        """Adds an entry saying that |dropped| entries were dropped to |batch|.
+        It goes to the default log, not to error reporting."""
+        target = _get_default_target()
+        if target is None:
+            # Fall back to the log of an entry of the batch.
+            target = next(
+                (entry.target for entry in batch if entry.target is not None),
+                None)
+            if target is None:
+                return
+        batch.append(
+            LogEntry(target, {'message': f'Dropped {dropped} log entries.'},
+                     LogSeverity.WARNING.name))
+
+    def _ship(self, batch):
+        """Ships |batch|, grouping entries with the same target."""
+        targets = collections.defaultdict(list)
+        for entry in batch:
+            targets[entry.target].append(entry)
+        for target, entries in targets.items():
+            # Custom retry logic to avoid circular dependency as retry from
+            # retry.py uses log.
+            for num_try in range(1, NUM_ATTEMPTS + 1):
+                try:
+                    self._ship_function(target, entries)
+                    break
+                except Exception:  # pylint: disable=broad-except
+                    # We really dont want do to do anything here except sleep
+                    # here, since we cant log it out as log itself is already
+                    # failing.
+                    time.sleep(
+                        utils.get_retry_delay(num_try, RETRY_DELAY, BACKOFF))
+
+
+def _get_shipper() -> LogShipper:
+    """Returns the LogShipper of this process, starting it if needed."""
+    global _shipper
+    with _shipper_lock:
+        if _shipper is None:
+            _shipper = LogShipper()
+            # Runs when the process exits, including processes started by
+            # multiprocessing, which don't run atexit handlers.
+            multiprocessing.util.Finalize(_shipper,
+                                          _shipper.flush,
+                                          exitpriority=0)
+        return _shipper
+
+
+def _reset_shipper():
+    """Forgets the LogShipper of the parent process in a forked child, its
+    thread only exists in the parent."""
+    global _shipper
+    global _shipper_lock
+    _shipper = None
+    _shipper_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_shipper)
+
+
+def flush(timeout=FLUSH_TIMEOUT) -> bool:
+    """Waits up to |timeout| seconds for the log entries of this process to be
+    shipped. Returns False if they weren't."""
+    if _shipper is None:
+        return True
+    return _shipper.flush(timeout)
+
+
+def _get_default_target():
+    """Returns where entries logged without a logger are shipped: the
+    JSON_LOG_FILE locally and the default logger on Google Cloud."""
+    if utils.is_local():
+        return os.getenv('JSON_LOG_FILE')
+    return _default_logger
+
+
 def log(logger, severity, message, *args, extras=None):
     """Log a message with severity |severity|. If using stack driver logging
     then |extras| is also logged (in addition to default extras)."""
-    # Custom retry logic to avoid circular dependency as retry from
-    # retry.py uses log.
-    for num_try in range(1, NUM_ATTEMPTS + 1):
-        try:
-            message = str(message)
-            if args:
+    try:
+        message = str(message)
+        if args:
+            try:
                 message = message % args
+            except (TypeError, ValueError):
+                message = f'{message} {args}'
 
-            if utils.is_local():
-                if extras:
-                    message += ' Extras: ' + str(extras)
-                logging.log(severity, message)
-                return
+        if utils.is_local() and not os.getenv('JSON_LOG_FILE'):
+            if extras:
+                message += ' Extras: ' + str(extras)
+            logging.log(severity, message)
+            return
 
-            if logger is None:
-                logger = _default_logger
-            assert logger
-
-            struct_message = {
-                'message': message,
-            }
-            all_extras = _default_extras.copy()
-            extras = extras or {}
-            all_extras.update(extras)
-            struct_message.update(all_extras)
-            severity = LogSeverity(severity).name
-            logger.log_struct(struct_message, severity=severity)
-            break
-        except Exception:  # pylint: disable=broad-except
-            # We really dont want do to do anything here except sleep here,
-            # since we cant log it out as log itself is already failing
-            time.sleep(utils.get_retry_delay(num_try, RETRY_DELAY, BACKOFF))
+        if utils.is_local() or logger is None:
+            logger = _get_default_target()
+        assert logger
+
+        struct_message = {
+            'message': message,
+        }
+        all_extras = _default_extras.copy()
+        extras = extras or {}
+        all_extras.update(extras)
+        struct_message.update(all_extras)
+        _get_shipper().put(
+            LogEntry(logger, struct_message,
+                     LogSeverity(severity).name))
+    except Exception:  # pylint: disable=broad-except
+        # We really dont want to raise into callers, and we cant log it out as
+        # log itself is already failing.
+        pass
 
 
 def error(message, *args, extras=None, logger=None):
     """Logs |message| to stackdriver logging and error reporting (including
     exception if there was one."""
 
-    def _report_error_with_retries(message):
+    def _report_error(message):
         if utils.is_local():
             return
-
-        # Custom retry logic to avoid circular dependency
-        # as retry from retry.py uses log
-        for num_try in range(1, NUM_ATTEMPTS + 1):
-            try:
-                _error_reporting_client.report(message)
-                break
-            except Exception:  # pylint: disable=broad-except
-                # We really dont want do to do anything here except sleep here,
-                # since we cant log it out as log itself is already failing
-                time.sleep(utils.get_retry_delay(num_try, RETRY_DELAY, BACKOFF))
+        _get_shipper().put(LogEntry(None, {'message': message}, None))
 
     if not any(sys.exc_info()):
-        _report_error_with_retries(message % args)
+        _report_error(message % args)
         log(logger, logging.ERROR, message, *args, extras=extras)
         return
     # I can't figure out how to include both the message and the exception
     # other than this having the exception message preceed the log message
     # (without using private APIs).
-    _report_error_with_retries(traceback.format_exc() + '\nMessage: ' +
-                               message % args)
+    _report_error(traceback.format_exc() + '\nMessage: ' + message % args)
     extras = {} if extras is None else extras
     extras['traceback'] = traceback.format_exc()
     log(logger, logging.ERROR, message, *args, extras=extras)
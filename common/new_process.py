@@ -17,12 +17,16 @@ import os
 import signal
 import subprocess
 import threading
-from typing import List, Optional
+import time
+from typing import Callable, List, Optional
 
 from common import logs
+from common import resource_usage
 
 LOG_LIMIT_FIELD = 10 * 1024  # 10 KB.
 
+READ_SIZE = 64 * 1024
+
 
 class WrappedPopen:
     """A simple wrapper class around subprocess.Popen."""
@@ -30,6 +34,32 @@ class WrappedPopen:
     def __init__(self, process: subprocess.Popen):
         self.process = process
         self.timed_out = False
+        self.start_time = time.time()
+        # The resource_usage.ResourceUsage of the process once it exited.
+        self.usage = None
+        # The usage of the process and its descendants sampled right before
+        # it was killed.
+        self.usage_before_kill = None
+
+
+def _wait(wrapped_process: WrappedPopen):
+    """Waits for the process to exit and records its resource usage."""
+    process = wrapped_process.process
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # The process was already reaped, e.g. by Popen.poll.
+        process.wait()
+        return
+    process.returncode = os.waitstatus_to_exitcode(status)
+    usage = resource_usage.from_rusage(rusage,
+                                       time.time() - wrapped_process.start_time)
+    if wrapped_process.usage_before_kill is not None:
+        # The descendants killed with the process weren't waited for, so
+        # their usage is only in the sample.
+        usage = resource_usage.get_max_usage(wrapped_process.usage_before_kill,
+                                             usage)
+    wrapped_process.usage = usage
 
 
 def _kill_process_group(process_group_id: int):
@@ -48,6 +78,9 @@ def _end_process(wrapped_process: WrappedPopen, kill_children: bool):
     except ProcessLookupError:
         process_group_id = None
 
+    wrapped_process.usage_before_kill = resource_usage.get_process_tree_usage(
+        wrapped_process.process.pid,
+        time.time() - wrapped_process.start_time)
     wrapped_process.process.kill()
     wrapped_process.timed_out = True
     if kill_children and process_group_id is not None:
@@ -68,6 +101,89 @@ ProcessResult = collections.namedtuple('ProcessResult',
                                        ['retcode', 'output', 'timed_out'])
 
 
+class OutputCapture:  # pylint: disable=too-many-instance-attributes
+    """Captures the output of a process as it is read. If |limit| is not None,
+    only the first |head_limit| bytes and the last |limit| bytes are kept, so
+    that memory use doesn't depend on how much the process writes.
+    |line_callback| is called with each line of output as it is read."""
+
+    def __init__(self,
+                 limit: Optional[int] = None,
+                 head_limit: int = 0,
+                 line_callback: Optional[Callable[[str], None]] = None):
+        self.limit = limit
+        self.head_limit = head_limit if limit is not None else 0
+        self.line_callback = line_callback
+        self.head = bytearray()
+        # Chunks of the tail, used as a ring buffer: the oldest chunks are
+        # dropped once the newer ones hold at least |limit| bytes.
+        self.tail = collections.deque()
+        self.tail_size = 0
+        self.omitted = 0
+        self.partial_line = b''
+
+    def write(self, data: bytes):
+        """Adds |data| read from the process."""
+        if self.line_callback is not None:
+            self._call_line_callback(data)
+        if len(self.head) < self.head_limit:
+            head_size = self.head_limit - len(self.head)
+            self.head.extend(data[:head_size])
+            data = data[head_size:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        if self.limit is None:
+            return
+        while (len(self.tail) > 1 and
+               self.tail_size - len(self.tail[0]) >= self.limit):
+            chunk = self.tail.popleft()
+            self.tail_size -= len(chunk)
+            self.omitted += len(chunk)
+
+    def _call_line_callback(self, data: bytes):
+        lines = (self.partial_line + data).split(b'\n')
+        self.partial_line = lines.pop()
+        if len(self.partial_line) >= READ_SIZE:
+            # Don't buffer lines without an end indefinitely.
+            lines.append(self.partial_line)
+            self.partial_line = b''
+        for line in lines:
+            self.line_callback(line.decode('utf-8', errors='ignore'))
+
+    def close(self):
+        """Calls |line_callback| with the last line if it isn't terminated."""
+        if self.line_callback is not None and self.partial_line:
+            self.line_callback(
+                self.partial_line.decode('utf-8', errors='ignore'))
+        self.partial_line = b''
+
+    def getvalue(self) -> str:
+        """Returns the captured output. Omitted output is replaced by a line
+        saying how many bytes were omitted."""
+        tail = b''.join(self.tail)
+        omitted = self.omitted
+        if self.limit is not None and len(tail) > self.limit:
+            omitted += len(tail) - self.limit
+            tail = tail[len(tail) - self.limit:]
+        output = bytes(self.head)
+        if omitted:
+            output += f'\n[... {omitted} bytes omitted ...]\n'.encode()
+        return (output + tail).decode('utf-8', errors='ignore')
+
+
+def _read_output(process: subprocess.Popen, capture: OutputCapture):
+    """Reads the output of |process| into |capture| until it is closed."""
+    while True:
+        data = process.stdout.read1(READ_SIZE)
+        if not data:
+            break
+        capture.write(data)
+    capture.close()
+    process.stdout.close()
+
+
 def execute(  # pylint: disable=too-many-locals,too-many-branches
         command: List[str],
         *args,
@@ -78,8 +194,17 @@ def execute(  # pylint: disable=too-many-locals,too-many-branches
         output_file: Optional[int] = None,
         # Not True by default because we can't always set group on processes.
         kill_children: bool = False,
+        output_limit: Optional[int] = None,
+        head_limit: int = 0,
+        line_callback: Optional[Callable[[str], None]] = None,
+        process_callback: Optional[Callable[[WrappedPopen], None]] = None,
         **kwargs) -> ProcessResult:
-    """Execute |command| and return the returncode and the output"""
+    """Execute |command| and return the returncode and the output. The output
+    is read as it is written. If |output_limit| is not None, only the first
+    |head_limit| bytes and the last |output_limit| bytes of it are kept.
+    |line_callback| is called with each line of output. |process_callback| is
+    called with the WrappedPopen of the process once it started, its |usage|
+    is set when the process exits."""
     if write_to_stdout:
         # Don't set stdout, it's default value None, causes it to be set to
         # stdout.
@@ -97,10 +222,18 @@ def execute(  # pylint: disable=too-many-locals,too-many-branches
     process_group_id = os.getpgid(process.pid)
 
     wrapped_process = WrappedPopen(process)
+    if process_callback is not None:
+        process_callback(wrapped_process)
     if timeout is not None:
         kill_thread = _start_kill_thread(wrapped_process, kill_children,
                                          timeout)
-    output, _ = process.communicate()
+    if output_file == subprocess.PIPE:
+        capture = OutputCapture(output_limit, head_limit, line_callback)
+        _read_output(process, capture)
+        output = capture.getvalue()
+    else:
+        output = None
+    _wait(wrapped_process)
 
     if timeout is not None:
         kill_thread.cancel()
@@ -114,7 +247,6 @@ def execute(  # pylint: disable=too-many-locals,too-many-branches
     log_message = 'Executed command: "%s" returned: %d.'
 
     if output is not None:
-        output = output.decode('utf-8', errors='ignore')
         output_for_log = output[-LOG_LIMIT_FIELD:]
         log_extras = {'output': output_for_log}
     else:
@@ -0,0 +1,156 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Accounting of the resources (CPU time, memory and I/O) used by processes.
+The usage of a process that exited comes from the rusage returned by
+os.wait4. The usage of a process that is still running is sampled from /proc
+for it and its descendants."""
+
+import collections
+import os
+from typing import Dict, Optional
+
+# CPU times and |wall_time| are in seconds, |max_rss| (of the largest process)
+# is in kilobytes.
+ResourceUsage = collections.namedtuple('ResourceUsage', [
+    'user_time', 'system_time', 'max_rss', 'read_bytes', 'write_bytes',
+    'wall_time'
+])
+
+# Size of the blocks counted by ru_inblock and ru_oublock.
+RUSAGE_BLOCK_SIZE = 512
+
+PROC_DIR = '/proc'
+
+
+def from_rusage(rusage, wall_time: float) -> ResourceUsage:
+    """Returns the ResourceUsage of a process from the |rusage| returned by
+    os.wait4 and its |wall_time|."""
+    return ResourceUsage(rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss,
+                         rusage.ru_inblock * RUSAGE_BLOCK_SIZE,
+                         rusage.ru_oublock * RUSAGE_BLOCK_SIZE, wall_time)
+
+
+def _read_proc_file(pid: int, name: str) -> Optional[str]:
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), name),
+                  encoding='utf-8') as file_handle:
+            return file_handle.read()
+    except OSError:
+        # The process exited or the file can't be read.
+        return None
+
+
+def _read_stat(pid: int) -> Optional[list]:
+    """Returns the fields of /proc/|pid|/stat after the command name, so
+    that the first one is the state."""
+    stat = _read_proc_file(pid, 'stat')
+    if stat is None:
+        return None
+    # The command name is in parentheses and can contain spaces.
+    return stat[stat.rfind(')') + 2:].split()
+
+
+def _read_fields(pid: int, name: str) -> Dict[str, int]:
+    """Returns the numeric "key: value" fields of /proc/|pid|/|name|."""
+    contents = _read_proc_file(pid, name) or ''
+    fields = {}
+    for line in contents.splitlines():
+        key, _, value = line.partition(':')
+        value = value.split()
+        if value and value[0].isdigit():
+            fields[key] = int(value[0])
+    return fields
+
+
+def _get_descendants(pid: int, stats: Dict[int, list]) -> list:
+    """Returns |pid| and the pids of its descendants, given the |stats| of
+    every process."""
+    children = collections.defaultdict(list)
+    for other_pid, stat in stats.items():
+        children[int(stat[1])].append(other_pid)
+    descendants = []
+    pids = [pid]
+    while pids:
+        current_pid = pids.pop()
+        descendants.append(current_pid)
+        pids.extend(children[current_pid])
+    return descendants
+
+
+def get_process_tree_usage(pid: int,
+                           wall_time: float) -> Optional[ResourceUsage]:
+    """Returns the ResourceUsage so far of the running process |pid| and its
+    descendants, including the CPU time of descendants that exited and were
+    waited for. Returns None if |pid| isn't running or /proc isn't
+    available."""
+    try:
+        pids = [int(name) for name in os.listdir(PROC_DIR) if name.isdigit()]
+    except OSError:
+        return None
+    stats = {}
+    for other_pid in pids:
+        stat = _read_stat(other_pid)
+        if stat is not None:
+            stats[other_pid] = stat
+    if pid not in stats:
+        return None
+
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    user_time = system_time = 0.0
+    max_rss = read_bytes = write_bytes = 0
+    for descendant in _get_descendants(pid, stats):
+        # utime, stime, cutime and cstime.
+        times = [int(field) / clock_ticks for field in stats[descendant][11:15]]
+        user_time += times[0] + times[2]
+        system_time += times[1] + times[3]
+        max_rss = max(max_rss,
+                      _read_fields(descendant, 'status').get('VmHWM', 0))
+        io_fields = _read_fields(descendant, 'io')
+        read_bytes += io_fields.get('read_bytes', 0)
+        write_bytes += io_fields.get('write_bytes', 0)
+    return ResourceUsage(user_time, system_time, max_rss, read_bytes,
+                         write_bytes, wall_time)
+
+
+def get_max_usage(sample: ResourceUsage, usage: ResourceUsage) -> ResourceUsage:
+    """Returns the largest of each counter of |sample|, taken from /proc while
+    the process was running, and of its final |usage|, with the wall time of
+    |usage|. The rusage of a process doesn't include the descendants it didn't
+    wait for, e.g. ones killed with it, which the sample does."""
+    return ResourceUsage(max(sample.user_time, usage.user_time),
+                         max(sample.system_time, usage.system_time),
+                         max(sample.max_rss, usage.max_rss),
+                         max(sample.read_bytes, usage.read_bytes),
+                         max(sample.write_bytes, usage.write_bytes),
+                         usage.wall_time)
+
+
+def to_stats(usage: ResourceUsage) -> Dict:
+    """Returns |usage| as a dictionary of stats (see fuzzer_stats.py)."""
+    return {
+        'cpu_time': round(usage.user_time + usage.system_time, 2),
+        'wall_time': round(usage.wall_time, 2),
+        'max_rss_mb': round(usage.max_rss / 1024, 2),
+        'read_bytes': usage.read_bytes,
+        'write_bytes': usage.write_bytes,
+    }
+
+
+def get_cpu_utilization(stats: Optional[Dict]) -> Optional[float]:
+    """Returns the effective CPU utilization (CPU time per wall time, 1.0 for
+    a process keeping one core busy) from |stats|, or None if they don't have
+    resource usage."""
+    if not stats or not stats.get('wall_time') or 'cpu_time' not in stats:
+        return None
+    return stats['cpu_time'] / stats['wall_time']
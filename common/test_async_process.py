@@ -0,0 +1,78 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for async_process.py."""
+import asyncio
+import subprocess
+import time
+
+import pytest
+
+from common import async_process
+
+
+def _python(code):
+    return ['python3', '-c', code]
+
+
+def test_execute_output_and_usage():
+    """Tests that execute returns the output, return code and resource usage
+    of the process."""
+    executor = async_process.AsyncExecutor()
+    result = asyncio.run(
+        executor.execute(_python(
+            'import sys; print("out"); x = bytearray(64 * 2**20); sys.exit(3)'),
+                         expect_zero=False))
+    assert result.retcode == 3
+    assert result.output == 'out\n'
+    assert not result.timed_out
+    assert result.usage.user_time + result.usage.system_time > 0
+    # The process allocated 64 MiB.
+    assert result.usage.max_rss > 64 * 1024
+    assert result.usage.wall_time > 0
+
+
+def test_execute_raises():
+    """Tests that execute raises if the process fails and |expect_zero|."""
+    executor = async_process.AsyncExecutor()
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(executor.execute(_python('import sys; sys.exit(1)')))
+
+
+def test_execute_timeout():
+    """Tests that processes are killed when they time out."""
+    executor = async_process.AsyncExecutor()
+    start_time = time.time()
+    result = asyncio.run(
+        executor.execute(_python('import time; time.sleep(60)'),
+                         timeout=.5,
+                         kill_children=True))
+    assert time.time() - start_time < 30
+    assert result.timed_out
+    assert result.retcode != 0
+
+
+def test_execute_many_limits_concurrency(tmp_path):
+    """Tests that execute_many runs processes concurrently, but no more than
+    |max_processes| at once."""
+    code = ('import os, sys, time; path = sys.argv[1]; open(path, "w").close();'
+            ' time.sleep(.5); print(len(os.listdir(os.path.dirname(path))));'
+            ' os.remove(path)')
+    executor = async_process.AsyncExecutor(max_processes=2)
+    commands = [_python(code) + [str(tmp_path / str(idx))] for idx in range(4)
+               ] + [_python('import sys; sys.exit(1)')]
+    start_time = time.time()
+    results = executor.execute_many(commands)
+    assert time.time() - start_time < 2
+    assert isinstance(results.pop(), subprocess.CalledProcessError)
+    assert all(int(result.output) <= 2 for result in results)
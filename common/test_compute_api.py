@@ -0,0 +1,210 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for compute_api.py."""
+import email.parser
+import email.policy
+import http.server
+import json
+import threading
+from unittest import mock
+
+import pytest
+import requests
+
+from common import compute_api
+
+PROJECT = 'my-project'
+ZONE = 'my-zone'
+
+# pylint: disable=redefined-outer-name,protected-access
+
+
+class FakeComputeHandler(http.server.BaseHTTPRequestHandler):
+    """Handler implementing the parts of the Compute Engine API used by
+    compute_api.py."""
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Don't spam test output."""
+
+    def _send_json(self, status, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles list requests."""
+        self.server.requests.append(('GET', self.path))
+        if '/instances' in self.path:
+            if 'pageToken' not in self.path:
+                self._send_json(200, {
+                    'items': [{
+                        'name': 'a'
+                    }],
+                    'nextPageToken': 'next'
+                })
+            else:
+                self._send_json(200, {'items': [{'name': 'b'}]})
+            return
+        self._send_json(404, {})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handles batch requests."""
+        self.server.requests.append(('POST', self.path))
+        length = int(self.headers['Content-Length'])
+        content = self.rfile.read(length)
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() +
+            b'\r\n\r\n' + content)
+        parts = []
+        for part in message.iter_parts():
+            content_id = part['Content-ID'].strip('<>')
+            request_line = part.get_payload().split('\r\n', 1)[0]
+            method, path, _ = request_line.split(' ')
+            self.server.calls.append((method, path))
+            status, body = self.server.handle_call(method, path)
+            parts.append(f'--response_boundary\r\n'
+                         f'Content-Type: application/http\r\n'
+                         f'Content-ID: <response-{content_id}>\r\n\r\n'
+                         f'HTTP/1.1 {status} OK\r\n'
+                         f'Content-Type: application/json\r\n\r\n'
+                         f'{json.dumps(body)}\r\n')
+        response = (''.join(parts) + '--response_boundary--\r\n').encode()
+        self.send_response(200)
+        self.send_header('Content-Type',
+                         'multipart/mixed; boundary=response_boundary')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class FakeComputeServer(http.server.ThreadingHTTPServer):
+    """Fake Compute Engine API server. Operations are reported as pending the
+    first time they are polled and as done afterwards."""
+
+    def __init__(self):
+        super().__init__(('localhost', 0), FakeComputeHandler)
+        self.requests = []
+        self.calls = []
+        self.polls = {}
+        self.failing_instances = set()
+
+    def handle_call(self, method, path):
+        """Returns the status and body of the response to a batched call."""
+        if '/operations/' in path:
+            name = path.rsplit('/', 1)[-1]
+            self.polls[name] = self.polls.get(name, 0) + 1
+            status = 'DONE' if self.polls[name] > 1 else 'RUNNING'
+            return 200, {
+                'name': name,
+                'status': status,
+                'targetLink': name.replace('op-', '')
+            }
+
+        name = path.rsplit('/', 1)[-1]
+        if method == 'POST':
+            name = 'new-instance'
+        if name in self.failing_instances:
+            return 404, {'error': {'code': 404}}
+        return 200, {
+            'name': f'op-{name}',
+            'status': 'RUNNING',
+            'targetLink': name
+        }
+
+
+@pytest.fixture
+def fake_server():
+    """Returns a running FakeComputeServer."""
+    server = FakeComputeServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(fake_server):
+    """Returns a ComputeClient using |fake_server|."""
+    endpoint = f'http://localhost:{fake_server.server_address[1]}'
+    with requests.Session() as session:
+        yield compute_api.ComputeClient(PROJECT,
+                                        endpoint=endpoint,
+                                        session=session)
+
+
+@mock.patch('common.compute_api.OPERATION_POLL_SECONDS', 0)
+def test_delete_instances_batched(fake_server, client):
+    """Tests that delete_instances deletes all instances using a single HTTP
+    request and that the operations are polled until they are done."""
+    instances = [f'instance-{i}' for i in range(5)]
+    results = client.delete_instances(ZONE, instances)
+    assert fake_server.requests == [('POST', compute_api.BATCH_PATH)]
+    assert fake_server.calls == [
+        ('DELETE',
+         f'/compute/v1/projects/{PROJECT}/zones/{ZONE}/instances/{instance}')
+        for instance in instances
+    ]
+    assert compute_api.wait_for_results(client, ZONE,
+                                        results) == [True] * len(instances)
+    # One poll request where operations are running, one where they are done.
+    assert len(fake_server.requests) == 3
+
+
+@mock.patch('common.compute_api.OPERATION_POLL_SECONDS', 0)
+def test_delete_instances_partial_failure(fake_server, client):
+    """Tests that failures of individual calls in a batch are reported."""
+    fake_server.failing_instances.add('instance-1')
+    results = client.delete_instances(ZONE, ['instance-0', 'instance-1'])
+    assert [result.status for result in results] == [200, 404]
+    assert compute_api.wait_for_results(client, ZONE, results) == [True, False]
+
+
+@mock.patch('common.compute_api.BATCH_SIZE', 2)
+def test_batch_split(fake_server, client):
+    """Tests that batch splits calls into multiple requests when there are more
+    than BATCH_SIZE calls."""
+    calls = [
+        compute_api.Call('DELETE', f'/instances/instance-{i}', None)
+        for i in range(5)
+    ]
+    results = client.batch(calls)
+    assert len(fake_server.requests) == 3
+    assert [result.body['targetLink'] for result in results
+           ] == [f'instance-{i}' for i in range(5)]
+
+
+def test_insert_instances(fake_server, client):
+    """Tests that insert_instances sends the instance body."""
+    client.insert_instances(ZONE, [{'name': 'new-instance'}])
+    assert fake_server.calls == [
+        ('POST', f'/compute/v1/projects/{PROJECT}/zones/{ZONE}/instances')
+    ]
+
+
+def test_list_instances_paginates(client):
+    """Tests that list_instances follows nextPageToken."""
+    names = [instance['name'] for instance in client.list_instances(ZONE)]
+    assert names == ['a', 'b']
+
+
+@pytest.mark.parametrize(('memory', 'expected_mb'), [('12GB', 12288),
+                                                     ('512MB', 512),
+                                                     ('3.75GB', 3840)])
+def test_parse_memory_mb(memory, expected_mb):
+    """Tests that parse_memory_mb handles the units used in configs."""
+    assert compute_api.parse_memory_mb(memory) == expected_mb
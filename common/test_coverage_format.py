@@ -0,0 +1,85 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for coverage_format.py."""
+import json
+import os
+
+import pytest
+
+from common import coverage_format
+
+FUZZERS_COVERED_BRANCHES = {
+    'afl': [[0, 0, 1, 1], [0, 0, 2, 2], [0, 0, 3, 3]],
+    'libfuzzer': [[0, 0, 1, 1], [0, 0, 2, 3], [0, 0, 3, 3], [0, 0, 4, 4]],
+    'honggfuzz': [],
+}
+
+
+def _get_branches(covered_branches, fuzzer):
+    return sorted(
+        coverage_format.get_fuzzer_branches(covered_branches, fuzzer).tolist())
+
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_write_and_load(tmp_path, mmap_mode):
+    """Tests that the branches covered by each fuzzer are the same after
+    writing and loading them."""
+    binary_path, index_path = coverage_format.write(str(tmp_path),
+                                                    FUZZERS_COVERED_BRANCHES)
+    index = coverage_format.read_index(index_path)
+    covered_branches = coverage_format.load(binary_path, index, mmap_mode)
+
+    # Each branch is stored once.
+    assert covered_branches.branches.shape == (5, 4)
+    assert covered_branches.branches.dtype.str == '<i2'
+    for fuzzer, branches in FUZZERS_COVERED_BRANCHES.items():
+        assert _get_branches(covered_branches, fuzzer) == sorted(branches)
+
+
+def test_write_and_load_no_branches(tmp_path):
+    """Tests that fuzzers that covered nothing can be written and loaded."""
+    binary_path, index_path = coverage_format.write(str(tmp_path), {
+        'afl': [],
+    })
+    index = coverage_format.read_index(index_path)
+    covered_branches = coverage_format.load(binary_path, index)
+    assert _get_branches(covered_branches, 'afl') == []
+
+
+def test_encode_large_values():
+    """Tests that the table uses a dtype wide enough for its values."""
+    contents, index = coverage_format.encode({'afl': [[0, 2**40]]})
+    assert index['dtype'] == '<i8'
+    assert len(contents) == index['bitmaps_offset'] + 1
+    assert index['bitmaps_offset'] % coverage_format.ALIGNMENT == 0
+
+
+def test_read_index_unsupported_version(tmp_path):
+    """Tests that read_index rejects other versions of the format."""
+    index_path = os.path.join(tmp_path, coverage_format.INDEX_FILENAME)
+    with open(index_path, 'w', encoding='utf-8') as file_handle:
+        json.dump({'version': coverage_format.VERSION + 1}, file_handle)
+    with pytest.raises(coverage_format.CoverageFormatError):
+        coverage_format.read_index(index_path)
+
+
+def test_load_not_binary_format(tmp_path):
+    """Tests that load rejects files that aren't in the binary format."""
+    binary_path, index_path = coverage_format.write(str(tmp_path),
+                                                    FUZZERS_COVERED_BRANCHES)
+    index = coverage_format.read_index(index_path)
+    with open(binary_path, 'wb') as file_handle:
+        file_handle.write(b'[[0, 0, 1, 1]]')
+    with pytest.raises(coverage_format.CoverageFormatError):
+        coverage_format.load(binary_path, index)
@@ -0,0 +1,132 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for cpu_topology.py."""
+import os
+from unittest import mock
+
+import pytest
+
+from common import cpu_topology
+
+# pylint: disable=redefined-outer-name
+
+# Two NUMA nodes with two physical cores each, every core has two SMT threads.
+# Sibling numbering follows what Linux does on x86: CPU N and N + 4 share a
+# core.
+SIBLINGS = {0: '0,4', 1: '1,5', 2: '2,6', 3: '3,7'}
+NODES = {0: 0, 1: 0, 2: 1, 3: 1}
+
+
+def _write(path, contents):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file_handle:
+        file_handle.write(contents + '\n')
+
+
+@pytest.fixture
+def sysfs_cpu_dir(tmp_path):
+    """Returns a fake /sys/devices/system/cpu directory for a two socket
+    machine with SMT."""
+    cpu_dir = str(tmp_path)
+    _write(os.path.join(cpu_dir, 'online'), '0-7')
+    for cpu in range(8):
+        core = cpu % 4
+        node = NODES[core]
+        this_cpu_dir = os.path.join(cpu_dir, f'cpu{cpu}')
+        _write(os.path.join(this_cpu_dir, 'topology', 'thread_siblings_list'),
+               SIBLINGS[core])
+        os.makedirs(os.path.join(this_cpu_dir, f'node{node}'))
+        cache_dir = os.path.join(this_cpu_dir, 'cache', 'index3')
+        _write(os.path.join(cache_dir, 'level'), '3')
+        _write(os.path.join(cache_dir, 'shared_cpu_list'),
+               '0-1,4-5' if node == 0 else '2-3,6-7')
+    return cpu_dir
+
+
+def test_parse_and_format_cpu_list():
+    """Tests that parse_cpu_list and format_cpu_list are inverses."""
+    assert cpu_topology.parse_cpu_list('0-2,5,7-8\n') == [0, 1, 2, 5, 7, 8]
+    assert cpu_topology.format_cpu_list([8, 0, 1, 2, 5, 7]) == '0-2,5-5,7-8'
+
+
+def test_read_topology(sysfs_cpu_dir):
+    """Tests that read_topology reads cores, nodes and caches from sysfs."""
+    topology = cpu_topology.read_topology(sysfs_cpu_dir)
+    assert topology[5] == cpu_topology.Cpu(cpu=5, core=1, node=0, l3=0)
+    assert topology[6] == cpu_topology.Cpu(cpu=6, core=2, node=1, l3=2)
+
+
+def test_read_topology_missing(tmp_path):
+    """Tests that read_topology treats every CPU as a core when sysfs can't be
+    read."""
+    topology = cpu_topology.read_topology(str(tmp_path / 'missing'))
+    assert all(cpu.cpu == cpu.core for cpu in topology)
+
+
+def test_allocate_runner_cpusets_whole_cores(sysfs_cpu_dir):
+    """Tests that each trial gets every SMT sibling of its core."""
+    topology = cpu_topology.read_topology(sysfs_cpu_dir)
+    assert cpu_topology.allocate_runner_cpusets(
+        topology, 3, 1) == ['0-0,4-4', '1-1,5-5', '2-2,6-6']
+
+
+def test_allocate_runner_cpusets_single_node(sysfs_cpu_dir):
+    """Tests that multi-core trials don't span NUMA nodes."""
+    topology = cpu_topology.read_topology(sysfs_cpu_dir)
+    assert cpu_topology.allocate_runner_cpusets(topology, 4,
+                                                2) == ['0-1,4-5', '2-3,6-7']
+    # A trial needing 3 cores doesn't fit on any node.
+    assert not cpu_topology.allocate_runner_cpusets(topology, 3, 3)
+
+
+def test_allocate_measurer_cpus(sysfs_cpu_dir):
+    """Tests that measurers aren't put on the siblings of runner cores."""
+    topology = cpu_topology.read_topology(sysfs_cpu_dir)
+    runner_cpusets = cpu_topology.allocate_runner_cpusets(topology, 1, 1)
+    assert cpu_topology.allocate_measurer_cpus(topology, runner_cpusets,
+                                               3) == [1, 5, 2]
+
+
+def test_allocate_measurer_cpus_not_enough(sysfs_cpu_dir):
+    """Tests that measurers share CPUs when there aren't enough free ones."""
+    topology = cpu_topology.read_topology(sysfs_cpu_dir)
+    runner_cpusets = cpu_topology.allocate_runner_cpusets(topology, 3, 1)
+    assert cpu_topology.allocate_measurer_cpus(topology, runner_cpusets,
+                                               3) == [3, 7, 3]
+
+
+def test_get_runner_cpusets(sysfs_cpu_dir):
+    """Tests that get_runner_cpusets hands out CPUs in order if no trial fits
+    on a NUMA node, and follows the topology otherwise."""
+    topology = cpu_topology.read_topology(sysfs_cpu_dir)
+    assert cpu_topology.get_runner_cpusets(topology, 4,
+                                           2) == ['0-1,4-5', '2-3,6-7']
+    runner_cpusets = cpu_topology.get_runner_cpusets(topology, 3, 3)
+    assert runner_cpusets == ['0-2']
+    # Measurers are kept off the CPUs of the fallback cpusets too.
+    assert cpu_topology.allocate_measurer_cpus(topology, runner_cpusets,
+                                               1) == [3]
+    with pytest.raises(ValueError):
+        cpu_topology.get_runner_cpusets(topology, 1, 2)
+
+
+def test_main(sysfs_cpu_dir, capsys):
+    """Tests that main prints the runner cpusets of this machine, one per
+    line."""
+    topology = cpu_topology.read_topology(sysfs_cpu_dir)
+    with mock.patch('sys.argv', ['cpu_topology.py', '4', '2']), \
+            mock.patch('common.cpu_topology.read_topology',
+                       return_value=topology):
+        assert cpu_topology.main() == 0
+    assert capsys.readouterr().out == '0-1,4-5\n2-3,6-7\n'
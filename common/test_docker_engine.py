@@ -0,0 +1,214 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for docker_engine.py."""
+import http.server
+import io
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import urllib.parse
+
+import pytest
+
+from common import docker_engine
+
+# pylint: disable=redefined-outer-name
+
+
+class FakeDockerHandler(http.server.BaseHTTPRequestHandler):
+    """Handler implementing the parts of the Docker Engine API used by
+    docker_engine.py."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Don't spam test output."""
+
+    def _send(self, status, body=None, content=None):
+        if content is None:
+            content = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length)) if length else None
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path.split('/')[2:]
+        self.server.calls.append((self.command, '/'.join(parts)))
+        self._send(*self.server.handle(self.command, parts, params, body))
+
+    do_GET = _handle  # pylint: disable=invalid-name
+    do_POST = _handle  # pylint: disable=invalid-name
+    do_DELETE = _handle  # pylint: disable=invalid-name
+
+
+class FakeDockerServer(socketserver.ThreadingUnixStreamServer):
+    """Fake Docker Engine listening on a unix socket."""
+    # Clients keep connections open, don't wait for them on shutdown.
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, socket_path):
+        super().__init__(socket_path, FakeDockerHandler)
+        self.socket_path = socket_path
+        self.calls = []
+        self.containers = {}
+        self.lock = threading.Lock()
+
+    def handle(self, method, parts, params, body):  # pylint: disable=too-many-return-statements
+        """Returns the status and JSON body of the response to a call."""
+        with self.lock:
+            if parts == ['containers', 'create']:
+                name = params['name']
+                if name in self.containers:
+                    return 409, {'message': 'Conflict.'}
+                self.containers[name] = {'config': body, 'status': 'created'}
+                return 201, {'Id': name}
+            if parts == ['containers', 'json']:
+                return 200, [{
+                    'Names': ['/' + name]
+                } for name in self.containers]
+
+            name = parts[1]
+            container = self.containers.get(name)
+            if container is None:
+                return 404, {'message': 'No such container.'}
+            action = parts[2] if len(parts) > 2 else None
+            if action == 'start':
+                container['status'] = 'running'
+                return 204, None
+            if action == 'stop':
+                if container['status'] != 'running':
+                    return 304, None
+                container['status'] = 'exited'
+                return 204, None
+            if action == 'json':
+                return 200, {
+                    'State': {
+                        'Status': container['status'],
+                        'ExitCode': container.get('exit_code', 0)
+                    }
+                }
+            if method == 'DELETE':
+                del self.containers[name]
+                return 204, None
+        return 404, {}
+
+
+@pytest.fixture
+def fake_server():
+    """Returns a running FakeDockerServer."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        server = FakeDockerServer(os.path.join(temp_dir, 'docker.sock'))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def client(fake_server):
+    """Returns a DockerClient using |fake_server|."""
+    return docker_engine.DockerClient(fake_server.socket_path, pool_size=4)
+
+
+def test_run_containers(fake_server, client):
+    """Tests that run_containers creates and starts every container and reports
+    the ones that failed."""
+    fake_server.containers['existing'] = {'status': 'running'}
+    names = [f'container-{i}' for i in range(10)] + ['existing']
+    results = client.run_containers([(name, {
+        'Image': 'image'
+    }) for name in names])
+    assert results == [True] * 10 + [False]
+    for name in names[:-1]:
+        assert fake_server.containers[name] == {
+            'config': {
+                'Image': 'image'
+            },
+            'status': 'running'
+        }
+
+
+def test_run_container_start_error(fake_server, client):
+    """Tests that run_container removes the container it created if it can't
+    be started."""
+    handle = fake_server.handle
+
+    def handle_start_error(method, parts, params, body):
+        if parts[-1:] == ['start']:
+            return 500, {'message': 'Error.'}
+        return handle(method, parts, params, body)
+
+    fake_server.handle = handle_start_error
+    assert not client.run_container('container', {'Image': 'image'})
+    assert not fake_server.containers
+
+
+def test_connections_reused(client):
+    """Tests that connections are returned to the pool and reused."""
+    client.list_containers()
+    connection = client._connections.get_nowait()  # pylint: disable=protected-access
+    client._connections.put(connection)  # pylint: disable=protected-access
+    client.list_containers()
+    assert client._connections.get_nowait() is connection  # pylint: disable=protected-access
+
+
+def test_stop_containers(fake_server, client):
+    """Tests that stop_containers stops and removes running and exited
+    containers and ignores missing ones."""
+    fake_server.containers['running'] = {'status': 'running'}
+    fake_server.containers['exited'] = {'status': 'exited'}
+    assert client.stop_containers(['running', 'exited', 'missing'])
+    assert not fake_server.containers
+
+
+def test_get_container_states(fake_server, client):
+    """Tests that get_container_states returns states and exit codes."""
+    fake_server.containers['crashed'] = {'status': 'exited', 'exit_code': 1}
+    assert client.get_container_states(['crashed', 'missing']) == {
+        'crashed': docker_engine.ContainerState('crashed', 'exited', 1),
+        'missing': None,
+    }
+
+
+def test_list_containers_prefix(fake_server, client):
+    """Tests that list_containers only returns names starting with the
+    prefix."""
+    for name in ['r-exp-1', 'r-exp-2', 'other-r-exp-1']:
+        fake_server.containers[name] = {'status': 'running'}
+    assert sorted(client.list_containers('r-exp-')) == ['r-exp-1', 'r-exp-2']
+
+
+def test_request_error(client):
+    """Tests that failed calls raise DockerEngineError with the status."""
+    with pytest.raises(docker_engine.DockerEngineError) as error:
+        client.request('GET', '/containers/missing/json')
+    assert error.value.status == 404
+
+
+def test_stream_logs(fake_server, client):
+    """Tests that stream_logs writes the container's output."""
+    fake_server.handle = lambda *args: (200, None, b'Fuzzing.\n')
+    output = io.BytesIO()
+    client.stream_logs('container', output)
+    assert output.getvalue() == b'Fuzzing.\n'
+    assert fake_server.calls == [('GET', 'containers/container/logs')]
@@ -28,6 +28,21 @@ def test_get_trial_instance_name():
                                                     9) == 'r-experiment-a-9'
 
 
+def test_get_trial_id_from_instance_name():
+    """Tests that get_trial_id_from_instance_name returns the trial id of
+    instances of the experiment and None for other instances."""
+    assert experiment_utils.get_trial_id_from_instance_name(
+        'experiment-a', 'r-experiment-a-9') == 9
+    assert experiment_utils.get_trial_id_from_instance_name(
+        'experiment-a', 'r-experiment-a-b-9') is None
+    assert experiment_utils.get_trial_id_from_instance_name(
+        'experiment-a', 'd-experiment-a') is None
+    packed_instance_name = experiment_utils.get_packed_instance_name(
+        'experiment-a', 9)
+    assert experiment_utils.get_trial_id_from_instance_name(
+        'experiment-a', packed_instance_name) is None
+
+
 def test_get_corpus_archive_name():
     """Tests that get_corpus_archive_name returns the expected result."""
     assert (experiment_utils.get_corpus_archive_name(9) ==
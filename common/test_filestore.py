@@ -0,0 +1,298 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for filestore.py."""
+
+import os
+import posixpath
+import subprocess
+from unittest import mock
+
+import google.auth.exceptions
+import pytest
+
+from common import filestore
+from common import gsutil
+from test_libs import fake_gcs
+
+BUCKET = 'bucket'
+
+
+@pytest.fixture
+def gcs():
+    """Yields a FakeGcs and a GcsFilestore using it."""
+    with fake_gcs.run_server() as (fake, endpoint):
+        with mock.patch('common.filestore.RETRY_DELAY', 0):
+            yield fake, filestore.GcsFilestore(endpoint, pool_size=2)
+
+
+def _write_tree(directory, files):
+    """Writes |files|, a dictionary mapping relative paths to contents, to
+    |directory|."""
+    for relpath, data in files.items():
+        path = os.path.join(directory, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file_handle:
+            file_handle.write(data)
+
+
+def _read_tree(directory):
+    """Returns a dictionary mapping the relative paths of the files in
+    |directory| to their contents."""
+    files = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            with open(path, encoding='utf-8') as file_handle:
+                files[os.path.relpath(path, directory)] = file_handle.read()
+    return files
+
+
+def test_local_cp_into_directory(tmp_path):
+    """Tests that LocalFilestore.cp copies into existing directories like
+    "cp -r"."""
+    _write_tree(tmp_path / 'source', {'a': 'a', 'dir/b': 'b'})
+    local = filestore.LocalFilestore()
+    local.cp(str(tmp_path / 'source'), str(tmp_path / 'dest'), recursive=True)
+    local.cp(str(tmp_path / 'source'), str(tmp_path / 'dest'), recursive=True)
+    assert _read_tree(tmp_path / 'dest') == {
+        'a': 'a',
+        'dir/b': 'b',
+        'source/a': 'a',
+        'source/dir/b': 'b'
+    }
+    with pytest.raises(filestore.FilestoreError):
+        local.cp(str(tmp_path / 'source'), str(tmp_path / 'other'))
+
+
+def test_local_rsync(tmp_path):
+    """Tests that LocalFilestore.rsync only copies changed files and deletes
+    files that aren't in the source."""
+    source = tmp_path / 'source'
+    dest = tmp_path / 'dest'
+    _write_tree(source, {'a': 'a', 'dir/b': 'b'})
+    _write_tree(dest, {'a': 'old', 'c': 'c', 'other/d': 'd'})
+    local = filestore.LocalFilestore()
+    local.rsync(str(source), str(dest))
+    assert _read_tree(dest) == {'a': 'a', 'dir/b': 'b'}
+    assert not os.path.exists(dest / 'other')
+
+    with mock.patch('shutil.copy2') as mocked_copy:
+        local.rsync(str(source), str(dest))
+    mocked_copy.assert_not_called()
+
+
+def test_local_rm(tmp_path):
+    """Tests that LocalFilestore.rm only ignores missing paths if |force|."""
+    local = filestore.LocalFilestore()
+    local.rm(str(tmp_path / 'missing'), force=True)
+    with pytest.raises(filestore.FilestoreNotFoundError):
+        local.rm(str(tmp_path / 'missing'))
+
+
+def test_local_os_errors(tmp_path):
+    """Tests that LocalFilestore.rsync and rm raise FilestoreError when the
+    filesystem fails."""
+    _write_tree(tmp_path / 'source', {'a': 'a'})
+    local = filestore.LocalFilestore()
+    with mock.patch('shutil.copy2', side_effect=PermissionError('denied')):
+        with pytest.raises(filestore.FilestoreError):
+            local.rsync(str(tmp_path / 'source'), str(tmp_path / 'dest'))
+    with mock.patch('shutil.rmtree', side_effect=PermissionError('denied')):
+        with pytest.raises(filestore.FilestoreError):
+            local.rm(str(tmp_path / 'source'))
+
+
+def test_local_bulk_operations(tmp_path):
+    """Tests that the bulk operations of LocalFilestore return a result for
+    each file."""
+    _write_tree(tmp_path / 'source', {'a': 'a', 'b': 'b'})
+    local = filestore.LocalFilestore()
+    errors = local.put_many({
+        str(tmp_path / 'source' / 'a'): str(tmp_path / 'dest' / 'a'),
+        str(tmp_path / 'source' / 'missing'): str(tmp_path / 'dest' / 'c'),
+    })
+    assert errors[str(tmp_path / 'source' / 'a')] is None
+    assert isinstance(errors[str(tmp_path / 'source' / 'missing')],
+                      filestore.FilestoreNotFoundError)
+    assert local.exists_many(
+        [str(tmp_path / 'dest' / 'a'),
+         str(tmp_path / 'dest' / 'c')]) == {
+             str(tmp_path / 'dest' / 'a'): True,
+             str(tmp_path / 'dest' / 'c'): False
+         }
+
+
+def test_run():
+    """Tests that run converts results and errors like new_process.execute."""
+
+    def fail():
+        raise filestore.FilestoreError('error')
+
+    assert filestore.run(lambda: 'output').output == 'output'
+    assert filestore.run(fail, expect_zero=False).retcode == 1
+    with pytest.raises(subprocess.CalledProcessError):
+        filestore.run(fail)
+
+
+def test_gcs_write_read_stat(gcs):  # pylint: disable=redefined-outer-name
+    """Tests writing, reading and statting objects with names that need to be
+    quoted."""
+    fake, client = gcs
+    path = f'gs://{BUCKET}/dir/file name#1.json'
+    client.write(path, b'data')
+    assert fake.get(BUCKET, 'dir/file name#1.json') == b'data'
+    assert client.read(path) == b'data'
+    info = client.stat(path)
+    assert info.size == 4
+    assert info.md5 == fake.get_resource(BUCKET,
+                                         'dir/file name#1.json')['md5Hash']
+    assert fake.metadata[(BUCKET, 'dir/file name#1.json')] == {
+        'contentType': 'application/json'
+    }
+    assert client.stat(f'gs://{BUCKET}/missing') is None
+    with pytest.raises(filestore.FilestoreNotFoundError):
+        client.read(f'gs://{BUCKET}/missing')
+
+
+def test_gcs_upload_metadata(gcs, tmp_path):  # pylint: disable=redefined-outer-name
+    """Tests that metadata is set on uploaded objects."""
+    fake, client = gcs
+    local_path = tmp_path / 'report.html'
+    local_path.write_text('<html>')
+    client.upload(str(local_path),
+                  f'gs://{BUCKET}/report.html',
+                  metadata={'cacheControl': 'public, max-age=0'})
+    assert fake.get(BUCKET, 'report.html') == b'<html>'
+    assert fake.metadata[(BUCKET, 'report.html')] == {
+        'cacheControl': 'public, max-age=0',
+        'contentType': 'text/html'
+    }
+
+
+def test_gcs_retries_transient_errors(gcs):  # pylint: disable=redefined-outer-name
+    """Tests that transient errors are retried but other errors aren't."""
+    fake, client = gcs
+    fake.put(BUCKET, 'file', b'data')
+    fake.errors = [503, 429]
+    assert client.read(f'gs://{BUCKET}/file') == b'data'
+
+    fake.errors = [403]
+    with pytest.raises(filestore.FilestoreError) as error:
+        client.read(f'gs://{BUCKET}/file')
+    assert error.value.status == 403
+
+
+def test_gcs_credentials_errors(gcs):  # pylint: disable=redefined-outer-name
+    """Tests that failures to refresh the credentials are retried if they
+    are transient and raised as FilestoreError."""
+    fake, client = gcs
+    fake.put(BUCKET, 'file', b'data')
+    credentials = mock.Mock(valid=False, token='token')
+    credentials.refresh.side_effect = [
+        google.auth.exceptions.TransportError('reset'), None
+    ]
+    client._credentials = credentials  # pylint: disable=protected-access
+    assert client.read(f'gs://{BUCKET}/file') == b'data'
+
+    credentials.refresh.side_effect = google.auth.exceptions.RefreshError(
+        'invalid_grant')
+    with pytest.raises(filestore.FilestoreError):
+        client.read(f'gs://{BUCKET}/file')
+    assert filestore.run(client.read, f'gs://{BUCKET}/file',
+                         expect_zero=False).retcode == 1
+
+
+def test_gcs_bulk_operations(gcs, tmp_path):  # pylint: disable=redefined-outer-name
+    """Tests get_many, put_many and exists_many with GCS."""
+    fake, client = gcs
+    _write_tree(tmp_path / 'source', {str(idx): str(idx) for idx in range(5)})
+    uploads = {
+        str(tmp_path / 'source' / str(idx)): f'gs://{BUCKET}/dir/{idx}'
+        for idx in range(5)
+    }
+    assert not any(client.put_many(uploads).values())
+
+    downloads = {
+        url: str(tmp_path / 'dest' / posixpath.basename(url))
+        for url in list(uploads.values()) + [f'gs://{BUCKET}/dir/missing']
+    }
+    errors = client.get_many(downloads)
+    assert isinstance(errors.pop(f'gs://{BUCKET}/dir/missing'),
+                      filestore.FilestoreNotFoundError)
+    assert not any(errors.values())
+    assert _read_tree(tmp_path / 'dest') == _read_tree(tmp_path / 'source')
+
+    # Paths in the same directory are checked with a single listing.
+    fake.requests.clear()
+    assert client.exists_many([f'gs://{BUCKET}/dir/0',
+                               f'gs://{BUCKET}/dir/x']) == {
+                                   f'gs://{BUCKET}/dir/0': True,
+                                   f'gs://{BUCKET}/dir/x': False
+                               }
+    assert len(fake.requests) == 1
+    assert client.exists_many([f'gs://{BUCKET}/dir']) == {
+        f'gs://{BUCKET}/dir': True
+    }
+
+
+def test_gcs_tree_operations(gcs, tmp_path):  # pylint: disable=redefined-outer-name
+    """Tests cp, ls, rsync and rm of directories between local paths and
+    GCS."""
+    fake, client = gcs
+    fake.page_size = 2
+    _write_tree(tmp_path / 'source', {'a': 'a', 'b': 'b', 'dir/c': 'c'})
+    dir_url = f'gs://{BUCKET}/dir'
+    client.cp(str(tmp_path / 'source'), dir_url, recursive=True)
+    assert client.ls(dir_url) == [
+        f'{dir_url}/a', f'{dir_url}/b', f'{dir_url}/dir/'
+    ]
+
+    client.cp(dir_url, str(tmp_path / 'copy'), recursive=True)
+    assert _read_tree(tmp_path / 'copy') == {'a': 'a', 'b': 'b', 'dir/c': 'c'}
+
+    _write_tree(tmp_path / 'source', {'a': 'new'})
+    os.remove(tmp_path / 'source' / 'b')
+    fake.requests.clear()
+    client.rsync(str(tmp_path / 'source'), dir_url)
+    assert sorted(name for _, name in fake.objects) == ['dir/a', 'dir/dir/c']
+    assert fake.get(BUCKET, 'dir/a') == b'new'
+    uploads = [path for _, path in fake.requests if 'upload' in path]
+    assert len(uploads) == 1
+
+    client.rm(dir_url)
+    assert not fake.objects
+    client.rm(dir_url, force=True)
+    with pytest.raises(filestore.FilestoreNotFoundError):
+        client.rm(dir_url)
+
+
+def test_gsutil_uses_gcs_client(gcs, environ):  # pylint: disable=redefined-outer-name,unused-argument
+    """Tests that gsutil functions use the GCS client when it is enabled."""
+    fake, client = gcs
+    fake.put(BUCKET, 'dir/file', b'data')
+    os.environ['USE_GCS_CLIENT'] = 'True'
+    with mock.patch('common.filestore.get_gcs_filestore',
+                    return_value=client), mock.patch(
+                        'common.new_process.execute') as mocked_execute:
+        assert gsutil.cat(f'gs://{BUCKET}/dir/file').output == 'data'
+        assert gsutil.ls(f'gs://{BUCKET}/dir').output == (
+            f'gs://{BUCKET}/dir/file\n')
+        assert gsutil.ls(f'gs://{BUCKET}/missing',
+                         must_exist=False).retcode == 1
+        assert gsutil.rm(f'gs://{BUCKET}/missing', force=True).retcode == 0
+        mocked_execute.assert_not_called()
+
+        # Wildcards are left to gsutil.
+        gsutil.ls(f'gs://{BUCKET}/dir/*')
+        mocked_execute.assert_called_once()
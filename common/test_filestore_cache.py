@@ -0,0 +1,144 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for filestore_cache.py."""
+
+import os
+import shutil
+from unittest import mock
+
+import pytest
+
+from common import filestore_cache
+from common import filestore_utils
+from common import new_process
+
+COVERAGE_BUILD = ('gs://bucket/experiment/coverage-binaries/'
+                  'coverage-build-benchmark.tar.gz')
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_is_cacheable():
+    """Tests that only immutable objects are cached."""
+    cache = filestore_cache.FilestoreCache('/cache')
+    assert cache.is_cacheable(COVERAGE_BUILD)
+    assert cache.is_cacheable(
+        'gs://bucket/experiment/results/experiment_data-v3.json.gz')
+    assert not cache.is_cacheable(
+        'gs://bucket/experiment/experiment-folders/benchmark-fuzzer/trial-1/'
+        'corpus/corpus-archive-0001.tar.gz')
+    assert not cache.is_cacheable(
+        'gs://bucket/experiment/experiment-folders/benchmark-fuzzer/trial-1/'
+        'results/stats-0001.json')
+
+
+def test_get_and_add(tmp_path):
+    """Tests that objects are stored once per distinct contents and read
+    back."""
+    cache = filestore_cache.FilestoreCache(str(tmp_path / 'cache'))
+    assert not cache.get('gs://a', str(tmp_path / 'out'))
+
+    local_path = _write(tmp_path / 'file', b'data')
+    cache.add('gs://a', local_path)
+    cache.add('gs://b', local_path)
+    assert cache.get('gs://a', str(tmp_path / 'out' / 'a'))
+    assert (tmp_path / 'out' / 'a').read_bytes() == b'data'
+    blobs = list((tmp_path / 'cache' / 'blobs').rglob('*'))
+    assert len([path for path in blobs if path.is_file()]) == 1
+
+
+def test_evict_least_recently_used(tmp_path):
+    """Tests that the least recently used objects are evicted once the cache
+    is full."""
+    cache = filestore_cache.FilestoreCache(str(tmp_path / 'cache'), size=10)
+    for idx, name in enumerate(['a', 'b']):
+        cache.add(f'gs://{name}', _write(tmp_path / name, name.encode() * 4))
+        blob_path = cache._get_blob_path(  # pylint: disable=protected-access
+            filestore_cache._get_digest(str(tmp_path / name)))  # pylint: disable=protected-access
+        os.utime(blob_path, (idx, idx))
+    # Reading "a" makes "b" the least recently used.
+    assert cache.get('gs://a', str(tmp_path / 'out'))
+    cache.add('gs://c', _write(tmp_path / 'c', b'cccc'))
+    assert cache.get('gs://a', str(tmp_path / 'out'))
+    assert not cache.get('gs://b', str(tmp_path / 'out'))
+    assert cache.get('gs://c', str(tmp_path / 'out'))
+
+
+def test_evict_only_scans_when_full(tmp_path):
+    """Tests that adding objects only scans the cache the first time and once
+    the estimated size is over the size of the cache."""
+    cache = filestore_cache.FilestoreCache(str(tmp_path / 'cache'), size=10)
+    with mock.patch('common.filestore_cache.remove_least_recently_used',
+                    side_effect=filestore_cache.remove_least_recently_used
+                   ) as mocked_remove_least_recently_used:
+        for name in ['a', 'b']:
+            cache.add(f'gs://{name}', _write(tmp_path / name,
+                                             name.encode() * 4))
+        assert mocked_remove_least_recently_used.call_count == 1
+        cache.add('gs://c', _write(tmp_path / 'c', b'cccc'))
+        assert mocked_remove_least_recently_used.call_count == 2
+
+
+def test_get_patterns():
+    """Tests that optional patterns are only used when named in
+    FILESTORE_CACHE_OPTIONAL."""
+    corpus_archive = ('gs://bucket/experiment/experiment-folders/'
+                      'benchmark-fuzzer/trial-1/corpus/'
+                      'corpus-archive-0001.tar.gz')
+    with mock.patch.dict(os.environ, {'FILESTORE_CACHE_OPTIONAL': ''}):
+        assert filestore_cache.get_patterns() == (
+            filestore_cache.IMMUTABLE_PATTERNS)
+    with mock.patch.dict(os.environ,
+                         {'FILESTORE_CACHE_OPTIONAL': 'corpus-archives,bad'}):
+        cache = filestore_cache.FilestoreCache(
+            '/cache', patterns=filestore_cache.get_patterns())
+    assert cache.is_cacheable(corpus_archive)
+    assert cache.is_cacheable(COVERAGE_BUILD)
+    assert not cache.is_cacheable(
+        'gs://bucket/experiment/coverage/data/benchmark/fuzzer/'
+        'covered_branches.json')
+
+
+@pytest.mark.usefixtures('use_gsutil')
+def test_cp_reads_through_cache(tmp_path):
+    """Tests that filestore_utils.cp only downloads immutable objects once."""
+    os.environ['FILESTORE_CACHE_DIR'] = str(tmp_path / 'cache')
+    source = _write(tmp_path / 'source', b'archive')
+
+    def cp(_, destination, **kwargs):  # pylint: disable=invalid-name,unused-argument
+        shutil.copyfile(source, destination)
+        return new_process.ProcessResult(0, '', False)
+
+    with mock.patch('common.gsutil.cp', side_effect=cp) as mocked_cp:
+        for idx in range(2):
+            destination = str(tmp_path / f'destination-{idx}')
+            assert not filestore_utils.cp(COVERAGE_BUILD, destination).retcode
+            with open(destination, 'rb') as file_handle:
+                assert file_handle.read() == b'archive'
+        assert mocked_cp.call_count == 1
+
+        filestore_utils.cp(COVERAGE_BUILD + '.json', str(tmp_path / 'json'))
+        filestore_utils.cp(COVERAGE_BUILD + '.json', str(tmp_path / 'json'))
+        assert mocked_cp.call_count == 3
+
+    with mock.patch('common.gsutil.get_many') as mocked_get_many:
+        assert filestore_utils.get_many(
+            {COVERAGE_BUILD: str(tmp_path / 'destination-2')}) == {
+                COVERAGE_BUILD: True
+            }
+    mocked_get_many.assert_not_called()
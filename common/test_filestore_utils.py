@@ -13,10 +13,12 @@
 # limitations under the License.
 """Tests for filestore_utils.py."""
 
+import os
 from unittest import mock
 
 import pytest
 
+from common import filestore
 from common import filestore_utils
 from common import new_process
 
@@ -28,55 +30,34 @@ GCS_DIR_2 = 'gs://fake_dir_2'
 
 def test_using_local_filestore(fs, use_local_filestore):  # pylint: disable=invalid-name,unused-argument
     """Tests that local_filestore is used in local running settings."""
-    fs.create_dir(LOCAL_DIR)
+    fs.create_file(os.path.join(LOCAL_DIR, 'file'))
     fs.create_dir(LOCAL_DIR_2)
 
     with mock.patch('common.new_process.execute') as mocked_execute:
         filestore_utils.cp(LOCAL_DIR, LOCAL_DIR_2, recursive=True)
-        assert 'gsutil' not in mocked_execute.call_args_list[0][0][0]
-
-    with mock.patch('common.new_process.execute') as mocked_execute:
-        filestore_utils.ls(LOCAL_DIR)
-        assert 'gsutil' not in mocked_execute.call_args_list[0][0][0]
-
-    with mock.patch('common.new_process.execute') as mocked_execute:
-        filestore_utils.rm(LOCAL_DIR, recursive=True)
-        assert 'gsutil' not in mocked_execute.call_args_list[0][0][0]
-
-    with mock.patch('common.new_process.execute') as mocked_execute:
+        assert filestore_utils.ls(LOCAL_DIR).output == 'file\n'
         filestore_utils.rsync(LOCAL_DIR, LOCAL_DIR_2, recursive=True)
-        assert 'gsutil' not in mocked_execute.call_args_list[0][0][0]
+        filestore_utils.rm(LOCAL_DIR, recursive=True)
+    mocked_execute.assert_not_called()
+    assert sorted(os.listdir(LOCAL_DIR_2)) == ['file']
+    assert not os.path.exists(LOCAL_DIR)
+    assert isinstance(filestore_utils.get_filestore(), filestore.LocalFilestore)
 
 
 def test_parallel_take_no_effects_locally(fs, use_local_filestore):  # pylint: disable=invalid-name,unused-argument
     """Tests that `parallel` argument takes no effect for local running no
     matter True or False."""
-    fs.create_dir(LOCAL_DIR)
-    fs.create_dir(LOCAL_DIR_2)
+    fs.create_file(os.path.join(LOCAL_DIR, 'file'))
 
-    with mock.patch('common.new_process.execute') as mocked_execute:
-        filestore_utils.rsync(LOCAL_DIR, LOCAL_DIR_2, parallel=True)
-        filestore_utils.rsync(LOCAL_DIR, LOCAL_DIR_2, parallel=False)
-        call_args_list = mocked_execute.call_args_list
-        assert call_args_list[0] == call_args_list[1]
-
-    with mock.patch('common.new_process.execute') as mocked_execute:
-        filestore_utils.cp(LOCAL_DIR,
-                           LOCAL_DIR_2,
-                           recursive=True,
-                           parallel=True)
+    for parallel in [True, False]:
         filestore_utils.cp(LOCAL_DIR,
                            LOCAL_DIR_2,
                            recursive=True,
-                           parallel=False)
-        call_args_list = mocked_execute.call_args_list
-        assert call_args_list[0] == call_args_list[1]
-
-    with mock.patch('common.new_process.execute') as mocked_execute:
-        filestore_utils.rm(LOCAL_DIR, recursive=True, parallel=True)
-        filestore_utils.rm(LOCAL_DIR, recursive=True, parallel=False)
-        call_args_list = mocked_execute.call_args_list
-        assert call_args_list[0] == call_args_list[1]
+                           parallel=parallel)
+        filestore_utils.rsync(LOCAL_DIR, LOCAL_DIR_2, parallel=parallel)
+        assert os.listdir(LOCAL_DIR_2) == ['file']
+        filestore_utils.rm(LOCAL_DIR_2, recursive=True, parallel=parallel)
+        assert not os.path.exists(LOCAL_DIR_2)
 
 
 def test_using_gsutil(use_gsutil):  # pylint: disable=unused-argument
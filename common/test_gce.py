@@ -87,3 +87,20 @@ def test_get_instance_group_size(mocked_get_instance_group_managers):
                   zone=ZONE)
     ]
     assert result == size
+
+
+@mock.patch('common.gce._get_instance_items')
+def test_get_preempted_instances(mocked_get_instance_items):
+    """Tests that get_preempted_instances asks the API to only list preempted
+    instances and only returns instances with |name_prefix|."""
+    mocked_get_instance_items.return_value = [{
+        'name': name,
+        'status': 'TERMINATED',
+        'scheduling': {
+            'preemptible': True
+        }
+    } for name in ['r-experiment-1', 'r-other-1']]
+    assert list(gce.get_preempted_instances(
+        PROJECT, ZONE, 'r-experiment-')) == ['r-experiment-1']
+    mocked_get_instance_items.assert_called_with(PROJECT, ZONE,
+                                                 gce.PREEMPTED_FILTER)
@@ -15,6 +15,11 @@
 
 from unittest import mock
 
+import google.auth.exceptions
+import pytest
+import requests
+
+from common import compute_api
 from common import gcloud
 from common import new_process
 from test_libs import utils as test_utils
@@ -190,3 +195,118 @@ def test_delete_instance_template(mocked_execute):
         'gcloud', 'compute', 'instance-templates', 'delete', template_name
     ]
     mocked_execute.assert_called_with(expected_command)
+
+
+@mock.patch('common.compute_api.wait_for_results', return_value=[True])
+@mock.patch('common.compute_api.get_client')
+def test_create_instance_compute_api(mocked_get_client, _, tmp_path):
+    """Tests that create_instance uses the Compute Engine API when
+    use_compute_api is set."""
+    startup_script = tmp_path / 'startup.sh'
+    startup_script.write_text('echo hello')
+    config = CONFIG.copy()
+    config['use_compute_api'] = True
+    config['cloud_project'] = 'my-project'
+    assert gcloud.create_instance(INSTANCE_NAME,
+                                  gcloud.InstanceType.RUNNER,
+                                  config,
+                                  startup_script=str(startup_script),
+                                  preemptible=True)
+    mocked_get_client.assert_called_with('my-project')
+    insert_instances = mocked_get_client.return_value.insert_instances
+    zone, bodies = insert_instances.call_args[0]
+    assert zone == ZONE
+    assert bodies == [{
+        'name': INSTANCE_NAME,
+        'machineType': f'zones/{ZONE}/machineTypes/{MACHINE_TYPE}',
+        'disks': [{
+            'boot': True,
+            'autoDelete': True,
+            'initializeParams': {
+                'sourceImage': gcloud.COS_IMAGE,
+                'diskSizeGb': 30,
+            },
+        }],
+        'networkInterfaces': [{
+            'network': 'global/networks/default'
+        }],
+        'serviceAccounts': [{
+            'email': 'default',
+            'scopes': ['https://www.googleapis.com/auth/cloud-platform'],
+        }],
+        'scheduling': {
+            'preemptible': True
+        },
+        'metadata': {
+            'items': [{
+                'key': 'startup-script',
+                'value': 'echo hello'
+            }]
+        },
+    }]
+
+
+@mock.patch('common.new_process.execute')
+@mock.patch('common.compute_api.wait_for_results', return_value=[True, False])
+@mock.patch('common.compute_api.get_client')
+def test_delete_instances_compute_api(mocked_get_client, _, mocked_execute):
+    """Tests that delete_instances uses the Compute Engine API client if one
+    was initialized and reports failures."""
+    instances = ['instance-0', 'instance-1']
+    zone = 'us-central1-a'
+    assert not gcloud.delete_instances(instances, zone)
+    mocked_get_client.return_value.delete_instances.assert_called_with(
+        zone, instances)
+    assert not mocked_execute.called
+
+
+@pytest.mark.parametrize('error', [
+    compute_api.ComputeApiError('failed'),
+    requests.exceptions.ConnectionError('reset'),
+    google.auth.exceptions.RefreshError('expired'),
+])
+@mock.patch('common.compute_api.get_client')
+def test_compute_api_errors(mocked_get_client, error):
+    """Tests that delete_instances and create_instances report errors raised
+    while waiting for the operations as failures."""
+    instances = ['instance-0', 'instance-1']
+    zone = 'us-central1-a'
+    with mock.patch('common.compute_api.wait_for_results', side_effect=error):
+        assert not gcloud.delete_instances(instances, zone)
+    mocked_get_client.return_value.insert_instances.side_effect = error
+    config = dict(CONFIG, cloud_project='project')
+    assert gcloud.create_instances(instances, gcloud.InstanceType.RUNNER,
+                                   config, [None, None],
+                                   [False, False]) == [False, False]
+
+
+@pytest.mark.parametrize(('machine_type', 'memory', 'num_trials', 'expected'), [
+    ('n1-standard-1', '12GB', 3, (6, 11520)),
+    ('n1-highmem-2', '12GB', 2, (4, 26624)),
+    ('custom-1-1024', '12GB', 1, (2, 2048)),
+    (None, '12GB', 2, (4, 24576)),
+    (None, '512MB', 2, (4, 3840)),
+    (None, '100GB', 2, (32, 204800)),
+])
+def test_get_packed_runner_resources(machine_type, memory, num_trials,
+                                     expected):
+    """Tests that packed runners get whole physical cores for each trial and no
+    more memory per vCPU than N1 custom machine types allow."""
+    config = {
+        'runner_machine_type': machine_type,
+        'runner_num_cpu_cores': 1,
+        'runner_memory': memory,
+    }
+    assert gcloud.get_packed_runner_resources(config, num_trials) == expected
+
+
+def test_get_packed_runner_resources_unsupported():
+    """Tests that get_packed_runner_resources raises ValueError for machine
+    types other than N1 ones."""
+    config = {
+        'runner_machine_type': 'e2-standard-2',
+        'runner_num_cpu_cores': 1,
+        'runner_memory': '12GB',
+    }
+    with pytest.raises(ValueError):
+        gcloud.get_packed_runner_resources(config, 2)
@@ -18,6 +18,7 @@ from unittest import mock
 import pytest
 
 from common import gsutil
+from common import new_process
 from test_libs import utils as test_utils
 
 
@@ -39,6 +40,34 @@ def test_ls_must_exist(must_exist):
                                           expect_zero=must_exist)
 
 
+def test_list_versions():
+    """Tests that list_versions returns the generation of each object."""
+    output = ('gs://bucket/data/afl/covered_branches.json#1700000000000001\n'
+              'gs://bucket/data/covered_branches.bin#1700000000000002\n')
+    with mock.patch('common.gsutil.gsutil_command') as mocked_gsutil_command:
+        mocked_gsutil_command.return_value = new_process.ProcessResult(
+            0, output, False)
+        assert gsutil.list_versions('gs://bucket/data') == {
+            'gs://bucket/data/afl/covered_branches.json': '1700000000000001',
+            'gs://bucket/data/covered_branches.bin': '1700000000000002',
+        }
+    mocked_gsutil_command.assert_called_with(
+        ['ls', '-a', 'gs://bucket/data/**'], expect_zero=False)
+
+
+@pytest.mark.parametrize(('output', 'expected_versions'),
+                         [('CommandException: One or more URLs matched no '
+                           'objects.', {}),
+                          ('AccessDeniedException: 403', None)])
+def test_list_versions_failed(output, expected_versions):
+    """Tests that list_versions distinguishes missing objects from
+    failures."""
+    with mock.patch('common.gsutil.gsutil_command') as mocked_gsutil_command:
+        mocked_gsutil_command.return_value = new_process.ProcessResult(
+            1, output, False)
+        assert gsutil.list_versions('gs://bucket/data') == expected_versions
+
+
 class TestGsutilRsync:
     """Tests for gsutil_command works as expected."""
     SRC = '/src'
@@ -81,3 +110,36 @@ class TestGsutilRsync:
                 'common.gsutil.gsutil_command') as mocked_gsutil_command:
             gsutil.rsync(self.SRC, self.DST, **kwargs_for_rsync)
         assert flag not in mocked_gsutil_command.call_args_list[0][0][0]
+
+
+def test_get_many_groups_files(tmp_path):
+    """Tests that get_many downloads files to the same directory with a single
+    command and finds out which files failed if it fails."""
+    downloads = {
+        'gs://bucket/dir/a': str(tmp_path / 'a'),
+        'gs://bucket/dir/b': str(tmp_path / 'b'),
+        'gs://bucket/other/c': str(tmp_path / 'renamed'),
+    }
+    with mock.patch('common.new_process.execute') as mocked_execute:
+        mocked_execute.return_value = new_process.ProcessResult(0, '', False)
+        assert gsutil.get_many(downloads) == {url: True for url in downloads}
+    commands = sorted(call[0][0] for call in mocked_execute.call_args_list)
+    assert commands == [
+        [
+            'gsutil', '-m', 'cp', 'gs://bucket/dir/a', 'gs://bucket/dir/b',
+            str(tmp_path) + '/'
+        ],
+        ['gsutil', 'cp', 'gs://bucket/other/c',
+         str(tmp_path / 'renamed')],
+    ]
+
+    def execute(command, expect_zero):  # pylint: disable=unused-argument
+        retcode = int('-m' in command or 'gs://bucket/dir/b' in command)
+        return new_process.ProcessResult(retcode, '', False)
+
+    with mock.patch('common.new_process.execute', side_effect=execute):
+        assert gsutil.get_many(downloads) == {
+            'gs://bucket/dir/a': True,
+            'gs://bucket/dir/b': False,
+            'gs://bucket/other/c': True,
+        }
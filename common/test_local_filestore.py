@@ -59,6 +59,20 @@ def test_ls_one_file_per_line(tmp_path):
     assert local_filestore.ls(str(dir_path)).output == 'file1\nfile2\n'
 
 
+def test_list_versions(tmp_path):
+    """Tests that list_versions lists files recursively and that versions
+    change when files are modified."""
+    file_path = tmp_path / 'dir' / 'file'
+    file_path.parent.mkdir()
+    file_path.write_text('hello')
+    versions = local_filestore.list_versions(str(tmp_path))
+    assert list(versions) == [str(file_path)]
+
+    file_path.write_text('hello world')
+    assert local_filestore.list_versions(str(tmp_path)) != versions
+    assert not local_filestore.list_versions(str(tmp_path / 'missing'))
+
+
 def test_cp(tmp_path):
     """Tests cp works as expected."""
     source = tmp_path / 'source'
@@ -103,12 +117,12 @@ DST = '/dst'
 
 def test_rsync_dir_to_dir(fs):  # pylint: disable=invalid-name
     """Tests that rsync works as intended."""
-    fs.create_dir(SRC)
-    fs.create_dir(DST)
+    fs.create_file(os.path.join(SRC, 'file'), contents='data')
+    fs.create_file(os.path.join(DST, 'other'))
     with mock.patch('common.new_process.execute') as mocked_execute:
         local_filestore.rsync(SRC, DST)
-    mocked_execute.assert_called_with(
-        ['rsync', '--delete', '-r', '/src/', '/dst'], expect_zero=True)
+    mocked_execute.assert_not_called()
+    assert os.listdir(DST) == ['file']
 
 
 def test_rsync_options(fs):  # pylint: disable=invalid-name
@@ -119,18 +133,32 @@ def test_rsync_options(fs):  # pylint: disable=invalid-name
     flag = '-flag'
     with mock.patch('common.new_process.execute') as mocked_execute:
         local_filestore.rsync(SRC, DST, options=[flag])
-    assert flag in mocked_execute.call_args_list[0][0][0]
+    mocked_execute.assert_called_with(
+        ['rsync', '--delete', '-r', flag, '/src/', '/dst'], expect_zero=True)
 
 
-@pytest.mark.parametrize(('kwarg_for_rsync', 'flag'), [('delete', '--delete'),
-                                                       ('recursive', '-r')])
-def test_rsync_no_flag(kwarg_for_rsync, flag, fs):  # pylint: disable=invalid-name
-    """Tests that rsync works as intended when caller specifies not
-    to use specific flags."""
-    fs.create_dir(SRC)
-    fs.create_dir(DST)
-    kwargs_for_rsync = {}
-    kwargs_for_rsync[kwarg_for_rsync] = False
-    with mock.patch('common.new_process.execute') as mocked_execute:
-        local_filestore.rsync(SRC, DST, **kwargs_for_rsync)
-    assert flag not in mocked_execute.call_args_list[0][0][0]
+def test_rsync_no_delete(fs):  # pylint: disable=invalid-name
+    """Tests that rsync keeps files that aren't in the source when caller
+    specifies not to delete them."""
+    fs.create_file(os.path.join(SRC, 'file'))
+    fs.create_file(os.path.join(DST, 'other'))
+    local_filestore.rsync(SRC, DST, delete=False)
+    assert sorted(os.listdir(DST)) == ['file', 'other']
+
+
+def test_rsync_no_recursive(fs):  # pylint: disable=invalid-name
+    """Tests that rsync doesn't copy subdirectories when caller specifies not
+    to be recursive."""
+    fs.create_file(os.path.join(SRC, 'file'))
+    fs.create_file(os.path.join(SRC, 'dir', 'file'))
+    local_filestore.rsync(SRC, DST, recursive=False)
+    assert os.listdir(DST) == ['file']
+
+
+def test_cat(tmp_path):
+    """Tests that cat returns the contents of the file."""
+    file_path = tmp_path / 'file'
+    file_path.write_text('hello')
+    assert local_filestore.cat(str(file_path)).output == 'hello'
+    result = local_filestore.cat(str(tmp_path / 'missing'), expect_zero=False)
+    assert result.retcode
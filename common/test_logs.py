@@ -0,0 +1,137 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for logs.py."""
+
+import json
+import logging
+import os
+import threading
+from unittest import mock
+
+from common import logs
+
+
+def _get_entry(message):
+    return logs.LogEntry('target', {'message': message}, 'INFO')
+
+
+def test_shipper_batches_entries():
+    """Tests that entries are shipped in batches of at most |batch_size|."""
+    batches = []
+    shipper = logs.LogShipper(lambda target, entries: batches.append(entries),
+                              batch_size=2,
+                              batch_interval=60)
+    for idx in range(5):
+        assert shipper.put(_get_entry(str(idx)))
+    assert shipper.flush()
+    assert [entry.struct['message'] for batch in batches for entry in batch
+           ] == ['0', '1', '2', '3', '4']
+    assert max(len(batch) for batch in batches) == 2
+
+
+def test_shipper_drops_entries_when_full():
+    """Tests that entries are dropped instead of blocking when the queue is
+    full and that the number of dropped entries is logged."""
+    shipping = threading.Event()
+    blocked = threading.Event()
+    messages = []
+
+    def ship(target, entries):  # pylint: disable=unused-argument
+        shipping.set()
+        blocked.wait()
+        messages.extend(entry.struct['message'] for entry in entries)
+
+    shipper = logs.LogShipper(ship, queue_size=1, batch_size=1)
+    shipper.put(_get_entry('first'))
+    shipping.wait()
+    assert shipper.put(_get_entry('second'))
+    assert not shipper.put(_get_entry('dropped'))
+    blocked.set()
+    assert shipper.flush()
+    assert messages == ['first', 'second', 'Dropped 1 log entries.']
+
+
+def test_shipper_retries():
+    """Tests that failures to ship entries are retried in the shipper's
+    thread."""
+    calls = []
+
+    def ship(target, entries):  # pylint: disable=unused-argument
+        calls.append(entries)
+        if len(calls) == 1:
+            raise ValueError('Error')
+
+    with mock.patch('common.logs.RETRY_DELAY', 0):
+        shipper = logs.LogShipper(ship)
+        shipper.put(_get_entry('message'))
+        assert shipper.flush()
+    assert len(calls) == 2
+
+
+def test_json_log_file(tmp_path, environ):  # pylint: disable=unused-argument
+    """Tests that entries are written to JSON_LOG_FILE when running
+    locally."""
+    log_file = tmp_path / 'log.jsonl'
+    os.environ['JSON_LOG_FILE'] = str(log_file)
+    with mock.patch('common.utils.is_local', return_value=True):
+        logs.info('Message %d.', 1, extras={'trial_id': '2'})
+        logs.warning('Other message.')
+    assert logs.flush()
+    with open(log_file, encoding='utf-8') as file_handle:
+        lines = [json.loads(line) for line in file_handle]
+    assert lines == [
+        {
+            'message': 'Message 1.',
+            'trial_id': '2',
+            'severity': 'INFO'
+        },
+        {
+            'message': 'Other message.',
+            'severity': 'WARNING'
+        },
+    ]
+
+
+def test_dropped_entry_not_reported(environ):  # pylint: disable=unused-argument
+    """Tests that the number of dropped entries is logged and not sent to
+    error reporting when the first entry of the batch is an error report."""
+    shipping = threading.Event()
+    blocked = threading.Event()
+    shipped = []
+
+    def ship(target, entries):
+        shipping.set()
+        blocked.wait()
+        shipped.extend((target, entry.struct['message']) for entry in entries)
+
+    shipper = logs.LogShipper(ship, queue_size=1, batch_size=2)
+    shipper.put(_get_entry('first'))
+    shipping.wait()
+    assert shipper.put(logs.LogEntry(None, {'message': 'error'}, None))
+    assert not shipper.put(_get_entry('dropped'))
+    os.environ['JSON_LOG_FILE'] = 'log.jsonl'
+    with mock.patch('common.utils.is_local', return_value=True):
+        blocked.set()
+        assert shipper.flush()
+    assert shipped == [('target', 'first'), (None, 'error'),
+                       ('log.jsonl', 'Dropped 1 log entries.')]
+
+
+def test_log_does_not_raise():
+    """Tests that errors while logging aren't raised into callers."""
+    with mock.patch('common.utils.is_local', return_value=False), \
+            mock.patch('common.logs._default_logger', None):
+        logs.log(None, logging.INFO, 'Message.')
+    with mock.patch('common.utils.is_local', return_value=False):
+        logs.log('logger', 12345, 'Message.')
@@ -61,3 +61,60 @@ class TestIntegrationExecute:
 
         with open(output_file_path, 'r', encoding='utf-8') as output_file:
             assert output_file.read() == 'Hello, World!\n'
+
+    def test_output(self):
+        """Tests that the output is returned and passed to |line_callback|
+        line by line."""
+        lines = []
+        command = ['python3', '-c', 'print("a\\nb", end="")']
+        result = new_process.execute(command, line_callback=lines.append)
+        assert result.output == 'a\nb'
+        assert lines == ['a', 'b']
+
+    def test_process_callback(self):
+        """Tests that |process_callback| is called with the process and that
+        its resource usage is recorded when it exits."""
+        processes = []
+        command = ['python3', '-c', 'x = bytearray(64 * 2**20)']
+        new_process.execute(command, process_callback=processes.append)
+        assert processes[0].process.returncode == 0
+        assert processes[0].usage.max_rss > 64 * 1024
+
+    def test_usage_after_timeout(self):
+        """Tests that the usage of a process killed at its timeout includes
+        the CPU time of its children that were killed with it."""
+        processes = []
+        command = [
+            'python3', '-c',
+            'import subprocess, sys; subprocess.run([sys.executable, "-c", '
+            '"while True: pass"])'
+        ]
+        result = new_process.execute(command,
+                                     timeout=2,
+                                     kill_children=True,
+                                     expect_zero=False,
+                                     process_callback=processes.append)
+        assert result.timed_out
+        usage = processes[0].usage
+        assert usage.user_time + usage.system_time > 1
+
+    def test_output_limit(self):
+        """Tests that only the beginning and the end of the output are kept if
+        |output_limit| is set."""
+        command = ['python3', '-c', 'print("a" * 100000 + "b" * 100000)']
+        result = new_process.execute(command, output_limit=10, head_limit=5)
+        assert result.output == ('aaaaa\n[... 199986 bytes omitted ...]\n'
+                                 'bbbbbbbbb\n')
+
+
+def test_output_capture():
+    """Tests that OutputCapture keeps a bounded tail and calls the line
+    callback for lines split across writes."""
+    lines = []
+    capture = new_process.OutputCapture(limit=4, line_callback=lines.append)
+    for data in [b'ab', b'c\nd', b'ef', b'\ngh']:
+        capture.write(data)
+    capture.close()
+    assert capture.tail_size == 5
+    assert capture.getvalue() == '\n[... 6 bytes omitted ...]\nf\ngh'
+    assert lines == ['abc', 'def', 'gh']
@@ -0,0 +1,71 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for resource_usage.py."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from common import resource_usage
+
+# Spins for a second in a child process, then allocates memory and waits.
+PARENT_CODE = '''
+import subprocess, sys, time
+subprocess.run([sys.executable, '-c',
+                'import time\\nend = time.time() + 1\\n'
+                'while time.time() < end: pass'], check=True)
+data = bytearray(64 * 2**20)
+print('ready', flush=True)
+time.sleep(60)
+'''
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/stat'),
+                    reason='Requires /proc.')
+def test_get_process_tree_usage():
+    """Tests that the usage of a running process includes the CPU time of the
+    children it waited for and its memory."""
+    with subprocess.Popen([sys.executable, '-c', PARENT_CODE],
+                          stdout=subprocess.PIPE) as process:
+        try:
+            assert process.stdout.readline() == b'ready\n'
+            usage = resource_usage.get_process_tree_usage(process.pid, 10)
+        finally:
+            process.kill()
+    assert usage.user_time + usage.system_time >= .5
+    assert usage.max_rss > 64 * 1024
+    assert usage.wall_time == 10
+    assert resource_usage.get_process_tree_usage(process.pid, 10) is None
+
+
+def test_stats():
+    """Tests converting usage to stats and computing the CPU utilization."""
+    usage = resource_usage.ResourceUsage(user_time=40.0,
+                                         system_time=10.0,
+                                         max_rss=2048,
+                                         read_bytes=1,
+                                         write_bytes=2,
+                                         wall_time=100.0)
+    stats = resource_usage.to_stats(usage)
+    assert stats == {
+        'cpu_time': 50.0,
+        'wall_time': 100.0,
+        'max_rss_mb': 2.0,
+        'read_bytes': 1,
+        'write_bytes': 2,
+    }
+    assert resource_usage.get_cpu_utilization(stats) == .5
+    assert resource_usage.get_cpu_utilization({'execs_per_sec': 1.0}) is None
+    assert resource_usage.get_cpu_utilization(None) is None
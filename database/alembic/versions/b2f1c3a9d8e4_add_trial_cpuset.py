@@ -0,0 +1,24 @@
+"""Add trial cpuset
+
+Revision ID: b2f1c3a9d8e4
+Revises: 8c237d2acbc4
+Create Date: 2024-05-02 10:12:43.512318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2f1c3a9d8e4'
+down_revision = '8c237d2acbc4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('trial', sa.Column('cpuset', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('trial', 'cpuset')
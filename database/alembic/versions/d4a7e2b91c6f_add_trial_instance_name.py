@@ -0,0 +1,25 @@
+"""Add trial instance_name
+
+Revision ID: d4a7e2b91c6f
+Revises: b2f1c3a9d8e4
+Create Date: 2024-05-09 14:37:05.104238
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7e2b91c6f'
+down_revision = 'b2f1c3a9d8e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('trial',
+                  sa.Column('instance_name', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('trial', 'instance_name')
@@ -0,0 +1,25 @@
+"""Add snapshot measurer_stats
+
+Revision ID: f3e8a1c5b7d2
+Revises: d4a7e2b91c6f
+Create Date: 2024-06-03 11:20:51.417702
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3e8a1c5b7d2'
+down_revision = 'd4a7e2b91c6f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('snapshot',
+                  sa.Column('measurer_stats', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('snapshot', 'measurer_stats')
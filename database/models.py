@@ -56,6 +56,14 @@ class Trial(Base):
     preempted = Column(Boolean, default=False, nullable=False)
     trial_group_num = Column(Integer, nullable=True)
 
+    # The CPUs the trial was pinned to in local experiments and on packed
+    # runner instances.
+    cpuset = Column(String, nullable=True)
+
+    # The instance the trial runs on if it shares it with other trials. None if
+    # the trial has its own instance, named after the trial.
+    instance_name = Column(String, nullable=True)
+
     # Every trial has snapshots which is basically the saved state of that trial
     # at a given time. The snapshots field here and the trial field on Snapshot,
     # declare this relationship exists to SQLAlchemy so that it is easy to get
@@ -73,6 +81,9 @@ class Snapshot(Base):
     trial = sqlalchemy.orm.relationship('Trial', back_populates='snapshots')
     edges_covered = Column(Integer, nullable=False)
     fuzzer_stats = Column(JSON, nullable=True)
+    # How long measuring the snapshot took and the resources used by its
+    # coverage run.
+    measurer_stats = Column(JSON, nullable=True)
     crashes = sqlalchemy.orm.relationship(
         'Crash',
         backref='snapshot',
@@ -101,13 +101,16 @@ def _get_makefile_run_template(image):
     return section
 
 
+def get_target_name(name):
+    """Returns the name of the make target building the image |name|."""
+    if not ('base-' in name or 'dispatcher-' in name or name == 'worker'):
+        return '.' + name
+    return name
+
+
 def get_rules_for_image(name, image):
     """Returns makefile section for |image|."""
-    if not ('base-' in name or 'dispatcher-' in name or name == 'worker'):
-        section = '.'
-    else:
-        section = ''
-    section += name + ':'
+    section = get_target_name(name) + ':'
     if 'depends_on' in image:
         for dep in image['depends_on']:
             if 'base' in dep:
@@ -0,0 +1,181 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Cache of fuzzer-benchmark images. Set BUILD_CACHE to enable it.
+
+The runner image of each fuzzer-benchmark pair that builds is also tagged with
+a key: a hash of the files it is built from and of the digest of the base
+image. A pair whose key already has an image isn't built again, the image is
+tagged for the new experiment instead."""
+
+import functools
+import hashlib
+import os
+import subprocess
+from typing import Iterable, List, Optional
+
+from common import environment
+from common import experiment_utils
+from common import fuzzer_utils
+from common import logs
+from common import utils
+from experiment.build import docker_images
+from src_analysis import fuzzer_dependencies
+
+if not experiment_utils.is_local_experiment():
+    import experiment.build.gcb_build as buildlib
+else:
+    import experiment.build.local_build as buildlib
+
+logger = logs.Logger()  # pylint: disable=invalid-name
+
+# Files used to build every runner image, relative to the root directory.
+SHARED_BUILD_PATHS = [
+    'common',
+    'docker/benchmark-builder',
+    'docker/benchmark-runner',
+    'docker/image_types.yaml',
+    'experiment/runner.py',
+]
+
+KEY_TAG_PREFIX = 'build-'
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_enabled() -> bool:
+    """Returns True if the build cache is enabled."""
+    return bool(environment.get('BUILD_CACHE', False))
+
+
+def _get_files(path: str) -> List[str]:
+    """Returns the files in |path| if it is a directory or |path| itself,
+    ignoring compiled python files."""
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for root, dirs, filenames in os.walk(path):
+        dirs[:] = [
+            directory for directory in dirs if directory != '__pycache__'
+        ]
+        files.extend(
+            os.path.join(root, filename)
+            for filename in filenames
+            if not filename.endswith('.pyc'))
+    return files
+
+
+def _hash_files(paths: Iterable[str]) -> str:
+    """Returns the SHA-256 digest of the names and contents of the files in
+    |paths|."""
+    sha256 = hashlib.sha256()
+    files = set()
+    for path in paths:
+        files.update(_get_files(path))
+    for path in sorted(os.path.relpath(path, utils.ROOT_DIR) for path in files):
+        sha256.update(path.encode() + b'\0')
+        with open(os.path.join(utils.ROOT_DIR, path), 'rb') as file_handle:
+            for chunk in iter(functools.partial(file_handle.read, CHUNK_SIZE),
+                              b''):
+                sha256.update(chunk)
+        sha256.update(b'\0')
+    return sha256.hexdigest()
+
+
+def _get_image_url(image_name: str,
+                   fuzzer: Optional[str],
+                   benchmark: Optional[str],
+                   tag: Optional[str] = None) -> str:
+    """Returns the URL of the image built from the |image_name| template of
+    docker/image_types.yaml with |tag|, the tag used by this experiment by
+    default."""
+    image_specs = docker_images.get_images_to_build([fuzzer],
+                                                    [benchmark])[image_name]
+    if tag is None:
+        tag = 'latest' if experiment_utils.is_local_experiment() else (
+            experiment_utils.get_experiment_name())
+    registry = environment.get('DOCKER_REGISTRY')
+    return f'{registry}/{image_specs["tag"]}:{tag}'
+
+
+@functools.lru_cache(maxsize=None)
+def get_base_image_digest() -> Optional[str]:
+    """Returns the digest of the base image of this experiment, or None if it
+    wasn't built."""
+    return buildlib.get_image_digest(
+        _get_image_url('base-image', fuzzer=None, benchmark=None))
+
+
+def get_key(fuzzer: str, benchmark: str, base_image_digest: str) -> str:
+    """Returns the key of the images of |fuzzer| for |benchmark|, built on the
+    base image with |base_image_digest|."""
+    fuzzer_directory = os.path.join(fuzzer_utils.FUZZERS_DIR, fuzzer)
+    paths = set(fuzzer_dependencies.get_fuzzer_dependencies(fuzzer))
+    paths.add(fuzzer_directory)
+    paths.add(os.path.join(utils.ROOT_DIR, 'benchmarks', benchmark))
+    paths.update(
+        os.path.join(utils.ROOT_DIR, path) for path in SHARED_BUILD_PATHS)
+    sha256 = hashlib.sha256()
+    sha256.update(base_image_digest.encode() + b'\0')
+    sha256.update(_hash_files(paths).encode())
+    return sha256.hexdigest()
+
+
+def _get_runner_image(fuzzer: str,
+                      benchmark: str,
+                      key: Optional[str] = None) -> str:
+    """Returns the URL of the runner image of |fuzzer| for |benchmark| in this
+    experiment, or in the cache with |key|."""
+    tag = None if key is None else KEY_TAG_PREFIX + key
+    return _get_image_url(f'{fuzzer}-{benchmark}-runner', fuzzer, benchmark,
+                          tag)
+
+
+def get_fuzzer_benchmark_key(fuzzer: str, benchmark: str) -> Optional[str]:
+    """Returns the key of the images of |fuzzer| for |benchmark| or None if it
+    can't be computed."""
+    base_image_digest = get_base_image_digest()
+    if base_image_digest is None:
+        logger.warning('Could not get the digest of the base image.')
+        return None
+    try:
+        return get_key(fuzzer, benchmark, base_image_digest)
+    except (ImportError, OSError) as error:
+        logger.warning('Could not get the build key of %s for %s: %s.', fuzzer,
+                       benchmark, error)
+        return None
+
+
+def restore(fuzzer: str, benchmark: str, key: str) -> bool:
+    """Tags the cached runner image of |fuzzer| for |benchmark| with |key| for
+    this experiment. Returns False if there is none."""
+    key_image = _get_runner_image(fuzzer, benchmark, key)
+    if buildlib.get_image_digest(key_image) is None:
+        return False
+    try:
+        buildlib.tag_image(key_image, _get_runner_image(fuzzer, benchmark))
+    except subprocess.CalledProcessError:
+        logger.warning('Could not tag the cached image %s.', key_image)
+        return False
+    return True
+
+
+def add(fuzzer: str, benchmark: str, key: str):
+    """Adds the runner image of |fuzzer| for |benchmark| that was just built to
+    the cache with |key|. Errors are only logged, the cache is best effort."""
+    try:
+        buildlib.tag_image(_get_runner_image(fuzzer, benchmark),
+                           _get_runner_image(fuzzer, benchmark, key))
+    except subprocess.CalledProcessError:
+        logger.warning('Could not add the build of %s for %s to the cache.',
+                       fuzzer, benchmark)
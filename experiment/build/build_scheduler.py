@@ -0,0 +1,162 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Schedules builds that depend on each other. Each build is started as soon
+as the builds it depends on succeeded, instead of waiting for every build of
+the previous stage. Failed builds are retried individually after a backoff and
+builds depending on a build that failed every attempt are skipped."""
+
+import collections
+from concurrent import futures
+import heapq
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+from common import logs
+
+logger = logs.Logger()  # pylint: disable=invalid-name
+
+# |build_func| is called with |args| and returns True if the build succeeded.
+# |dependencies| are the names of the nodes that must be built before.
+BuildNode = collections.namedtuple(
+    'BuildNode', ['name', 'build_func', 'args', 'dependencies'])
+
+
+def get_retry_wait(attempt: int, max_wait: float) -> float:
+    """Returns how long to wait before retrying a build that failed
+    |attempt| times. The wait is random so that the retries of builds that
+    failed at once don't all start at the same time, and up to |max_wait|
+    before the first retry, doubling with every attempt."""
+    return random.uniform(1, max_wait) * 2**(attempt - 1)
+
+
+def _build(node: BuildNode) -> bool:
+    try:
+        return bool(node.build_func(*node.args))
+    except Exception:  # pylint: disable=broad-except
+        logger.error('Build %s raised an exception.', node.name)
+        return False
+
+
+class BuildScheduler:  # pylint: disable=too-many-instance-attributes
+    """Runs the builds of a graph of BuildNodes, at most
+    |max_concurrent_builds| at once. Each build is attempted up to
+    |num_attempts| times, waiting up to |fail_wait| seconds before the first
+    retry (see get_retry_wait). |on_success| is called with every node that
+    succeeded, from the thread calling run, as soon as it is built."""
+
+    def __init__(self,
+                 max_concurrent_builds: int,
+                 num_attempts: int,
+                 fail_wait: float,
+                 on_success: Optional[Callable[[BuildNode], None]] = None):
+        self.max_concurrent_builds = max_concurrent_builds
+        self.num_attempts = num_attempts
+        self.fail_wait = fail_wait
+        self.on_success = on_success
+        self.nodes = {}
+        self.succeeded = []
+        self.failed = []
+        self._attempts = collections.Counter()
+        # Heap of (time, name) of the builds waiting to be retried.
+        self._retries = []
+
+    def _get_ready_nodes(self, waiting: Dict[str, BuildNode]) -> List:
+        """Removes the nodes whose dependencies all succeeded from |waiting|
+        and returns them. Nodes with a dependency that failed are skipped."""
+        succeeded = set(self.succeeded)
+        failed = set(self.failed)
+        ready = []
+        skipped = True
+        # Repeat until no node is skipped, so that the nodes depending on a
+        # skipped node are skipped as well.
+        while skipped:
+            skipped = False
+            for name, node in list(waiting.items()):
+                failed_dependencies = failed.intersection(node.dependencies)
+                if failed_dependencies:
+                    logger.error('Skipping build %s, dependencies failed: %s.',
+                                 name, sorted(failed_dependencies))
+                    self.failed.append(name)
+                    failed.add(name)
+                    del waiting[name]
+                    skipped = True
+                elif succeeded.issuperset(node.dependencies):
+                    ready.append(node)
+                    del waiting[name]
+        return ready
+
+    def _handle_result(self, node: BuildNode, success: bool):
+        self._attempts[node.name] += 1
+        attempt = self._attempts[node.name]
+        if success:
+            logger.info('Build succeeded: %s.', node.name)
+            self.succeeded.append(node.name)
+            if self.on_success is not None:
+                self.on_success(node)
+            return
+        if attempt >= self.num_attempts:
+            logger.error('Build failed after %d attempts: %s.', attempt,
+                         node.name)
+            self.failed.append(node.name)
+            return
+        wait = get_retry_wait(attempt, self.fail_wait)
+        logger.error('Build failed: %s. Retrying in %d secs.', node.name, wait)
+        heapq.heappush(self._retries, (time.time() + wait, node.name))
+
+    def run(self, nodes: List[BuildNode]) -> List[str]:
+        """Builds |nodes| and returns the names of the ones that succeeded, in
+        the order they were built."""
+        self.nodes.update((node.name, node) for node in nodes)
+        for node in nodes:
+            unknown_dependencies = set(node.dependencies) - set(self.nodes)
+            if unknown_dependencies:
+                raise ValueError(f'Build {node.name} depends on unknown '
+                                 f'builds: {sorted(unknown_dependencies)}.')
+
+        waiting = {node.name: node for node in nodes}
+        ready = collections.deque()
+        running = {}
+        with futures.ThreadPoolExecutor(self.max_concurrent_builds) as pool:
+            while True:
+                ready.extend(self._get_ready_nodes(waiting))
+                while self._retries and self._retries[0][0] <= time.time():
+                    _, name = heapq.heappop(self._retries)
+                    ready.append(self.nodes[name])
+                while ready and len(running) < self.max_concurrent_builds:
+                    node = ready.popleft()
+                    logger.info('Starting build: %s.', node.name)
+                    running[pool.submit(_build, node)] = node
+
+                if not running and not ready and not self._retries:
+                    break
+
+                timeout = None
+                if self._retries:
+                    timeout = max(self._retries[0][0] - time.time(), 0)
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                done, _ = futures.wait(running,
+                                       timeout=timeout,
+                                       return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    self._handle_result(running.pop(future), future.result())
+
+        # Nodes left waiting depend on each other in a cycle.
+        if waiting:
+            logger.error('Builds with cyclic dependencies: %s.',
+                         sorted(waiting))
+            self.failed.extend(waiting)
+        return self.succeeded
@@ -19,10 +19,13 @@ from common import experiment_path as exp_path
 from common import filestore_utils
 
 
-def store_build_logs(build_config, build_result):
-    """Save build results in the build logs bucket."""
-    build_output = (f'Command returned {build_result.retcode}.\n'
-                    f'Output: {build_result.output}')
+def store_build_logs(build_config, build_result, build_time=None):
+    """Save build results in the build logs bucket. |build_time| is the time
+    the build took in seconds, if known."""
+    build_output = f'Command returned {build_result.retcode}.\n'
+    if build_time is not None:
+        build_output += f'Build time: {build_time:.1f} secs.\n'
+    build_output += f'Output: {build_result.output}'
     with tempfile.NamedTemporaryFile(mode='w') as tmp:
         tmp.write(build_output)
         tmp.flush()
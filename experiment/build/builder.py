@@ -16,14 +16,11 @@
 
 import argparse
 import itertools
-from multiprocessing import pool as mp_pool
 import os
-import random
 import subprocess
 import sys
-import time
 import types
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 
 from common import benchmark_config
 from common import benchmark_utils
@@ -34,6 +31,8 @@ from common import filesystem
 from common import utils
 from common import logs
 
+from experiment.build import build_cache
+from experiment.build import build_scheduler
 from experiment.build import build_utils
 from experiment import run_experiment
 
@@ -42,7 +41,8 @@ if not experiment_utils.is_local_experiment():
 else:
     import experiment.build.local_build as buildlib
 
-# Build attempts and wait interval.
+# Build attempts and maximum wait before the first retry (see
+# build_scheduler.get_retry_wait).
 NUM_BUILD_ATTEMPTS = 3
 BUILD_FAIL_WAIT = 5 * 60
 
@@ -107,6 +107,77 @@ def build_measurer(benchmark: str) -> bool:
         return False
 
 
+def _get_num_concurrent_builds() -> int:
+    num_concurrent_builds = int(os.getenv('CONCURRENT_BUILDS'))
+    logs.info('Concurrent builds: %d.', num_concurrent_builds)
+    return num_concurrent_builds
+
+
+def get_measurer_node_name(benchmark: str) -> str:
+    """Returns the name of the build node of the measurer for
+    |benchmark|."""
+    return f'coverage-{benchmark}'
+
+
+def get_fuzzer_benchmark_node_name(fuzzer: str, benchmark: str) -> str:
+    """Returns the name of the build node of |fuzzer| for |benchmark|."""
+    return f'{fuzzer}-{benchmark}'
+
+
+def get_build_nodes(fuzzers: List[str],
+                    benchmarks: List[str]) -> List[build_scheduler.BuildNode]:
+    """Returns the graph of builds needed to run |fuzzers| on |benchmarks|.
+    The base images are built before (see build_base_images). The measurer and
+    the fuzzer images of a benchmark are all built from its project builder
+    image (see docker/image_types.yaml). The measurer build builds that image
+    first, so that the fuzzer builds of the benchmark reuse it, and fuzzers
+    are only built for benchmarks whose measurers built."""
+    nodes = [
+        build_scheduler.BuildNode(get_measurer_node_name(benchmark),
+                                  build_measurer, (benchmark,), ())
+        for benchmark in benchmarks
+    ]
+    for fuzzer, benchmark in get_fuzzer_benchmark_pairs(fuzzers, benchmarks):
+        nodes.append(
+            build_scheduler.BuildNode(
+                get_fuzzer_benchmark_node_name(fuzzer, benchmark),
+                build_fuzzer_benchmark, (fuzzer, benchmark),
+                (get_measurer_node_name(benchmark),)))
+    return nodes
+
+
+def build_all(
+    fuzzers: List[str],
+    benchmarks: List[str],
+    on_fuzzer_benchmark_built: Optional[Callable[[str, str], None]] = None
+) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Builds the measurers of |benchmarks| and the images of |fuzzers| for
+    them. Each build starts as soon as the builds it depends on succeeded
+    and failed builds are retried individually. |on_fuzzer_benchmark_built|
+    is called with each fuzzer and benchmark pair as soon as it is built.
+    Returns the list of benchmarks whose measurers built and the list of
+    fuzzer,benchmark pairs that built."""
+    logger.info('Building measurers and fuzzer benchmarks.')
+    filesystem.recreate_directory(build_utils.get_coverage_binaries_dir())
+    measurers = []
+    fuzzer_benchmarks = []
+
+    def on_success(node):
+        if node.build_func is build_measurer:
+            measurers.append(node.args[0])
+            return
+        fuzzer_benchmarks.append(node.args)
+        if on_fuzzer_benchmark_built is not None:
+            on_fuzzer_benchmark_built(*node.args)
+
+    scheduler = build_scheduler.BuildScheduler(_get_num_concurrent_builds(),
+                                               NUM_BUILD_ATTEMPTS,
+                                               BUILD_FAIL_WAIT, on_success)
+    scheduler.run(get_build_nodes(fuzzers, benchmarks))
+    logger.info('Done building measurers and fuzzer benchmarks.')
+    return measurers, fuzzer_benchmarks
+
+
 def build_all_measurers(benchmarks: List[str]) -> List[str]:
     """Build measurers for each benchmark in |benchmarks| in parallel
     Returns a list of benchmarks built successfully."""
@@ -120,55 +191,42 @@ def build_all_measurers(benchmarks: List[str]) -> List[str]:
     return [successful_call[0] for successful_call in successful_calls]
 
 
-def split_successes_and_failures(inputs: List,
-                                 results: List[bool]) -> Tuple[List, List]:
-    """Returns a tuple where the left side is a list of every input[idx] where
-    results[idx] is True and the right side is a list of every input[idx] where
-    results[idx] is False."""
-    assert len(inputs) == len(results)
-    successes = []
-    failures = []
-    for idx, _input in enumerate(inputs):
-        if results[idx]:
-            successes.append(_input)
-        else:
-            failures.append(_input)
-    return successes, failures
-
-
 def retry_build_loop(build_func: types.FunctionType,
                      inputs: List[Tuple]) -> List:
-    """Calls |build_func| in parallel on |inputs|. Repeat on failures up to
-    |NUM_BUILD_ATTEMPTS| times. Returns the list of inputs that |build_func| was
-    called successfully on."""
-    successes = []
-    num_concurrent_builds = int(os.getenv('CONCURRENT_BUILDS'))
-    logs.info('Concurrent builds: %d.', num_concurrent_builds)
-    with mp_pool.ThreadPool(num_concurrent_builds) as pool:
-        for _ in range(NUM_BUILD_ATTEMPTS):
-            logs.info('Building using (%s): %s', build_func.__name__, inputs)
-            results = pool.starmap(build_func, inputs)
-            curr_successes, curr_failures = split_successes_and_failures(
-                inputs, results)
-
-            logs.info('Build successes: %s', curr_successes)
-            successes.extend(curr_successes)
-            if not curr_failures:
-                break
-
-            logs.error('Build failures: %s', curr_failures)
-            inputs = curr_failures
-            sleep_interval = random.uniform(1, BUILD_FAIL_WAIT)
-            logs.info('Sleeping for %d secs before retrying.', sleep_interval)
-            time.sleep(sleep_interval)
-
+    """Calls |build_func| in parallel on |inputs|. Retries each failed call
+    up to |NUM_BUILD_ATTEMPTS| times. Returns the list of inputs that
+    |build_func| was called successfully on."""
+    logs.info('Building using (%s): %s', build_func.__name__, inputs)
+    nodes = [
+        build_scheduler.BuildNode(str(idx), build_func, args, ())
+        for idx, args in enumerate(inputs)
+    ]
+    scheduler = build_scheduler.BuildScheduler(_get_num_concurrent_builds(),
+                                               NUM_BUILD_ATTEMPTS,
+                                               BUILD_FAIL_WAIT)
+    succeeded = set(scheduler.run(nodes))
+    successes = [node.args for node in nodes if node.name in succeeded]
+    logs.info('Build successes: %s', successes)
+    if scheduler.failed:
+        logs.error('Build failures: %s',
+                   [scheduler.nodes[name].args for name in scheduler.failed])
     return successes
 
 
 def build_fuzzer_benchmark(fuzzer: str, benchmark: str) -> bool:
     """Wrapper around buildlib.build_fuzzer_benchmark that logs and catches
     exceptions. buildlib.build_fuzzer_benchmark builds an image for |fuzzer|
-    to fuzz |benchmark|."""
+    to fuzz |benchmark|. The build is skipped if the build cache has images
+    built from the same files (see build_cache.py)."""
+    cache_key = None
+    if build_cache.is_enabled():
+        cache_key = build_cache.get_fuzzer_benchmark_key(fuzzer, benchmark)
+    if cache_key is not None and build_cache.restore(fuzzer, benchmark,
+                                                     cache_key):
+        logger.info('Using cached build of benchmark: %s, fuzzer: %s.',
+                    benchmark, fuzzer)
+        return True
+
     logger.info('Building benchmark: %s, fuzzer: %s.', benchmark, fuzzer)
     try:
         buildlib.build_fuzzer_benchmark(fuzzer, benchmark)
@@ -177,6 +235,8 @@ def build_fuzzer_benchmark(fuzzer: str, benchmark: str) -> bool:
                      fuzzer)
         return False
     logs.info('Done building benchmark: %s, fuzzer: %s.', benchmark, fuzzer)
+    if cache_key is not None:
+        build_cache.add(fuzzer, benchmark, cache_key)
     return True
 
 
@@ -188,9 +248,6 @@ def build_all_fuzzer_benchmarks(fuzzers: List[str],
     logger.info('Building all fuzzer benchmarks.')
     build_fuzzer_benchmark_args = get_fuzzer_benchmark_pairs(
         fuzzers, benchmarks)
-
-    # TODO(metzman): Use an asynchronous unordered map variant to schedule
-    # eagerly.
     successful_calls = retry_build_loop(build_fuzzer_benchmark,
                                         build_fuzzer_benchmark_args)
     logger.info('Done building fuzzer benchmarks.')
@@ -16,7 +16,7 @@
 import os
 import subprocess
 import tempfile
-from typing import Dict
+from typing import Dict, Optional
 
 from common import logs
 from common import new_process
@@ -31,6 +31,10 @@ CONFIG_DIR = 'config'
 # Maximum time to wait for a GCB config to finish build.
 GCB_BUILD_TIMEOUT = 4 * 60 * 60  # 4 hours.
 
+# The beginning and the end of build output that are kept in build logs.
+BUILD_LOG_HEAD_LIMIT = 64 * 1024
+BUILD_LOG_LIMIT = 1024 * 1024
+
 logger = logs.Logger()  # pylint: disable=invalid-name
 
 
@@ -101,7 +105,9 @@ def _build(
                                      write_to_stdout=False,
                                      kill_children=True,
                                      timeout=timeout_seconds,
-                                     expect_zero=False)
+                                     expect_zero=False,
+                                     output_limit=BUILD_LOG_LIMIT,
+                                     head_limit=BUILD_LOG_HEAD_LIMIT)
         # TODO(metzman): Refactor code so that local_build stores logs as well.
         build_utils.store_build_logs(config_name, result)
         if result.retcode != 0:
@@ -123,3 +129,22 @@ def build_fuzzer_benchmark(fuzzer: str, benchmark: str):
                                                         benchmark=benchmark,
                                                         fuzzer=fuzzer)
     _build(config, config_name)
+
+
+def get_image_digest(image: str) -> Optional[str]:
+    """Returns the digest of |image| in the registry or None if it doesn't
+    exist."""
+    result = new_process.execute([
+        'gcloud', 'container', 'images', 'describe', image,
+        '--format=value(image_summary.digest)'
+    ],
+                                 expect_zero=False)
+    if result.retcode != 0:
+        return None
+    return result.output.strip() or None
+
+
+def tag_image(image: str, new_image: str):
+    """Adds the tag of |new_image| to |image| in the registry."""
+    new_process.execute(
+        ['gcloud', 'container', 'images', 'add-tag', image, new_image, '-q'])
@@ -14,8 +14,13 @@
 # limitations under the License.
 """Module for building things on Google Cloud Build for use in trials."""
 
+import gzip
 import os
-from typing import Tuple
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional, Set, Tuple
 
 from common import benchmark_utils
 from common import environment
@@ -23,19 +28,88 @@ from common import experiment_utils
 from common import logs
 from common import new_process
 from common import utils
+from docker import generate_makefile
+from experiment.build import build_utils
+from experiment.build import docker_images
 
 logger = logs.Logger()  # pylint: disable=invalid-name
 
-
-def make(targets):
-    """Invoke |make| with |targets| and return the result."""
-    command = ['make', '-j'] + targets
-    return new_process.execute(command, cwd=utils.ROOT_DIR)
+# Dockerfile of the image that only contains the files of a coverage build, in
+# the layout of the archives of coverage builds. The builder image isn't run,
+# its files are exported by docker build.
+COVERAGE_BUILD_DOCKERFILE = """FROM scratch
+COPY --from={image} /out/ /
+COPY --from={image} /src /src
+COPY --from={image} /work /work
+"""
+
+# pylint: disable=invalid-name
+_jobserver = None
+_built_targets = set()
+_lock = threading.Lock()
+
+
+def _get_jobserver() -> Tuple[int, int]:
+    """Returns the file descriptors of the GNU make jobserver shared by all the
+    make processes started by this process. Besides the job every make process
+    can always run, they run at most LOCAL_BUILD_JOBS (the number of CPUs by
+    default) jobs at once."""
+    global _jobserver
+    with _lock:
+        if _jobserver is None:
+            num_jobs = environment.get('LOCAL_BUILD_JOBS', os.cpu_count())
+            read_fd, write_fd = os.pipe()
+            os.write(write_fd, b'+' * num_jobs)
+            _jobserver = (read_fd, write_fd)
+        return _jobserver
+
+
+def get_image_targets(image_name: str,
+                      fuzzer: Optional[str] = None,
+                      benchmark: Optional[str] = None) -> Set[str]:
+    """Returns the make targets building |image_name| (an image of |fuzzer|
+    and |benchmark| in docker/image_types.yaml) and the images it depends
+    on."""
+    images = docker_images.get_images_to_build([fuzzer], [benchmark])
+    targets = set()
+    image_names = [image_name]
+    while image_names:
+        name = image_names.pop()
+        target = generate_makefile.get_target_name(name)
+        if target in targets:
+            continue
+        targets.add(target)
+        image_names.extend(images[name].get('depends_on', []))
+    return targets
+
+
+def make(targets, built_targets: Optional[Set[str]] = None):
+    """Invoke |make| with |targets| and return the result. The make targets
+    of the images that were built by previous calls aren't made again.
+    |built_targets| are the targets that are made by |targets|."""
+    read_fd, write_fd = _get_jobserver()
+    with _lock:
+        command = ['make'] + [
+            f'--assume-old={target}' for target in sorted(_built_targets)
+        ] + targets
+    env = os.environ.copy()
+    # Passing -j on the command line would disable the jobserver.
+    env['MAKEFLAGS'] = f'-j --jobserver-auth={read_fd},{write_fd}'
+    result = new_process.execute(command,
+                                 cwd=utils.ROOT_DIR,
+                                 env=env,
+                                 pass_fds=(read_fd, write_fd),
+                                 output_limit=new_process.LOG_LIMIT_FIELD)
+    if not result.retcode and built_targets:
+        with _lock:
+            _built_targets.update(built_targets)
+    return result
 
 
 def build_base_images() -> Tuple[int, str]:
     """Build base images locally."""
-    return make(['base-image', 'worker'])
+    return make(['base-image', 'worker'],
+                get_image_targets('base-image') | get_image_targets('worker'))
 
 
 def get_shared_coverage_binaries_dir():
@@ -49,39 +123,83 @@ def make_shared_coverage_binaries_dir():
     shared_coverage_binaries_dir = get_shared_coverage_binaries_dir()
     if os.path.exists(shared_coverage_binaries_dir):
         return
-    os.makedirs(shared_coverage_binaries_dir)
+    os.makedirs(shared_coverage_binaries_dir, exist_ok=True)
 
 
 def build_coverage(benchmark):
     """Build (locally) coverage image for benchmark."""
+    start_time = time.time()
     image_name = f'build-coverage-{benchmark}'
-    result = make([image_name])
+    result = make([image_name],
+                  get_image_targets(f'coverage-{benchmark}-builder',
+                                    benchmark=benchmark))
     if result.retcode:
         return result
     make_shared_coverage_binaries_dir()
     copy_coverage_binaries(benchmark)
+    build_time = time.time() - start_time
+    logger.info('Built coverage for %s in %.1f secs.',
+                benchmark,
+                build_time,
+                extras={
+                    'benchmark': benchmark,
+                    'build_time': build_time
+                })
+    build_utils.store_build_logs(f'benchmark-{benchmark}-coverage', result,
+                                 build_time)
     return result
 
 
 def copy_coverage_binaries(benchmark):
-    """Copy coverage binaries in a local experiment."""
+    """Copy coverage binaries in a local experiment. They are exported from
+    the builder image by docker build, without running it."""
     shared_coverage_binaries_dir = get_shared_coverage_binaries_dir()
-    mount_arg = f'{shared_coverage_binaries_dir}:{shared_coverage_binaries_dir}'
     builder_image_url = benchmark_utils.get_builder_image_url(
         benchmark, 'coverage', environment.get('DOCKER_REGISTRY'))
     coverage_build_archive = f'coverage-build-{benchmark}.tar.gz'
     coverage_build_archive_shared_dir_path = os.path.join(
         shared_coverage_binaries_dir, coverage_build_archive)
-    command = (
-        '(cd /out; '
-        f'tar -czvf {coverage_build_archive_shared_dir_path} * /src /work)')
-    return new_process.execute([
-        'docker', 'run', '-v', mount_arg, builder_image_url, '/bin/bash', '-c',
-        command
-    ])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dockerfile_path = os.path.join(temp_dir, 'Dockerfile')
+        with open(dockerfile_path, 'w', encoding='utf-8') as file_handle:
+            file_handle.write(
+                COVERAGE_BUILD_DOCKERFILE.format(image=builder_image_url))
+        tar_path = os.path.join(temp_dir, 'coverage-build.tar')
+        docker_command = [
+            'docker', 'build', '--output', f'type=tar,dest={tar_path}',
+            '--file', dockerfile_path, temp_dir
+        ]
+        result = new_process.execute(docker_command,
+                                     env=dict(os.environ, DOCKER_BUILDKIT='1'),
+                                     output_limit=new_process.LOG_LIMIT_FIELD)
+        # Compress next to the archive, so that it is complete when it is
+        # renamed. Use the same compression level as tar -z.
+        temp_archive_path = coverage_build_archive_shared_dir_path + '.tmp'
+        with open(tar_path,
+                  'rb') as tar_file, gzip.open(temp_archive_path,
+                                               'wb',
+                                               compresslevel=6) as archive:
+            shutil.copyfileobj(tar_file, archive)
+        os.replace(temp_archive_path, coverage_build_archive_shared_dir_path)
+    return result
 
 
 def build_fuzzer_benchmark(fuzzer: str, benchmark: str) -> bool:
     """Builds |benchmark| for |fuzzer|."""
     image_name = f'build-{fuzzer}-{benchmark}'
     make([image_name])
+
+
+def get_image_digest(image: str) -> Optional[str]:
+    """Returns the ID of the local |image| or None if it doesn't exist."""
+    result = new_process.execute(
+        ['docker', 'image', 'inspect', '--format={{.Id}}', image],
+        expect_zero=False)
+    if result.retcode != 0:
+        return None
+    return result.output.strip() or None
+
+
+def tag_image(image: str, new_image: str):
+    """Tags the local |image| as |new_image|."""
+    new_process.execute(['docker', 'tag', image, new_image])
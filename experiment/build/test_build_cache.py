@@ -0,0 +1,92 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for build_cache.py."""
+
+import os
+from unittest import mock
+
+from experiment.build import build_cache
+from experiment.build import builder
+
+# pylint: disable=unused-argument
+
+FUZZER = 'afl'
+BENCHMARK = 'libpng_libpng_read_fuzzer'
+
+
+def test_hash_files(tmp_path):
+    """Tests that the hash of files changes when their names or contents
+    change but not when compiled python files do."""
+    directory = tmp_path / 'directory'
+    directory.mkdir()
+    (directory / 'file').write_text('contents')
+    paths = [str(directory)]
+    with mock.patch('common.utils.ROOT_DIR', str(tmp_path)):
+        digest = build_cache._hash_files(paths)  # pylint: disable=protected-access
+        (directory / '__pycache__').mkdir()
+        (directory / '__pycache__' / 'module.pyc').write_text('compiled')
+        assert build_cache._hash_files(paths) == digest  # pylint: disable=protected-access
+        (directory / 'file').write_text('new contents')
+        new_digest = build_cache._hash_files(paths)  # pylint: disable=protected-access
+        assert new_digest != digest
+        os.rename(directory / 'file', directory / 'renamed')
+        assert build_cache._hash_files(paths) not in (digest, new_digest)  # pylint: disable=protected-access
+
+
+def test_get_key():
+    """Tests that the key of a fuzzer-benchmark pair is stable and depends on
+    the pair and the base image."""
+    key = build_cache.get_key(FUZZER, BENCHMARK, 'sha256:base')
+    assert key == build_cache.get_key(FUZZER, BENCHMARK, 'sha256:base')
+    assert key != build_cache.get_key(FUZZER, BENCHMARK, 'sha256:other')
+    assert key != build_cache.get_key('libfuzzer', BENCHMARK, 'sha256:base')
+
+
+@mock.patch('experiment.build.builder.buildlib')
+@mock.patch('experiment.build.build_cache.buildlib')
+@mock.patch('experiment.build.build_cache.get_base_image_digest',
+            return_value='sha256:base')
+def test_build_fuzzer_benchmark_cached(_, mocked_cache_buildlib,
+                                       mocked_buildlib, experiment):
+    """Tests that build_fuzzer_benchmark tags the cached image instead of
+    building when the build cache has it."""
+    os.environ['BUILD_CACHE'] = 'True'
+    mocked_cache_buildlib.get_image_digest.return_value = 'sha256:runner'
+    with mock.patch('experiment.build.build_cache.get_key', return_value='key'):
+        assert builder.build_fuzzer_benchmark(FUZZER, BENCHMARK)
+
+    assert not mocked_buildlib.build_fuzzer_benchmark.called
+    image = f'gcr.io/fuzzbench/runners/{FUZZER}/{BENCHMARK}'
+    mocked_cache_buildlib.tag_image.assert_called_once_with(
+        f'{image}:build-key', f'{image}:test-experiment')
+
+
+@mock.patch('experiment.build.builder.buildlib')
+@mock.patch('experiment.build.build_cache.buildlib')
+@mock.patch('experiment.build.build_cache.get_base_image_digest',
+            return_value='sha256:base')
+def test_build_fuzzer_benchmark_not_cached(_, mocked_cache_buildlib,
+                                           mocked_buildlib, experiment):
+    """Tests that build_fuzzer_benchmark builds and adds the images to the
+    build cache when it doesn't have them."""
+    os.environ['BUILD_CACHE'] = 'True'
+    mocked_cache_buildlib.get_image_digest.return_value = None
+    with mock.patch('experiment.build.build_cache.get_key', return_value='key'):
+        assert builder.build_fuzzer_benchmark(FUZZER, BENCHMARK)
+
+    mocked_buildlib.build_fuzzer_benchmark.assert_called_once_with(
+        FUZZER, BENCHMARK)
+    image = f'gcr.io/fuzzbench/runners/{FUZZER}/{BENCHMARK}'
+    mocked_cache_buildlib.tag_image.assert_called_once_with(
+        f'{image}:test-experiment', f'{image}:build-key')
@@ -0,0 +1,110 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for build_scheduler.py."""
+
+import threading
+from unittest import mock
+
+import pytest
+
+from experiment.build import build_scheduler
+
+# pylint: disable=unused-argument
+
+
+def _get_node(name, build_func, dependencies=()):
+    return build_scheduler.BuildNode(name, build_func, (name,), dependencies)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait():
+    """Retries builds without waiting."""
+    with mock.patch('experiment.build.build_scheduler.get_retry_wait',
+                    return_value=0):
+        yield
+
+
+def test_run_starts_builds_eagerly():
+    """Tests that a build starts as soon as its dependencies are built, while
+    unrelated builds are still running."""
+    dependent_built = threading.Event()
+
+    def build(name):
+        if name == 'slow':
+            # Only finishes once the dependent of the fast build was built.
+            assert dependent_built.wait(10)
+        return True
+
+    def on_success(node):
+        built.append(node.name)
+        if node.name == 'dependent':
+            dependent_built.set()
+
+    nodes = [
+        _get_node('slow', build),
+        _get_node('fast', build),
+        _get_node('dependent', build, ('fast',)),
+    ]
+    built = []
+    scheduler = build_scheduler.BuildScheduler(2, 1, 0, on_success=on_success)
+    assert scheduler.run(nodes) == ['fast', 'dependent', 'slow']
+    assert built == ['fast', 'dependent', 'slow']
+
+
+def test_run_retries_failures_individually():
+    """Tests that only failed builds are retried, up to |num_attempts|
+    times."""
+    calls = []
+
+    def build(name):
+        calls.append(name)
+        return name != 'fail' and calls.count(name) > 1
+
+    nodes = [_get_node('flaky', build), _get_node('fail', build)]
+    scheduler = build_scheduler.BuildScheduler(2, 3, 0)
+    assert scheduler.run(nodes) == ['flaky']
+    assert scheduler.failed == ['fail']
+    assert calls.count('flaky') == 2
+    assert calls.count('fail') == 3
+
+
+def test_run_skips_dependents_of_failures():
+    """Tests that builds depending on a failed build, directly or not, are
+    skipped and that exceptions are failures."""
+    calls = []
+
+    def build(name):
+        calls.append(name)
+        if name == 'fail':
+            raise Exception('Build error')
+        return True
+
+    nodes = [
+        _get_node('indirect', build, ('direct',)),
+        _get_node('direct', build, ('fail',)),
+        _get_node('fail', build),
+        _get_node('other', build),
+    ]
+    scheduler = build_scheduler.BuildScheduler(1, 1, 0)
+    assert scheduler.run(nodes) == ['other']
+    assert sorted(scheduler.failed) == ['direct', 'fail', 'indirect']
+    assert sorted(calls) == ['fail', 'other']
+
+
+def test_run_unknown_dependency():
+    """Tests that run raises an error if a node depends on a node that isn't
+    in the graph."""
+    scheduler = build_scheduler.BuildScheduler(1, 1, 0)
+    with pytest.raises(ValueError):
+        scheduler.run([_get_node('node', bool, ('unknown',))])
@@ -67,13 +67,13 @@ def get_benchmarks_or_fuzzers(benchmarks_or_fuzzers_directory, filename,
                     '3.10')
 @pytest.mark.parametrize('build_measurer_return_value', [True, False])
 @mock.patch('experiment.build.builder.build_measurer')
-@mock.patch('experiment.build.builder.time')
+@mock.patch('experiment.build.build_scheduler.get_retry_wait', return_value=0)
 @mock.patch('experiment.build.builder.filesystem')
 @mock.patch('experiment.build.builder.build_utils')
 @mock.patch.dict(os.environ,
                  {'CONCURRENT_BUILDS': str(DEFAULT_CONCURRENT_BUILDS)})
-def test_build_all_measurers(mocked_build_utils, mocked_fs, mocked_time,
-                             mocked_build_measurer,
+def test_build_all_measurers(mocked_build_utils, mocked_fs,
+                             mocked_get_retry_wait, mocked_build_measurer,
                              build_measurer_return_value):
     """Tests that build_all_measurers works as intendend when build_measurer
     calls fail."""
@@ -214,3 +214,34 @@ def test_get_fuzzer_benchmark_pairs():
             ('fuzzer1', 'benchmark3'), ('fuzzer2', 'benchmark3'),
             ('fuzzer3', 'benchmark1'), ('fuzzer3', 'benchmark3')
         ]
+
+
+@mock.patch('common.benchmark_config.get_config', mock_get_benchmark_config)
+@mock.patch('experiment.build.build_scheduler.get_retry_wait', return_value=0)
+@mock.patch('experiment.build.builder.build_utils')
+@mock.patch('experiment.build.builder.filesystem')
+@mock.patch('experiment.build.builder.build_fuzzer_benchmark',
+            return_value=True)
+@mock.patch('experiment.build.builder.build_measurer')
+@mock.patch.dict(os.environ, {'CONCURRENT_BUILDS': '2'})
+def test_build_all(mocked_build_measurer, mocked_build_fuzzer_benchmark, *_):
+    """Tests that build_all only builds fuzzers for the benchmarks whose
+    measurers built and reports each fuzzer,benchmark pair as it is built."""
+    mocked_build_measurer.side_effect = (
+        lambda benchmark: benchmark != 'benchmark1')
+    built = []
+    measurers, fuzzer_benchmarks = builder.build_all(
+        ['fuzzer1', 'fuzzer3'], ['benchmark1', 'benchmark2', 'benchmark3'],
+        lambda fuzzer, benchmark: built.append((fuzzer, benchmark)))
+
+    assert sorted(measurers) == ['benchmark2', 'benchmark3']
+    # The measurer of benchmark1 is retried.
+    assert mocked_build_measurer.call_count == builder.NUM_BUILD_ATTEMPTS + 2
+    expected_fuzzer_benchmarks = [('fuzzer1', 'benchmark2'),
+                                  ('fuzzer1', 'benchmark3'),
+                                  ('fuzzer3', 'benchmark3')]
+    assert sorted(fuzzer_benchmarks) == expected_fuzzer_benchmarks
+    assert built == fuzzer_benchmarks
+    assert sorted(
+        call.args for call in mocked_build_fuzzer_benchmark.call_args_list
+    ) == expected_fuzzer_benchmarks
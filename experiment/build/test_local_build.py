@@ -0,0 +1,109 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for local_build.py."""
+
+import io
+import os
+import tarfile
+from unittest import mock
+
+import pytest
+
+from common import new_process
+from experiment.build import local_build
+
+# pylint: disable=redefined-outer-name,unused-argument
+
+SUCCESS_RESULT = new_process.ProcessResult(0, '', False)
+
+
+@pytest.fixture
+def mocked_execute():
+    """Mocks new_process.execute and resets the images built by
+    local_build."""
+    with mock.patch('common.new_process.execute',
+                    return_value=SUCCESS_RESULT) as mocked_execute, \
+            mock.patch('experiment.build.local_build._built_targets', set()):
+        yield mocked_execute
+
+
+def test_make_uses_jobserver(mocked_execute):
+    """Tests that make processes share a jobserver instead of running an
+    unbounded number of jobs."""
+    local_build.make(['build-coverage-benchmark'])
+    command = mocked_execute.call_args.args[0]
+    kwargs = mocked_execute.call_args.kwargs
+    assert command == ['make', 'build-coverage-benchmark']
+    read_fd, write_fd = kwargs['pass_fds']
+    assert kwargs['env']['MAKEFLAGS'] == (
+        f'-j --jobserver-auth={read_fd},{write_fd}')
+
+
+def test_make_skips_built_images(mocked_execute):
+    """Tests that the images built by a call to make aren't made again by
+    later calls."""
+    local_build.build_base_images()
+    local_build.make(['build-fuzzer-benchmark'])
+    assert mocked_execute.call_args.args[0] == [
+        'make', '--assume-old=base-image', '--assume-old=worker',
+        'build-fuzzer-benchmark'
+    ]
+
+
+def test_get_image_targets():
+    """Tests that get_image_targets returns the make targets of an image and
+    of the images it depends on."""
+    assert local_build.get_image_targets('coverage-benchmark-builder',
+                                         benchmark='benchmark') == {
+                                             '.coverage-benchmark-builder',
+                                             '.coverage-benchmark-builder-'
+                                             'intermediate',
+                                             '.benchmark-project-builder',
+                                             'base-image'
+                                         }
+
+
+def _write_tar(command, *args, **kwargs):
+    """Writes a tar with a coverage binary to the destination of
+    |command|."""
+    dest = command[command.index('--output') + 1].split('dest=')[1]
+    with tarfile.open(dest, 'w') as tar:
+        data = b'binary'
+        info = tarfile.TarInfo('fuzz-target')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return SUCCESS_RESULT
+
+
+@mock.patch('experiment.build.build_utils.store_build_logs')
+@mock.patch('experiment.build.local_build.make', return_value=SUCCESS_RESULT)
+def test_build_coverage(mocked_make, mocked_store_build_logs, tmp_path,
+                        experiment):
+    """Tests that build_coverage exports the coverage build from the builder
+    image without running it and records the build time."""
+    os.environ['EXPERIMENT_FILESTORE'] = str(tmp_path)
+    with mock.patch('common.new_process.execute',
+                    side_effect=_write_tar) as mocked_execute:
+        local_build.build_coverage('benchmark')
+
+    command = mocked_execute.call_args.args[0]
+    assert command[:2] == ['docker', 'build']
+    archive_path = (tmp_path / 'test-experiment' / 'coverage-binaries' /
+                    'coverage-build-benchmark.tar.gz')
+    with tarfile.open(archive_path, 'r:gz') as tar:
+        assert tar.getnames() == ['fuzz-target']
+    config_name, result, build_time = mocked_store_build_logs.call_args.args
+    assert config_name == 'benchmark-benchmark-coverage'
+    assert result == SUCCESS_RESULT
+    assert build_time >= 0
@@ -22,7 +22,7 @@ import os
 import sys
 import threading
 import time
-from typing import List
+from typing import Callable, List, Optional
 
 from common import random_corpus_fuzzing_utils
 from common import experiment_path as exp_path
@@ -105,22 +105,26 @@ class Experiment:  # pylint: disable=too-many-instance-attributes
         self.micro_experiment = self.config.get('micro_experiment')
 
 
-def build_images_for_trials(fuzzers: List[str], benchmarks: List[str],
-                            num_trials: int,
-                            preemptible: bool) -> List[models.Trial]:
+def build_images_for_trials(
+    fuzzers: List[str],
+    benchmarks: List[str],
+    num_trials: int,
+    preemptible: bool,
+    on_trials_built: Optional[Callable[[List[models.Trial]], None]] = None
+) -> List[models.Trial]:
     """Builds the images needed to run |experiment| and returns a list of trials
     that can be run for experiment. This is the number of trials specified in
-    experiment times each pair of fuzzer+benchmark that builds successfully."""
+    experiment times each pair of fuzzer+benchmark that builds successfully.
+    |on_trials_built| is called with the trials of each pair as soon as its
+    images are built."""
     # This call will raise an exception if the images can't be built which will
     # halt the experiment.
     builder.build_base_images()
 
-    # Only build fuzzers for benchmarks whose measurers built successfully.
-    benchmarks = builder.build_all_measurers(benchmarks)
-    build_successes = builder.build_all_fuzzer_benchmarks(fuzzers, benchmarks)
     experiment_name = experiment_utils.get_experiment_name()
     trials = []
-    for fuzzer, benchmark in build_successes:
+
+    def on_fuzzer_benchmark_built(fuzzer, benchmark):
         fuzzer_benchmark_trials = [
             models.Trial(fuzzer=fuzzer,
                          experiment=experiment_name,
@@ -129,6 +133,11 @@ def build_images_for_trials(fuzzers: List[str], benchmarks: List[str],
                          trial_group_num=trial) for trial in range(num_trials)
         ]
         trials.extend(fuzzer_benchmark_trials)
+        if on_trials_built is not None:
+            on_trials_built(fuzzer_benchmark_trials)
+
+    # Only builds fuzzers for benchmarks whose measurers built successfully.
+    builder.build_all(fuzzers, benchmarks, on_fuzzer_benchmark_built)
     return trials
 
 
@@ -148,22 +157,29 @@ def dispatcher_main():
 
     _initialize_experiment_in_db(experiment.config)
 
-    trials = build_images_for_trials(experiment.fuzzers, experiment.benchmarks,
-                                     experiment.num_trials,
-                                     experiment.preemptible)
-    _initialize_trials_in_db(trials)
-
     if experiment.micro_experiment:
         random_corpus_fuzzing_utils.initialize_random_corpus_fuzzing(
             experiment.benchmarks, experiment.num_trials)
 
     create_work_subdirs(['experiment-folders', 'measurement-folders'])
 
-    # Start measurer and scheduler in seperate threads/processes.
+    # Start the scheduler first so that it starts the trials of each
+    # fuzzer-benchmark pair as soon as its images are built.
+    builds_done = threading.Event()
     scheduler_loop_thread = threading.Thread(target=scheduler.schedule_loop,
-                                             args=(experiment.config,))
+                                             args=(experiment.config,
+                                                   builds_done))
     scheduler_loop_thread.start()
 
+    try:
+        build_images_for_trials(experiment.fuzzers, experiment.benchmarks,
+                                experiment.num_trials, experiment.preemptible,
+                                _initialize_trials_in_db)
+    finally:
+        builds_done.set()
+
+    # The measurer sets up the coverage binaries of the benchmarks that have
+    # trials when it starts, so start it once every build is done.
     measurer_main_process = multiprocessing.Process(
         target=measure_manager.measure_main, args=(experiment.config,))
 
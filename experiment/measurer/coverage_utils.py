@@ -16,6 +16,7 @@
 import os
 import json
 
+from common import coverage_format
 from common import experiment_path as exp_path
 from common import experiment_utils as exp_utils
 from common import new_process
@@ -51,18 +52,25 @@ def generate_coverage_reports(experiment_config: dict):
     region_coverage = experiment_config['region_coverage']
 
     for benchmark in benchmarks:
+        fuzzers_covered_branches = {}
         for fuzzer in fuzzers:
-            generate_coverage_report(experiment, benchmark, fuzzer,
-                                     region_coverage)
+            covered_branches = generate_coverage_report(experiment, benchmark,
+                                                        fuzzer, region_coverage)
+            if covered_branches is not None:
+                fuzzers_covered_branches[fuzzer] = covered_branches
+        store_covered_branches(benchmark, fuzzers_covered_branches)
 
     logger.info('Finished generating coverage reports.')
 
 
 def generate_coverage_report(experiment, benchmark, fuzzer, region_coverage):
-    """Generates the coverage report for one pair of benchmark and fuzzer."""
+    """Generates the coverage report for one pair of benchmark and fuzzer.
+    Returns the branches (or regions) covered by |fuzzer| or None if they
+    couldn't be extracted."""
     logger.info('Generating coverage report for benchmark: %s fuzzer: %s.',
                 benchmark, fuzzer)
 
+    covered_branches = None
     try:
         coverage_reporter = CoverageReporter(experiment, fuzzer, benchmark,
                                              region_coverage)
@@ -73,8 +81,9 @@ def generate_coverage_report(experiment, benchmark, fuzzer, region_coverage):
         # Generate the coverage summary json file based on merged profdata file.
         coverage_reporter.generate_coverage_summary_json()
 
-        # Generate the coverage branches json file.
-        coverage_reporter.generate_coverage_branches_json()
+        # Extract the covered branches, they are stored for all fuzzers at
+        # once.
+        covered_branches = coverage_reporter.get_covered_branches()
 
         # Generates the html reports using llvm-cov.
         coverage_reporter.generate_coverage_report()
@@ -82,6 +91,25 @@ def generate_coverage_report(experiment, benchmark, fuzzer, region_coverage):
         logger.info('Finished generating coverage report.')
     except Exception:  # pylint: disable=broad-except
         logger.error('Error occurred when generating coverage report.')
+    return covered_branches
+
+
+def store_covered_branches(benchmark, fuzzers_covered_branches):
+    """Stores |fuzzers_covered_branches|, the branches covered by each fuzzer
+    on |benchmark|, in the compact binary format and its index in the
+    filestore."""
+    data_dir = os.path.join(get_coverage_info_dir(), 'data', benchmark)
+    filesystem.create_directory(data_dir)
+    try:
+        paths = coverage_format.write(data_dir, fuzzers_covered_branches)
+    except Exception:  # pylint: disable=broad-except
+        logger.error('Failed to write covered branches for benchmark: %s.',
+                     benchmark)
+        return
+    # Upload the index last, readers only use the binary file if the index
+    # exists.
+    for path in paths:
+        filestore_utils.cp(path, exp_path.filestore(path), expect_zero=False)
 
 
 class CoverageReporter:  # pylint: disable=too-many-instance-attributes
@@ -99,8 +127,6 @@ class CoverageReporter:  # pylint: disable=too-many-instance-attributes
         coverage_info_dir = get_coverage_info_dir()
         self.report_dir = os.path.join(coverage_info_dir, 'reports', benchmark,
                                        fuzzer)
-        self.data_dir = os.path.join(coverage_info_dir, 'data', benchmark,
-                                     fuzzer)
 
         benchmark_fuzzer_dir = exp_utils.get_benchmark_fuzzer_dir(
             benchmark, fuzzer)
@@ -162,7 +188,9 @@ class CoverageReporter:  # pylint: disable=too-many-instance-attributes
             self.binary_file,
             f'-instr-profile={self.merged_profdata_file}',
         ]
-        result = new_process.execute(command, expect_zero=False)
+        result = new_process.execute(command,
+                                     expect_zero=False,
+                                     output_limit=new_process.LOG_LIMIT_FIELD)
         if result.retcode != 0:
             logger.error('Coverage report generation failed for '
                          f'fuzzer: {self.fuzzer},benchmark: {self.benchmark}.')
@@ -172,22 +200,14 @@ class CoverageReporter:  # pylint: disable=too-many-instance-attributes
         dst_dir = exp_path.filestore(self.report_dir)
         filestore_utils.cp(src_dir, dst_dir, recursive=True, parallel=True)
 
-    def generate_coverage_branches_json(self):
-        """Stores the coverage data in a json file."""
+    def get_covered_branches(self):
+        """Returns the branches (or regions if |region_coverage|) covered in
+        the merged coverage summary."""
         if self.region_coverage:
-            edges_covered = extract_covered_regions_from_summary_json(
-                self.merged_summary_json_file)
-        else:
-            edges_covered = extract_covered_branches_from_summary_json(
+            return extract_covered_regions_from_summary_json(
                 self.merged_summary_json_file)
-        coverage_json_src = os.path.join(self.data_dir, 'covered_branches.json')
-        coverage_json_dst = exp_path.filestore(coverage_json_src)
-        filesystem.create_directory(self.data_dir)
-        with open(coverage_json_src, 'w', encoding='utf-8') as file_handle:
-            json.dump(edges_covered, file_handle)
-        filestore_utils.cp(coverage_json_src,
-                           coverage_json_dst,
-                           expect_zero=False)
+        return extract_covered_branches_from_summary_json(
+            self.merged_summary_json_file)
 
 
 def get_coverage_archive_name(benchmark):
@@ -227,7 +247,9 @@ def merge_profdata_files(src_files, dst_file):
     command = ['llvm-profdata', 'merge', '-sparse']
     command.extend(src_files)
     command.extend(['-o', dst_file])
-    result = new_process.execute(command, expect_zero=False)
+    result = new_process.execute(command,
+                                 expect_zero=False,
+                                 output_limit=new_process.LOG_LIMIT_FIELD)
     return result
 
 
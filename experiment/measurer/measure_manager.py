@@ -34,12 +34,15 @@ from sqlalchemy import func
 from sqlalchemy import orm
 
 from common import benchmark_utils
+from common import cpu_topology
+from common import environment
 from common import experiment_utils
 from common import experiment_path as exp_path
 from common import filesystem
 from common import fuzzer_stats
 from common import filestore_utils
 from common import logs
+from common import resource_usage
 from common import utils
 from database import utils as db_utils
 from database import models
@@ -76,9 +79,11 @@ def measure_main(experiment_config):
     experiment = experiment_config['experiment']
     max_total_time = experiment_config['max_total_time']
     measurers_cpus = experiment_config['measurers_cpus']
+    runners_cpus = experiment_config.get('runners_cpus')
+    runner_num_cpu_cores = experiment_config.get('runner_num_cpu_cores', 1)
     region_coverage = experiment_config['region_coverage']
     measure_manager_loop(experiment, max_total_time, measurers_cpus,
-                         region_coverage)
+                         region_coverage, runners_cpus, runner_num_cpu_cores)
 
     # Clean up resources.
     gc.collect()
@@ -89,11 +94,21 @@ def measure_main(experiment_config):
     logger.info('Finished measuring.')
 
 
-def _process_init(cores_queue):
-    """Cpu pin for each pool process"""
-    cpu = cores_queue.get()
-    if sys.platform == 'linux':
-        psutil.Process().cpu_affinity([cpu])
+def _process_init(cores_queue, num_measurers):
+    """Cpu pin for each pool process if |cores_queue| is given. Also limits
+    the processes (e.g. crash reproductions) each of the |num_measurers| pool
+    processes runs at once with async_process to its share of the CPUs."""
+    if cores_queue is not None:
+        cpu = cores_queue.get()
+        if sys.platform == 'linux':
+            psutil.Process().cpu_affinity([cpu])
+        # Pinned processes each have their own CPUs.
+        num_measurers = 1
+    if environment.get('MAX_CONCURRENT_PROCESSES') is None:
+        num_cpus = (len(psutil.Process().cpu_affinity())
+                    if sys.platform == 'linux' else multiprocessing.cpu_count())
+        os.environ['MAX_CONCURRENT_PROCESSES'] = str(
+            max(1, num_cpus // num_measurers))
 
 
 def measure_loop(experiment: str,
@@ -392,11 +407,12 @@ class SnapshotMeasurer(coverage_utils.TrialCoverage):  # pylint: disable=too-man
         filesystem.create_directory(self.report_dir)
 
     def run_cov_new_units(self):
-        """Run the coverage binary on new units."""
+        """Run the coverage binary on new units. Returns the
+        resource_usage.ResourceUsage of the run or None if it isn't known."""
         coverage_binary = coverage_utils.get_coverage_binary(self.benchmark)
-        run_coverage.do_coverage_run(coverage_binary, self.corpus_dir,
-                                     self.profraw_file_pattern,
-                                     self.crashes_dir)
+        return run_coverage.do_coverage_run(coverage_binary, self.corpus_dir,
+                                            self.profraw_file_pattern,
+                                            self.crashes_dir)
 
     def generate_summary(self, cycle: int, summary_only=False):
         """Transforms the .profdata file into json form."""
@@ -517,13 +533,18 @@ class SnapshotMeasurer(coverage_utils.TrialCoverage):  # pylint: disable=too-man
                              crash_stacktrace=crash.crash_stacktrace))
         return crashes
 
-    def get_fuzzer_stats(self, cycle):
-        """Get the fuzzer stats for |cycle|."""
+    def get_fuzzer_stats_filestore_path(self, cycle):
+        """Returns the filestore path of the fuzzer stats for |cycle|."""
         stats_filename = experiment_utils.get_stats_filename(cycle)
-        stats_filestore_path = exp_path.filestore(
-            os.path.join(self.trial_dir, stats_filename))
+        return exp_path.filestore(os.path.join(self.trial_dir, stats_filename))
+
+    def get_fuzzer_stats(self, cycle, stats_path=None):
+        """Get the fuzzer stats for |cycle|. |stats_path| is a local copy of
+        them if they were already downloaded."""
         try:
-            return get_fuzzer_stats(stats_filestore_path)
+            if stats_path is not None:
+                return read_fuzzer_stats(stats_path)
+            return get_fuzzer_stats(self.get_fuzzer_stats_filestore_path(cycle))
         except (ValueError, json.decoder.JSONDecodeError):
             logger.error('Stats are invalid.')
             return None
@@ -537,7 +558,14 @@ def get_fuzzer_stats(stats_filestore_path):
                                     expect_zero=False)
         if result.retcode != 0:
             return None
-        stats_str = temp_file.read()
+        return read_fuzzer_stats(temp_file.name)
+
+
+def read_fuzzer_stats(stats_path):
+    """Reads, validates and returns the stats in the local file
+    |stats_path|."""
+    with open(stats_path, 'rb') as stats_file:
+        stats_str = stats_file.read()
     fuzzer_stats.validate_fuzzer_stats(stats_str)
     return json.loads(stats_str)
 
@@ -598,52 +626,68 @@ def measure_snapshot_coverage(  # pylint: disable=too-many-locals
     if not os.path.exists(corpus_archive_dir):
         os.makedirs(corpus_archive_dir)
 
-    if filestore_utils.cp(corpus_archive_src,
-                          corpus_archive_dst,
-                          expect_zero=False).retcode:
-        snapshot_logger.warning('Corpus not found for cycle: %d.', cycle)
-        return None
+    # Download the stats together with the corpus. Runners save the stats
+    # after the corpus, so they are downloaded again later if they weren't
+    # there yet.
+    stats_src = snapshot_measurer.get_fuzzer_stats_filestore_path(cycle)
+    stats_dst = os.path.join(snapshot_measurer.trial_dir,
+                             experiment_utils.get_stats_filename(cycle))
+    downloaded = filestore_utils.get_many({
+        corpus_archive_src: corpus_archive_dst,
+        stats_src: stats_dst,
+    })
+    try:
+        if not downloaded[corpus_archive_src]:
+            snapshot_logger.warning('Corpus not found for cycle: %d.', cycle)
+            return None
+
+        snapshot_measurer.initialize_measurement_dirs()
+        snapshot_measurer.extract_corpus(corpus_archive_dst)
+        # Don't keep corpus archives around longer than they need to be.
+        os.remove(corpus_archive_dst)
 
-    snapshot_measurer.initialize_measurement_dirs()
-    snapshot_measurer.extract_corpus(corpus_archive_dst)
-    # Don't keep corpus archives around longer than they need to be.
-    os.remove(corpus_archive_dst)
+        # Run coverage on the new corpus units.
+        coverage_run_usage = snapshot_measurer.run_cov_new_units()
 
-    # Run coverage on the new corpus units.
-    snapshot_measurer.run_cov_new_units()
+        # Generate profdata and transform it into json form.
+        snapshot_measurer.generate_coverage_information(cycle)
 
-    # Generate profdata and transform it into json form.
-    snapshot_measurer.generate_coverage_information(cycle)
+        # Compress and save the exported profdata snapshot.
+        coverage_archive_zipped = os.path.join(
+            snapshot_measurer.trial_dir, 'coverage',
+            experiment_utils.get_coverage_archive_name(cycle) + '.gz')
 
-    # Compress and save the exported profdata snapshot.
-    coverage_archive_zipped = os.path.join(
-        snapshot_measurer.trial_dir, 'coverage',
-        experiment_utils.get_coverage_archive_name(cycle) + '.gz')
+        coverage_archive_dir = os.path.dirname(coverage_archive_zipped)
+        if not os.path.exists(coverage_archive_dir):
+            os.makedirs(coverage_archive_dir)
 
-    coverage_archive_dir = os.path.dirname(coverage_archive_zipped)
-    if not os.path.exists(coverage_archive_dir):
-        os.makedirs(coverage_archive_dir)
+        with gzip.open(str(coverage_archive_zipped), 'wb') as compressed:
+            with open(snapshot_measurer.cov_summary_file, 'rb') as uncompressed:
+                # avoid saving warnings so we can direct import with pandas
+                compressed.write(uncompressed.readlines()[-1])
 
-    with gzip.open(str(coverage_archive_zipped), 'wb') as compressed:
-        with open(snapshot_measurer.cov_summary_file, 'rb') as uncompressed:
-            # avoid saving warnings so we can direct import with pandas
-            compressed.write(uncompressed.readlines()[-1])
+        coverage_archive_dst = exp_path.filestore(coverage_archive_zipped)
+        if filestore_utils.cp(coverage_archive_zipped,
+                              coverage_archive_dst,
+                              expect_zero=False).retcode:
+            snapshot_logger.warning('Coverage not found for cycle: %d.', cycle)
+            return None
 
-    coverage_archive_dst = exp_path.filestore(coverage_archive_zipped)
-    if filestore_utils.cp(coverage_archive_zipped,
-                          coverage_archive_dst,
-                          expect_zero=False).retcode:
-        snapshot_logger.warning('Coverage not found for cycle: %d.', cycle)
-        return None
+        os.remove(coverage_archive_zipped)  # no reason to keep this around
 
-    os.remove(coverage_archive_zipped)  # no reason to keep this around
+        # Run crashes again, parse stacktraces and generate crash signatures.
+        crashes = snapshot_measurer.process_crashes(cycle)
 
-    # Run crashes again, parse stacktraces and generate crash signatures.
-    crashes = snapshot_measurer.process_crashes(cycle)
+        # Get the coverage summary of the new corpus units.
+        branches_covered = snapshot_measurer.get_current_coverage()
+        fuzzer_stats_data = snapshot_measurer.get_fuzzer_stats(
+            cycle, stats_dst if downloaded[stats_src] else None)
+    finally:
+        # The stats are downloaded before knowing whether the snapshot can be
+        # measured, remove them on every path.
+        if downloaded[stats_src]:
+            os.remove(stats_dst)
 
-    # Get the coverage summary of the new corpus units.
-    branches_covered = snapshot_measurer.get_current_coverage()
-    fuzzer_stats_data = snapshot_measurer.get_fuzzer_stats(cycle)
     snapshot = models.Snapshot(time=this_time,
                                trial_id=trial_num,
                                edges_covered=branches_covered,
@@ -653,9 +697,24 @@ def measure_snapshot_coverage(  # pylint: disable=too-many-locals
     measuring_time = round(time.time() - measuring_start_time, 2)
     snapshot_logger.info('Measured cycle: %d in %f seconds.', cycle,
                          measuring_time)
+    snapshot.measurer_stats = get_measurer_stats(coverage_run_usage,
+                                                 measuring_time)
     return snapshot
 
 
+def get_measurer_stats(coverage_run_usage, measuring_time):
+    """Returns the stats of measuring a snapshot: the time it took and the
+    resources used by the coverage run (see resource_usage.to_stats) if
+    |coverage_run_usage| is known."""
+    stats = {'measuring_time': measuring_time}
+    if coverage_run_usage is not None:
+        stats.update({
+            f'coverage_run_{key}': value for key, value in
+            resource_usage.to_stats(coverage_run_usage).items()
+        })
+    return stats
+
+
 def set_up_coverage_binaries(pool, experiment):
     """Set up coverage binaries for all benchmarks in |experiment|."""
     # Use set comprehension to select distinct benchmarks.
@@ -762,36 +821,48 @@ def measure_manager_inner_loop(experiment: str, max_cycle: int, request_queue,
     return True
 
 
-def get_pool_args(measurers_cpus, runners_cpus):
+def get_pool_args(measurers_cpus, runners_cpus, runner_num_cpu_cores=1):
     """Return pool args based on measurer cpus and runner cpus arguments."""
-    if measurers_cpus is None or runners_cpus is None:
-        return ()
-
-    local_experiment = experiment_utils.is_local_experiment()
-    if not local_experiment:
-        return (measurers_cpus,)
-
+    num_measurers = measurers_cpus or multiprocessing.cpu_count()
+    if (measurers_cpus is None or runners_cpus is None or
+            not experiment_utils.is_local_experiment()):
+        return (num_measurers, _process_init, (None, num_measurers))
+
+    # Use the same allocation as the scheduler to find the cores used by
+    # runners and keep measurers off them (including their SMT siblings).
+    topology = cpu_topology.read_topology()
+    runner_cpusets = cpu_topology.get_runner_cpusets(topology, runners_cpus,
+                                                     runner_num_cpu_cores)
+    measurer_cpus = cpu_topology.allocate_measurer_cpus(topology,
+                                                        runner_cpusets,
+                                                        measurers_cpus)
     cores_queue = multiprocessing.Queue()
-    logger.info('Scheduling measurers from core %d to %d.', runners_cpus,
-                runners_cpus + measurers_cpus - 1)
-    for cpu in range(runners_cpus, runners_cpus + measurers_cpus):
+    logger.info('Scheduling measurers on cores: %s.', measurer_cpus)
+    for cpu in measurer_cpus:
         cores_queue.put(cpu)
-    return (measurers_cpus, _process_init, (cores_queue,))
+    return (num_measurers, _process_init, (cores_queue, num_measurers))
 
 
-def measure_manager_loop(experiment: str,
-                         max_total_time: int,
-                         measurers_cpus=None,
-                         region_coverage=False):  # pylint: disable=too-many-locals
+def measure_manager_loop(  # pylint: disable=too-many-locals,too-many-arguments
+        experiment: str,
+        max_total_time: int,
+        measurers_cpus=None,
+        region_coverage=False,
+        runners_cpus=None,
+        runner_num_cpu_cores=1):
     """Measure manager loop. Creates request and response queues, request
     measurements tasks from workers, retrieve measurement results from response
     queue and writes measured snapshots in database."""
     logger.info('Starting measure manager loop.')
+    # Pin measurers to cores not used by runners if the runners are pinned.
+    pool_args = get_pool_args(measurers_cpus, runners_cpus,
+                              runner_num_cpu_cores)
     if not measurers_cpus:
         measurers_cpus = multiprocessing.cpu_count()
         logger.info('Number of measurer CPUs not passed as argument. using %d',
                     measurers_cpus)
-    with multiprocessing.Pool() as pool, multiprocessing.Manager() as manager:
+    with multiprocessing.Pool(
+            *pool_args) as pool, multiprocessing.Manager() as manager:
         logger.info('Setting up coverage binaries')
         set_up_coverage_binaries(pool, experiment)
         request_queue = manager.Queue()
@@ -42,7 +42,8 @@ def do_coverage_run(  # pylint: disable=too-many-locals
         coverage_binary: str, new_units_dir: List[str],
         profraw_file_pattern: str, crashes_dir: str):
     """Does a coverage run of |coverage_binary| on |new_units_dir|. Writes
-    the result to |profraw_file_pattern|."""
+    the result to |profraw_file_pattern|. Returns the
+    resource_usage.ResourceUsage of the run or None if it isn't known."""
     with tempfile.TemporaryDirectory() as merge_dir:
         command = [
             coverage_binary, '-merge=1', '-dump_coverage=1',
@@ -55,16 +56,20 @@ def do_coverage_run(  # pylint: disable=too-many-locals
         env = os.environ.copy()
         env['LLVM_PROFILE_FILE'] = profraw_file_pattern
         sanitizer.set_sanitizer_options(env)
+        processes = []
         result = new_process.execute(command,
                                      env=env,
                                      cwd=coverage_binary_dir,
                                      expect_zero=False,
                                      kill_children=True,
-                                     timeout=MAX_TOTAL_TIME)
+                                     timeout=MAX_TOTAL_TIME,
+                                     output_limit=new_process.LOG_LIMIT_FIELD,
+                                     process_callback=processes.append)
 
     if result.retcode != 0:
         logger.error('Coverage run failed.',
                      extras={
                          'coverage_binary': coverage_binary,
-                         'output': result.output[-new_process.LOG_LIMIT_FIELD:],
+                         'output': result.output,
                      })
+    return processes[0].usage if processes else None
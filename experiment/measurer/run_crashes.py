@@ -13,12 +13,14 @@
 # limitations under the License.
 """Module for processing crashes."""
 
+import asyncio
 import collections
 import os
 import re
 
 from clusterfuzz import stacktraces
 
+from common import async_process
 from common import logs
 from common import new_process
 from common import sanitizer
@@ -45,16 +47,19 @@ def _filter_crash_state(crash_state):
     return CPLUSPLUS_TEMPLATE_REGEX.sub('', crash_state)
 
 
-def process_crash(app_binary, crash_testcase_path, crashes_dir):
-    """Returns the crashing unit in coverage_binary_output."""
+def _should_process(crash_testcase_path):
+    """Returns False for testcases that are not worth reproducing."""
     crash_filename = os.path.basename(crash_testcase_path)
-    if (crash_filename.startswith('oom-') or
-            crash_filename.startswith('timeout-')):
-        # Don't spend time processing ooms and timeouts as these are
-        # uninteresting crashes anyway. These are also excluded below, but don't
-        # process them in the first place based on filename.
-        return None
+    # Don't spend time processing ooms and timeouts as these are uninteresting
+    # crashes anyway. These are also excluded by _parse_crash, but don't
+    # process them in the first place based on filename.
+    return not (crash_filename.startswith('oom-') or
+                crash_filename.startswith('timeout-'))
+
 
+def _get_execute_args(app_binary, crash_testcase_path):
+    """Returns the command and the keyword arguments to reproduce
+    |crash_testcase_path| on |app_binary| with."""
     # Run the crash with sanitizer options set in environment.
     env = os.environ.copy()
     sanitizer.set_sanitizer_options(env)
@@ -62,14 +67,20 @@ def process_crash(app_binary, crash_testcase_path, crashes_dir):
         app_binary, f'-timeout={run_coverage.UNIT_TIMEOUT}',
         f'-rss_limit_mb={run_coverage.RSS_LIMIT_MB}', crash_testcase_path
     ]
-    app_binary_dir = os.path.dirname(app_binary)
-    result = new_process.execute(command,
-                                 env=env,
-                                 cwd=app_binary_dir,
-                                 expect_zero=False,
-                                 kill_children=True,
-                                 timeout=run_coverage.UNIT_TIMEOUT + 5)
-    if not result.output:
+    kwargs = {
+        'env': env,
+        'cwd': os.path.dirname(app_binary),
+        'expect_zero': False,
+        'kill_children': True,
+        'timeout': run_coverage.UNIT_TIMEOUT + 5,
+    }
+    return command, kwargs
+
+
+def _parse_crash(app_binary, crash_testcase_path, crashes_dir, output):
+    """Returns the crashing unit in |output|, the output of
+    |crash_testcase_path| run on |app_binary|."""
+    if not output:
         # Hang happened, no crash. Bail out.
         return None
 
@@ -79,7 +90,7 @@ def process_crash(app_binary, crash_testcase_path, crashes_dir):
                                            symbolized=True,
                                            detect_ooms_and_hangs=True,
                                            include_ubsan=True)
-    crash_result = stack_parser.parse(result.output)
+    crash_result = stack_parser.parse(output)
     if not crash_result.crash_state:
         # No crash occurred. Bail out.
         return None
@@ -96,19 +107,53 @@ def process_crash(app_binary, crash_testcase_path, crashes_dir):
                  crash_stacktrace=crash_result.crash_stacktrace)
 
 
+def process_crash(app_binary, crash_testcase_path, crashes_dir):
+    """Returns the crashing unit in coverage_binary_output."""
+    if not _should_process(crash_testcase_path):
+        return None
+    command, kwargs = _get_execute_args(app_binary, crash_testcase_path)
+    result = new_process.execute(command, **kwargs)
+    return _parse_crash(app_binary, crash_testcase_path, crashes_dir,
+                        result.output)
+
+
 def _get_crash_key(crash_result):
     """Return a unique identifier for a crash."""
     return f'{crash_result.crash_type}:{crash_result.crash_state}'
 
 
+async def _process_crash_async(app_binary, crash_testcase_path, crashes_dir):
+    """Like process_crash, but runs the testcase with the executor shared by
+    the process."""
+    command, kwargs = _get_execute_args(app_binary, crash_testcase_path)
+    try:
+        result = await async_process.execute(command, **kwargs)
+    except OSError:
+        logger.error('Failed to run crash testcase: %s.', crash_testcase_path)
+        return None
+    return _parse_crash(app_binary, crash_testcase_path, crashes_dir,
+                        result.output)
+
+
 def do_crashes_run(app_binary, crashes_dir):
     """Does a crashes run of |app_binary| on |crashes_dir|. Returns a list of
-    unique crashes."""
-    crashes = {}
+    unique crashes. The crashes are reproduced concurrently, up to the limit
+    of async_process.get_executor."""
+    crash_testcase_paths = []
     for root, _, filenames in os.walk(crashes_dir):
         for filename in filenames:
             crash_testcase_path = os.path.join(root, filename)
-            crash = process_crash(app_binary, crash_testcase_path, crashes_dir)
-            if crash:
-                crashes[_get_crash_key(crash)] = crash
+            if _should_process(crash_testcase_path):
+                crash_testcase_paths.append(crash_testcase_path)
+
+    async def process_crashes():
+        return await asyncio.gather(*[
+            _process_crash_async(app_binary, crash_testcase_path, crashes_dir)
+            for crash_testcase_path in crash_testcase_paths
+        ])
+
+    crashes = {}
+    for crash in asyncio.run(process_crashes()):
+        if crash:
+            crashes[_get_crash_key(crash)] = crash
     return crashes
@@ -21,6 +21,7 @@ import pytest
 
 from common import experiment_utils
 from common import new_process
+from common import resource_usage
 from database import models
 from database import utils as db_utils
 from experiment.build import build_utils
@@ -90,6 +91,22 @@ def test_get_current_coverage_no_file(fs, experiment):
     assert not covered_branches
 
 
+def test_get_fuzzer_stats_local_copy(fs, experiment):
+    """Tests that get_fuzzer_stats uses the copy of the stats that was already
+    downloaded instead of downloading them."""
+    snapshot_measurer = measure_manager.SnapshotMeasurer(
+        FUZZER, BENCHMARK, TRIAL_NUM, SNAPSHOT_LOGGER, REGION_COVERAGE)
+    fs.create_file('/stats.json', contents='{"execs_per_sec": 100.0}')
+    with mock.patch('common.filestore_utils.cp') as mocked_cp:
+        assert snapshot_measurer.get_fuzzer_stats(1, '/stats.json') == {
+            'execs_per_sec': 100.0
+        }
+    mocked_cp.assert_not_called()
+
+    fs.create_file('/invalid.json', contents='{"invalid": 1}')
+    assert snapshot_measurer.get_fuzzer_stats(1, '/invalid.json') is None
+
+
 @mock.patch('common.new_process.execute')
 def test_generate_profdata_create(mocked_execute, experiment, fs):
     """Tests that generate_profdata can run the correct command."""
@@ -185,6 +202,26 @@ def test_measure_trial_coverage(mocked_measure_snapshot_coverage, mocked_queue,
     assert mocked_measure_snapshot_coverage.call_args_list == expected_calls
 
 
+def test_measure_snapshot_coverage_no_corpus(fs, experiment):
+    """Tests that measure_snapshot_coverage removes the stats it downloaded
+    when the corpus of the snapshot isn't found."""
+
+    def get_many(downloads):
+        for source, destination in downloads.items():
+            if source.endswith('.json'):
+                fs.create_file(destination, contents='{}')
+        return {source: source.endswith('.json') for source in downloads}
+
+    with mock.patch('common.filestore_utils.get_many', side_effect=get_many):
+        assert measure_manager.measure_snapshot_coverage(
+            FUZZER, BENCHMARK, TRIAL_NUM, 1, REGION_COVERAGE) is None
+    snapshot_measurer = measure_manager.SnapshotMeasurer(
+        FUZZER, BENCHMARK, TRIAL_NUM, SNAPSHOT_LOGGER, REGION_COVERAGE)
+    assert not os.path.exists(
+        os.path.join(snapshot_measurer.trial_dir,
+                     experiment_utils.get_stats_filename(1)))
+
+
 @mock.patch('common.filestore_utils.ls')
 @mock.patch('common.filestore_utils.rsync')
 def test_measure_all_trials_not_ready(mocked_rsync, mocked_ls, experiment):
@@ -326,8 +363,12 @@ class TestIntegrationMeasurement:
         os.makedirs(corpus_dir)
         shutil.copy(archive, corpus_dir)
 
-        with mock.patch('common.filestore_utils.cp') as mocked_cp:
+        with mock.patch('common.filestore_utils.cp') as mocked_cp, mock.patch(
+                'common.filestore_utils.get_many') as mocked_get_many:
             mocked_cp.return_value = new_process.ProcessResult(0, '', False)
+            mocked_get_many.side_effect = lambda downloads: {
+                path: path.endswith('.tar.gz') for path in downloads
+            }
             # TODO(metzman): Create a system for using actual buckets in
             # integration tests.
             snapshot = measure_manager.measure_snapshot_coverage(
@@ -529,3 +570,40 @@ def test_measure_manager_inner_loop_writes_to_db(
     measure_manager.measure_manager_inner_loop('experiment', 1, request_queue,
                                                response_queue, set())
     mocked_add_all.assert_called_with([snapshot_model])
+
+
+def test_get_measurer_stats():
+    """Tests that get_measurer_stats records the measuring time and the
+    resources used by the coverage run if they are known."""
+    assert measure_manager.get_measurer_stats(None, 10.5) == {
+        'measuring_time': 10.5
+    }
+    usage = resource_usage.ResourceUsage(user_time=2.0,
+                                         system_time=1.0,
+                                         max_rss=4096,
+                                         read_bytes=0,
+                                         write_bytes=0,
+                                         wall_time=5.0)
+    stats = measure_manager.get_measurer_stats(usage, 10.5)
+    assert stats['coverage_run_cpu_time'] == 3.0
+    assert stats['coverage_run_max_rss_mb'] == 4.0
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'),
+                    reason='Needs CPU affinity.')
+@mock.patch('psutil.Process')
+def test_process_init_limits_concurrent_processes(mocked_process, environ):  # pylint: disable=unused-argument
+    """Tests that each measurer runs at most its share of the CPUs' worth of
+    processes at once."""
+    mocked_process.return_value.cpu_affinity.return_value = list(range(8))
+    os.environ.pop('MAX_CONCURRENT_PROCESSES', None)
+    measure_manager._process_init(None, 4)  # pylint: disable=protected-access
+    assert os.environ['MAX_CONCURRENT_PROCESSES'] == '2'
+
+    # Pinned measurers have their own CPUs.
+    os.environ.pop('MAX_CONCURRENT_PROCESSES')
+    cores_queue = queue.Queue()
+    cores_queue.put(3)
+    mocked_process.return_value.cpu_affinity.return_value = [3]
+    measure_manager._process_init(cores_queue, 4)  # pylint: disable=protected-access
+    assert os.environ['MAX_CONCURRENT_PROCESSES'] == '1'
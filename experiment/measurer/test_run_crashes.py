@@ -14,6 +14,8 @@
 """Tests for run_coverage.py."""
 
 import os
+import stat
+from unittest import mock
 
 import pytest
 
@@ -51,6 +53,31 @@ class TestIntegrationRunCoverage:
                 in actual_crash.crash_stacktrace)
 
 
+def test_do_crashes_run(tmp_path):
+    """Tests that do_crashes_run reproduces each testcase except ooms and
+    timeouts, and keeps one crash per crash key."""
+    app_binary = tmp_path / 'fuzz-target'
+    app_binary.write_text('#!/bin/sh\ncat "$3"\n')
+    app_binary.chmod(app_binary.stat().st_mode | stat.S_IEXEC)
+    crashes_dir = tmp_path / 'crashes'
+    crashes_dir.mkdir()
+    for filename, contents in [('crash-1', 'Abrt'), ('crash-2', 'Segv'),
+                               ('crash-3', 'Segv'), ('oom-1', 'Abrt')]:
+        (crashes_dir / filename).write_text(contents)
+
+    def parse_crash(_, crash_testcase_path, crashes_dir, output):
+        return run_crashes.Crash(
+            os.path.relpath(crash_testcase_path, crashes_dir), output, '',
+            output, '')
+
+    with mock.patch('experiment.measurer.run_crashes._parse_crash',
+                    side_effect=parse_crash) as mocked_parse_crash:
+        crashes = run_crashes.do_crashes_run(str(app_binary), str(crashes_dir))
+    assert mocked_parse_crash.call_count == 3
+    assert sorted(crashes) == ['Abrt:Abrt', 'Segv:Segv']
+    assert crashes['Abrt:Abrt'].crash_testcase == 'crash-1'
+
+
 # pylint: disable=protected-access
 def test_filter_crash_type():
     """Tests _filter_crash_type."""
@@ -37,6 +37,12 @@ def get_reports_dir():
     return exp_path.path('reports')
 
 
+def get_report_cache_dir():
+    """Return the directory of the caches kept between reports. It isn't in
+    the reports directory so that the caches aren't published."""
+    return str(exp_path.path('report-cache'))
+
+
 def get_core_fuzzers():
     """Return list of core fuzzers to be used for merging experiment data."""
     return yaml_utils.read(CORE_FUZZERS_YAML)['fuzzers']
@@ -72,8 +78,10 @@ def output_report(experiment_config: dict,
     experiment_benchmarks = set(experiment_config['benchmarks'])
     try:
         logger.debug('Generating report.')
-        filesystem.recreate_directory(reports_dir)
-        generate_report.generate_report(
+        # Keep the previous report so that unchanged plots aren't rendered
+        # again and are skipped by rsync.
+        filesystem.create_directory(reports_dir)
+        removed_images = generate_report.generate_report(
             [experiment_name],
             str(reports_dir),
             report_name=experiment_name,
@@ -81,7 +89,10 @@ def output_report(experiment_config: dict,
             in_progress=in_progress,
             merge_with_clobber_nonprivate=merge_with_nonprivate,
             coverage_report=coverage_report,
-            experiment_benchmarks=experiment_benchmarks)
+            experiment_benchmarks=experiment_benchmarks,
+            plot_cache=True,
+            use_results_store=merge_with_nonprivate,
+            cache_dir=get_report_cache_dir())
         filestore_utils.rsync(
             str(reports_dir),
             web_filestore_path,
@@ -89,6 +100,11 @@ def output_report(experiment_config: dict,
             gsutil_options=[
                 '-h', 'Cache-Control:public,max-age=0,no-transform'
             ])
+        # rsync doesn't delete files, remove the plots the report dropped.
+        for image in removed_images:
+            filestore_utils.rm(posixpath.join(web_filestore_path, image),
+                               recursive=False,
+                               force=True)
         logger.debug('Done generating report.')
     except data_utils.EmptyDataError:
         logs.warning('No snapshot data.')
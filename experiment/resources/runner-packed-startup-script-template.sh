@@ -0,0 +1,44 @@
+#!/bin/bash
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Configure the host.
+
+# Make everything ptrace-able.
+echo 0 > /proc/sys/kernel/yama/ptrace_scope
+
+# Do not notify external programs about core dumps.
+echo core >/proc/sys/kernel/core_pattern
+
+# Start docker.
+# Hack because container-optmized-os doesn't support writing to /home/root.
+# docker-credential-gcr needs to write to a dotfile in $HOME.
+export HOME=/home/chronos
+mkdir -p $HOME
+docker-credential-gcr configure-docker -include-artifact-registry
+{% for docker_image_url in docker_image_urls %}
+while ! docker pull {{docker_image_url}}
+do
+  echo 'Error pulling image, retrying...'
+done
+{% endfor %}
+# Give each trial whole physical cores of this instance. Its topology is only
+# known here, so the cpusets are computed on the instance, one per trial.
+CPUSETS=($(docker run --rm --entrypoint python3 {{docker_image_urls[0]}} -m common.cpu_topology {{num_cores}} {{cores_per_trial}}))
+# Run every trial on this instance in the background, each one is pinned to its
+# own cores.
+{% for runner_command in runner_commands %}
+{{runner_command}} &
+{% endfor %}
+wait
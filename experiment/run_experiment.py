@@ -29,6 +29,7 @@ import jinja2
 import yaml
 
 from common import benchmark_utils
+from common import docker_engine
 from common import experiment_utils
 from common import filestore_utils
 from common import filesystem
@@ -190,6 +191,14 @@ def read_and_validate_experiment_config(config_filename: str) -> Dict:
             Requirement(False, str, False, ''),
         'micro_experiment':
             Requirement(False, bool, False, ''),
+        'use_compute_api':
+            Requirement(False, bool, False, ''),
+        'use_docker_engine':
+            Requirement(False, bool, False, ''),
+        'trials_per_runner':
+            Requirement(False, int, False, ''),
+        'use_gcs_client':
+            Requirement(False, bool, False, ''),
     }
 
     all_params_valid = _validate_config_parameters(config, config_requirements)
@@ -213,6 +222,21 @@ def get_directories(parent_dir):
     ]
 
 
+def validate_trials_per_runner(config: Dict):
+    """Validates that a runner machine type can run trials_per_runner trials
+    in |config|."""
+    trials_per_runner = config.get('trials_per_runner') or 1
+    if config.get('local_experiment') or trials_per_runner == 1:
+        return
+    try:
+        gcloud.get_packed_runner_resources(config, trials_per_runner)
+    except ValueError as error:
+        raise ValidationError(
+            f'Cannot run {trials_per_runner} trials per runner: {error} '
+            'Set runner_machine_type to an N1 machine type, or to null to use '
+            'runner_memory.') from error
+
+
 # pylint: disable=too-many-locals
 def validate_custom_seed_corpus(custom_seed_corpus_dir, benchmarks):
     """Validate seed corpus provided by user"""
@@ -353,6 +377,7 @@ def start_experiment(  # pylint: disable=too-many-arguments
     # 12GB is just the amount that KLEE needs, use this default to make KLEE
     # experiments easier to run.
     config['runner_memory'] = config.get('runner_memory', '12GB')
+    validate_trials_per_runner(config)
     config['region_coverage'] = region_coverage
 
     config['custom_seed_corpus_dir'] = custom_seed_corpus_dir
@@ -367,6 +392,9 @@ def start_experiment_from_full_config(config):
     """Start a fuzzer benchmarking experiment from a full (internal) config."""
 
     set_up_experiment_config_file(config)
+    if config.get('use_gcs_client'):
+        # Copy the resources of the experiment with the GCS client as well.
+        os.environ['USE_GCS_CLIENT'] = 'True'
 
     # Make sure we can connect to database.
     local_experiment = config.get('local_experiment', False)
@@ -409,6 +437,18 @@ def add_oss_fuzz_corpus(benchmark, oss_fuzz_corpora_dir):
     gsutil.cp(src_corpus_url, dest_corpus_url, parallel=True, expect_zero=False)
 
 
+def get_directory_uploads(directory: str, destination: str) -> Dict[str, str]:
+    """Returns a dictionary mapping each file in |directory| to its path in
+    |destination|, for filestore_utils.put_many."""
+    uploads = {}
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            uploads[path] = os.path.join(destination,
+                                         os.path.relpath(path, directory))
+    return uploads
+
+
 def copy_resources_to_bucket(config_dir: str, config: Dict):
     """Copy resources the dispatcher will need for the experiment to the
     experiment_filestore."""
@@ -431,8 +471,33 @@ def copy_resources_to_bucket(config_dir: str, config: Dict):
     source_archive = 'src.tar.gz'
     with tarfile.open(source_archive, 'w:gz') as tar:
         tar.add(utils.ROOT_DIR, arcname='', recursive=True, filter=filter_file)
-    filestore_utils.cp(source_archive, base_destination + '/', parallel=True)
+    # Upload the source archive and every file of the custom seed corpora in a
+    # single bulk operation. gsutil copies the corpora faster with one
+    # recursive command per benchmark than with one command per 100 files.
+    uploads = {source_archive: os.path.join(base_destination, source_archive)}
+    custom_seed_corpus_dir = config['custom_seed_corpus_dir']
+    copy_corpora_recursively = filestore_utils.uses_gsutil_processes()
+    if custom_seed_corpus_dir and not copy_corpora_recursively:
+        custom_seed_corpora_path = (
+            experiment_utils.get_custom_seed_corpora_filestore_path())
+        for benchmark in config['benchmarks']:
+            uploads.update(
+                get_directory_uploads(
+                    os.path.join(custom_seed_corpus_dir, benchmark),
+                    os.path.join(custom_seed_corpora_path, benchmark)))
+    uploaded = filestore_utils.put_many(uploads)
     os.remove(source_archive)
+    failed_uploads = [path for path, success in uploaded.items() if not success]
+    if failed_uploads:
+        raise RuntimeError(f'Failed to upload: {failed_uploads}.')
+
+    if custom_seed_corpus_dir and copy_corpora_recursively:
+        for benchmark in config['benchmarks']:
+            filestore_utils.cp(
+                os.path.join(custom_seed_corpus_dir, benchmark),
+                experiment_utils.get_custom_seed_corpora_filestore_path() + '/',
+                recursive=True,
+                parallel=True)
 
     # Send config files.
     destination = os.path.join(base_destination, 'config')
@@ -446,16 +511,6 @@ def copy_resources_to_bucket(config_dir: str, config: Dict):
         for benchmark in config['benchmarks']:
             add_oss_fuzz_corpus(benchmark, oss_fuzz_corpora_dir)
 
-    if config['custom_seed_corpus_dir']:
-        for benchmark in config['benchmarks']:
-            benchmark_custom_corpus_dir = os.path.join(
-                config['custom_seed_corpus_dir'], benchmark)
-            filestore_utils.cp(
-                benchmark_custom_corpus_dir,
-                experiment_utils.get_custom_seed_corpora_filestore_path() + '/',
-                recursive=True,
-                parallel=True)
-
 
 class BaseDispatcher:
     """Class representing the dispatcher."""
@@ -509,40 +564,47 @@ class LocalDispatcher(BaseDispatcher):
             f'CONCURRENT_BUILDS={self.config["concurrent_builds"]}')
         set_worker_pool_name_arg = (
             f'WORKER_POOL_NAME={self.config["worker_pool_name"]}')
-        environment_args = [
-            '-e',
+        environment = [
             'LOCAL_EXPERIMENT=True',
-            '-e',
             set_instance_name_arg,
-            '-e',
             set_experiment_arg,
-            '-e',
             sql_database_arg,
-            '-e',
             set_experiment_filestore_arg,
-            '-e',
             set_snapshot_period_arg,
-            '-e',
             set_report_filestore_arg,
-            '-e',
             set_docker_registry_arg,
-            '-e',
             set_concurrent_builds_arg,
-            '-e',
             set_worker_pool_name_arg,
         ]
+        volumes = [
+            '/var/run/docker.sock:/var/run/docker.sock',
+            shared_experiment_filestore_arg,
+            shared_report_filestore_arg,
+        ]
+        dispatcher_command = (
+            'rsync -r '
+            '"${EXPERIMENT_FILESTORE}/${EXPERIMENT}/input/" ${WORK} && '
+            'mkdir ${WORK}/src && '
+            'tar -xvzf ${WORK}/src.tar.gz -C ${WORK}/src && '
+            'PYTHONPATH=${WORK}/src python3 '
+            '${WORK}/src/experiment/dispatcher.py')
+        if docker_engine.use_docker_engine(self.config):
+            return self._run_with_docker_engine(container_name,
+                                                docker_image_url, environment,
+                                                volumes, dispatcher_command)
+
+        environment_args = []
+        for env_var in environment:
+            environment_args.extend(['-e', env_var])
+        volume_args = []
+        for volume in volumes:
+            volume_args.extend(['-v', volume])
         command = [
             'docker',
             'run',
             '-ti',
             '--rm',
-            '-v',
-            '/var/run/docker.sock:/var/run/docker.sock',
-            '-v',
-            shared_experiment_filestore_arg,
-            '-v',
-            shared_report_filestore_arg,
-        ] + environment_args + [
+        ] + volume_args + environment_args + [
             '--shm-size=2g',
             '--cap-add=SYS_PTRACE',
             '--cap-add=SYS_NICE',
@@ -550,17 +612,42 @@ class LocalDispatcher(BaseDispatcher):
             docker_image_url,
             '/bin/bash',
             '-c',
-            'rsync -r '
-            '"${EXPERIMENT_FILESTORE}/${EXPERIMENT}/input/" ${WORK} && '
-            'mkdir ${WORK}/src && '
-            'tar -xvzf ${WORK}/src.tar.gz -C ${WORK}/src && '
-            'PYTHONPATH=${WORK}/src python3 '
-            '${WORK}/src/experiment/dispatcher.py || '
+            dispatcher_command + ' || '
             '/bin/bash'  # Open shell if experiment fails.
         ]
         logs.info('Starting dispatcher with container name: %s', container_name)
         return new_process.execute(command, write_to_stdout=True)
 
+    def _run_with_docker_engine(  # pylint: disable=too-many-arguments
+            self, container_name: str, docker_image_url: str,
+            environment: List[str], volumes: List[str],
+            dispatcher_command: str) -> new_process.ProcessResult:
+        """Runs the dispatcher container using the Docker Engine API and
+        streams its output until it exits."""
+        client = docker_engine.get_client()
+        config = {
+            'Image': docker_image_url,
+            'Cmd': ['/bin/bash', '-c', dispatcher_command],
+            'Env': environment,
+            'Tty': True,
+            'HostConfig': {
+                'Binds': volumes,
+                'ShmSize': 2 * 1024**3,
+                'CapAdd': ['SYS_PTRACE', 'SYS_NICE'],
+            },
+        }
+        logs.info('Starting dispatcher with container name: %s', container_name)
+        if not client.run_container(container_name, config):
+            raise RuntimeError('Failed to start dispatcher container.')
+        try:
+            client.stream_logs(container_name)
+            exit_code = client.wait_container(container_name)
+        finally:
+            # Remove the container once it exited, like "docker run --rm", or
+            # if following it failed.
+            client.stop_container(container_name)
+        return new_process.ProcessResult(exit_code, '', False)
+
 
 class GoogleCloudDispatcher(BaseDispatcher):
     """Class representing the dispatcher instance on Google Cloud."""
@@ -602,6 +689,7 @@ class GoogleCloudDispatcher(BaseDispatcher):
             'concurrent_builds': self.config['concurrent_builds'],
             'worker_pool_name': self.config['worker_pool_name'],
             'private': self.config['private'],
+            'use_gcs_client': self.config.get('use_gcs_client', False),
         }
         if 'worker_pool_name' in self.config:
             kwargs['worker_pool_name'] = self.config['worker_pool_name']
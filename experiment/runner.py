@@ -36,6 +36,7 @@ from common import fuzzer_utils
 from common import fuzzer_stats
 from common import logs
 from common import new_process
+from common import resource_usage
 from common import retry
 from common import sanitizer
 from common import utils
@@ -54,6 +55,10 @@ CORPUS_DIRNAME = 'corpus'
 RESULTS_DIRNAME = 'results'
 CORPUS_ARCHIVE_DIRNAME = 'corpus-archives'
 
+# Seconds to wait for fuzzer.get_stats. The resource usage is still recorded
+# if it takes longer.
+FUZZER_STATS_TIMEOUT = 60
+
 
 def _clean_seed_corpus(seed_corpus_dir):
     """Prepares |seed_corpus_dir| for the trial. This ensures that it can be
@@ -171,9 +176,10 @@ def _unpack_clusterfuzz_seed_corpus(fuzz_target_path, corpus_directory):
               seed_corpus_archive_path)
 
 
-def run_fuzzer(max_total_time, log_filename):
+def run_fuzzer(max_total_time, log_filename, process_callback=None):
     """Runs the fuzzer using its script. Logs stdout and stderr of the fuzzer
-    script to |log_filename| if provided."""
+    script to |log_filename| if provided. |process_callback| is called with
+    the new_process.WrappedPopen of the fuzzer process."""
     input_corpus = environment.get('SEED_CORPUS_DIR')
     output_corpus = os.environ['OUTPUT_CORPUS_DIR']
     fuzz_target_name = environment.get('FUZZ_TARGET')
@@ -215,6 +221,7 @@ def run_fuzzer(max_total_time, log_filename):
                                 timeout=max_total_time,
                                 write_to_stdout=True,
                                 kill_children=True,
+                                process_callback=process_callback,
                                 env=env)
         else:
             with open(log_filename, 'wb') as log_file:
@@ -222,6 +229,7 @@ def run_fuzzer(max_total_time, log_filename):
                                     timeout=max_total_time,
                                     output_file=log_file,
                                     kill_children=True,
+                                    process_callback=process_callback,
                                     env=env)
     except subprocess.CalledProcessError:
         global fuzzer_errored_out  # pylint:disable=invalid-name
@@ -250,6 +258,10 @@ class TrialRunner:  # pylint: disable=too-many-instance-attributes
         self.log_file = os.path.join(self.results_dir, 'fuzzer-log.txt')
         self.last_sync_time = None
         self.last_archive_time = -float('inf')
+        # The new_process.WrappedPopen of the fuzzer process once it started.
+        self.fuzzer_process = None
+        # The thread calling fuzzer.get_stats, if it timed out.
+        self.stats_thread = None
 
     def initialize_directories(self):
         """Initialize directories needed for the trial."""
@@ -292,7 +304,7 @@ class TrialRunner:  # pylint: disable=too-many-instance-attributes
         self.set_up_corpus_directories()
 
         max_total_time = environment.get('MAX_TOTAL_TIME')
-        args = (max_total_time, self.log_file)
+        args = (max_total_time, self.log_file, self.set_fuzzer_process)
 
         # Sync initial corpus before fuzzing begins.
         self.do_sync()
@@ -339,44 +351,88 @@ class TrialRunner:  # pylint: disable=too-many-instance-attributes
         """Save corpus archives and results to GCS."""
         try:
             self.archive_and_save_corpus()
-            # TODO(metzman): Enable stats.
+            if self.fuzzer_process is not None:
+                self.record_stats()
             self.save_results()
             logs.debug('Finished sync.')
         except Exception:  # pylint: disable=broad-except
             logs.error('Failed to sync cycle: %d.', self.cycle)
 
-    def record_stats(self):
-        """Use fuzzer.get_stats if it is offered, validate the stats and then
-        save them to a file so that they will be synced to the filestore."""
-        # TODO(metzman): Make this more resilient so we don't wait forever and
-        # so that breakages in stats parsing doesn't break runner.
-
+    def set_fuzzer_process(self, wrapped_process):
+        """Sets the new_process.WrappedPopen of the fuzzer process."""
+        self.fuzzer_process = wrapped_process
+
+    def get_resource_usage(self):
+        """Returns the resource_usage.ResourceUsage of the fuzzer process (and
+        its children) so far, or None if it isn't known."""
+        if self.fuzzer_process is None:
+            return None
+        usage = resource_usage.get_process_tree_usage(
+            self.fuzzer_process.process.pid,
+            time.time() - self.fuzzer_process.start_time)
+        # The process exited if it can't be sampled anymore.
+        return usage or self.fuzzer_process.usage
+
+    def get_fuzzer_module_stats(self):
+        """Returns the stats returned by fuzzer.get_stats if it is offered and
+        they are valid. Returns an empty dictionary otherwise, or if it didn't
+        return within FUZZER_STATS_TIMEOUT seconds."""
         fuzzer_module = get_fuzzer_module(self.fuzzer)
 
         fuzzer_module_get_stats = getattr(fuzzer_module, 'get_stats', None)
         if fuzzer_module_get_stats is None:
             # Stats support is optional.
-            return
+            return {}
 
-        try:
-            output_corpus = environment.get('OUTPUT_CORPUS_DIR')
-            stats_json_str = fuzzer_module_get_stats(output_corpus,
-                                                     self.log_file)
+        if self.stats_thread is not None and self.stats_thread.is_alive():
+            logs.error('Previous call to %s still hasn\'t returned.',
+                       fuzzer_module_get_stats)
+            return {}
 
-        except Exception:  # pylint: disable=broad-except
-            logs.error('Call to %s failed.', fuzzer_module_get_stats)
-            return
+        result = {}
 
+        def get_stats():
+            try:
+                output_corpus = environment.get('OUTPUT_CORPUS_DIR')
+                result['stats'] = fuzzer_module_get_stats(
+                    output_corpus, self.log_file)
+            except Exception:  # pylint: disable=broad-except
+                logs.error('Call to %s failed.', fuzzer_module_get_stats)
+
+        # The call runs in a daemon thread so that a fuzzer module that hangs
+        # can't stop the runner from syncing or exiting.
+        self.stats_thread = threading.Thread(target=get_stats, daemon=True)
+        self.stats_thread.start()
+        self.stats_thread.join(FUZZER_STATS_TIMEOUT)
+        if self.stats_thread.is_alive():
+            logs.error('Call to %s timed out.', fuzzer_module_get_stats)
+            return {}
+        if 'stats' not in result:
+            return {}
+
+        stats_json_str = result['stats']
         try:
             fuzzer_stats.validate_fuzzer_stats(stats_json_str)
         except (ValueError, json.decoder.JSONDecodeError):
             logs.error('Stats are invalid.')
+            return {}
+        return json.loads(stats_json_str)
+
+    def record_stats(self):
+        """Save the resources used by the fuzzer and the stats from
+        fuzzer.get_stats to a file so that they will be synced to the
+        filestore."""
+        stats = self.get_fuzzer_module_stats()
+        usage = self.get_resource_usage()
+        if usage is not None:
+            stats.update(resource_usage.to_stats(usage))
+        if not stats:
             return
 
         stats_filename = experiment_utils.get_stats_filename(self.cycle)
         stats_path = os.path.join(self.results_dir, stats_filename)
         with open(stats_path, 'w', encoding='utf-8') as stats_file_handle:
-            stats_file_handle.write(stats_json_str)
+            json.dump(stats, stats_file_handle)
 
     def archive_corpus(self):
         """Archive this cycle's corpus."""
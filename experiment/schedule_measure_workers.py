@@ -72,6 +72,7 @@ def initialize(experiment_config: dict):
         'EXPERIMENT': experiment,
         'LOCAL_EXPERIMENT': local_experiment,
         'CLOUD_COMPUTE_ZONE': cloud_compute_zone,
+        'USE_GCS_CLIENT': experiment_config.get('use_gcs_client', False),
     }
 
     zone = experiment_config['cloud_compute_zone']
@@ -12,18 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Code for starting and ending trials."""
+# pylint: disable=too-many-lines
+import collections
 import datetime
 import math
 import multiprocessing
 import os
 import sys
 import random
+import threading
 import time
-from typing import List, Dict
+from typing import Dict, List, Optional
 
 import jinja2
+import sqlalchemy
 
 from common import benchmark_utils
+from common import compute_api
+from common import cpu_topology
+from common import docker_engine
 from common import experiment_utils
 from common import gcloud
 from common import gce
@@ -120,18 +127,36 @@ def delete_instances(instances, experiment_config):
                                    experiment_config['cloud_compute_zone'])
 
 
+def get_instance_name(experiment: str, trial) -> str:
+    """Returns the name of the instance running |trial| of |experiment|."""
+    return trial.instance_name or experiment_utils.get_trial_instance_name(
+        experiment, trial.id)
+
+
+def stop_local_containers(containers: List[str]) -> bool:
+    """Stops and removes the runner |containers| of a local experiment. Logs
+    the ones that exited with an error before being stopped."""
+    client = docker_engine.get_client()
+    for state in client.get_container_states(containers).values():
+        if state and state.status == 'exited' and state.exit_code:
+            logger.warning('Container %s exited with code %d.', state.name,
+                           state.exit_code)
+    return client.stop_containers(containers)
+
+
 def end_expired_trials(experiment_config: dict, core_allocation: dict):
     """Get all expired trials, end them and return them."""
-    trials_past_expiry = get_expired_trials(experiment_config['experiment'],
+    experiment = experiment_config['experiment']
+    trials_past_expiry = get_expired_trials(experiment,
                                             experiment_config['max_total_time'])
     expired_instances = []
     expired_trial_ids = []
     current_dt = datetime_now()
     for trial in trials_past_expiry:
         trial_id = trial.id
-        expired_instances.append(
-            experiment_utils.get_trial_instance_name(
-                experiment_config['experiment'], trial_id))
+        instance_name = get_instance_name(experiment, trial)
+        if instance_name not in expired_instances:
+            expired_instances.append(instance_name)
         expired_trial_ids.append(trial_id)
         trial.time_ended = current_dt
 
@@ -139,13 +164,28 @@ def end_expired_trials(experiment_config: dict, core_allocation: dict):
     if not expired_instances:
         return
 
+    # Don't delete packed instances that still run trials that didn't expire.
+    busy_instances = {
+        trial.instance_name for trial in get_running_trials(experiment).filter(
+            models.Trial.instance_name.in_(expired_instances),
+            models.Trial.id.notin_(expired_trial_ids))
+    }
+    expired_instances = [
+        instance for instance in expired_instances
+        if instance not in busy_instances
+    ]
+
     if core_allocation is not None:
         for cpuset, trial_id in core_allocation.items():
             if trial_id in expired_trial_ids:
                 core_allocation[cpuset] = None
 
-    if not experiment_utils.is_local_experiment() and not delete_instances(
-            expired_instances, experiment_config):
+    if experiment_utils.is_local_experiment():
+        if (docker_engine.use_docker_engine(experiment_config) and
+                not stop_local_containers(expired_instances)):
+            logger.error('Failed to stop containers after trial expiry.')
+            return
+    elif not delete_instances(expired_instances, experiment_config):
         # If we failed to delete some instances, then don't update the status
         # of expired trials in database as we don't know which instances were
         # successfully deleted. Wait for next iteration of end_expired_trials.
@@ -241,6 +281,11 @@ class TrialInstanceManager:  # pylint: disable=too-many-instance-attributes
         self.preempted_trials = {}
         self.preemptible_starts_futile = False
 
+        # Names of preempted instances that were already processed. Preempted
+        # instances remain listed until they are deleted, this lets us skip
+        # them without querying the database again.
+        self._known_preempted_instances = set()
+
         # Filter operations happening before the experiment started.
         with db_utils.session_scope() as session:
             self.last_preemptible_query = (session.query(
@@ -390,15 +435,31 @@ class TrialInstanceManager:  # pylint: disable=too-many-instance-attributes
 
         return replacements
 
-    def _get_started_unfinished_instances(self) -> Dict[str, models.Trial]:
-        """Returns a dictionary of instance names to trials for trials were
-        started but not finished according to the database."""
+    def _get_started_unfinished_instances(
+        self,
+        trial_ids: Optional[List[int]] = None,
+        instance_names: Optional[List[str]] = None
+    ) -> Dict[str, List[models.Trial]]:
+        """Returns a dictionary of instance names to the trials running on them
+        for trials were started but not finished according to the database. If
+        |trial_ids| or |instance_names| are provided, only trials with those
+        ids or running on those (packed) instances are returned."""
         experiment = self.experiment_config['experiment']
         running_trials = get_running_trials(experiment)
-        return {
-            experiment_utils.get_trial_instance_name(experiment, trial.id):
-            trial for trial in running_trials
-        }
+        if trial_ids is not None or instance_names is not None:
+            conditions = []
+            if trial_ids:
+                conditions.append(models.Trial.id.in_(trial_ids))
+            if instance_names:
+                conditions.append(
+                    models.Trial.instance_name.in_(instance_names))
+            if not conditions:
+                return {}
+            running_trials = running_trials.filter(sqlalchemy.or_(*conditions))
+        instances = collections.defaultdict(list)
+        for trial in running_trials:
+            instances[get_instance_name(experiment, trial)].append(trial)
+        return instances
 
     def get_preempted_trials(self) -> List[models.Trial]:
         """Returns a list of trials that were preempted."""
@@ -407,23 +468,45 @@ class TrialInstanceManager:  # pylint: disable=too-many-instance-attributes
             assert not self.preempted_trials
             return []
 
-        started_instances = self._get_started_unfinished_instances()
         query_time = datetime_now()
 
-        preempted_instances = self._get_preempted_instances_with_retries()
+        # Only look up trials for instances we haven't seen preempted before,
+        # so that the database work done here is proportional to the number of
+        # new preemptions rather than to the number of running trials.
+        experiment = self.experiment_config['experiment']
+        preempted_instances = [
+            instance
+            for instance in self._get_preempted_instances_with_retries()
+            if instance not in self._known_preempted_instances
+        ]
+        trial_ids = []
+        packed_instances = []
+        for instance in preempted_instances:
+            trial_id = experiment_utils.get_trial_id_from_instance_name(
+                experiment, instance)
+            if trial_id is None:
+                # Instances running multiple trials aren't named after a trial.
+                packed_instances.append(instance)
+            else:
+                trial_ids.append(trial_id)
+        started_instances = self._get_started_unfinished_instances(
+            trial_ids, packed_instances) if preempted_instances else {}
+
         trials = []
         for instance in preempted_instances:
-            trial = started_instances.get(instance)
-            if trial is None:
+            self._known_preempted_instances.add(instance)
+            instance_trials = started_instances.get(instance)
+            if not instance_trials:
                 # Preemption for this trial was probably handled already.
                 logs.warning('Instance: %s is preempted but is not running.',
                              instance)
                 continue
-            if trial.id in self.preempted_trials:
-                # We already know this instance was preempted.
-                continue
-            self.preempted_trials[trial.id] = trial
-            trials.append(trial)
+            for trial in instance_trials:
+                if trial.id in self.preempted_trials:
+                    # We already know this instance was preempted.
+                    continue
+                self.preempted_trials[trial.id] = trial
+                trials.append(trial)
 
         # Update this now when we know that we have succeded processing the
         # query. It's far worse if we update the query too early than if we
@@ -441,7 +524,9 @@ class TrialInstanceManager:  # pylint: disable=too-many-instance-attributes
     def _get_preempted_instances_with_retries(self):
         project = self.experiment_config['cloud_project']
         zone = self.experiment_config['cloud_compute_zone']
-        return list(gce.get_preempted_instances(project, zone))
+        name_prefix = experiment_utils.get_trial_instance_name_prefix(
+            self.experiment_config['experiment'])
+        return list(gce.get_preempted_instances(project, zone, name_prefix))
 
     def handle_preempted_trials(self):
         """Handle preempted trials by marking them as preempted and creating
@@ -527,10 +612,9 @@ class TrialInstanceManager:  # pylint: disable=too-many-instance-attributes
 
         replacements = self._get_preempted_replacements(preempted_trials)
         experiment = self.experiment_config['experiment']
-        instances = [
-            experiment_utils.get_trial_instance_name(experiment, trial.id)
-            for trial in preempted_trials
-        ]
+        instances = sorted({
+            get_instance_name(experiment, trial) for trial in preempted_trials
+        })
 
         logs.info('Deleting preempted instances: %s', instances)
         if not delete_instances(instances, self.experiment_config):
@@ -567,52 +651,59 @@ def schedule(experiment_config: dict, pool, core_allocation=None):
     return started_trials
 
 
-def schedule_loop(experiment_config: dict):
+def schedule_loop(experiment_config: dict,
+                  builds_done: Optional[threading.Event] = None):
     """Continuously run the scheduler until there is nothing left to schedule.
+    If |builds_done| is passed, trials are added while images are being built
+    and the scheduler keeps running until it is set.
     Note that this should not be called unless
     multiprocessing.set_start_method('spawn') was called first. Otherwise it
     will use fork to create the Pool which breaks logging."""
     # Create the thread pool once and reuse it to avoid leaking threads and
     # other issues.
     logger.info('Starting scheduler.')
-    num_trials = len(
-        get_experiment_trials(experiment_config['experiment']).all())
+
+    def all_builds_done():
+        return builds_done is None or builds_done.is_set()
+
     local_experiment = experiment_utils.is_local_experiment()
     pool_args = ()
     core_allocation = None
     runners_cpus = experiment_config['runners_cpus']
     if runners_cpus is not None:
         if local_experiment:
-            runner_num_cpu_cores = experiment_config['runner_num_cpu_cores']
-            processes = runners_cpus // runner_num_cpu_cores
-            logger.info('Scheduling runners from core 0 to %d.',
-                        runner_num_cpu_cores * processes - 1)
-            core_allocation = {}
-            for cpu in range(0, runner_num_cpu_cores * processes,
-                             runner_num_cpu_cores):
-                core_allocation[
-                    f'{cpu}-{cpu + runner_num_cpu_cores - 1}'] = None
-            pool_args = (processes,)
+            cpusets = cpu_topology.get_runner_cpusets(
+                cpu_topology.read_topology(), runners_cpus,
+                experiment_config['runner_num_cpu_cores'])
+            logger.info('Scheduling runners on cpusets: %s.', cpusets)
+            core_allocation = {cpuset: None for cpuset in cpusets}
+            pool_args = (len(cpusets),)
         else:
             pool_args = (runners_cpus,)
 
     if not local_experiment:
         gce.initialize()
-        trial_instance_manager = TrialInstanceManager(num_trials,
-                                                      experiment_config)
+        if gcloud.use_compute_api(experiment_config):
+            compute_api.initialize(experiment_config['cloud_project'])
 
     experiment = experiment_config['experiment']
     with multiprocessing.Pool(*pool_args) as pool:
         handle_preempted = False
-        while not all_trials_ended(experiment):
+        while not all_builds_done() or not all_trials_ended(experiment):
             try:
                 if (not local_experiment and not handle_preempted and
+                        all_builds_done() and
                         not any_pending_trials(experiment)):
                     # This ensures that:
                     # 1. handle_preempted will not becomes True when running
                     #    locally.
                     # 2. Only start handling preempted instances once every
-                    #    initial trial was started.
+                    #    initial trial was added and started.
+                    num_trials = len(get_experiment_trials(experiment).all())
+                    trial_instance_manager = TrialInstanceManager(
+                        num_trials, experiment_config)
+                    # Only set once the manager exists, so that it is created
+                    # again by the next iteration if this one raised.
                     handle_preempted = True
 
                 schedule(experiment_config, pool, core_allocation)
@@ -642,6 +733,8 @@ def update_started_trials(trial_proxies, trial_id_mapping, core_allocation):
             continue
         trial = trial_id_mapping[proxy.id]
         trial.time_started = proxy.time_started
+        trial.cpuset = proxy.cpuset
+        trial.instance_name = proxy.instance_name
 
         if core_allocation is not None:
             core_allocation[proxy.cpuset] = proxy.id
@@ -682,7 +775,23 @@ def start_trials(trials, experiment_config: dict, pool, core_allocation=None):
              free_cpusets[index] if free_cpusets is not None else None)
         ]
 
-    started_trial_proxies = pool.starmap(_start_trial, start_trial_args)
+    if get_trials_per_runner(experiment_config) > 1:
+        # Run multiple trials on each instance.
+        started_trial_proxies = _start_packed_trials(start_trial_args,
+                                                     experiment_config, pool)
+    elif (experiment_utils.is_local_experiment() and
+          docker_engine.use_docker_engine(experiment_config)):
+        # Create all containers concurrently using the Docker Engine API.
+        started_trial_proxies = _start_local_trials_batched(
+            start_trial_args, experiment_config)
+    elif (not experiment_utils.is_local_experiment() and
+          gcloud.use_compute_api(experiment_config)):
+        # Create all instances using batched API calls instead of one call per
+        # trial.
+        started_trial_proxies = _start_trials_batched(start_trial_args,
+                                                      experiment_config)
+    else:
+        started_trial_proxies = pool.starmap(_start_trial, start_trial_args)
     started_trials = update_started_trials(started_trial_proxies,
                                            trial_id_mapping, core_allocation)
     logger.info(f'Started {len(started_trials)} trials.')
@@ -701,6 +810,7 @@ class TrialProxy:  # pylint: disable=too-many-instance-attributes
         self.time_ended = trial.time_ended
         self.preemptible = trial.preemptible
         self.cpuset = None
+        self.instance_name = None
         self.trial_group_num = trial.trial_group_num
 
 
@@ -739,23 +849,186 @@ def _start_trial(trial: TrialProxy, experiment_config: dict, cpuset=None):
     return None
 
 
-def render_startup_script_template(  # pylint: disable=too-many-arguments
+def _start_trials_batched(start_trial_args, experiment_config: dict):
+    """Starts the trials in |start_trial_args| (the arguments _start_trial
+    would be called with) by creating their instances in batches. Returns a
+    list containing the started TrialProxy or None for each trial."""
+    instance_names = []
+    startup_scripts = []
+    preemptibles = []
+    for trial, _, cpuset in start_trial_args:
+        instance_name, startup_script_path = write_startup_script(
+            trial.fuzzer, trial.benchmark, trial.id, experiment_config, cpuset,
+            trial.trial_group_num)
+        instance_names.append(instance_name)
+        startup_scripts.append(startup_script_path)
+        preemptibles.append(trial.preemptible)
+
+    if not instance_names:
+        return []
+
+    created = gcloud.create_instances(instance_names,
+                                      gcloud.InstanceType.RUNNER,
+                                      experiment_config, startup_scripts,
+                                      preemptibles)
+    time_started = datetime_now()
+    started_trial_proxies = []
+    for (trial, _, cpuset), started in zip(start_trial_args, created):
+        if not started:
+            logger.info('Trial: %d not started.', trial.id)
+            started_trial_proxies.append(None)
+            continue
+        trial.time_started = time_started
+        trial.cpuset = cpuset
+        started_trial_proxies.append(trial)
+    return started_trial_proxies
+
+
+def get_trials_per_runner(experiment_config: dict) -> int:
+    """Returns the number of trials to run on each runner instance. This is
+    always 1 in local experiments, which use runners_cpus instead."""
+    if experiment_utils.is_local_experiment():
+        return 1
+    return experiment_config.get('trials_per_runner') or 1
+
+
+def get_packed_runner_config(experiment_config: dict, num_trials: int) -> dict:
+    """Returns |experiment_config| with the runner machine sized to run
+    |num_trials| trials (see gcloud.get_packed_runner_resources)."""
+    num_cpus, memory_mb = gcloud.get_packed_runner_resources(
+        experiment_config, num_trials)
+    return dict(experiment_config,
+                runner_machine_type=None,
+                runner_num_cpu_cores=num_cpus,
+                runner_memory=f'{memory_mb}MB')
+
+
+def _get_packed_runners(start_trial_args,
+                        experiment_config: dict) -> List[List[TrialProxy]]:
+    """Returns the trials in |start_trial_args| grouped by the runner instance
+    they will share. Preemptible and nonpreemptible trials aren't mixed."""
+    trials_per_runner = get_trials_per_runner(experiment_config)
+    runners = []
+    for preemptible in (False, True):
+        trials = [
+            trial for trial, _, _ in start_trial_args
+            if trial.preemptible == preemptible
+        ]
+        for idx in range(0, len(trials), trials_per_runner):
+            runners.append(trials[idx:idx + trials_per_runner])
+    return runners
+
+
+def _start_packed_runner(trials: List[TrialProxy], experiment_config: dict):
+    """Starts |trials| on a single runner instance. Returns a list containing
+    the started TrialProxy or None for each trial."""
+    _initialize_logs(experiment_config['experiment'])
+    instance_name, startup_script_path = write_packed_startup_script(
+        trials, experiment_config)
+    logger.info('Start trials %s on %s.', [trial.id for trial in trials],
+                instance_name)
+    started = gcloud.create_instance(instance_name,
+                                     gcloud.InstanceType.RUNNER,
+                                     get_packed_runner_config(
+                                         experiment_config, len(trials)),
+                                     startup_script=startup_script_path,
+                                     preemptible=trials[0].preemptible)
+    return _mark_packed_trials_started(trials, started)
+
+
+def _mark_packed_trials_started(trials: List[TrialProxy], started: bool):
+    """Returns a list containing each of |trials| marked as started if
+    |started| or None otherwise."""
+    if not started:
+        logger.info('Trials: %s not started.', [trial.id for trial in trials])
+        return [None] * len(trials)
+    time_started = datetime_now()
+    for trial in trials:
+        trial.time_started = time_started
+    return trials
+
+
+def _start_packed_trials(start_trial_args, experiment_config: dict, pool):
+    """Starts the trials in |start_trial_args| (the arguments _start_trial
+    would be called with) running up to trials_per_runner of them on each
+    instance. Returns a list containing the started TrialProxy or None for
+    each trial."""
+    runners = _get_packed_runners(start_trial_args, experiment_config)
+    if not gcloud.use_compute_api(experiment_config):
+        results = pool.starmap(
+            _start_packed_runner,
+            [(trials, experiment_config) for trials in runners])
+        return [trial for result in results for trial in result]
+
+    # Create the instances in batches, one batch per machine size.
+    started_trial_proxies = []
+    for num_trials in sorted({len(trials) for trials in runners}):
+        sized_runners = [
+            trials for trials in runners if len(trials) == num_trials
+        ]
+        instance_names = []
+        startup_scripts = []
+        for trials in sized_runners:
+            instance_name, startup_script_path = write_packed_startup_script(
+                trials, experiment_config)
+            instance_names.append(instance_name)
+            startup_scripts.append(startup_script_path)
+        created = gcloud.create_instances(
+            instance_names, gcloud.InstanceType.RUNNER,
+            get_packed_runner_config(experiment_config,
+                                     num_trials), startup_scripts,
+            [trials[0].preemptible for trials in sized_runners])
+        for trials, started in zip(sized_runners, created):
+            started_trial_proxies.extend(
+                _mark_packed_trials_started(trials, started))
+    return started_trial_proxies
+
+
+def _start_local_trials_batched(start_trial_args, experiment_config: dict):
+    """Starts the trials in |start_trial_args| (the arguments _start_trial
+    would be called with) by running their containers concurrently. Returns a
+    list containing the started TrialProxy or None for each trial."""
+    containers = []
+    for trial, _, cpuset in start_trial_args:
+        instance_name = experiment_utils.get_trial_instance_name(
+            experiment_config['experiment'], trial.id)
+        containers.append(
+            (instance_name,
+             get_runner_container_config(instance_name, trial.fuzzer,
+                                         trial.benchmark, trial.id,
+                                         trial.trial_group_num,
+                                         experiment_config, cpuset)))
+
+    started = docker_engine.get_client().run_containers(containers)
+    time_started = datetime_now()
+    started_trial_proxies = []
+    for (trial, _, cpuset), trial_started in zip(start_trial_args, started):
+        if not trial_started:
+            logger.info('Trial: %d not started.', trial.id)
+            started_trial_proxies.append(None)
+            continue
+        trial.time_started = time_started
+        trial.cpuset = cpuset
+        started_trial_proxies.append(trial)
+    return started_trial_proxies
+
+
+def get_runner_kwargs(  # pylint: disable=too-many-arguments
         instance_name: str,
         fuzzer: str,
         benchmark: str,
         trial_id: int,
         trial_group_num: int,
         experiment_config: dict,
-        cpuset=None):
-    """Render the startup script using the template and the parameters
-    provided and return the result."""
+        cpuset=None) -> dict:
+    """Returns the parameters of the runner for trial |trial_id|, used to
+    render the startup script or create the runner container."""
     experiment = experiment_config['experiment']
     docker_image_url = benchmark_utils.get_runner_image_url(
         experiment, benchmark, fuzzer, experiment_config['docker_registry'])
     fuzz_target = benchmark_utils.get_fuzz_target(benchmark)
 
     local_experiment = experiment_utils.is_local_experiment()
-    template = JINJA_ENV.get_template('runner-startup-script-template.sh')
     kwargs = {
         'instance_name': instance_name,
         'benchmark': benchmark,
@@ -779,25 +1052,98 @@ def render_startup_script_template(  # pylint: disable=too-many-arguments
         'private': experiment_config['private'],
         'cpuset': cpuset,
         'custom_seed_corpus_dir': experiment_config['custom_seed_corpus_dir'],
+        'packed': False,
     }
 
     if not local_experiment:
         kwargs['cloud_compute_zone'] = experiment_config['cloud_compute_zone']
         kwargs['cloud_project'] = experiment_config['cloud_project']
+        kwargs['use_gcs_client'] = experiment_config.get(
+            'use_gcs_client', False)
+
+    return kwargs
+
 
+def render_startup_script_template(  # pylint: disable=too-many-arguments
+        instance_name: str,
+        fuzzer: str,
+        benchmark: str,
+        trial_id: int,
+        trial_group_num: int,
+        experiment_config: dict,
+        cpuset=None):
+    """Render the startup script using the template and the parameters
+    provided and return the result."""
+    template = JINJA_ENV.get_template('runner-startup-script-template.sh')
+    kwargs = get_runner_kwargs(instance_name, fuzzer, benchmark, trial_id,
+                               trial_group_num, experiment_config, cpuset)
     return template.render(**kwargs)
 
 
-def create_trial_instance(  # pylint: disable=too-many-arguments
+def get_runner_container_config(  # pylint: disable=too-many-arguments
+        instance_name: str,
+        fuzzer: str,
+        benchmark: str,
+        trial_id: int,
+        trial_group_num: int,
+        experiment_config: dict,
+        cpuset=None) -> dict:
+    """Returns the Docker Engine API config of the container running trial
+    |trial_id| in a local experiment. This is the equivalent of the "docker
+    run" command in the startup script."""
+    kwargs = get_runner_kwargs(instance_name, fuzzer, benchmark, trial_id,
+                               trial_group_num, experiment_config, cpuset)
+    env_vars = {
+        'INSTANCE_NAME': kwargs['instance_name'],
+        'FUZZER': kwargs['fuzzer'],
+        'BENCHMARK': kwargs['benchmark'],
+        'EXPERIMENT': kwargs['experiment'],
+        'TRIAL_ID': kwargs['trial_id'],
+        'TRIAL_GROUP_NUM': kwargs['trial_group_num'],
+        'MICRO_EXPERIMENT': kwargs['micro_experiment'],
+        'MAX_TOTAL_TIME': kwargs['max_total_time'],
+        'SNAPSHOT_PERIOD': kwargs['snapshot_period'],
+        'NO_SEEDS': kwargs['no_seeds'],
+        'NO_DICTIONARIES': kwargs['no_dictionaries'],
+        'OSS_FUZZ_CORPUS': kwargs['oss_fuzz_corpus'],
+        'CUSTOM_SEED_CORPUS_DIR': kwargs['custom_seed_corpus_dir'],
+        'DOCKER_REGISTRY': kwargs['docker_registry'],
+        'EXPERIMENT_FILESTORE': kwargs['experiment_filestore'],
+        'REPORT_FILESTORE': kwargs['report_filestore'],
+        'FUZZ_TARGET': kwargs['fuzz_target'],
+        'PRIVATE': kwargs['private'],
+        'LOCAL_EXPERIMENT': kwargs['local_experiment'],
+    }
+    host_config = {
+        'Privileged': True,
+        'NanoCpus': int(kwargs['num_cpu_cores'] * 1e9),
+        'Binds': [
+            f'{kwargs["experiment_filestore"]}:'
+            f'{kwargs["experiment_filestore"]}',
+            f'{kwargs["report_filestore"]}:{kwargs["report_filestore"]}',
+        ],
+        'ShmSize': 2 * 1024**3,
+        'CapAdd': ['SYS_NICE', 'SYS_PTRACE'],
+        'SecurityOpt': ['seccomp=unconfined'],
+    }
+    if cpuset:
+        host_config['CpusetCpus'] = cpuset
+    return {
+        'Image': kwargs['docker_image_url'],
+        'Env': [f'{name}={value}' for name, value in env_vars.items()],
+        'HostConfig': host_config,
+    }
+
+
+def write_startup_script(  # pylint: disable=too-many-arguments
         fuzzer: str,
         benchmark: str,
         trial_id: int,
         experiment_config: dict,
-        preemptible: bool,
         cpuset=None,
-        trial_group_num: int = 0) -> bool:
-    """Create or start a trial instance for a specific
-    trial_id,fuzzer,benchmark."""
+        trial_group_num: int = 0):
+    """Writes the startup script for the instance of trial |trial_id| and
+    returns the instance name and the path to the startup script."""
     instance_name = experiment_utils.get_trial_instance_name(
         experiment_config['experiment'], trial_id)
     startup_script = render_startup_script_template(instance_name, fuzzer,
@@ -807,7 +1153,61 @@ def create_trial_instance(  # pylint: disable=too-many-arguments
     startup_script_path = f'/tmp/{instance_name}-start-docker.sh'
     with open(startup_script_path, 'w', encoding='utf-8') as file_handle:
         file_handle.write(startup_script)
+    return instance_name, startup_script_path
+
+
+def write_packed_startup_script(  # pylint: disable=too-many-locals
+        trials: List[TrialProxy], experiment_config: dict):
+    """Writes the startup script of an instance running all of |trials|, each
+    pinned to its own physical cores, and returns the instance name and the
+    path to the startup script. Sets the instance of each trial. The cpusets
+    are computed on the instance from its topology, so they aren't recorded."""
+    experiment = experiment_config['experiment']
+    instance_name = experiment_utils.get_packed_instance_name(
+        experiment, trials[0].id)
+    cores_per_trial = experiment_config['runner_num_cpu_cores']
+
+    docker_run_template = JINJA_ENV.get_template(
+        'runner-docker-run-template.sh')
+    runner_commands = []
+    docker_image_urls = []
+    for idx, trial in enumerate(trials):
+        trial.instance_name = instance_name
+        trial.cpuset = None
+        # Expanded by the startup script to the cpuset of this trial.
+        cpuset = f'"${{CPUSETS[{idx}]}}"'
+        kwargs = get_runner_kwargs(instance_name, trial.fuzzer, trial.benchmark,
+                                   trial.id, trial.trial_group_num,
+                                   experiment_config, cpuset)
+        kwargs['packed'] = True
+        runner_commands.append(docker_run_template.render(**kwargs))
+        if kwargs['docker_image_url'] not in docker_image_urls:
+            docker_image_urls.append(kwargs['docker_image_url'])
+
+    template = JINJA_ENV.get_template(
+        'runner-packed-startup-script-template.sh')
+    startup_script = template.render(docker_image_urls=docker_image_urls,
+                                     runner_commands=runner_commands,
+                                     num_cores=cores_per_trial * len(trials),
+                                     cores_per_trial=cores_per_trial)
+    startup_script_path = f'/tmp/{instance_name}-start-docker.sh'
+    with open(startup_script_path, 'w', encoding='utf-8') as file_handle:
+        file_handle.write(startup_script)
+    return instance_name, startup_script_path
+
 
+def create_trial_instance(  # pylint: disable=too-many-arguments
+        fuzzer: str,
+        benchmark: str,
+        trial_id: int,
+        experiment_config: dict,
+        preemptible: bool,
+        cpuset=None,
+        trial_group_num: int = 0) -> bool:
+    """Create or start a trial instance for a specific
+    trial_id,fuzzer,benchmark."""
+    instance_name, startup_script_path = write_startup_script(
+        fuzzer, benchmark, trial_id, experiment_config, cpuset, trial_group_num)
     return gcloud.create_instance(instance_name,
                                   gcloud.InstanceType.RUNNER,
                                   experiment_config,
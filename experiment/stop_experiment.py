@@ -16,6 +16,8 @@
 
 import sys
 
+from common import compute_api
+from common import docker_engine
 from common import experiment_utils
 from common import logs
 from common import gce
@@ -25,18 +27,45 @@ from common import yaml_utils
 logger = logs.Logger()  # pylint: disable=invalid-name
 
 
+def stop_local_experiment(experiment_name):
+    """Stop the containers of local experiment |experiment_name|."""
+    logger.info('Stopping local experiment.')
+    client = docker_engine.get_client()
+    try:
+        containers = client.list_containers(
+            experiment_utils.get_trial_instance_name_prefix(experiment_name))
+    except docker_engine.DockerEngineError as error:
+        logger.error('Failed to list experiment containers: %s', error)
+        return False
+    # The local dispatcher container has a fixed name. Stopping it is a no-op if
+    # it isn't running.
+    containers.append('dispatcher-container')
+
+    logger.info('Stopping containers.')
+    if not client.stop_containers(containers):
+        logger.error('Failed to stop experiment containers.')
+        return False
+
+    logger.info('Successfully stopped experiment.')
+    return True
+
+
 def stop_experiment(experiment_name, experiment_config_filename):
     """Stop the experiment specified by |experiment_config_filename|."""
     experiment_config = yaml_utils.read(experiment_config_filename)
     if experiment_config.get('local_experiment', False):
-        raise NotImplementedError(
-            'Local experiment stop logic is not implemented.')
+        if not docker_engine.use_docker_engine(experiment_config):
+            raise NotImplementedError(
+                'Local experiment stop logic is not implemented.')
+        return stop_local_experiment(experiment_name)
 
     logger.info('Stopping experiment.')
     cloud_project = experiment_config['cloud_project']
     cloud_compute_zone = experiment_config['cloud_compute_zone']
 
     gce.initialize()
+    if gcloud.use_compute_api(experiment_config):
+        compute_api.initialize(cloud_project)
     instances = list(gce.get_instances(cloud_project, cloud_compute_zone))
 
     experiment_instances = []
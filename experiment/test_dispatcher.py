@@ -21,7 +21,6 @@ import pytest
 from database import models
 from database import utils as db_utils
 from experiment import dispatcher
-from test_libs import utils as test_utils
 
 TEST_DATA_PATH = os.path.join(os.path.dirname(__file__), 'test_data')
 
@@ -33,17 +32,7 @@ def get_test_data_path(*subpaths):
     return os.path.join(TEST_DATA_PATH, *subpaths)
 
 
-def mock_split_successes_and_failures(inputs, results):
-    """Mocked version of split_successes_and_failures. Returns inputs, [] as if
-    there was a corresponding True value in |results| for every value in
-    |inputs|."""
-    return inputs, []
-
-
 @pytest.fixture
-@mock.patch('multiprocessing.pool.ThreadPool', test_utils.MockPool)
-@mock.patch('experiment.build.builder.split_successes_and_failures',
-            mock_split_successes_and_failures)
 def dispatcher_experiment(fs, db, experiment):
     """Creates a dispatcher.Experiment object."""
     fs.create_dir(os.environ['WORK'])
@@ -52,7 +41,21 @@ def dispatcher_experiment(fs, db, experiment):
     return dispatcher.Experiment(experiment_config_filepath)
 
 
-@mock.patch('multiprocessing.pool.ThreadPool', test_utils.MockPool)
+def get_mocked_build_all(successful_builds):
+    """Returns a mocked version of builder.build_all where
+    |successful_builds| are the fuzzer,benchmark pairs that build."""
+
+    def mocked_build_all(fuzzers, benchmarks, on_fuzzer_benchmark_built):
+        for fuzzer, benchmark in successful_builds:
+            assert fuzzer in fuzzers
+            assert benchmark in benchmarks
+            on_fuzzer_benchmark_built(fuzzer, benchmark)
+        return (sorted({benchmark for _, benchmark in successful_builds}),
+                successful_builds)
+
+    return mocked_build_all
+
+
 def test_experiment(dispatcher_experiment):
     """Tests creating an Experiment object."""
     assert dispatcher_experiment.benchmarks == ['benchmark-1', 'benchmark-2']
@@ -107,14 +110,11 @@ def test_build_images_for_trials_build_success(_, dispatcher_experiment):
     fuzzer_benchmarks = list(
         itertools.product(dispatcher_experiment.fuzzers,
                           dispatcher_experiment.benchmarks))
-    with mock.patch('experiment.build.builder.build_all_measurers',
-                    return_value=dispatcher_experiment.benchmarks):
-        with mock.patch('experiment.build.builder.build_all_fuzzer_benchmarks',
-                        return_value=fuzzer_benchmarks):
-            trials = dispatcher.build_images_for_trials(
-                dispatcher_experiment.fuzzers, dispatcher_experiment.benchmarks,
-                dispatcher_experiment.num_trials,
-                dispatcher_experiment.preemptible)
+    with mock.patch('experiment.build.builder.build_all',
+                    side_effect=get_mocked_build_all(fuzzer_benchmarks)):
+        trials = dispatcher.build_images_for_trials(
+            dispatcher_experiment.fuzzers, dispatcher_experiment.benchmarks,
+            dispatcher_experiment.num_trials, dispatcher_experiment.preemptible)
     trial_fuzzer_benchmarks = [
         (trial.fuzzer, trial.benchmark) for trial in trials
     ]
@@ -126,31 +126,6 @@ def test_build_images_for_trials_build_success(_, dispatcher_experiment):
         trial_fuzzer_benchmarks))
 
 
-@mock.patch('experiment.build.builder.build_base_images')
-def test_build_images_for_trials_benchmark_fail(_, dispatcher_experiment):
-    """Tests that build_for_trial doesn't return trials or try to build fuzzers
-    for a benchmark whose coverage build failed."""
-    successful_benchmark = 'benchmark-1'
-
-    def mocked_build_all_fuzzer_benchmarks(fuzzers, benchmarks):
-        assert benchmarks == [successful_benchmark]
-        return list(itertools.product(fuzzers, benchmarks))
-
-    with mock.patch('experiment.build.builder.build_all_measurers',
-                    return_value=[successful_benchmark]):
-        with mock.patch('experiment.build.builder.build_all_fuzzer_benchmarks',
-                        side_effect=mocked_build_all_fuzzer_benchmarks):
-            # Check this test so that we know we are actually testing behavior
-            # when benchmarks fail.
-            assert len(set(dispatcher_experiment.benchmarks)) > 1
-            trials = dispatcher.build_images_for_trials(
-                dispatcher_experiment.fuzzers, dispatcher_experiment.benchmarks,
-                dispatcher_experiment.num_trials,
-                dispatcher_experiment.preemptible)
-    for trial in trials:
-        assert trial.benchmark == successful_benchmark
-
-
 @mock.patch('experiment.build.builder.build_base_images')
 def test_build_images_for_trials_fuzzer_fail(_, dispatcher_experiment):
     """Tests that build_for_trial doesn't return trials a fuzzer whose build
@@ -169,19 +144,10 @@ def test_build_images_for_trials_fuzzer_fail(_, dispatcher_experiment):
                          (fail_fuzzer, successful_benchmark_for_fail_fuzzer)]
     num_trials = 10
 
-    def mocked_build_all_fuzzer_benchmarks(fuzzers, benchmarks):
-        # Sanity check this test so that we know we are actually testing
-        # behavior when fuzzers fail.
-        assert sorted(fuzzers) == sorted([successful_fuzzer, fail_fuzzer])
-        assert successful_benchmark_for_fail_fuzzer in benchmarks
-        return successful_builds
-
-    with mock.patch('experiment.build.builder.build_all_measurers',
-                    return_value=benchmarks):
-        with mock.patch('experiment.build.builder.build_all_fuzzer_benchmarks',
-                        side_effect=mocked_build_all_fuzzer_benchmarks):
-            trials = dispatcher.build_images_for_trials(fuzzers, benchmarks,
-                                                        num_trials, False)
+    with mock.patch('experiment.build.builder.build_all',
+                    side_effect=get_mocked_build_all(successful_builds)):
+        trials = dispatcher.build_images_for_trials(fuzzers, benchmarks,
+                                                    num_trials, False)
 
     trial_fuzzer_benchmarks = [
         (trial.fuzzer, trial.benchmark) for trial in trials
@@ -192,3 +158,23 @@ def test_build_images_for_trials_fuzzer_fail(_, dispatcher_experiment):
     ]
     assert (sorted(expected_trial_fuzzer_benchmarks) == sorted(
         trial_fuzzer_benchmarks))
+
+
+@mock.patch('experiment.build.builder.build_base_images')
+def test_build_images_for_trials_on_trials_built(_, dispatcher_experiment):
+    """Tests that build_for_trial passes the trials of each fuzzer,benchmark
+    pair to |on_trials_built| as soon as the pair is built."""
+    successful_builds = [('fuzzer-a', 'benchmark-2'),
+                         ('fuzzer-b', 'benchmark-1')]
+    built_trials = []
+    with mock.patch('experiment.build.builder.build_all',
+                    side_effect=get_mocked_build_all(successful_builds)):
+        trials = dispatcher.build_images_for_trials(
+            dispatcher_experiment.fuzzers, dispatcher_experiment.benchmarks,
+            dispatcher_experiment.num_trials, False, built_trials.append)
+
+    assert [{
+        (trial.fuzzer, trial.benchmark) for trial in pair_trials
+    } for pair_trials in built_trials] == [{pair} for pair in successful_builds]
+    assert [trial for pair_trials in built_trials for trial in pair_trials
+           ] == trials
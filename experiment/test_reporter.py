@@ -58,21 +58,21 @@ def _setup_experiment_files(fs):
     ])
 def test_output_report_filestore(experiment_fuzzers, expected_merged_fuzzers,
                                  expected_report_url, fs, experiment):
-    """Test that output_report writes the report and rsyncs it to the report
-    filestore."""
+    """Test that output_report writes the report, rsyncs it to the report
+    filestore and removes the plots it doesn't have anymore."""
     experiment_config = _setup_experiment_files(fs)
     experiment_config['fuzzers'] = experiment_fuzzers
     experiment_benchmarks = set(experiment_config['benchmarks'])
 
     with test_utils.mock_popen_ctx_mgr() as mocked_popen:
-        with mock.patch('analysis.generate_report.generate_report'
-                       ) as mocked_generate_report:
+        with mock.patch('analysis.generate_report.generate_report',
+                        return_value=['removed.svg']) as mocked_generate_report:
             reporter.output_report(experiment_config)
             reports_dir = os.path.join(os.environ['WORK'], 'reports')
             assert mocked_popen.commands == [[
                 'gsutil', '-h', 'Cache-Control:public,max-age=0,no-transform',
                 'rsync', '-r', reports_dir, expected_report_url
-            ]]
+            ], ['gsutil', 'rm', '-f', expected_report_url + '/removed.svg']]
             experiment_name = os.environ['EXPERIMENT']
             mocked_generate_report.assert_called_with(
                 [experiment_name],
@@ -82,4 +82,7 @@ def test_output_report_filestore(experiment_fuzzers, expected_merged_fuzzers,
                 in_progress=False,
                 merge_with_clobber_nonprivate=False,
                 coverage_report=False,
-                experiment_benchmarks=experiment_benchmarks)
+                experiment_benchmarks=experiment_benchmarks,
+                plot_cache=True,
+                use_results_store=False,
+                cache_dir=os.path.join(os.environ['WORK'], 'report-cache'))
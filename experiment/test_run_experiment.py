@@ -203,6 +203,23 @@ def test_validate_experiment_name_invalid(experiment_name):
     assert 'is invalid. Must match' in str(exception.value)
 
 
+def test_validate_trials_per_runner():
+    """Tests that validate_trials_per_runner raises an exception for runner
+    machine types that can't be used to run several trials."""
+    config = {
+        'runner_machine_type': 'n1-standard-1',
+        'runner_num_cpu_cores': 1,
+        'runner_memory': '12GB',
+        'trials_per_runner': 4,
+    }
+    run_experiment.validate_trials_per_runner(config)
+    config['runner_machine_type'] = 'e2-standard-2'
+    with pytest.raises(run_experiment.ValidationError):
+        run_experiment.validate_trials_per_runner(config)
+    config['trials_per_runner'] = 1
+    run_experiment.validate_trials_per_runner(config)
+
+
 # This test takes up to a minute to complete.
 @pytest.mark.slow
 def test_copy_resources_to_bucket(tmp_path):
@@ -220,15 +237,17 @@ def test_copy_resources_to_bucket(tmp_path):
         'custom_seed_corpus_dir': None,
     }
     try:
-        with mock.patch('common.filestore_utils.cp') as mocked_filestore_cp:
+        with mock.patch(
+                'common.filestore_utils.put_many') as mocked_filestore_put_many:
+            mocked_filestore_put_many.return_value = {'src.tar.gz': True}
             with mock.patch(
                     'common.filestore_utils.rsync') as mocked_filestore_rsync:
                 with mock.patch('common.gsutil.cp') as mocked_gsutil_cp:
                     run_experiment.copy_resources_to_bucket(config_dir, config)
-                    mocked_filestore_cp.assert_called_once_with(
-                        'src.tar.gz',
-                        'gs://gsutil-bucket/experiment/input/',
-                        parallel=True)
+                    mocked_filestore_put_many.assert_called_once_with({
+                        'src.tar.gz':
+                            'gs://gsutil-bucket/experiment/input/src.tar.gz'
+                    })
                     mocked_filestore_rsync.assert_called_once_with(
                         'config',
                         'gs://gsutil-bucket/experiment/input/config',
@@ -242,3 +261,54 @@ def test_copy_resources_to_bucket(tmp_path):
                         parallel=True)
     finally:
         os.chdir(cwd)
+
+
+def test_get_directory_uploads(tmp_path):
+    """Tests that get_directory_uploads maps every file in a directory to its
+    destination."""
+    (tmp_path / 'dir').mkdir()
+    (tmp_path / 'dir' / 'seed').write_text('')
+    (tmp_path / 'seed').write_text('')
+    assert run_experiment.get_directory_uploads(str(tmp_path), 'gs://b/c') == {
+        str(tmp_path / 'dir' / 'seed'): 'gs://b/c/dir/seed',
+        str(tmp_path / 'seed'): 'gs://b/c/seed',
+    }
+
+
+@pytest.mark.parametrize('use_gcs_client', [False, True])
+def test_copy_resources_to_bucket_custom_seed_corpus(use_gcs_client, tmp_path,
+                                                     environ):  # pylint: disable=unused-argument
+    """Tests that copy_resources_to_bucket copies custom seed corpora with one
+    recursive copy per benchmark when gsutil is used, and with the source
+    archive otherwise."""
+    os.environ['USE_GCS_CLIENT'] = str(use_gcs_client)
+    corpus_dir = tmp_path / 'corpora'
+    (corpus_dir / 'benchmark').mkdir(parents=True)
+    (corpus_dir / 'benchmark' / 'seed').write_text('seed')
+    config = {
+        'experiment_filestore': 'gs://bucket',
+        'experiment': 'experiment',
+        'benchmarks': ['benchmark'],
+        'oss_fuzz_corpus': False,
+        'custom_seed_corpus_dir': str(corpus_dir),
+    }
+    with mock.patch('tarfile.open'), mock.patch('os.remove'), \
+            mock.patch('common.filestore_utils.rsync'), \
+            mock.patch('common.filestore_utils.cp') as mocked_cp, \
+            mock.patch('common.filestore_utils.put_many') as mocked_put_many:
+        mocked_put_many.side_effect = lambda uploads: dict.fromkeys(
+            uploads, True)
+        run_experiment.copy_resources_to_bucket('config', config)
+
+    uploads = mocked_put_many.call_args[0][0]
+    corpora_path = 'gs://bucket/experiment/custom_seed_corpora/'
+    if use_gcs_client:
+        assert uploads[str(corpus_dir / 'benchmark' /
+                           'seed')] == corpora_path + 'benchmark/seed'
+        mocked_cp.assert_not_called()
+    else:
+        assert list(uploads) == ['src.tar.gz']
+        mocked_cp.assert_called_once_with(str(corpus_dir / 'benchmark'),
+                                          corpora_path,
+                                          recursive=True,
+                                          parallel=True)
@@ -13,9 +13,11 @@
 # limitations under the License.
 """Tests for runner.py."""
 
+import json
 import os
 import pathlib
 import posixpath
+import threading
 from unittest import mock
 
 import pytest
@@ -23,6 +25,7 @@ import pytest
 from common import benchmark_config
 from common import filestore_utils
 from common import new_process
+from common import resource_usage
 from experiment import runner
 from test_libs import utils as test_utils
 
@@ -109,9 +112,38 @@ def test_record_stats(trial_runner, fuzzer_module):
     stats_file = os.path.join(trial_runner.results_dir, f'stats-{cycle}.json')
     trial_runner.record_stats()
     with open(stats_file, encoding='utf-8') as file_handle:
-        stats_file_contents = file_handle.read()
+        stats = json.load(file_handle)
 
-    assert stats_file_contents == FuzzerAModule.DEFAULT_STATS
+    assert stats == json.loads(FuzzerAModule.DEFAULT_STATS)
+
+
+def test_record_stats_resource_usage(trial_runner, fuzzer_module):
+    """Tests that record_stats records the resources used by the fuzzer with
+    its stats."""
+    cycle = 1337
+    trial_runner.cycle = cycle
+    fuzzer_process = mock.Mock(start_time=0)
+    fuzzer_process.usage = resource_usage.ResourceUsage(user_time=3.0,
+                                                        system_time=1.0,
+                                                        max_rss=1024,
+                                                        read_bytes=0,
+                                                        write_bytes=10,
+                                                        wall_time=8.0)
+    trial_runner.set_fuzzer_process(fuzzer_process)
+
+    trial_runner.record_stats()
+    stats_file = os.path.join(trial_runner.results_dir, f'stats-{cycle}.json')
+    with open(stats_file, encoding='utf-8') as file_handle:
+        stats = json.load(file_handle)
+
+    assert stats == {
+        'execs_per_sec': 20.0,
+        'cpu_time': 4.0,
+        'wall_time': 8.0,
+        'max_rss_mb': 1.0,
+        'read_bytes': 0,
+        'write_bytes': 10,
+    }
 
 
 def test_record_stats_unsupported(trial_runner):
@@ -182,6 +214,42 @@ def test_record_stats_exception(mocked_log_error, trial_runner, fuzzer_module):
         'Call to %s failed.', FuzzerAModuleGetStatsException.get_stats)
 
 
+def test_record_stats_get_stats_timeout(trial_runner):
+    """Tests that record_stats records the resource usage when
+    fuzzer_module.get_stats doesn't return."""
+    cycle = 1337
+    trial_runner.cycle = cycle
+    fuzzer_process = mock.Mock(start_time=0)
+    fuzzer_process.usage = resource_usage.ResourceUsage(user_time=3.0,
+                                                        system_time=1.0,
+                                                        max_rss=1024,
+                                                        read_bytes=0,
+                                                        write_bytes=10,
+                                                        wall_time=8.0)
+    trial_runner.set_fuzzer_process(fuzzer_process)
+    unblock = threading.Event()
+
+    class FuzzerAModuleHangingGetStats:
+        """Fake fuzzer.py module whose get_stats doesn't return."""
+
+        @staticmethod
+        def get_stats(output_directory, log_filename):
+            """Fake get_stats method that blocks."""
+            unblock.wait()
+
+    with mock.patch('experiment.runner.get_fuzzer_module',
+                    return_value=FuzzerAModuleHangingGetStats), \
+            mock.patch('experiment.runner.FUZZER_STATS_TIMEOUT', .1):
+        trial_runner.record_stats()
+    unblock.set()
+
+    stats_file = os.path.join(trial_runner.results_dir, f'stats-{cycle}.json')
+    with open(stats_file, encoding='utf-8') as file_handle:
+        stats = json.load(file_handle)
+    assert stats['cpu_time'] == 4.0
+    assert 'execs_per_sec' not in stats
+
+
 def test_trial_runner(trial_runner):
     """Tests that TrialRunner gets initialized as it is supposed to."""
     assert trial_runner.gcs_sync_dir == (
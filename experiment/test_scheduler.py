@@ -122,7 +122,7 @@ docker run \\
 -e NO_DICTIONARIES=False \\
 -e OSS_FUZZ_CORPUS=False \\
 -e CUSTOM_SEED_CORPUS_DIR=None \\
--e DOCKER_REGISTRY=gcr.io/fuzzbench -e CLOUD_PROJECT=fuzzbench -e CLOUD_COMPUTE_ZONE=us-central1-a \\
+-e DOCKER_REGISTRY=gcr.io/fuzzbench -e CLOUD_PROJECT=fuzzbench -e CLOUD_COMPUTE_ZONE=us-central1-a -e USE_GCS_CLIENT=False \\
 -e EXPERIMENT_FILESTORE=gs://experiment-data \\
 -e REPORT_FILESTORE=gs://web-reports \\
 -e FUZZ_TARGET={oss_fuzz_target} \\
@@ -229,6 +229,142 @@ def test_start_trials_not_started(mocked_create_instance, pending_trials,
     assert not result
 
 
+@mock.patch('common.gcloud.create_instances')
+@mock.patch('common.benchmark_utils.get_fuzz_target',
+            return_value='fuzz-target')
+def test_start_trials_compute_api(_, mocked_create_instances, pending_trials,
+                                  experiment_config):
+    """Test that start_trials creates all instances in one batch when using the
+    Compute Engine API."""
+    experiment_config['use_compute_api'] = True
+    mocked_create_instances.side_effect = (
+        lambda names, *args: [True] + [False] * (len(names) - 1))
+    pool = mock.Mock()
+    result = scheduler.start_trials(pending_trials, experiment_config, pool)
+    assert not pool.starmap.called
+    assert mocked_create_instances.call_count == 1
+    instance_names = mocked_create_instances.call_args[0][0]
+    assert len(instance_names) == pending_trials.count()
+    assert len(result) == 1
+    assert result[0].time_started is not None
+
+
+@mock.patch('common.gcloud.create_instance', return_value=True)
+@mock.patch('common.benchmark_utils.get_fuzz_target',
+            return_value='fuzz-target')
+def test_start_trials_packed(_, mocked_create_instance, pending_trials,
+                             experiment_config):
+    """Test that start_trials runs trials_per_runner trials on each instance,
+    each pinned to its own physical cores."""
+    experiment_config['trials_per_runner'] = 2
+    with ThreadPool() as pool:
+        result = scheduler.start_trials(pending_trials, experiment_config, pool)
+    assert len(result) == 2
+    assert mocked_create_instance.call_count == 1
+    instance_name, _, config = mocked_create_instance.call_args[0]
+    # Two physical cores and the memory of two n1-standard-1 machines.
+    assert config['runner_num_cpu_cores'] == 4
+    assert config['runner_memory'] == '7680MB'
+    assert config['runner_machine_type'] is None
+
+    trial_ids = sorted(trial.id for trial in result)
+    assert instance_name == experiment_utils.get_packed_instance_name(
+        experiment_config['experiment'], result[0].id)
+    assert {trial.instance_name for trial in result} == {instance_name}
+    # The cpusets are computed on the instance from its topology.
+    assert {trial.cpuset for trial in result} == {None}
+
+    startup_script_path = mocked_create_instance.call_args[1]['startup_script']
+    with open(startup_script_path, encoding='utf-8') as file_handle:
+        startup_script = file_handle.read()
+    assert startup_script.count('docker pull') == 1
+    assert '-m common.cpu_topology 2 1))' in startup_script
+    for idx, trial_id in enumerate(trial_ids):
+        assert f'--name=runner-container-{trial_id} ' in startup_script
+        assert f'/tmp/runner-log-{trial_id}.txt &' in startup_script
+        assert f'--cpuset-cpus="${{CPUSETS[{idx}]}}"' in startup_script
+
+
+@mock.patch('experiment.scheduler.delete_instances', return_value=True)
+@mock.patch('experiment.scheduler.datetime_now')
+def test_end_expired_trials_packed(mocked_datetime_now, mocked_delete_instances,
+                                   db, experiment_config):
+    """Tests that end_expired_trials deletes packed instances once, and only
+    when all of their trials expired."""
+    create_experiments(experiment_config)
+    experiment = experiment_config['experiment']
+    max_total_time = experiment_config['max_total_time']
+    mocked_datetime_now.return_value = ARBITRARY_DATETIME + datetime.timedelta(
+        seconds=max_total_time + scheduler.GRACE_TIME_SECONDS * 2)
+    trials = [
+        models.Trial(experiment=experiment,
+                     benchmark=BENCHMARK,
+                     fuzzer=FUZZER,
+                     time_started=time_started,
+                     instance_name=instance_name)
+        for time_started, instance_name in [
+            (ARBITRARY_DATETIME, 'r-test-experiment-h1'),
+            (ARBITRARY_DATETIME, 'r-test-experiment-h1'),
+            (ARBITRARY_DATETIME, 'r-test-experiment-h3'),
+            (mocked_datetime_now.return_value, 'r-test-experiment-h3'),
+        ]
+    ]
+    db_utils.add_all(trials)
+    scheduler.end_expired_trials(experiment_config, None)
+    mocked_delete_instances.assert_called_once_with(['r-test-experiment-h1'],
+                                                    experiment_config)
+
+
+@mock.patch('common.docker_engine.get_client')
+@mock.patch('common.benchmark_utils.get_fuzz_target',
+            return_value='fuzz-target')
+def test_start_trials_docker_engine(_, mocked_get_client, pending_trials,
+                                    experiment_config, environ):
+    """Test that start_trials runs all containers of a local experiment using
+    the Docker Engine API."""
+    os.environ['LOCAL_EXPERIMENT'] = 'True'
+    experiment_config['use_docker_engine'] = True
+    mocked_run_containers = mocked_get_client.return_value.run_containers
+    mocked_run_containers.side_effect = (lambda containers: [True] + [False] *
+                                         (len(containers) - 1))
+    pool = mock.Mock()
+    result = scheduler.start_trials(pending_trials, experiment_config, pool)
+    assert not pool.starmap.called
+    containers = mocked_run_containers.call_args[0][0]
+    assert len(containers) == pending_trials.count()
+    name, config = containers[0]
+    assert name.startswith('r-test-experiment-')
+    assert f'INSTANCE_NAME={name}' in config['Env']
+    assert 'LOCAL_EXPERIMENT=True' in config['Env']
+    assert len(result) == 1
+
+
+@mock.patch('common.docker_engine.get_client')
+@mock.patch('experiment.scheduler.datetime_now')
+def test_end_expired_trials_docker_engine(mocked_datetime_now,
+                                          mocked_get_client, pending_trials,
+                                          experiment_config, environ):
+    """Tests that end_expired_trials stops the containers of expired trials of
+    a local experiment in bulk."""
+    os.environ['LOCAL_EXPERIMENT'] = 'True'
+    experiment_config['use_docker_engine'] = True
+    mocked_datetime_now.return_value = ARBITRARY_DATETIME + datetime.timedelta(
+        seconds=(experiment_config['max_total_time'] +
+                 scheduler.GRACE_TIME_SECONDS * 2))
+    mocked_client = mocked_get_client.return_value
+    mocked_client.get_container_states.return_value = {}
+    mocked_client.stop_containers.return_value = True
+    scheduler.end_expired_trials(experiment_config, None)
+    expired_containers = mocked_client.stop_containers.call_args[0][0]
+    assert len(expired_containers) == 2
+    assert all(
+        container.startswith('r-test-experiment-')
+        for container in expired_containers)
+    with db_utils.session_scope() as session:
+        assert session.query(models.Trial).filter(
+            models.Trial.time_ended.isnot(None)).count() == 2
+
+
 @mock.patch('common.new_process.execute')
 @mock.patch('experiment.scheduler.datetime_now')
 @mock.patch('common.benchmark_utils.get_fuzz_target',
@@ -443,3 +579,82 @@ def test_get_preempted_trials_new_preempted(mocked_get_instance_items,
     result = trial_instance_manager.get_preempted_trials()
     expected_result = [unknown_preempted]
     assert result == expected_result
+
+
+@mock.patch('common.gce._get_instance_items')
+def test_get_preempted_trials_packed(mocked_get_instance_items,
+                                     preempt_exp_conf):
+    """Tests that TrialInstanceManager.get_preempted_trials returns every trial
+    running on a preempted packed instance."""
+    trial_instance_manager = get_trial_instance_manager(preempt_exp_conf)
+    experiment = preempt_exp_conf['experiment']
+    instance_name = experiment_utils.get_packed_instance_name(experiment, 1)
+    trials = [
+        models.Trial(experiment=experiment,
+                     fuzzer=FUZZER,
+                     benchmark=BENCHMARK,
+                     time_started=ARBITRARY_DATETIME,
+                     instance_name=instance_name) for _ in range(2)
+    ]
+    other_trial = models.Trial(experiment=experiment,
+                               fuzzer=FUZZER,
+                               benchmark=BENCHMARK,
+                               time_started=ARBITRARY_DATETIME)
+    db_utils.add_all(trials + [other_trial])
+    preempted_instance_item = _get_preempted_instance_item(
+        other_trial.id, preempt_exp_conf)
+    preempted_instance_item['name'] = instance_name
+    mocked_get_instance_items.return_value = [preempted_instance_item]
+    assert trial_instance_manager.get_preempted_trials() == trials
+
+
+@mock.patch('common.gce._get_instance_items')
+def test_get_preempted_trials_known_instances_skip_db(mocked_get_instance_items,
+                                                      preempt_exp_conf):
+    """Tests that TrialInstanceManager.get_preempted_trials only queries the
+    database for instances it hasn't seen preempted before."""
+    trial_instance_manager = get_trial_instance_manager(preempt_exp_conf)
+    trial = models.Trial(experiment=preempt_exp_conf['experiment'],
+                         fuzzer=FUZZER,
+                         benchmark=BENCHMARK,
+                         time_started=ARBITRARY_DATETIME)
+    db_utils.add_all([trial])
+    mocked_get_instance_items.return_value = [
+        _get_preempted_instance_item(trial.id, preempt_exp_conf)
+    ]
+    with mock.patch(
+            'experiment.scheduler.TrialInstanceManager.'
+            '_get_started_unfinished_instances',
+            wraps=trial_instance_manager._get_started_unfinished_instances
+    ) as mocked_get_started_unfinished_instances:
+        assert trial_instance_manager.get_preempted_trials() == [trial]
+        mocked_get_started_unfinished_instances.assert_called_once_with(
+            [trial.id], [])
+
+        # The instance is still listed as preempted (e.g. because it wasn't
+        # deleted yet) but we already know about it.
+        assert not trial_instance_manager.get_preempted_trials()
+        assert mocked_get_started_unfinished_instances.call_count == 1
+
+
+@mock.patch('time.sleep')
+@mock.patch('multiprocessing.Pool')
+@mock.patch('common.gce.initialize')
+@mock.patch('experiment.scheduler.schedule')
+@mock.patch('experiment.scheduler.any_pending_trials', return_value=False)
+@mock.patch('experiment.scheduler.all_trials_ended',
+            side_effect=[False, False, True])
+@mock.patch('experiment.scheduler.TrialInstanceManager')
+def test_schedule_loop_trial_instance_manager_error(
+        mocked_trial_instance_manager, _, __, mocked_schedule, ___, ____, _____,
+        experiment_config, db):
+    """Tests that schedule_loop creates the TrialInstanceManager again if
+    creating it failed instead of handling preempted trials without one."""
+    experiment_config['runners_cpus'] = None
+    manager = mock.Mock()
+    mocked_trial_instance_manager.side_effect = [Exception(), manager]
+    with mock.patch.dict(os.environ, {'LOCAL_EXPERIMENT': 'False'}):
+        scheduler.schedule_loop(experiment_config)
+    assert mocked_trial_instance_manager.call_count == 2
+    assert mocked_schedule.call_count == 1
+    manager.handle_preempted_trials.assert_called_once_with()
@@ -0,0 +1,29 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for stop_experiment.py."""
+from unittest import mock
+
+from common import docker_engine
+from experiment import stop_experiment
+
+
+@mock.patch('common.docker_engine.get_client')
+def test_stop_local_experiment_list_error(mocked_get_client):
+    """Tests that stop_local_experiment fails without stopping anything if the
+    containers can't be listed."""
+    client = mocked_get_client.return_value
+    client.list_containers.side_effect = docker_engine.DockerEngineError(
+        'Error.', 500)
+    assert not stop_experiment.stop_local_experiment('experiment')
+    assert not client.stop_containers.call_count
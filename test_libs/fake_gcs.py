@@ -0,0 +1,209 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-memory fake of the parts of the Google Cloud Storage JSON API used by
+common/filestore.py, for testing."""
+
+import base64
+import contextlib
+import email.parser
+import email.policy
+import hashlib
+import http.server
+import json
+import threading
+import urllib.parse
+
+OBJECTS_PATH_PREFIX = '/storage/v1/b/'
+UPLOAD_PATH_PREFIX = '/upload/storage/v1/b/'
+
+
+class FakeGcs:
+    """The state of the fake: the contents of the objects of each bucket and
+    the requests it received."""
+
+    def __init__(self):
+        self.objects = {}
+        self.metadata = {}
+        self.requests = []
+        # Statuses to return instead of handling the next requests.
+        self.errors = []
+        # Maximum number of objects listed per page.
+        self.page_size = 1000
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def put(self, bucket, name, data, metadata=None):
+        """Stores |data| in object |name| of |bucket|."""
+        with self.lock:
+            self.generation += 1
+            self.objects[(bucket, name)] = (data, self.generation)
+            self.metadata[(bucket, name)] = dict(metadata or {})
+
+    def get(self, bucket, name):
+        """Returns the contents of object |name| of |bucket|."""
+        return self.objects[(bucket, name)][0]
+
+    def get_resource(self, bucket, name):
+        """Returns the object resource of object |name| of |bucket|."""
+        data, generation = self.objects[(bucket, name)]
+        md5 = base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+        return {
+            'name': name,
+            'bucket': bucket,
+            'size': str(len(data)),
+            'generation': str(generation),
+            'md5Hash': md5,
+        }
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Handles the requests made to the fake."""
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self) -> FakeGcs:
+        """Returns the state of the fake."""
+        return self.server.fake
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Doesn't log requests."""
+
+    def _respond(self, status, body=b'', content_type='application/json'):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        self.fake.requests.append((method, self.path))
+        if self.fake.errors:
+            self._respond(self.fake.errors.pop(0), {'error': 'injected'})
+            return
+
+        if url.path.startswith(UPLOAD_PATH_PREFIX) and method == 'POST':
+            bucket = url.path[len(UPLOAD_PATH_PREFIX):].split('/')[0]
+            self._upload(bucket, params, body)
+            return
+
+        if not url.path.startswith(OBJECTS_PATH_PREFIX):
+            self._respond(400, {'error': 'unsupported'})
+            return
+        parts = url.path[len(OBJECTS_PATH_PREFIX):].split('/')
+        bucket = parts[0]
+        if len(parts) == 2 and method == 'GET':
+            self._list(bucket, params)
+            return
+        name = urllib.parse.unquote(parts[2])
+        if (bucket, name) not in self.fake.objects:
+            self._respond(404, {'error': 'not found'})
+            return
+        if len(parts) == 8 and parts[3] == 'rewriteTo':
+            # .../o/{name}/rewriteTo/b/{destination bucket}/o/{destination}.
+            metadata = json.loads(body) if body else None
+            self.fake.put(parts[5], urllib.parse.unquote(parts[7]),
+                          self.fake.get(bucket, name), metadata)
+            self._respond(200, {'done': True})
+        elif method == 'DELETE':
+            with self.fake.lock:
+                del self.fake.objects[(bucket, name)]
+            self._respond(204)
+        elif params.get('alt') == 'media':
+            self._respond(200, self.fake.get(bucket, name),
+                          'application/octet-stream')
+        else:
+            self._respond(200, self.fake.get_resource(bucket, name))
+
+    def _upload(self, bucket, params, body):
+        if params['uploadType'] == 'media':
+            self.fake.put(bucket, params['name'], body,
+                          {'contentType': self.headers['Content-Type']})
+        else:
+            message = email.parser.BytesParser(
+                policy=email.policy.HTTP).parsebytes(
+                    b'Content-Type: ' + self.headers['Content-Type'].encode() +
+                    b'\r\n\r\n' + body)
+            metadata_part, media_part = message.iter_parts()
+            metadata = json.loads(metadata_part.get_content())
+            name = metadata.pop('name')
+            self.fake.put(bucket, name, media_part.get_payload(decode=True),
+                          metadata)
+            params['name'] = name
+        self._respond(200, self.fake.get_resource(bucket, params['name']))
+
+    def _list(self, bucket, params):
+        prefix = params.get('prefix', '')
+        delimiter = params.get('delimiter')
+        page_size = min(int(params.get('maxResults', self.fake.page_size)),
+                        self.fake.page_size)
+        entries = set()
+        for object_bucket, name in list(self.fake.objects):
+            if object_bucket != bucket or not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                entries.add(
+                    ('prefix', prefix + rest[:rest.index(delimiter) + 1]))
+            else:
+                entries.add(('item', name))
+        entries = sorted(entries, key=lambda entry: entry[1])
+        start = int(params.get('pageToken', 0))
+        page = entries[start:start + page_size]
+        response = {
+            'items': [
+                self.fake.get_resource(bucket, name)
+                for kind, name in page
+                if kind == 'item'
+            ],
+            'prefixes': [name for kind, name in page if kind == 'prefix'],
+        }
+        if start + page_size < len(entries):
+            response['nextPageToken'] = str(start + page_size)
+        self._respond(200, response)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles GET requests."""
+        self._handle('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handles POST requests."""
+        self._handle('POST')
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Handles DELETE requests."""
+        self._handle('DELETE')
+
+
+@contextlib.contextmanager
+def run_server():
+    """Runs a fake GCS server on localhost and yields its FakeGcs and its
+    endpoint."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    server.fake = FakeGcs()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.fake, f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -14,6 +14,8 @@
 """Utilities used in testing."""
 
 import contextlib
+import io
+import subprocess
 from unittest import mock
 
 
@@ -43,12 +45,17 @@ def create_mock_popen(
             self.stdout = None
             self.stderr = None
             self.returncode = returncode
-            if hasattr(stdout, 'write'):
+            if stdout == subprocess.PIPE:
+                self.stdout = io.BytesIO(output)
+            elif hasattr(stdout, 'write'):
                 self.stdout = stdout
             self.pid = 1
 
         def communicate(self, input_data=None):  # pylint: disable=unused-argument
             """Mock subprocess.Popen.communicate."""
+            if isinstance(self.stdout, io.BytesIO):
+                return self.stdout.read(), err
+
             if self.stdout:
                 self.stdout.write(output)
 